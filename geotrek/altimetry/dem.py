@@ -0,0 +1,228 @@
+import math
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+from django.conf import settings
+from django.contrib.gis.geos import LineString, Point
+
+
+def pg_integer(value):
+    """
+    Round ``value`` like PostgreSQL casts a double to integer: to the
+    nearest integer, ties to even (``rint()``), as ``round()`` does.
+    """
+    return int(round(value))
+
+
+class DemSampler:
+    """
+    Sample elevations from a memory-mapped copy of the ``altimetry_dem`` table.
+
+    The file contains a header (magic, origin, pixel size and dimensions of
+    the whole raster) followed by float32 values, row by row. Missing values
+    (outside of tiles or nodata) are stored as NaN.
+
+    Sampling mimics the PostGIS functions used by triggers
+    (``add_point_elevation``, ``ft_drape_line``, ``ft_elevation_infos``),
+    so that results can be computed without any database round trip.
+    """
+    magic = b'GTDEM001'
+    header = struct.Struct('<8s4d2q')
+    data_offset = 64
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.origin_x, self.origin_y, self.scale_x, self.scale_y, self.width, self.height = \
+            self.header.unpack_from(self.mmap)
+        if magic != self.magic:
+            raise ValueError("Invalid DEM file %s" % filename)
+        self.values = memoryview(self.mmap)[self.data_offset:].cast('f')
+
+    @classmethod
+    def build(cls, filename):
+        """
+        Write the DEM loaded in database (see ``loaddem`` command) into
+        ``filename``. Return False if there is no DEM.
+        """
+        from .models import Dem
+
+        tiles = list(Dem.objects.all())
+        if not tiles:
+            return False
+        first = tiles[0].rast
+        scale_x, scale_y = first.scale.x, first.scale.y
+        origin_x = (min if scale_x > 0 else max)(tile.rast.origin.x for tile in tiles)
+        origin_y = (max if scale_y < 0 else min)(tile.rast.origin.y for tile in tiles)
+        width = max(round((tile.rast.origin.x - origin_x) / scale_x) + tile.rast.width for tile in tiles)
+        height = max(round((tile.rast.origin.y - origin_y) / scale_y) + tile.rast.height for tile in tiles)
+
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        # Unique temporary file, so that concurrent builds do not mix
+        fd, tmp_filename = tempfile.mkstemp(dir=dirname or None, prefix=os.path.basename(filename) + '.')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(cls.header.pack(cls.magic, origin_x, origin_y, scale_x, scale_y, width, height)
+                    .ljust(cls.data_offset, b'\0'))
+            f.truncate(cls.data_offset + width * height * 4)
+        with open(tmp_filename, 'r+b') as f:
+            mm = mmap.mmap(f.fileno(), 0)
+            values = memoryview(mm)[cls.data_offset:].cast('f')
+            nan_row = array('f', [math.nan]) * width
+            for row in range(height):
+                values[row * width:(row + 1) * width] = nan_row
+            for tile in tiles:
+                rast = tile.rast
+                band = rast.bands[0]
+                nodata = band.nodata_value
+                data = band.data()
+                if hasattr(data, 'ravel'):
+                    data = data.ravel().tolist()
+                col0 = round((rast.origin.x - origin_x) / scale_x)
+                row0 = round((rast.origin.y - origin_y) / scale_y)
+                for row in range(rast.height):
+                    tile_row = data[row * rast.width:(row + 1) * rast.width]
+                    start = (row0 + row) * width + col0
+                    values[start:start + rast.width] = array('f', [
+                        math.nan if value == nodata else value for value in tile_row
+                    ])
+            del values
+            mm.flush()
+            mm.close()
+        os.replace(tmp_filename, filename)
+        return True
+
+    def value(self, x, y):
+        """
+        Return the raw value of the pixel containing (x, y), like ``ST_Value()``,
+        or None if outside of DEM or nodata.
+        """
+        col = math.floor((x - self.origin_x) / self.scale_x)
+        row = math.floor((y - self.origin_y) / self.scale_y)
+        if not (0 <= col < self.width and 0 <= row < self.height):
+            return None
+        value = self.values[row * self.width + col]
+        if math.isnan(value):
+            return None
+        return value
+
+    def interpolated_value(self, x, y):
+        """
+        Return the value at (x, y) bilinearly interpolated between the
+        centers of the four closest pixels, or None if one of them is missing.
+        """
+        if self.value(x, y) is None:
+            return None
+        if self.width < 2 or self.height < 2:
+            return self.value(x, y)
+        fx = (x - self.origin_x) / self.scale_x - 0.5
+        fy = (y - self.origin_y) / self.scale_y - 0.5
+        # Clamp on borders, where there is only one pixel center around
+        col = min(max(math.floor(fx), 0), self.width - 2)
+        row = min(max(math.floor(fy), 0), self.height - 2)
+        dx = min(max(fx - col, 0.0), 1.0)
+        dy = min(max(fy - row, 0.0), 1.0)
+        i = row * self.width + col
+        v00, v01 = self.values[i], self.values[i + 1]
+        v10, v11 = self.values[i + self.width], self.values[i + self.width + 1]
+        if any(math.isnan(v) for v in (v00, v01, v10, v11)):
+            return None
+        return (v00 * (1 - dx) * (1 - dy) + v01 * dx * (1 - dy)
+                + v10 * (1 - dx) * dy + v11 * dx * dy)
+
+    def elevation(self, x, y, bilinear=False):
+        """
+        Return integer elevation at (x, y), 0 if unknown (``add_point_elevation``).
+        """
+        value = self.interpolated_value(x, y) if bilinear else self.value(x, y)
+        if value is None:
+            return 0
+        return pg_integer(value)
+
+    def drape_line(self, coords, step=None, bilinear=False):
+        """
+        Return 3D coordinates of a line sampled every ``step`` meters,
+        keeping original vertices (``ft_drape_line``).
+        """
+        step = step or settings.ALTIMETRIC_PROFILE_PRECISION
+        if any(len(coord) > 2 and coord[2] for coord in coords):
+            # Already 3D
+            return [tuple(coord[:2]) + (coord[2] if len(coord) > 2 else 0, ) for coord in coords]
+        draped = []
+        for i in range(len(coords) - 1):
+            (x1, y1), (x2, y2) = coords[i][:2], coords[i + 1][:2]
+            n = math.trunc(math.hypot(x2 - x1, y2 - y1) / step) + 1
+            last = i == len(coords) - 2
+            for k in range(n + 1 if last else n):
+                f = k / n
+                x, y = x1 + (x2 - x1) * f, y1 + (y2 - y1) * f
+                draped.append((x, y, self.elevation(x, y, bilinear)))
+        return draped
+
+    @classmethod
+    def smooth(cls, coords, step=None):
+        """
+        Moving average of elevations on ``step`` points before and after
+        (``ft_smooth_line``).
+        """
+        step = settings.ALTIMETRIC_PROFILE_AVERAGE if step is None else step
+        smoothed = []
+        if step <= 0:
+            # Average with previous smoothed elevation
+            last = None
+            for x, y, z in coords:
+                z = pg_integer(z)
+                last = int((z + (z if last is None else last)) / 2)
+                smoothed.append((x, y, last))
+            return smoothed
+        for i, (x, y, z) in enumerate(coords):
+            window = coords[max(i - step, 0):i + step + 1]
+            smoothed.append((x, y, pg_integer(sum(c[2] for c in window) / len(window))))
+        return smoothed
+
+    def elevation_infos(self, geom, bilinear=False):
+        """
+        Return draped geometry and elevation statistics of a 2D geometry
+        (``ft_elevation_infos`` with ``ALTIMETRIC_PROFILE_STEP`` epsilon).
+        """
+        if geom.geom_type == 'Point':
+            z = self.elevation(geom.x, geom.y, bilinear)
+            return {'draped': Point(geom.x, geom.y, z, srid=geom.srid), 'slope': 0.0,
+                    'min_elevation': z, 'max_elevation': z, 'positive_gain': 0, 'negative_gain': 0}
+        if geom.geom_type != 'LineString':
+            raise ValueError("Cannot compute elevation of %s" % geom.geom_type)
+        coords = self.drape_line(geom.coords, bilinear=bilinear)
+        if settings.ALTIMETRIC_PROFILE_STEP > 0:
+            coords = self.smooth(coords)
+        positive_gain, negative_gain = 0, 0
+        for previous, current in zip(coords[:-1], coords[1:]):
+            positive_gain += max(current[2] - previous[2], 0)
+            negative_gain += min(current[2] - previous[2], 0)
+        elevations = [coord[2] for coord in coords]
+        min_elevation, max_elevation = pg_integer(min(elevations)), pg_integer(max(elevations))
+        slope = (max_elevation - min_elevation) / geom.length if geom.length > 0 else 0.0
+        return {'draped': LineString(coords, srid=geom.srid), 'slope': slope,
+                'min_elevation': min_elevation, 'max_elevation': max_elevation,
+                'positive_gain': positive_gain, 'negative_gain': negative_gain}
+
+
+_sampler = None
+
+
+def get_dem_sampler():
+    """
+    Return the DEM sampler if ``ALTIMETRIC_DEM_FILE`` is set and was built
+    by ``loaddem`` command. Return None otherwise.
+    """
+    global _sampler
+    filename = settings.ALTIMETRIC_DEM_FILE
+    if not filename or not os.path.exists(filename):
+        return None
+    mtime = os.path.getmtime(filename)
+    if _sampler is None or _sampler[0] != (filename, mtime):
+        _sampler = ((filename, mtime), DemSampler(filename))
+    return _sampler[1]
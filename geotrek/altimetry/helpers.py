@@ -1,56 +1,87 @@
 import logging
+import math
 
+from django.contrib.gis.db.models.functions import Transform
 from django.contrib.gis.geos import GEOSGeometry
 from django.utils import translation
 from django.utils.translation import gettext as _
-from django.contrib.gis.geos import LineString
+from django.contrib.gis.geos import LineString, Polygon
 from django.conf import settings
 from django.db import connection
 
 import pygal
 from pygal.style import LightSolarizedStyle
 
+from .dem import get_dem_sampler
+
 logger = logging.getLogger(__name__)
 
 
 class AltimetryHelper:
     @classmethod
-    def elevation_profile(cls, geometry3d, precision=None, offset=0):
+    def elevation_profile(cls, geometry3d, precision=None, offset=0, geometry3d_api=None):
         """Extract elevation profile from a 3D geometry.
 
         :precision:  geometry sampling in meters
+        :geometry3d_api:  same geometry transformed to API_SRID, if already known
         """
         precision = precision or settings.ALTIMETRIC_PROFILE_PRECISION
 
         if geometry3d.geom_type == 'Point':
             return [[0, geometry3d.x, geometry3d.y, geometry3d.z]]
 
+        if geometry3d_api is None:
+            geometry3d_api = geometry3d.transform(settings.API_SRID, clone=True)
+
         if geometry3d.geom_type == 'MultiLineString':
             profile = []
-            for subcoords in geometry3d.coords:
+            for subcoords, subcoords_api in zip(geometry3d.coords, geometry3d_api.coords):
                 subline = LineString(subcoords, srid=geometry3d.srid)
+                subline_api = LineString(subcoords_api, srid=settings.API_SRID)
                 offset += subline.length
-                subprofile = AltimetryHelper.elevation_profile(subline, precision, offset)
+                subprofile = AltimetryHelper.elevation_profile(subline, precision, offset, subline_api)
                 profile.extend(subprofile)
             return profile
 
-        # Add measure to 2D version of geometry3d
-        # Get distance from origin for each vertex
-        sql = """
-        WITH line2d AS (SELECT ST_Force2D('%(ewkt)s'::geometry) AS geom),
-             line_measure AS (SELECT ST_Addmeasure(geom, 0, ST_length(geom)) AS geom FROM line2d),
-             points2dm AS (SELECT (ST_DumpPoints(geom)).geom AS point FROM line_measure)
-        SELECT (%(offset)s + ST_M(point)) FROM points2dm;
-        """ % {'offset': offset, 'ewkt': geometry3d.ewkt}
-        cursor = connection.cursor()
-        cursor.execute(sql)
-        pointsm = cursor.fetchall()
-        # Join (offset+distance, x, y, z) together
-        geom3dapi = geometry3d.transform(settings.API_SRID, clone=True)
-        assert len(pointsm) == len(geom3dapi.coords), 'Cannot map distance to xyz'
-        dxyz = [pointsm[i] + v for i, v in enumerate(geom3dapi.coords)]
+        # Get 2D distance from origin for each vertex, and join
+        # (offset+distance, x, y, z) together
+        coords = geometry3d.coords
+        coords_api = geometry3d_api.coords
+        assert len(coords) == len(coords_api), 'Cannot map distance to xyz'
+        dxyz = []
+        distance = 0.0
+        for i, coord in enumerate(coords):
+            if i > 0:
+                distance += math.hypot(coord[0] - coords[i - 1][0], coord[1] - coords[i - 1][1])
+            dxyz.append((offset + distance, ) + coords_api[i])
         return dxyz
 
+    @classmethod
+    def elevation_profiles(cls, queryset, precision=None):
+        """Extract elevation profiles of all objects of a queryset in one query.
+
+        Returns a dict of profiles by primary key.
+        """
+        qs = queryset.annotate(geom_3d_api=Transform('geom_3d', settings.API_SRID))
+        profiles = {}
+        for pk, geom_3d, geom_3d_api in qs.values_list('pk', 'geom_3d', 'geom_3d_api').iterator():
+            if geom_3d is None:
+                continue
+            profiles[pk] = cls.elevation_profile(geom_3d, precision, geometry3d_api=geom_3d_api)
+        return profiles
+
+    @classmethod
+    def elevation_infos(cls, geom):
+        """Compute draped geometry and elevation statistics of a 2D geometry
+        like the ``ft_elevation_infos()`` trigger function, without database.
+
+        Returns None if ``ALTIMETRIC_DEM_FILE`` is not set or if there is no DEM.
+        """
+        sampler = get_dem_sampler()
+        if sampler is None:
+            return None
+        return sampler.elevation_infos(geom, bilinear=settings.ALTIMETRIC_DEM_BILINEAR)
+
     @classmethod
     def altimetry_limits(cls, profile):
         elevations = [int(v[3]) for v in profile]
@@ -139,56 +170,11 @@ class AltimetryHelper:
         if height < precision or width < precision:
             precision = min([height, width])
 
-        sql = """
-            -- Author: Celian Garcia
-            WITH columns AS (
-                    SELECT generate_series({xmin}::int, {xmax}::int, {precision}) AS x
-                ),
-                lines AS (
-                    SELECT generate_series({ymin}::int, {ymax}::int, {precision}) AS y
-                ),
-                resolution AS (
-                    SELECT x, y
-                    FROM (SELECT COUNT(x) AS x FROM columns) AS col,
-                         (SELECT COUNT(y) AS y FROM lines)   AS lin
-                ),
-                points2d AS (
-                    SELECT row_number() OVER (ORDER BY lines.y, columns.x) AS id,
-                           ST_SetSRID(ST_MakePoint(x, y), {srid}) AS geom,
-                           ST_Transform(ST_SetSRID(ST_MakePoint(x, y), {srid}), 4326) AS geomll
-                    FROM columns, lines
-                ),
-                draped AS (
-                    SELECT id, CASE WHEN ST_Value(altimetry_dem.rast, p.geom)::int = -99999 THEN 0 ELSE ST_Value(altimetry_dem.rast, p.geom)::int END AS altitude
-                    FROM altimetry_dem, points2d AS p
-                    WHERE ST_Intersects(altimetry_dem.rast, p.geom)
-                ),
-                all_draped AS (
-                    SELECT geomll, geom, altitude
-                    FROM points2d LEFT JOIN draped ON (points2d.id = draped.id)
-                    ORDER BY points2d.id
-                ),
-                extent_latlng AS (
-                    SELECT ST_Envelope(ST_Union(geom)) AS extent,
-                           MIN(altitude) AS min_z,
-                           MAX(altitude) AS max_z,
-                           AVG(altitude) AS center_z
-                    FROM all_draped
-                )
-            SELECT extent,
-                   ST_transform(extent, 4326),
-                   center_z,
-                   min_z,
-                   max_z,
-                   resolution.x AS resolution_w,
-                   resolution.y AS resolution_h,
-                   altitude
-            FROM extent_latlng, resolution, all_draped;
-        """.format(xmin=xmin, ymin=ymin, xmax=xmax, ymax=ymax,
-                   srid=settings.SRID, precision=precision)
-        cursor = connection.cursor()
-        cursor.execute(sql)
-        result = cursor.fetchall()
+        sampler = get_dem_sampler()
+        if sampler is not None:
+            result = cls._elevation_area_grid(sampler, xmin, ymin, xmax, ymax, precision)
+        else:
+            result = cls._elevation_area_sql(xmin, ymin, xmax, ymax, precision)
         first = result[0]
         envelop_native, envelop, center_z, min_z, max_z, resolution_w, resolution_h, a = first
         envelop = GEOSGeometry(envelop, srid=4326)
@@ -252,3 +238,81 @@ class AltimetryHelper:
             'altitudes': altitudes
         }
         return area
+
+    @classmethod
+    def _elevation_area_sql(cls, xmin, ymin, xmax, ymax, precision):
+        sql = """
+            -- Author: Celian Garcia
+            WITH columns AS (
+                    SELECT generate_series({xmin}::int, {xmax}::int, {precision}) AS x
+                ),
+                lines AS (
+                    SELECT generate_series({ymin}::int, {ymax}::int, {precision}) AS y
+                ),
+                resolution AS (
+                    SELECT x, y
+                    FROM (SELECT COUNT(x) AS x FROM columns) AS col,
+                         (SELECT COUNT(y) AS y FROM lines)   AS lin
+                ),
+                points2d AS (
+                    SELECT row_number() OVER (ORDER BY lines.y, columns.x) AS id,
+                           ST_SetSRID(ST_MakePoint(x, y), {srid}) AS geom,
+                           ST_Transform(ST_SetSRID(ST_MakePoint(x, y), {srid}), 4326) AS geomll
+                    FROM columns, lines
+                ),
+                draped AS (
+                    SELECT id, CASE WHEN ST_Value(altimetry_dem.rast, p.geom)::int = -99999 THEN 0 ELSE ST_Value(altimetry_dem.rast, p.geom)::int END AS altitude
+                    FROM altimetry_dem, points2d AS p
+                    WHERE ST_Intersects(altimetry_dem.rast, p.geom)
+                ),
+                all_draped AS (
+                    SELECT geomll, geom, altitude
+                    FROM points2d LEFT JOIN draped ON (points2d.id = draped.id)
+                    ORDER BY points2d.id
+                ),
+                extent_latlng AS (
+                    SELECT ST_Envelope(ST_Union(geom)) AS extent,
+                           MIN(altitude) AS min_z,
+                           MAX(altitude) AS max_z,
+                           AVG(altitude) AS center_z
+                    FROM all_draped
+                )
+            SELECT extent,
+                   ST_transform(extent, 4326),
+                   center_z,
+                   min_z,
+                   max_z,
+                   resolution.x AS resolution_w,
+                   resolution.y AS resolution_h,
+                   altitude
+            FROM extent_latlng, resolution, all_draped;
+        """.format(xmin=xmin, ymin=ymin, xmax=xmax, ymax=ymax,
+                   srid=settings.SRID, precision=precision)
+        cursor = connection.cursor()
+        cursor.execute(sql)
+        result = cursor.fetchall()
+        return result
+
+    @classmethod
+    def _elevation_area_grid(cls, sampler, xmin, ymin, xmax, ymax, precision):
+        """Same rows as ``_elevation_area_sql()``, sampled from the memory-mapped DEM.
+        """
+        columns = range(xmin, xmax + 1, precision)
+        lines = range(ymin, ymax + 1, precision)
+        altitudes = []
+        for y in lines:
+            for x in columns:
+                altitude = sampler.value(x, y)
+                if altitude is not None:
+                    altitude = int(round(altitude))
+                    if altitude == -99999:
+                        altitude = 0
+                altitudes.append(altitude)
+        x1, x2, y1, y2 = columns[0], columns[-1], lines[0], lines[-1]
+        extent = Polygon(((x1, y1), (x1, y2), (x2, y2), (x2, y1), (x1, y1)), srid=settings.SRID)
+        known = [altitude for altitude in altitudes if altitude is not None]
+        center_z = sum(known) / len(known) if known else None
+        min_z = min(known) if known else None
+        max_z = max(known) if known else None
+        return [(extent, extent.transform(4326, clone=True), center_z, min_z, max_z, len(columns), len(lines), altitude)
+                for altitude in altitudes]
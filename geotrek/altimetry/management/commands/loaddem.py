@@ -7,6 +7,7 @@ import os.path
 from subprocess import call, PIPE
 import tempfile
 
+from geotrek.altimetry.dem import DemSampler
 from geotrek.altimetry.models import Dem
 
 
@@ -100,6 +101,12 @@ class Command(BaseCommand):
         output.close()
         if verbose:
             self.stdout.write('DEM successfully loaded.\n')
+
+        # Step 4: Copy DEM into memory-mapped file, if enabled
+        if settings.ALTIMETRIC_DEM_FILE:
+            DemSampler.build(settings.ALTIMETRIC_DEM_FILE)
+            if verbose:
+                self.stdout.write('DEM successfully copied to %s.\n' % settings.ALTIMETRIC_DEM_FILE)
         return
 
     def call_command_system(self, cmd, **kwargs):
@@ -56,9 +56,10 @@ class AltimetryMixin(models.Model):
     def get_elevation_profile_svg(self, language=None):
         return AltimetryHelper.profile_svg(self.get_elevation_profile(), language)
 
-    def get_formatted_elevation_profile_and_limits(self, **kwargs):
+    def get_formatted_elevation_profile_and_limits(self, elevation_profile=None, **kwargs):
         data = {}
-        elevation_profile = self.get_elevation_profile()
+        if elevation_profile is None:
+            elevation_profile = self.get_elevation_profile()
         # Formatted as distance, elevation, [lng, lat]
         for step in elevation_profile:
             formatted = step[0], step[3], step[1:3]
@@ -66,9 +67,10 @@ class AltimetryMixin(models.Model):
         data['limits'] = dict(zip(['ceil', 'floor'], AltimetryHelper.altimetry_limits(elevation_profile)))
         return data
 
-    def get_elevation_profile_and_limits(self, **kwargs):
+    def get_elevation_profile_and_limits(self, elevation_profile=None, **kwargs):
         data = {}
-        elevation_profile = self.get_elevation_profile()
+        if elevation_profile is None:
+            elevation_profile = self.get_elevation_profile()
         data['profile'] = elevation_profile
         data['limits'] = dict(zip(['ceil', 'floor'], AltimetryHelper.altimetry_limits(elevation_profile)))
         return data
@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.gis.geos import LineString, Point
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from geotrek.altimetry.dem import DemSampler, get_dem_sampler, pg_integer
+from geotrek.altimetry.helpers import AltimetryHelper
+from geotrek.altimetry.tests.test_elevation import fill_raster
+
+
+class DemSamplerMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.dem_file = os.path.join(cls.tmp_dir, 'dem.bin')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.assertTrue(DemSampler.build(self.dem_file))
+        self.sampler = DemSampler(self.dem_file)
+
+    def sql(self, query, *params):
+        with connection.cursor() as cur:
+            cur.execute(query, params)
+            return cur.fetchone()
+
+
+class DemSamplerTest(DemSamplerMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        fill_raster()
+
+    def test_no_dem(self):
+        with connection.cursor() as cur:
+            cur.execute('DELETE FROM altimetry_dem')
+        self.assertFalse(DemSampler.build(os.path.join(self.tmp_dir, 'empty.bin')))
+
+    def test_invalid_file(self):
+        filename = os.path.join(self.tmp_dir, 'invalid.bin')
+        with open(filename, 'wb') as f:
+            f.write(b'\0' * 64)
+        with self.assertRaises(ValueError):
+            DemSampler(filename)
+
+    def test_value_parity(self):
+        for x in range(-10, 110, 7):
+            for y in range(-10, 135, 7):
+                expected, = self.sql('SELECT ST_Value(rast, 1, ST_SetSRID(ST_MakePoint(%s, %s), %s))::integer '
+                                     'FROM altimetry_dem', x, y, settings.SRID)
+                value = self.sampler.value(x, y)
+                self.assertEqual(None if value is None else round(value), expected, (x, y))
+
+    def test_point_elevation_parity(self):
+        for x, y in ((12, 12), (60, 100), (99, 1), (150, 150)):
+            expected, = self.sql('SELECT ST_Z(add_point_elevation(ST_SetSRID(ST_MakePoint(%s, %s), %s)))',
+                                 x, y, settings.SRID)
+            self.assertEqual(self.sampler.elevation(x, y), expected)
+
+    def test_elevation_infos_parity(self):
+        for geom in (LineString((78, 117), (3, 17), srid=settings.SRID),
+                     LineString((1, 1), (98, 1), (98, 120), (2, 60), srid=settings.SRID),
+                     LineString((50, 50), (50.5, 50), srid=settings.SRID),
+                     Point(60, 100, srid=settings.SRID)):
+            expected = self.sql('SELECT ST_AsEWKB(draped), slope, min_elevation, max_elevation, positive_gain, negative_gain '
+                                'FROM ft_elevation_infos(ST_GeomFromEWKT(%s), %s)', geom.ewkt, settings.ALTIMETRIC_PROFILE_STEP)
+            infos = self.sampler.elevation_infos(geom)
+            draped = LineString(expected[0].tobytes()) if geom.geom_type == 'LineString' else Point(expected[0].tobytes())
+            self.assertEqual(len(infos['draped'].coords), len(draped.coords))
+            for coord, expected_coord in zip(infos['draped'].coords if geom.geom_type == 'LineString' else [infos['draped'].coords],
+                                             draped.coords if geom.geom_type == 'LineString' else [draped.coords]):
+                self.assertAlmostEqual(coord[0], expected_coord[0])
+                self.assertAlmostEqual(coord[1], expected_coord[1])
+                self.assertEqual(coord[2], expected_coord[2])
+            self.assertAlmostEqual(infos['slope'], expected[1])
+            self.assertEqual((infos['min_elevation'], infos['max_elevation'],
+                              infos['positive_gain'], infos['negative_gain']), expected[2:])
+
+    def test_bilinear(self):
+        # Pixel centers keep their value
+        self.assertEqual(self.sampler.interpolated_value(12.5, 112.5), 0)
+        self.assertEqual(self.sampler.interpolated_value(37.5, 87.5), 2)
+        # Halfway between 2 and 10
+        self.assertEqual(self.sampler.interpolated_value(50, 87.5), 6)
+        # Outside of DEM
+        self.assertIsNone(self.sampler.interpolated_value(150, 150))
+        self.assertEqual(self.sampler.elevation(150, 150, bilinear=True), 0)
+
+    def test_get_dem_sampler(self):
+        with override_settings(ALTIMETRIC_DEM_FILE=None):
+            self.assertIsNone(get_dem_sampler())
+            self.assertIsNone(AltimetryHelper.elevation_infos(LineString((0, 0), (10, 10))))
+        filename = os.path.join(self.tmp_dir, 'other.bin')
+        with override_settings(ALTIMETRIC_DEM_FILE=filename):
+            # File is built by loaddem, not on first use
+            self.assertIsNone(get_dem_sampler())
+            self.assertFalse(os.path.exists(filename))
+            DemSampler.build(filename)
+            sampler = get_dem_sampler()
+            self.assertIs(get_dem_sampler(), sampler)
+            self.assertEqual(AltimetryHelper.elevation_infos(Point(60, 100))['max_elevation'], 10)
+        # Temporary file was renamed
+        self.assertEqual([name for name in os.listdir(self.tmp_dir) if name.startswith('other.bin.')], [])
+
+    def test_rounding_parity(self):
+        for value in (2.5, 3.5, -2.5, 1.49, 7.51, 10):
+            expected, = self.sql('SELECT %s::float8::integer', value)
+            self.assertEqual(pg_integer(value), expected, value)
+
+
+class DemSamplerAreaTest(DemSamplerMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        fill_raster()
+
+    def test_elevation_area_parity(self):
+        for geom in (LineString((100, 370), (1100, 370), srid=settings.SRID),
+                     LineString((100, 370), (105, 371), srid=settings.SRID),
+                     LineString((-1000, -1000), (2000, 3000), srid=settings.SRID)):
+            with override_settings(ALTIMETRIC_DEM_FILE=None):
+                expected = AltimetryHelper.elevation_area(geom)
+            with override_settings(ALTIMETRIC_DEM_FILE=self.dem_file), self.assertNumQueries(0):
+                area = AltimetryHelper.elevation_area(geom)
+            self.assertEqual(area['altitudes'], expected['altitudes'])
+            self.assertEqual(area['resolution'], expected['resolution'])
+            self.assertEqual(area['extent']['altitudes'], expected['extent']['altitudes'])
+            self.assertEqual(area['center']['z'], expected['center']['z'])
+            for corner in ('southwest', 'northwest', 'northeast', 'southeast'):
+                for key in ('x', 'y', 'lat', 'lng'):
+                    self.assertAlmostEqual(area['extent'][corner][key], expected['extent'][corner][key])
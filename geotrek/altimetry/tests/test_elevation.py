@@ -47,6 +47,17 @@ class ElevationTest(TestCase):
         self.assertAlmostEqual(profile[5][3], 20.0)
         self.assertAlmostEqual(profile[6][3], 22.0)
 
+    @skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
+    def test_elevation_profiles(self):
+        with self.assertNumQueries(1):
+            profiles = AltimetryHelper.elevation_profiles(Path.objects.filter(pk=self.path.pk))
+        self.assertEqual(list(profiles.keys()), [self.path.pk])
+        profile = self.path.get_elevation_profile()
+        self.assertEqual(len(profiles[self.path.pk]), len(profile))
+        for step, expected in zip(profiles[self.path.pk], profile):
+            for value, expected_value in zip(step, expected):
+                self.assertAlmostEqual(value, expected_value)
+
     @skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
     def test_elevation_limits(self):
         limits = self.path.get_elevation_limits()
@@ -116,6 +127,17 @@ class ElevationProfileTest(TestCase):
 
         profile = AltimetryHelper.elevation_profile(geom)
         self.assertEqual(len(profile), 4)
+        self.assertAlmostEqual(profile[0][0], 1.0)
+        self.assertAlmostEqual(profile[1][0], 2.0)
+        self.assertAlmostEqual(profile[2][0], 3.5)
+        self.assertAlmostEqual(profile[3][0], 6.0)
+
+    def test_elevation_profile_linestring_distances(self):
+        geom = LineString((0, 0, 8), (3, 4, 10), (3, 10, 12), srid=settings.SRID)
+        with self.assertNumQueries(0):
+            profile = AltimetryHelper.elevation_profile(geom)
+        self.assertEqual([round(step[0], 6) for step in profile], [0.0, 5.0, 11.0])
+        self.assertEqual([step[3] for step in profile], [8.0, 10.0, 12.0])
 
     def test_elevation_profile_point(self):
         geom = Point(1.5, 2.5, 8, srid=settings.SRID)
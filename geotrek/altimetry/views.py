@@ -44,6 +44,8 @@ class ElevationChart(LastModifiedMixin, PublicOrReadPermMixin, BaseDetailView):
 class ElevationProfile(LastModifiedMixin, JSONResponseMixin,
                        PublicOrReadPermMixin, BaseDetailView):
     """Extract elevation profile from a path and return it as JSON"""
+    # Profiles by pk, precomputed with ``AltimetryHelper.elevation_profiles()``
+    profiles = None
 
     def view_cache_key(self):
         """Used by the ``view_cache_response_content`` decorator.
@@ -60,7 +62,8 @@ class ElevationProfile(LastModifiedMixin, JSONResponseMixin,
         """
         Put elevation profile into response context.
         """
-        return self.object.get_formatted_elevation_profile_and_limits()
+        profile = self.profiles.get(self.object.pk) if self.profiles else None
+        return self.object.get_formatted_elevation_profile_and_limits(elevation_profile=profile)
 
 
 class ElevationArea(LastModifiedMixin, JSONResponseMixin, PublicOrReadPermMixin,
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils.translation import gettext_lazy as _
+
+
+class ApiConfig(AppConfig):
+    name = 'geotrek.api'
+    verbose_name = _("API")
+
+    def ready(self):
+        from .signals import invalidate_api_responses
+
+        post_save.connect(invalidate_api_responses)
+        post_delete.connect(invalidate_api_responses)
+        m2m_changed.connect(invalidate_api_responses)
@@ -1,6 +1,9 @@
 import argparse
+import hashlib
+import json
 import logging
 import filecmp
+import multiprocessing
 import os
 from PIL import Image
 import re
@@ -11,8 +14,10 @@ import cairosvg
 
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.contrib.contenttypes.models import ContentType
 from django.core.management.base import BaseCommand, CommandError
-from django.db.models import Q
+from django.db import connections
+from django.db.models import Count, Max, Q
 from django.http import StreamingHttpResponse
 from django.test.client import RequestFactory
 from django.utils import translation
@@ -24,7 +29,7 @@ from geotrek.tourism import models as tourism_models
 from geotrek.trekking import models as trekking_models
 from geotrek.api.mobile.views.trekking import TrekViewSet
 from geotrek.api.mobile.views.common import FlatPageViewSet, SettingsView
-from geotrek.common.helpers_sync import ZipTilesBuilder
+from geotrek.common.helpers_sync import TilesStore, ZipTilesBuilder
 # Register mapentity models
 from geotrek.trekking import urls  # NOQA
 from geotrek.tourism import urls  # NOQA
@@ -32,22 +37,48 @@ from geotrek.tourism import urls  # NOQA
 
 logger = logging.getLogger(__name__)
 
+# Command running in worker processes, see ``Command.sync_treks_media()``
+_sync_command = None
+
+
+def _init_worker():
+    # SQLite connections must not be shared with the parent process
+    if 'store' in _sync_command.builder_args:
+        _sync_command.builder_args['store'] = TilesStore(_sync_command.tiles_dir, _sync_command.tiles_urls)
+
+
+def _sync_trek_media(args):
+    pk, stamp = args
+    command = _sync_command
+    command.manifest = {}
+    command.sync_trek_by_pk_media(trekking_models.Trek.objects.get(pk=pk), stamp=stamp)
+    command.stdout.flush()
+    return command.manifest
+
 
 class Command(BaseCommand):
+    # Stamps of treks zip files of this run and of previous one, see ``load_manifest()``
+    manifest = None
+    old_manifest = {}
+
     def add_arguments(self, parser):
         parser.add_argument('path')
         parser.add_argument('--languages', '-l', dest='languages', default='', help='Languages to sync')
         parser.add_argument('--portal', '-P', dest='portal', default=None, help='Filter by portal(s)')
         parser.add_argument('--skip-tiles', '-t', action='store_true', dest='skip_tiles', default=False,
                             help='Skip inclusion of tiles in zip files')
+        parser.add_argument('--tiles-workers', dest='tiles_workers', type=int, default=1,
+                            help='Number of threads used to download tiles')
         parser.add_argument('--url', '-u', dest='url', default='http://localhost', help='Base url')
         parser.add_argument('--indent', '-i', default=0, type=int, help='Indent json files')
+        parser.add_argument('--processes', dest='processes', type=int, default=1,
+                            help='Number of processes used to package treks media in parallel')
+        parser.add_argument('--full', action='store_true', dest='full', default=False,
+                            help='Package media of all treks again, even unchanged ones since last sync')
         parser.add_argument('--task', default=None, help=argparse.SUPPRESS)
 
     def mkdirs(self, name):
-        dirname = os.path.dirname(name)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
+        os.makedirs(os.path.dirname(name), exist_ok=True)
 
     def sync_view(self, lang, view, name, url='/', params=None, headers={}, zipfile=None, fix2028=False, **kwargs):
         if self.verbosity == 2:
@@ -249,6 +280,8 @@ class Command(BaseCommand):
         if self.portal:
             treks = treks.filter(Q(portal__name__in=self.portal) | Q(portal=None))
 
+        # Compute POIs of outdated treks at once
+        trekking_models.TrekRelatedObject.refresh(treks.values_list('pk', flat=True))
         for trek in treks:
             self.sync_geojson(lang, TrekViewSet, '{pk}/trek.geojson'.format(pk=trek.pk), pk=trek.pk,
                               type_view={'get': 'retrieve'})
@@ -280,11 +313,62 @@ class Command(BaseCommand):
         self.sync_global_media()
         self.sync_treks_media()
 
-    def sync_trek_by_pk_media(self, trek):
+    def get_trek_media_stamp(self, trek):
+        """
+        Signature of the trek and of the related objects whose media are packaged with it, used to keep
+        zip files of treks unchanged since previous sync without packaging them again.
+        """
+        querysets = [trekking_models.Trek.objects.filter(pk=trek.pk), trek.children, trek.published_pois,
+                     trek.published_touristic_contents, trek.published_touristic_events]
+        for qs in list(querysets):
+            querysets.append(common_models.Attachment.objects.filter(
+                content_type=ContentType.objects.get_for_model(qs.model), object_id__in=qs.values('pk')))
+        stamp = []
+        for qs in querysets:
+            aggregate = qs.order_by().aggregate(count=Count('pk'), date_update=Max('date_update'))
+            stamp.append('{count}:{date_update}'.format(**aggregate))
+        desks = tourism_models.InformationDesk.objects.filter(Q(treks=trek) | Q(treks__trek_parents__parent=trek))
+        stamp += sorted('{}:{}'.format(pk, photo) for pk, photo in desks.values_list('pk', 'photo'))
+        return ','.join(stamp)
+
+    def keep_trek_media(self, trek, stamp):
+        """
+        Record ``stamp`` of the trek in manifest and, if it did not change since previous sync, keep zip file
+        and media of the trek. Return True if they were kept.
+        """
         url_trek = os.path.join('nolang')
         zipname_trekid = os.path.join(url_trek, "{}.zip".format(trek.pk))
         zipfullname_trekid = os.path.join(self.tmp_root, zipname_trekid)
         self.mkdirs(zipfullname_trekid)
+
+        self.manifest[zipname_trekid] = stamp
+        oldzipfullname_trekid = os.path.join(self.dst_root, zipname_trekid)
+        if self.old_manifest.get(zipname_trekid) != stamp or not os.path.isfile(oldzipfullname_trekid):
+            return False
+        os.link(oldzipfullname_trekid, zipfullname_trekid)
+        old_media = os.path.join(self.dst_root, url_trek, str(trek.pk))
+        if os.path.isdir(old_media):
+            shutil.copytree(old_media, os.path.join(self.tmp_root, url_trek, str(trek.pk)), copy_function=os.link)
+        if self.verbosity == 2:
+            self.stdout.write("\x1b[36m**\x1b[0m \x1b[1m{name}\x1b[0m \x1b[32munchanged\x1b[0m".format(
+                name=zipname_trekid))
+        return True
+
+    def sync_trek_by_pk_media(self, trek, stamp=None):
+        """
+        Package zip file and media of the trek, unless they did not change since previous sync.
+        ``stamp`` is given when this was already checked.
+        """
+        url_trek = os.path.join('nolang')
+        zipname_trekid = os.path.join(url_trek, "{}.zip".format(trek.pk))
+        zipfullname_trekid = os.path.join(self.tmp_root, zipname_trekid)
+        if stamp is None:
+            if self.keep_trek_media(trek, self.get_trek_media_stamp(trek)):
+                return
+        else:
+            self.mkdirs(zipfullname_trekid)
+            self.manifest[zipname_trekid] = stamp
+
         trekid_zipfile = ZipFile(zipfullname_trekid, 'w')
 
         if not self.skip_tiles:
@@ -332,13 +416,67 @@ class Command(BaseCommand):
 
         self.close_zip(trekid_zipfile, zipname_trekid)
 
+    def prepare_treks_media(self, treks):
+        """
+        Resize pictures and render elevation charts of all objects packaged with ``treks``, once for
+        each object even if it is shared by several treks, before packaging treks.
+        """
+        done = set()
+
+        def prepare(obj):
+            key = (type(obj), obj.pk)
+            if key in done:
+                return False
+            done.add(key)
+            if isinstance(obj, tourism_models.InformationDesk):
+                obj.resized_picture
+            else:
+                obj.resized_pictures
+            return True
+
+        for trek in treks:
+            for obj in [trek] + list(trek.published_pois) + list(trek.published_touristic_contents) \
+                    + list(trek.published_touristic_events) + list(trek.information_desks.all()):
+                prepare(obj)
+            for child in trek.children:
+                if prepare(child):
+                    for lang in self.languages:
+                        child.prepare_elevation_chart(lang, self.referer)
+                for desk in child.information_desks.all():
+                    prepare(desk)
+            for lang in self.languages:
+                trek.prepare_elevation_chart(lang, self.referer)
+
     def sync_treks_media(self):
         treks = trekking_models.Trek.objects.existing().filter(published=True).order_by('pk')
         if self.portal:
             treks = treks.filter(Q(portal__name__in=self.portal) | Q(portal=None))
+        # Compute POIs of outdated treks at once
+        trekking_models.TrekRelatedObject.refresh(treks.values_list('pk', flat=True))
+
+        if self.processes <= 1:
+            for trek in treks:
+                self.sync_trek_by_pk_media(trek)
+            return
 
+        # Keep unchanged treks first, so that only media of outdated ones are prepared and packaged
+        outdated = []
         for trek in treks:
-            self.sync_trek_by_pk_media(trek)
+            stamp = self.get_trek_media_stamp(trek)
+            if not self.keep_trek_media(trek, stamp):
+                outdated.append((trek, stamp))
+        if not outdated:
+            return
+        self.prepare_treks_media([trek for trek, stamp in outdated])
+        global _sync_command
+        _sync_command = self
+        # Worker processes must not share database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(self.processes, initializer=_init_worker) as pool:
+            for manifest in pool.imap_unordered(_sync_trek_media, [(trek.pk, stamp) for trek, stamp in outdated]):
+                self.manifest.update(manifest)
+        _sync_command = None
 
     def sync_global_media(self):
         url_media_nolang = os.path.join('nolang')
@@ -378,22 +516,10 @@ class Command(BaseCommand):
             self.stdout.write("\x1b[36m**\x1b[0m \x1b[1mnolang/{}/tiles/\x1b[0m ...".format(trek.pk), ending="")
             self.stdout._out.flush()
 
-        def _radius2bbox(lng, lat, radius):
-            return (lng - radius, lat - radius,
-                    lng + radius, lat + radius)
-
         tiles = ZipTilesBuilder(zipfile, prefix='/{}/tiles/'.format(trek.pk), **self.builder_args)
-
-        geom = trek.geom
-        if geom.geom_type == 'MultiLineString':
-            geom = geom[0]  # FIXME
-        geom.transform(4326)
-
-        for (lng, lat) in geom.coords:
-            large = _radius2bbox(lng, lat, settings.MOBILE_TILES_RADIUS_LARGE)
-            small = _radius2bbox(lng, lat, settings.MOBILE_TILES_RADIUS_SMALL)
-            tiles.add_coverage(bbox=large, zoomlevels=settings.MOBILE_TILES_LOW_ZOOMS)
-            tiles.add_coverage(bbox=small, zoomlevels=settings.MOBILE_TILES_HIGH_ZOOMS)
+        # Tiles along the trek, the closest ones up to the highest zoom levels
+        tiles.add_corridor_coverage(trek.geom, settings.MOBILE_TILES_RADIUS_LARGE, settings.MOBILE_TILES_LOW_ZOOMS)
+        tiles.add_corridor_coverage(trek.geom, settings.MOBILE_TILES_RADIUS_SMALL, settings.MOBILE_TILES_HIGH_ZOOMS)
 
         tiles.run()
 
@@ -450,10 +576,38 @@ class Command(BaseCommand):
         if not os.path.exists(self.dst_root):
             return
         existing = set([os.path.basename(p) for p in os.listdir(self.dst_root)])
-        remaining = existing - {'nolang'} - set(settings.MODELTRANSLATION_LANGUAGES)
+        remaining = existing - {'nolang', 'manifest.json'} - set(settings.MODELTRANSLATION_LANGUAGES)
         if remaining:
             raise CommandError("Destination directory contains extra data")
 
+    def get_signature(self):
+        """
+        Options, settings and version changing the content of all zip files. Previous files are not reused
+        if it changes.
+        """
+        keys = ('url', 'portal', 'languages', 'skip_tiles')
+        signature = [settings.VERSION, settings.MOBILE_TILES_URL, settings.MOBILE_NUMBER_PICTURES_SYNC] + \
+            [self.options.get(key) for key in keys]
+        return hashlib.sha1(json.dumps(signature).encode()).hexdigest()
+
+    def load_manifest(self):
+        """
+        Return stamps of treks zip files generated by previous sync, by file name.
+        """
+        try:
+            with open(os.path.join(self.dst_root, 'manifest.json')) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('signature') != self.get_signature():
+            return {}
+        return manifest['files']
+
+    def write_manifest(self):
+        manifest = {'signature': self.get_signature(), 'files': self.manifest}
+        with open(os.path.join(self.tmp_root, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, sort_keys=True)
+
     def rename_root(self):
         if os.path.exists(self.dst_root):
             tmp_root2 = os.path.join(os.path.dirname(self.dst_root), 'deprecated_sync_mobile')
@@ -495,12 +649,21 @@ class Command(BaseCommand):
             tiles_url = settings.MOBILE_TILES_URL
         else:
             tiles_url = settings.MOBILE_TILES_URL[0]
+        self.tiles_dir = os.path.join(settings.VAR_DIR, 'tiles')
         self.builder_args = {
             'tiles_url': tiles_url,
             'tiles_headers': {"Referer": self.referer},
             'ignore_errors': True,
-            'tiles_dir': os.path.join(settings.VAR_DIR, 'tiles'),
+            'tiles_dir': self.tiles_dir,
+            'workers': options.get('tiles_workers', 1),
         }
+        if not self.skip_tiles:
+            self.tiles_urls = [settings.MOBILE_TILES_URL] if isinstance(settings.MOBILE_TILES_URL, str) else settings.MOBILE_TILES_URL
+            self.builder_args['store'] = TilesStore(self.tiles_dir, self.tiles_urls)
+        self.processes = options.get('processes', 1)
+        self.options = options
+        self.manifest = {}
+        self.old_manifest = {} if options.get('full') else self.load_manifest()
 
         self.tmp_root = os.path.join(os.path.dirname(self.dst_root), 'tmp_sync_mobile')
         try:
@@ -514,6 +677,7 @@ class Command(BaseCommand):
             )
         try:
             self.sync()
+            self.write_manifest()
             if self.celery_task:
                 self.celery_task.update_state(
                     state='PROGRESS',
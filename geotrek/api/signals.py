@@ -0,0 +1,9 @@
+from geotrek.api.v2.utils import invalidate_api_cache
+
+
+def invalidate_api_responses(sender, raw=False, **kwargs):
+    if raw:
+        return
+    # Serializations include related objects: any change may alter responses
+    if sender.__module__.startswith('geotrek.'):
+        invalidate_api_cache()
@@ -16,7 +16,7 @@ from django.core import management
 from django.core.management.base import CommandError
 from django.db.models import Q
 from django.http import HttpResponse, StreamingHttpResponse
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.test.utils import override_settings
 from django.utils import translation
 
@@ -580,3 +580,73 @@ class SyncMobileTreksTest(TranslationResetMixin, VarTmpTestCase):
         management.call_command('sync_mobile', 'var/tmp', url='http://localhost:8000',
                                 skip_tiles=True, verbosity=2, stdout=output)
         self.assertIn('Done', output.getvalue())
+
+    def test_unchanged_trek_media_not_packaged_again(self):
+        management.call_command('sync_mobile', 'var/tmp', url='http://localhost:8000',
+                                skip_tiles=True, verbosity=0)
+        zipname = os.path.join('var/tmp/nolang', '{}.zip'.format(self.trek_1.pk))
+        inode = os.stat(zipname).st_ino
+        output = StringIO()
+        management.call_command('sync_mobile', 'var/tmp', url='http://localhost:8000',
+                                skip_tiles=True, verbosity=2, stdout=output)
+        self.assertIn('nolang/{}.zip\x1b[0m \x1b[32munchanged'.format(self.trek_1.pk), output.getvalue())
+        self.assertEqual(os.stat(zipname).st_ino, inode)
+        self.assertTrue(os.path.exists(os.path.join('var/tmp/nolang', str(self.trek_1.pk),
+                                                    'media/paperclip/trekking_trek')))
+        # Media of the child trek are packaged with its parent
+        self.trek_4.save()
+        output = StringIO()
+        management.call_command('sync_mobile', 'var/tmp', url='http://localhost:8000',
+                                skip_tiles=True, verbosity=2, stdout=output)
+        self.assertNotIn('nolang/{}.zip\x1b[0m \x1b[32munchanged'.format(self.trek_1.pk), output.getvalue())
+        self.assertNotEqual(os.stat(zipname).st_ino, inode)
+
+    def test_full_packages_unchanged_trek_media(self):
+        management.call_command('sync_mobile', 'var/tmp', url='http://localhost:8000',
+                                skip_tiles=True, verbosity=0)
+        output = StringIO()
+        management.call_command('sync_mobile', 'var/tmp', url='http://localhost:8000',
+                                skip_tiles=True, full=True, verbosity=2, stdout=output)
+        self.assertNotIn('unchanged', output.getvalue())
+
+
+class SyncMobileParallelTest(TransactionTestCase):
+    def setUp(self):
+        VarTmpTestCase.setUp(self)
+        self.trek_1 = TrekWithPublishedPOIsFactory.create()
+        self.trek_2 = TrekWithPublishedPOIsFactory.create()
+        AttachmentFactory.create(content_object=self.trek_1, attachment_file=get_dummy_uploaded_image())
+        AttachmentFactory.create(content_object=self.trek_1.published_pois.first(),
+                                 attachment_file=get_dummy_uploaded_image())
+
+    def tearDown(self):
+        VarTmpTestCase.tearDown(self)
+
+    def test_sync_processes(self):
+        management.call_command('sync_mobile', 'var/tmp', url='http://localhost:8000', skip_tiles=True,
+                                processes=2, verbosity=0)
+        for trek in (self.trek_1, self.trek_2):
+            self.assertTrue(os.path.exists(os.path.join('var/tmp/nolang', '{}.zip'.format(trek.pk))))
+        self.assertTrue(os.path.exists(os.path.join('var/tmp/nolang', str(self.trek_1.pk),
+                                                    'media/paperclip/trekking_trek')))
+        self.assertTrue(os.path.exists(os.path.join('var/tmp/nolang', str(self.trek_1.pk),
+                                                    'media/paperclip/trekking_poi')))
+        with open(os.path.join('var/tmp', 'manifest.json')) as f:
+            manifest = json.load(f)
+        self.assertEqual(set(manifest['files']), {os.path.join('nolang', '{}.zip'.format(self.trek_1.pk)),
+                                                  os.path.join('nolang', '{}.zip'.format(self.trek_2.pk))})
+
+    def test_sync_processes_unchanged(self):
+        kwargs = {'url': 'http://localhost:8000', 'skip_tiles': True, 'processes': 2, 'verbosity': 0}
+        management.call_command('sync_mobile', 'var/tmp', **kwargs)
+        self.trek_2.save()
+        with mock.patch('geotrek.api.management.commands.sync_mobile.Command.prepare_treks_media',
+                        autospec=True) as prepare_treks_media:
+            management.call_command('sync_mobile', 'var/tmp', **kwargs)
+            # Only media of the modified trek are prepared
+            self.assertEqual(prepare_treks_media.call_args[0][1], [self.trek_2])
+            prepare_treks_media.reset_mock()
+            management.call_command('sync_mobile', 'var/tmp', **kwargs)
+            prepare_treks_media.assert_not_called()
+        for trek in (self.trek_1, self.trek_2):
+            self.assertTrue(os.path.exists(os.path.join('var/tmp/nolang', '{}.zip'.format(trek.pk))))
@@ -1,20 +1,23 @@
 import datetime
+import json
+from base64 import urlsafe_b64encode
 from unittest import skipIf
 
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from django.contrib.gis.geos import (LineString, MultiLineString, MultiPoint,
-                                     Point, Polygon)
+                                     MultiPolygon, Point, Polygon)
 from django.contrib.gis.geos.collections import GeometryCollection
-from django.db import connection
-from django.test.testcases import TestCase
-from django.test.utils import override_settings
+from django.db import connection, transaction
+from django.test.testcases import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from freezegun.api import freeze_time
 from mapentity.tests.factories import SuperUserFactory
 
 from geotrek import __version__
+from geotrek.api.v2.utils import invalidate_api_cache
 from geotrek.authent import models as authent_models
 from geotrek.authent.tests import factories as authent_factory
 from geotrek.common import models as common_models
@@ -1167,6 +1170,19 @@ class APIAccessAnonymousTestCase(BaseApiTest):
 
         self.assertEqual(json_response.get('features')[1].get('properties').get('count_children'), 1)
 
+    def test_tour_deleted_step(self):
+        self.child1.delete()
+        response = self.get_tour_detail(self.parent.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([step['id'] for step in response.json()['steps']], [self.child2.pk])
+
+    def test_trek_deleted_parent(self):
+        self.treks[0].delete()
+        response = self.get_trek_detail(self.child2.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()['previous']), [str(self.parent.pk)])
+        self.assertEqual(list(response.json()['next']), [str(self.parent.pk)])
+
     @override_settings(ONLY_EXTERNAL_PUBLIC_PDF=True)
     def test_trek_external_pdf(self):
         response = self.get_trek_detail(self.parent.id)
@@ -2784,6 +2800,212 @@ class TrekWebLinksTestCase(TestCase):
         self.assertEqual(response.json()['web_links'][0]['category']['pictogram'], 'http://testserver/media/dummy_picto.png')
 
 
+class TrekListQueriesTestCase(TestCase):
+    """
+    The number of queries of trek and tour lists does not depend on the number of treks.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = zoning_factory.CityFactory.create(
+            geom=MultiPolygon(Polygon.from_bbox((600000, 6500000, 800000, 6700000)), srid=settings.SRID))
+
+    def create_tour(self):
+        parent = trek_factory.TrekFactory.create()
+        for order in range(3):
+            trek_models.OrderedTrekChild.objects.create(parent=parent, child=trek_factory.TrekFactory.create(),
+                                                        order=order)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(context)
+
+    def test_trek_list(self):
+        trek_factory.TrekFactory.create_batch(2)
+        json_result, count = self.count_queries(reverse('apiv2:trek-list'))
+        self.assertEqual(json_result['results'][0]['departure_city'], self.city.code)
+        trek_factory.TrekFactory.create_batch(8)
+        json_result, count_more = self.count_queries(reverse('apiv2:trek-list'))
+        self.assertEqual(json_result['count'], 10)
+        self.assertEqual(count_more, count)
+
+    def test_tour_list(self):
+        self.create_tour()
+        json_result, count = self.count_queries(reverse('apiv2:tour-list'))
+        self.assertEqual(len(json_result['results'][0]['steps']), 3)
+        for i in range(3):
+            self.create_tour()
+        json_result, count_more = self.count_queries(reverse('apiv2:tour-list'))
+        self.assertEqual(json_result['count'], 4)
+        self.assertEqual(count_more, count)
+
+
+class CursorPaginationAndStreamingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.treks = trek_factory.TrekFactory.create_batch(5)
+
+    def test_cursor_pagination(self):
+        url = reverse('apiv2:trek-list')
+        response = self.client.get(url, {'cursor': '', 'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        json_result = response.json()
+        self.assertNotIn('count', json_result)
+        ids = [trek['id'] for trek in json_result['results']]
+        while json_result['next']:
+            json_result = self.client.get(json_result['next']).json()
+            ids += [trek['id'] for trek in json_result['results']]
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(set(ids), {trek.pk for trek in self.treks})
+
+    def test_cursor_pagination_after_update(self):
+        url = reverse('apiv2:trek-list')
+        json_result = self.client.get(url, {'cursor': '', 'page_size': 5}).json()
+        self.assertIsNone(json_result['next'])
+        cursor = self.client.get(url, {'cursor': '', 'page_size': 4}).json()['next']
+        trek = trek_models.Trek.objects.get(pk=json_result['results'][0]['id'])
+        trek.save()
+        json_result = self.client.get(cursor).json()
+        self.assertEqual([result['id'] for result in json_result['results']][-1], trek.pk)
+
+    def test_cursor_pagination_geojson(self):
+        response = self.client.get(reverse('apiv2:trek-list'), {'cursor': '', 'page_size': 2, 'format': 'geojson'})
+        json_result = response.json()
+        self.assertEqual(json_result['type'], 'FeatureCollection')
+        self.assertEqual(len(json_result['features']), 2)
+        self.assertIn('cursor=', json_result['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('apiv2:trek-list'), {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+        for values in ({'pk': 1}, ['2022-01-01T00:00:00+00:00', 'foo'], ['2022-01-01T00:00:00+00:00', 1.5],
+                       ['2022-01-01T00:00:00', 1], [1, 1], ['2022-13-01T00:00:00+00:00', 1]):
+            cursor = urlsafe_b64encode(json.dumps(values).encode()).decode()
+            response = self.client.get(reverse('apiv2:trek-list'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.json()['detail'], 'Invalid cursor')
+
+    def test_stream(self):
+        response = self.client.get(reverse('apiv2:trek-list'), {'stream': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        json_result = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(json_result['results']), 5)
+        self.assertEqual(json_result['results'][0]['id'], self.client.get(reverse('apiv2:trek-list')).json()['results'][0]['id'])
+
+    def test_stream_geojson(self):
+        response = self.client.get(reverse('apiv2:trek-list'), {'stream': 'true', 'format': 'geojson'})
+        json_result = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(json_result['type'], 'FeatureCollection')
+        self.assertEqual(len(json_result['features']), 5)
+
+
+class ChangesTestCase(TransactionTestCase):
+    """
+    Changes are logged at commit and served once their transaction is
+    finished: objects are created outside of a test transaction.
+    """
+    def get_changes(self, since, **params):
+        response = self.client.get(reverse('apiv2:changes'), dict(since=since, **params))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_token_without_since(self):
+        trek_factory.TrekFactory.create()
+        response = self.client.get(reverse('apiv2:changes'))
+        self.assertEqual(response.json(), {'token': common_models.ObjectChange.last_token()})
+
+    def test_changes(self):
+        trek = trek_factory.TrekFactory.create()
+        deleted_trek = trek_factory.TrekFactory.create()
+        token = self.client.get(reverse('apiv2:changes')).json()['token']
+        new_trek = trek_factory.TrekFactory.create()
+        trek.name = "Updated"
+        trek.save()
+        deleted_trek.delete()
+        transient_trek = trek_factory.TrekFactory.create()
+        transient_trek.delete()
+        json_result = self.get_changes(token)
+        self.assertFalse(json_result['has_more'])
+        self.assertEqual(json_result['changes']['trek'], {
+            'created': [new_trek.pk],
+            'updated': [trek.pk],
+            'deleted': [deleted_trek.pk],
+        })
+        self.assertEqual(self.get_changes(json_result['token'])['changes'], {})
+
+    def test_changes_by_model(self):
+        trek = trek_factory.TrekFactory.create()
+        content = tourism_factory.TouristicContentFactory.create()
+        json_result = self.get_changes(0, models='touristiccontent')
+        self.assertEqual(json_result['changes'], {
+            'touristiccontent': {'created': [content.pk], 'updated': [], 'deleted': []},
+        })
+        self.assertIn(trek.pk, self.get_changes(0, models='trek,poi')['changes']['trek']['created'])
+
+    def test_transaction_is_not_split(self):
+        token = common_models.ObjectChange.last_token()
+        with transaction.atomic():
+            treks = trek_factory.TrekFactory.create_batch(3)
+        last_trek = trek_factory.TrekFactory.create()
+        changes, token, has_more = common_models.ObjectChange.changes_since(token, ['trek'], 2)
+        self.assertTrue(has_more)
+        self.assertCountEqual(changes['trek']['created'], [trek.pk for trek in treks])
+        changes, token, has_more = common_models.ObjectChange.changes_since(token, ['trek'], 2)
+        self.assertFalse(has_more)
+        self.assertEqual(changes['trek']['created'], [last_trek.pk])
+
+    def test_invalid_token(self):
+        response = self.client.get(reverse('apiv2:changes'), {'since': 'invalid'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalRequestsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.trek = trek_factory.TrekFactory.create()
+
+    def setUp(self):
+        invalidate_api_cache()
+
+    def test_not_modified(self):
+        url = reverse('apiv2:trek-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_modified_after_save(self):
+        url = reverse('apiv2:trek-detail', args=(self.trek.pk, ))
+        etag = self.client.get(url)['ETag']
+        self.trek.name = "Updated"
+        self.trek.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['name']['en'], "Updated")
+
+    def test_etag_depends_on_parameters(self):
+        url = reverse('apiv2:trek-list')
+        self.assertNotEqual(self.client.get(url)['ETag'], self.client.get(url, {'language': 'en'})['ETag'])
+
+    def test_cached_response(self):
+        url = reverse('apiv2:trek-list')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        count = len(context)
+        with CaptureQueriesContext(connection) as context:
+            cached_response = self.client.get(url)
+        self.assertLess(len(context), count)
+        self.assertEqual(cached_response.json(), response.json())
+
+    def test_invalid_pk(self):
+        response = self.client.get(reverse('apiv2:trek-detail', args=('invalid', )))
+        self.assertEqual(response.status_code, 404)
+
+
 class TrekDifficultyFilterCase(TestCase):
     @classmethod
     def setUpTestData(cls):
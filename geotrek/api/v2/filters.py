@@ -11,11 +11,10 @@ from rest_framework.filters import BaseFilterBackend
 from rest_framework_gis.filters import DistanceToPointFilter, InBBOXFilter
 
 from geotrek.common.utils import intersecting
-from geotrek.core.models import Topology
 if 'geotrek.outdoor' in settings.INSTALLED_APPS:
     from geotrek.outdoor.models import Course, Site
 from geotrek.tourism.models import TouristicContent, TouristicContentType, TouristicEvent, TouristicEventType
-from geotrek.trekking.models import ServiceType, Trek, POI
+from geotrek.trekking.models import ServiceType, Trek, TrekRelatedObject, POI
 from geotrek.zoning.models import City, District
 
 
@@ -170,10 +169,7 @@ class GeotrekSensitiveAreaFilter(BaseFilterBackend):
         trek_id = request.GET.get('trek')
         trek = Trek.objects.filter(pk=trek_id)
         if trek:
-            contents_intersecting = intersecting(qs,
-                                                 trek.get(),
-                                                 distance=settings.SENSITIVE_AREA_INTERSECTION_MARGIN)
-            qs = contents_intersecting.order_by('id')
+            qs = TrekRelatedObject.filter_queryset(qs, trek.get()).order_by('id')
         return qs.distinct()
 
     def get_schema_fields(self, view):
@@ -213,10 +209,7 @@ class GeotrekPOIFilter(BaseFilterBackend):
         trek = request.GET.get('trek', None)
         if trek is not None:
             t = Trek.objects.get(pk=trek)
-            if settings.TREKKING_TOPOLOGY_ENABLED:
-                qs = Topology.overlapping(t, qs)
-            else:
-                qs = intersecting(qs, t)
+            qs = TrekRelatedObject.filter_queryset(qs, t)
             qs = qs.exclude(pk__in=t.pois_excluded.all())
         sites = request.GET.get('sites', None)
         if sites is not None:
@@ -818,24 +811,17 @@ class GeotrekSiteFilter(GeotrekZoningAndThemeFilter):
         if root_sites_only:
             # Being a root node <=> having no parent
             queryset = queryset.filter(parent=None)
+        # Sites having the practice or rating themselves or in one of their descendants
+        descendants = queryset.model.objects.filter(tree_id=OuterRef('tree_id'), lft__gte=OuterRef('lft'),
+                                                    lft__lte=OuterRef('rght'))
         practices_in_hierarchy = request.GET.get('practices_in_hierarchy')
-        # TODO Optimize this filter by finding an alternative to queryset iterating
         if practices_in_hierarchy:
             wanted_practices = set(map(int, practices_in_hierarchy.split(',')))
-            for site in queryset:
-                # Exclude if practices in hierarchy don't match any wanted practices
-                found_practices = site.super_practices_id
-                if found_practices.isdisjoint(wanted_practices):
-                    queryset = queryset.exclude(id=site.pk)
-        # TODO Optimize this filter by finding an alternative to queryset iterating
+            queryset = queryset.filter(Exists(descendants.filter(practice__in=wanted_practices)))
         ratings_in_hierarchy = request.GET.get('ratings_in_hierarchy')
         if ratings_in_hierarchy:
             wanted_ratings = set(map(int, ratings_in_hierarchy.split(',')))
-            for site in queryset:
-                # Exclude if ratings in hierarchy don't match any wanted ratings
-                found_ratings = site.super_ratings_id
-                if found_ratings.isdisjoint(wanted_ratings):
-                    queryset = queryset.exclude(id=site.pk)
+            queryset = queryset.filter(Exists(descendants.filter(ratings__in=wanted_ratings)))
         types = request.GET.get('types')
         if types:
             queryset = queryset.filter(type__in=types.split(','))
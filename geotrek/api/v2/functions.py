@@ -35,3 +35,9 @@ class StartPoint(GeoFunc):
 class EndPoint(GeoFunc):
     """ ST_EndPoint postgis function """
     output_field = PointField()
+
+
+class FirstPoint(GeoFunc):
+    """ First point of any geometry (ST_Points then ST_GeometryN postgis functions) """
+    template = 'ST_GeometryN(ST_Points(%(expressions)s), 1)'
+    output_field = PointField()
@@ -1,16 +1,107 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from collections import OrderedDict
 
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
+    """
+    Page number pagination, or keyset pagination on (date_update, id) when
+    ``cursor`` parameter is given (empty for the first page). Keyset pages do
+    not count results and take the same time whatever their position, which
+    suits harvesting of all objects.
+    """
     page_size = 50
     page_size_query_param = 'page_size'
     max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_keys = None
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        return self.paginate_queryset_by_cursor(queryset, request)
+
+    def get_cursor_keys(self, model):
+        try:
+            model._meta.get_field('date_update')
+        except FieldDoesNotExist:
+            return ('pk', )
+        return ('date_update', 'pk')
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, key) for key in self.cursor_keys]
+        if len(values) > 1:
+            values[0] = values[0].isoformat()
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        """
+        Return keys values of ``cursor``, raise NotFound if it was not given
+        by ``encode_cursor()``, as ``CursorPagination`` does.
+        """
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+            if not isinstance(values, list) or len(values) != len(self.cursor_keys):
+                raise ValueError
+            pk = values[-1]
+            if not isinstance(pk, int) or isinstance(pk, bool):
+                raise ValueError
+            if len(values) > 1:
+                if not isinstance(values[0], str):
+                    raise ValueError
+                values[0] = parse_datetime(values[0])
+                if values[0] is None or values[0].tzinfo is None:
+                    raise ValueError
+            return values
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset_by_cursor(self, queryset, request):
+        self.cursor_keys = self.get_cursor_keys(queryset.model)
+        queryset = queryset.order_by(*self.cursor_keys)
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            values = self.decode_cursor(cursor)
+            if len(values) > 1:
+                queryset = queryset.filter(Q(date_update__gt=values[0]) | Q(date_update=values[0], pk__gt=values[1]))
+            else:
+                queryset = queryset.filter(pk__gt=values[0])
+        page_size = self.get_page_size(request)
+        page = list(queryset[:page_size + 1])
+        self.next_cursor = self.encode_cursor(page[page_size - 1]) if len(page) > page_size else None
+        self.page = page[:page_size]
+        return self.page
+
+    def get_next_cursor_link(self):
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
 
     def get_paginated_response(self, data):
-        if self.request.query_params.get('format', 'json') == 'geojson':
+        geojson = self.request.query_params.get('format', 'json') == 'geojson'
+        if self.cursor_keys is not None:
+            if geojson:
+                return Response(OrderedDict([
+                    ('type', 'FeatureCollection'),
+                    ('next', self.get_next_cursor_link()),
+                    ('features', data['features'])
+                ]))
+            return Response(OrderedDict([
+                ('next', self.get_next_cursor_link()),
+                ('results', data)
+            ]))
+        if geojson:
             return Response(OrderedDict([
                 ('type', 'FeatureCollection'),
                 ('count', self.page.paginator.count),
@@ -674,13 +674,19 @@ if 'geotrek.trekking' in settings.INSTALLED_APPS:
         def get_points_reference(self, obj):
             if not obj.points_reference:
                 return None
-            geojson = obj.points_reference.transform(settings.API_SRID, clone=True).geojson
+            if hasattr(obj, 'points_reference_transformed'):
+                geojson = obj.points_reference_transformed.geojson
+            else:
+                geojson = obj.points_reference.transform(settings.API_SRID, clone=True).geojson
             return json.loads(geojson)
 
         def get_cities(self, obj):
             return [city.code for city in obj.published_cities]
 
         def get_departure_city(self, obj):
+            if hasattr(obj, 'departure_city_code'):
+                # Annotated by TrekViewSet
+                return obj.departure_city_code
             geom = self.get_first_point(obj.geom)
             city = zoning_models.City.objects.all().filter(geom__contains=geom).first()
             return city.code if city else None
@@ -713,12 +719,16 @@ if 'geotrek.trekking' in settings.INSTALLED_APPS:
             return obj.count_children
 
         def get_steps(self, obj):
-            qs = obj.children \
-                .select_related('topo_object', 'difficulty') \
-                .prefetch_related('topo_object__aggregations', 'themes', 'networks', 'attachments') \
-                .annotate(geom3d_transformed=Transform(F('geom_3d'), settings.API_SRID),
-                          length_2d_m=Length('geom'),
-                          length_3d_m=Length3D('geom_3d'))
+            if hasattr(obj, 'prefetched_steps'):
+                # Prefetched by TourViewSet
+                qs = [relation.child for relation in obj.prefetched_steps]
+            else:
+                qs = obj.children \
+                    .select_related('topo_object', 'difficulty') \
+                    .prefetch_related('topo_object__aggregations', 'themes', 'networks', 'attachments') \
+                    .annotate(geom3d_transformed=Transform(F('geom_3d'), settings.API_SRID),
+                              length_2d_m=Length('geom'),
+                              length_3d_m=Length3D('geom_3d'))
             FinalClass = override_serializer(self.context.get('request').GET.get('format'),
                                              TrekSerializer)
             return FinalClass(qs, many=True, context=self.context).data
@@ -85,6 +85,7 @@ if 'drf_yasg' in settings.INSTALLED_APPS:
     _urlpatterns.append(path('', api_views.schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'))
 _urlpatterns += [
     path('config/', api_views.ConfigView.as_view(), name='config'),
+    path('changes/', api_views.ChangesView.as_view(), name='changes'),
     path('sportpractice/', RedirectView.as_view(pattern_name='apiv2:sportpractice-list', permanent=True)),
     path('sportpractice/<int:pk>/', RedirectView.as_view(pattern_name='apiv2:sportpractice-detail', permanent=True)),
     path('version', api_views.GeotrekVersionAPIView.as_view()),
@@ -1,3 +1,5 @@
+import uuid
+
 from django.conf import settings
 from django.core.cache import caches
 from rest_framework.response import Response
@@ -40,6 +42,29 @@ def build_url(serializer, url):
     return url
 
 
+API_CACHE_VERSION_KEY = 'api_v2_version'
+
+
+def get_api_cache():
+    return caches[settings.MAPENTITY_CONFIG['GEOJSON_LAYERS_CACHE_BACKEND']]
+
+
+def get_api_cache_version():
+    """
+    Return version of API responses, changed each time an object is saved.
+    """
+    cache = get_api_cache()
+    version = cache.get(API_CACHE_VERSION_KEY)
+    if version is None:
+        cache.add(API_CACHE_VERSION_KEY, uuid.uuid4().hex)
+        version = cache.get(API_CACHE_VERSION_KEY)
+    return version
+
+
+def invalidate_api_cache():
+    get_api_cache().delete(API_CACHE_VERSION_KEY)
+
+
 def build_response_from_cache(cache_lookup, data_func, content_type):
     # Choose adequate cache
     if content_type == "application/json":
@@ -1,10 +1,13 @@
 from rest_framework import response, permissions
+from rest_framework.exceptions import ParseError
 from rest_framework.views import APIView
 
 from django.conf import settings
 from django.contrib.gis.geos import Polygon
 
 from geotrek import __version__
+from geotrek.api.v2.viewsets import GeotrekViewSet
+from geotrek.common.models import ObjectChange
 from .authent import StructureViewSet  # noqa
 from .common import TargetPortalViewSet, ThemeViewSet, SourceViewSet, ReservationSystemViewSet, LabelViewSet, OrganismViewSet  # noqa
 if 'geotrek.core' in settings.INSTALLED_APPS:
@@ -56,3 +59,31 @@ class GeotrekVersionAPIView(APIView):
 
     def get(self, request, *args, **kwargs):
         return response.Response({'version': __version__})
+
+
+class ChangesView(APIView):
+    """
+    Ids of objects created, updated or deleted since the token given with
+    ``since`` parameter, by model (``models`` parameter, comma separated).
+    Without ``since``, only the current token is returned.
+    """
+    permission_classes = GeotrekViewSet.permission_classes
+    authentication_classes = GeotrekViewSet.authentication_classes
+    max_changes = 10000
+
+    def get(self, request, *args, **kwargs):
+        since = request.query_params.get('since')
+        if not since:
+            return response.Response({'token': ObjectChange.last_token()})
+        try:
+            since = int(since)
+        except ValueError:
+            raise ParseError("Invalid token")
+        model_names = request.query_params.get('models')
+        model_names = model_names.split(',') if model_names else None
+        changes, token, has_more = ObjectChange.changes_since(since, model_names, self.max_changes)
+        return response.Response({
+            'token': token,
+            'has_more': has_more,
+            'changes': changes,
+        })
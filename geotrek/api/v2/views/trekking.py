@@ -1,6 +1,6 @@
 from django.conf import settings
 from django.contrib.gis.db.models.functions import Transform
-from django.db.models import F, Prefetch, Q
+from django.db.models import F, OuterRef, Prefetch, Q, Subquery
 from django.db.models.aggregates import Count
 from django.http import Http404
 from django.shortcuts import get_object_or_404
@@ -11,12 +11,14 @@ from rest_framework.response import Response
 from geotrek.api.v2 import filters as api_filters
 from geotrek.api.v2 import serializers as api_serializers
 from geotrek.api.v2 import viewsets as api_viewsets
-from geotrek.api.v2.functions import Length3D
+from geotrek.api.v2.functions import FirstPoint, Length3D
 from geotrek.common.functions import Length
 from geotrek.common.models import Attachment, AccessibilityAttachment
 from geotrek.api.v2.renderers import SVGProfileRenderer
 from geotrek.api.v2.utils import build_response_from_cache
 from geotrek.trekking import models as trekking_models
+from geotrek.zoning import models as zoning_models
+from geotrek.zoning.mixins import prefetch_zoning
 
 
 class WebLinkCategoryViewSet(api_viewsets.GeotrekViewSet):
@@ -35,9 +37,20 @@ class TrekViewSet(api_viewsets.GeotrekGeometricViewset):
 
     def get_queryset(self):
         activate(self.request.GET.get('language'))
-        return trekking_models.Trek.objects.existing() \
+        return self.prepare_queryset(trekking_models.Trek.objects.existing()) \
+            .order_by("name")  # Required for reliable pagination
+
+    def prepare_queryset(self, queryset):
+        """
+        Fetch everything serialized for the treks with a constant number of queries,
+        whatever the number of treks.
+        """
+        departure_cities = zoning_models.City.objects.filter(geom__contains=OuterRef('departure_point'))
+        return queryset \
             .select_related('topo_object') \
-            .prefetch_related('topo_object__aggregations', 'accessibilities',
+            .prefetch_related('topo_object__aggregations', 'accessibilities', 'information_desks', 'labels',
+                              'networks', 'portal', 'ratings', 'source', 'themes',
+                              'trek_children', 'trek_parents__parent__trek_children',
                               Prefetch('attachments',
                                        queryset=Attachment.objects.select_related('license')),
                               Prefetch('attachments_accessibility',
@@ -46,8 +59,10 @@ class TrekViewSet(api_viewsets.GeotrekGeometricViewset):
                                        queryset=trekking_models.WebLink.objects.select_related('category'))) \
             .annotate(geom3d_transformed=Transform(F('geom_3d'), settings.API_SRID),
                       length_2d_m=Length('geom'),
-                      length_3d_m=Length3D('geom_3d')) \
-            .order_by("name")  # Required for reliable pagination
+                      length_3d_m=Length3D('geom_3d'),
+                      points_reference_transformed=Transform(F('points_reference'), settings.API_SRID),
+                      departure_point=FirstPoint('geom')) \
+            .annotate(departure_city_code=Subquery(departure_cities.values('code')[:1]))
 
     def retrieve(self, request, pk=None, format=None):
         # Return detail view even for unpublished treks that are childrens of other published treks
@@ -107,8 +122,18 @@ class TourViewSet(TrekViewSet):
         qs = super().get_queryset()
         qs = qs.annotate(count_children=Count('trek_children'))\
             .filter(count_children__gt=0)
+        # Fetch steps of all tours at once (see TourSerializer.get_steps())
+        steps = trekking_models.OrderedTrekChild.objects.filter(child__deleted=False).select_related(None).prefetch_related(
+            Prefetch('child', queryset=self.prepare_queryset(trekking_models.Trek.objects.all()))
+        )
+        qs = qs.prefetch_related(Prefetch('trek_children', queryset=steps, to_attr='prefetched_steps'))
         return qs
 
+    def prefetch_objects(self, objs):
+        super().prefetch_objects(objs)
+        # Resolve cities of steps of the whole page at once
+        prefetch_zoning([relation.child for tour in objs for relation in tour.prefetched_steps])
+
 
 class PracticeViewSet(api_viewsets.GeotrekViewSet):
     filter_backends = api_viewsets.GeotrekViewSet.filter_backends + (api_filters.TrekRelatedPortalFilter,)
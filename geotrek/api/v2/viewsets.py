@@ -1,12 +1,25 @@
+import json
+from calendar import timegm
+from hashlib import md5
+from itertools import islice
+
 from django_filters.rest_framework.backends import DjangoFilterBackend
 from rest_framework import viewsets, renderers
 from rest_framework.authentication import BasicAuthentication, SessionAuthentication
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
 
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Count, Max, prefetch_related_objects
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
 
 from geotrek.api.v2 import pagination as api_pagination, filters as api_filters
 from geotrek.api.v2.serializers import override_serializer
+from geotrek.api.v2.utils import get_api_cache, get_api_cache_version
+from geotrek.zoning.mixins import ZoningPropertiesMixin, prefetch_zoning
 from mapentity.renderers import GeoJSONRenderer
 
 
@@ -20,6 +33,8 @@ class GeotrekViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticatedOrReadOnly, ] if settings.API_IS_PUBLIC else [IsAuthenticated, ]
     authentication_classes = [BasicAuthentication, SessionAuthentication]
     renderer_classes = [renderers.JSONRenderer, renderers.BrowsableAPIRenderer, ] if settings.DEBUG else [renderers.JSONRenderer, ]
+    stream_query_param = 'stream'
+    stream_chunk_size = 500
 
     def get_serializer_context(self):
         return {
@@ -27,6 +42,115 @@ class GeotrekViewSet(viewsets.ReadOnlyModelViewSet):
             'kwargs': self.kwargs
         }
 
+    def prefetch_objects(self, objs):
+        """
+        Fetch data shared by serializations of ``objs`` at once.
+        """
+        if objs and isinstance(objs[0], ZoningPropertiesMixin):
+            # Resolve cities of the whole page at once
+            prefetch_zoning(objs)
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            self.prefetch_objects(page)
+        return page
+
+    def get_validators(self, queryset):
+        """
+        Return ETag and last update date of the response serializing
+        ``queryset``, which change with its objects, the request URL and
+        language, and the API cache version.
+        """
+        aggregates = {'count': Count('pk')}
+        try:
+            queryset.model._meta.get_field('date_update')
+            aggregates['last_update'] = Max('date_update')
+        except FieldDoesNotExist:
+            pass
+        # Annotations of queryset are not computed
+        values = queryset.model._base_manager.filter(pk__in=queryset.values('pk')).aggregate(**aggregates)
+        last_update = values.get('last_update')
+        key = [
+            self.request.build_absolute_uri(),
+            self.request.accepted_renderer.format,
+            get_language(),
+            values['count'],
+            last_update.isoformat() if last_update else None,
+            get_api_cache_version(),
+        ]
+        return md5(json.dumps(key).encode()).hexdigest(), last_update
+
+    def get_cached_response(self, queryset, get_response):
+        """
+        Answer conditional requests for ``queryset``, or return rendered
+        response from cache, or from ``get_response()`` (cached when
+        rendered, see ``finalize_response()``).
+        """
+        etag, last_update = self.get_validators(queryset)
+        last_modified = timegm(last_update.utctimetuple()) if last_update else None
+        response = get_conditional_response(self.request, etag=quote_etag(etag), last_modified=last_modified)
+        if response is None:
+            cache_key = 'api_v2_response_{}'.format(etag)
+            cached = get_api_cache().get(cache_key)
+            if cached is not None:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+            else:
+                response = get_response()
+                response.api_cache_key = cache_key
+        response['ETag'] = quote_etag(etag)
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        cache_key = getattr(response, 'api_cache_key', None)
+        if cache_key and response.status_code == 200 and request.accepted_renderer.format != 'api':
+            response.render()
+            get_api_cache().set(cache_key, (response.content, response['Content-Type']))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if request.query_params.get(self.stream_query_param, '').lower() in ('1', 'true'):
+            return StreamingHttpResponse(self.stream_list(queryset), content_type='application/json')
+        return self.get_cached_response(queryset, lambda: super(GeotrekViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, ValidationError):
+            # Invalid lookup value, answered by a 404 error
+            return super().retrieve(request, *args, **kwargs)
+        return self.get_cached_response(queryset, lambda: super(GeotrekViewSet, self).retrieve(request, *args, **kwargs))
+
+    def stream_list(self, queryset):
+        """
+        Yield JSON of all objects of ``queryset``, read from a server-side
+        cursor and serialized by chunks, without pagination.
+        """
+        geojson = self.request.query_params.get('format', 'json') == 'geojson'
+        renderer = renderers.JSONRenderer()
+        # Prefetches are ignored by iterator(), they are done for each chunk
+        lookups = queryset._prefetch_related_lookups
+        iterator = queryset.iterator(chunk_size=self.stream_chunk_size)
+        yield b'{"type":"FeatureCollection","features":[' if geojson else b'{"results":['
+        separator = b''
+        while True:
+            objs = list(islice(iterator, self.stream_chunk_size))
+            if not objs:
+                break
+            prefetch_related_objects(objs, *lookups)
+            self.prefetch_objects(objs)
+            data = self.get_serializer(objs, many=True).data
+            for item in data['features'] if geojson else data:
+                yield separator + renderer.render(item)
+                separator = b','
+        yield b']}'
+
 
 class GeotrekGeometricViewset(GeotrekViewSet):
     filter_backends = GeotrekViewSet.filter_backends + (
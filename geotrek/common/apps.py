@@ -1,4 +1,5 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
 from django.utils.translation import gettext_lazy as _
 
 
@@ -8,3 +9,12 @@ class CommonConfig(AppConfig):
 
     def ready(self):
         import geotrek.common.lookups  # NOQA
+        from mapentity.models import MapEntityMixin
+        from .signals import invalidate_object_tiles, remember_computed_tile_geom, remember_tile_geom
+
+        for model in apps.get_models():
+            if issubclass(model, MapEntityMixin):
+                post_init.connect(remember_tile_geom, sender=model)
+                pre_save.connect(remember_computed_tile_geom, sender=model)
+                post_save.connect(invalidate_object_tiles, sender=model)
+                post_delete.connect(invalidate_object_tiles, sender=model)
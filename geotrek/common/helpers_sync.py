@@ -1,5 +1,10 @@
 import logging
+import os
 import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
 
 from django.conf import settings
 from landez import TilesManager
@@ -7,26 +12,83 @@ from landez.sources import DownloadError
 
 from geotrek.common import models
 from geotrek.common import views
+from geotrek.common.utils.tiles import corridor_tiles
 
 logger = logging.getLogger(__name__)
 
 
+class TilesStore:
+    """
+    Tiles shared by all tiles files, fetched once and kept for next syncs in
+    a MBTiles file. Identical tiles (empty areas…) are stored once.
+    """
+    def __init__(self, tiles_dir, tiles_urls):
+        os.makedirs(tiles_dir, exist_ok=True)
+        name = md5(' '.join(tiles_urls).encode()).hexdigest()
+        self.path = os.path.join(tiles_dir, '{}.mbtiles'.format(name))
+        # Several sync processes may share the store
+        self.connection = sqlite3.connect(self.path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT);
+                CREATE TABLE IF NOT EXISTS map (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER,
+                                                tile_id TEXT, PRIMARY KEY (zoom_level, tile_column, tile_row));
+                CREATE TABLE IF NOT EXISTS images (tile_id TEXT PRIMARY KEY, tile_data BLOB);
+                CREATE VIEW IF NOT EXISTS tiles AS
+                    SELECT zoom_level, tile_column, tile_row, tile_data
+                    FROM map JOIN images ON images.tile_id = map.tile_id;
+            """)
+
+    def get(self, tile):
+        z, x, y = tile
+        row = self.connection.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, 2 ** z - 1 - y)
+        ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def put(self, tile, data):
+        z, x, y = tile
+        tile_id = md5(data).hexdigest()
+        self.connection.execute("INSERT OR IGNORE INTO images (tile_id, tile_data) VALUES (?, ?)",
+                                (tile_id, sqlite3.Binary(data)))
+        self.connection.execute("INSERT OR REPLACE INTO map (zoom_level, tile_column, tile_row, tile_id) "
+                                "VALUES (?, ?, ?, ?)", (z, x, 2 ** z - 1 - y, tile_id))
+
+    def commit(self):
+        self.connection.commit()
+
+
 class ZipTilesBuilder:
-    def __init__(self, zipfile, prefix="", **builder_args):
+    def __init__(self, zipfile, prefix="", store=None, workers=1, **builder_args):
         self.zipfile = zipfile
         self.prefix = prefix
-        builder_args['tile_format'] = self.format_from_url(builder_args['tiles_url'])
-        self.tm = TilesManager(**builder_args)
-
-        if not isinstance(settings.MOBILE_TILES_URL, str) and len(settings.MOBILE_TILES_URL) > 1:
-            for url in settings.MOBILE_TILES_URL[1:]:
-                args = builder_args
-                args['tiles_url'] = url
-                args['tile_format'] = self.format_from_url(args['tiles_url'])
-                self.tm.add_layer(TilesManager(**args), opacity=1)
-
+        self.store = store
+        self.workers = workers
+        if store is not None:
+            # Tiles are already kept in store
+            builder_args['cache'] = False
+        self.builder_args = builder_args
+        # landez tiles managers are not shared between threads
+        self.local = threading.local()
+        self.tm = self.get_tiles_manager()
         self.tiles = set()
 
+    def get_tiles_manager(self):
+        if not hasattr(self.local, 'tm'):
+            builder_args = dict(self.builder_args)
+            builder_args['tile_format'] = self.format_from_url(builder_args['tiles_url'])
+            tm = TilesManager(**builder_args)
+            if not isinstance(settings.MOBILE_TILES_URL, str) and len(settings.MOBILE_TILES_URL) > 1:
+                for url in settings.MOBILE_TILES_URL[1:]:
+                    args = dict(builder_args)
+                    args['tiles_url'] = url
+                    args['tile_format'] = self.format_from_url(args['tiles_url'])
+                    tm.add_layer(TilesManager(**args), opacity=1)
+            self.local.tm = tm
+        return self.local.tm
+
     def format_from_url(self, url):
         """
         Try to guess the tile mime type from the tiles URL.
@@ -41,16 +103,45 @@ class ZipTilesBuilder:
     def add_coverage(self, bbox, zoomlevels):
         self.tiles |= set(self.tm.tileslist(bbox, zoomlevels))
 
+    def add_corridor_coverage(self, geom, radius, zoomlevels):
+        self.tiles |= corridor_tiles(geom, radius, zoomlevels)
+
+    def fetch(self, tile):
+        try:
+            return self.get_tiles_manager().tile(tile)
+        except DownloadError:
+            return None
+
+    def fetch_all(self, tiles):
+        """
+        Yield tiles with their data, read from store or fetched by
+        ``workers`` threads.
+        """
+        missing = []
+        for tile in tiles:
+            data = self.store.get(tile) if self.store is not None else None
+            if data is None:
+                missing.append(tile)
+            else:
+                yield tile, data
+        with ThreadPoolExecutor(self.workers) as executor:
+            for i, (tile, data) in enumerate(zip(missing, executor.map(self.fetch, missing))):
+                if data is not None and self.store is not None:
+                    self.store.put(tile, data)
+                    if i % 100 == 99:
+                        self.store.commit()
+                yield tile, data
+        if self.store is not None:
+            self.store.commit()
+
     def run(self):
-        for tile in self.tiles:
+        for tile, data in self.fetch_all(sorted(self.tiles)):
             name = '{prefix}{0}/{1}/{2}{ext}'.format(
                 *tile,
                 prefix=self.prefix,
                 ext=settings.MOBILE_TILES_EXTENSION or self.tm._tile_extension
             )
-            try:
-                data = self.tm.tile(tile)
-            except DownloadError:
+            if data is None:
                 logger.warning("Failed to download tile %s" % name)
             else:
                 self.zipfile.writestr(name, data)
@@ -15,6 +15,7 @@ class Command(BaseCommand):
         parser.add_argument('shapefile', nargs="?")
         parser.add_argument('-l', dest='limit', type=int, help='Limit number of lines to import')
         parser.add_argument('--encoding', '-e', default='utf8')
+        parser.add_argument('--resume', action='store_true', help='Resume a failed import from its last checkpoint')
 
     def handle(self, *args, **options):
         verbosity = options['verbosity']
@@ -52,7 +53,7 @@ class Command(BaseCommand):
         parser = Parser(progress_cb=progress_cb, encoding=encoding)
 
         try:
-            parser.parse(options['shapefile'], limit=limit)
+            parser.parse(options['shapefile'], limit=limit, resume=options['resume'])
         except ImportError as e:
             raise CommandError(e)
 
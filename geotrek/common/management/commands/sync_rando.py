@@ -1,6 +1,8 @@
 import argparse
+import hashlib
+import json
 import logging
-import filecmp
+import multiprocessing
 import os
 import shutil
 from time import sleep
@@ -9,6 +11,7 @@ from zipfile import ZipFile
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 from django.db.models import Q
 from django.http import StreamingHttpResponse
 from django.test.client import RequestFactory
@@ -46,8 +49,24 @@ from geotrek.tourism import urls  # NOQA
 
 logger = logging.getLogger(__name__)
 
+# Command running in worker processes, see ``Command.sync_parallel()``
+_sync_command = None
+
+
+def _sync_language(lang):
+    command = _sync_command
+    command.successfull = True
+    command.manifest = {}
+    command.sync_language(lang)
+    command.stdout.flush()
+    return lang, command.successfull, command.manifest
+
 
 class Command(BaseCommand):
+    # Output files of this run and of previous one, see ``load_manifest()``
+    manifest = None
+    old_manifest = {}
+
     def add_arguments(self, parser):
         parser.add_argument('path')
         parser.add_argument('--url', '-u', dest='url', default='http://localhost', help='Base url')
@@ -59,6 +78,8 @@ class Command(BaseCommand):
                             help='Skip generation of PDF files')
         parser.add_argument('--skip-tiles', '-t', action='store_true', dest='skip_tiles', default=False,
                             help='Skip generation of zip tiles files')
+        parser.add_argument('--tiles-workers', dest='tiles_workers', type=int, default=1,
+                            help='Number of threads used to download tiles')
         parser.add_argument('--skip-dem', '-d', action='store_true', dest='skip_dem', default=False,
                             help='Skip generation of DEM files for 3D')
         parser.add_argument('--skip-profile-png', '-e', action='store_true', dest='skip_profile_png', default=False,
@@ -75,12 +96,15 @@ class Command(BaseCommand):
                             default=False, help='include infrastructures')
         parser.add_argument('--with-dives', action='store_true', dest='with_dives',
                             default=False, help='include dives')
+        parser.add_argument('--processes', dest='processes', type=int, default=1,
+                            help='Number of processes used to sync languages in parallel')
+        parser.add_argument('--full', action='store_true', dest='full', default=False,
+                            help='Render all objects again, even unchanged ones since last sync')
         parser.add_argument('--task', default=None, help=argparse.SUPPRESS)
 
     def mkdirs(self, name):
         dirname = os.path.dirname(name)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
+        os.makedirs(dirname, exist_ok=True)
 
     def get_params_portal(self, params):
         if self.portal:
@@ -121,35 +145,62 @@ class Command(BaseCommand):
 
         trek_file = os.path.join(self.tmp_root, zipname)
 
-        def _radius2bbox(lng, lat, radius):
-            return (lng - radius, lat - radius,
-                    lng + radius, lat + radius)
-
         self.mkdirs(trek_file)
 
         zipfile = ZipFile(trek_file, 'w')
         tiles = common_sync.ZipTilesBuilder(zipfile, **self.builder_args)
-
-        geom = trek.geom
-        if geom.geom_type == 'MultiLineString':
-            geom = geom[0]  # FIXME
-        geom.transform(4326)
-
-        for (lng, lat) in geom.coords:
-            large = _radius2bbox(lng, lat, settings.MOBILE_TILES_RADIUS_LARGE)
-            small = _radius2bbox(lng, lat, settings.MOBILE_TILES_RADIUS_SMALL)
-            tiles.add_coverage(bbox=large, zoomlevels=settings.MOBILE_TILES_LOW_ZOOMS)
-            tiles.add_coverage(bbox=small, zoomlevels=settings.MOBILE_TILES_HIGH_ZOOMS)
+        # Tiles along the trek, the closest ones up to the highest zoom levels
+        tiles.add_corridor_coverage(trek.geom, settings.MOBILE_TILES_RADIUS_LARGE, settings.MOBILE_TILES_LOW_ZOOMS)
+        tiles.add_corridor_coverage(trek.geom, settings.MOBILE_TILES_RADIUS_SMALL, settings.MOBILE_TILES_HIGH_ZOOMS)
 
         tiles.run()
         self.close_zip(zipfile, zipname)
 
-    def sync_view(self, lang, view, name, url='/', params={}, zipfile=None, fix2028=False, **kwargs):
+    def sync_view(self, lang, view, name, url='/', params={}, zipfile=None, fix2028=False, stamp=None, **kwargs):
+        """
+        Render view into ``name`` file. If ``stamp`` (a signature of the rendered object and of its related objects)
+        did not change since previous sync, the previous file is kept without rendering the view.
+        """
         if self.verbosity == 2:
             self.stdout.write("{lang} {name} ...".format(lang=lang, name=name), ending="")
             self.stdout._out.flush()
         fullname = os.path.join(self.tmp_root, name)
+        oldfilename = os.path.join(self.dst_root, name)
+        old = self.old_manifest.get(name)
         self.mkdirs(fullname)
+        if os.path.isfile(fullname):
+            # Already synced for another object
+            if self.verbosity == 2:
+                self.stdout.write("unchanged")
+        elif stamp is not None and old and old['stamp'] == stamp and os.path.isfile(oldfilename):
+            os.link(oldfilename, fullname)
+            if self.manifest is not None:
+                self.manifest[name] = old
+            if self.verbosity == 2:
+                self.stdout.write("unchanged")
+        else:
+            content = self.render_view(lang, view, url, params, fix2028, **kwargs)
+            if content is None:
+                return
+            digest = hashlib.sha1(content).hexdigest()
+            if self.manifest is not None:
+                self.manifest[name] = {'stamp': stamp, 'hash': digest}
+            # If new file is identical to old one, don't recreate it. This will help backup
+            if os.path.isfile(oldfilename) and (old['hash'] == digest if old else self.read_file(oldfilename) == content):
+                os.link(oldfilename, fullname)
+                if self.verbosity == 2:
+                    self.stdout.write("unchanged")
+            else:
+                with open(fullname, 'wb') as f:
+                    f.write(content)
+                if self.verbosity == 2:
+                    self.stdout.write("generated")
+        # FixMe: Find why there are duplicate files.
+        if zipfile:
+            if name not in zipfile.namelist():
+                zipfile.write(fullname, name)
+
+    def render_view(self, lang, view, url, params, fix2028, **kwargs):
         request = self.factory.get(url, params, HTTP_HOST=self.host, secure=self.secure)
         request.LANGUAGE_CODE = lang
         request.user = AnonymousUser()
@@ -163,13 +214,12 @@ class Command(BaseCommand):
                 self.stdout.write("\x1b[3D\x1b[31mfailed ({})\x1b[0m".format(e))
             if settings.DEBUG:
                 raise
-            return
+            return None
         if response.status_code != 200:
             self.successfull = False
             if self.verbosity > 0:
                 self.stderr.write(self.style.ERROR("failed (HTTP {code})".format(code=response.status_code)))
-            return
-        f = open(fullname, 'wb')
+            return None
         if isinstance(response, StreamingHttpResponse):
             content = b''.join(response.streaming_content)
         else:
@@ -178,22 +228,11 @@ class Command(BaseCommand):
         if fix2028:
             content = content.replace(b'\\u2028', b'\\n')
             content = content.replace(b'\\u2029', b'\\n')
-        f.write(content)
-        f.close()
-        oldfilename = os.path.join(self.dst_root, name)
-        # If new file is identical to old one, don't recreate it. This will help backup
-        if os.path.isfile(oldfilename) and filecmp.cmp(fullname, oldfilename):
-            os.unlink(fullname)
-            os.link(oldfilename, fullname)
-            if self.verbosity == 2:
-                self.stdout.write("unchanged")
-        else:
-            if self.verbosity == 2:
-                self.stdout.write("generated")
-        # FixMe: Find why there are duplicate files.
-        if zipfile:
-            if name not in zipfile.namelist():
-                zipfile.write(fullname, name)
+        return content
+
+    def read_file(self, filename):
+        with open(filename, 'rb') as f:
+            return f.read()
 
     def sync_json(self, lang, viewset, name, zipfile=None, params={}, as_view_args=[], **kwargs):
         view = viewset.as_view(*as_view_args)
@@ -216,35 +255,36 @@ class Command(BaseCommand):
 
         self.sync_view(lang, view, name, params=params, zipfile=zipfile, fix2028=True, **kwargs)
 
-    def sync_object_view(self, lang, obj, view, basename_fmt, zipfile=None, params={}, **kwargs):
+    def sync_object_view(self, lang, obj, view, basename_fmt, zipfile=None, params={}, stamp=None, **kwargs):
         translation.activate(lang)
         modelname = obj._meta.model_name
         name = os.path.join('api', lang, '{modelname}s'.format(modelname=modelname), str(obj.pk),
                             basename_fmt.format(obj=obj))
-        self.sync_view(lang, view, name, params=params, zipfile=zipfile, pk=obj.pk, **kwargs)
+        self.sync_view(lang, view, name, params=params, zipfile=zipfile, stamp=stamp, pk=obj.pk, **kwargs)
         translation.deactivate()
 
-    def sync_profile_json(self, lang, obj, zipfile=None):
-        view = ElevationProfile.as_view(model=type(obj))
-        self.sync_object_view(lang, obj, view, 'profile.json', zipfile=zipfile)
+    def sync_profile_json(self, lang, obj, zipfile=None, profiles=None, stamp=None):
+        view = ElevationProfile.as_view(model=type(obj), profiles=profiles)
+        self.sync_object_view(lang, obj, view, 'profile.json', zipfile=zipfile, stamp=stamp)
 
-    def sync_profile_png(self, lang, obj, zipfile=None):
+    def sync_profile_png(self, lang, obj, zipfile=None, stamp=None):
         view = serve_elevation_chart
         model_name = type(obj)._meta.model_name
-        self.sync_object_view(lang, obj, view, 'profile.png', zipfile=zipfile, model_name=model_name, from_command=True)
+        self.sync_object_view(lang, obj, view, 'profile.png', zipfile=zipfile, stamp=stamp, model_name=model_name,
+                              from_command=True)
 
-    def sync_dem(self, lang, obj):
+    def sync_dem(self, lang, obj, stamp=None):
         if self.skip_dem:
             return
         view = ElevationArea.as_view(model=type(obj))
-        self.sync_object_view(lang, obj, view, 'dem.json')
+        self.sync_object_view(lang, obj, view, 'dem.json', stamp=stamp)
 
-    def sync_metas(self, lang, metaview, obj=None):
+    def sync_metas(self, lang, metaview, obj=None, stamp=None):
         params = {'rando_url': self.rando_url, 'lang': lang}
         self.get_params_portal(params)
         if obj:
             name = os.path.join('meta', lang, obj.rando_url, 'index.html')
-            self.sync_view(lang, metaview.as_view(), name, pk=obj.pk, params=params)
+            self.sync_view(lang, metaview.as_view(), name, pk=obj.pk, params=params, stamp=stamp)
         else:
             name = os.path.join('meta', lang, 'index.html')
             self.sync_view(lang, metaview.as_view(), name, params=params)
@@ -260,7 +300,11 @@ class Command(BaseCommand):
                 self.stdout.write("\x1b[36m{lang}\x1b[0m \x1b[1m{url}/{name}\x1b[0m \x1b[31mfile does not exist\x1b[0m".format(lang=lang, url=url, name=name))
             return
         if not os.path.isfile(dst):
-            os.link(src, dst)
+            try:
+                os.link(src, dst)
+            except FileExistsError:
+                # Linked meanwhile by another process
+                pass
         if zipfile:
             zipfile.write(dst, os.path.join(url, name))
         if self.verbosity == 2:
@@ -351,7 +395,7 @@ class Command(BaseCommand):
                     }
                 )
 
-    def sync_pdf(self, lang, obj, view):
+    def sync_pdf(self, lang, obj, view, stamp=None):
         if self.skip_pdf:
             return
         try:
@@ -377,7 +421,7 @@ class Command(BaseCommand):
             if self.source:
                 params['source'] = self.source[0]
             self.get_params_portal(params)
-            self.sync_object_view(lang, obj, view, '{obj.slug}.pdf', params=params, slug=obj.slug)
+            self.sync_object_view(lang, obj, view, '{obj.slug}.pdf', params=params, stamp=stamp, slug=obj.slug)
 
     def sync(self):
         step_value = int(50 / len(settings.MODELTRANSLATION_LANGUAGES))
@@ -398,43 +442,97 @@ class Command(BaseCommand):
             subcommands.append(tourism_sync.SyncRando(self))
         if 'geotrek.sensitivity' in settings.INSTALLED_APPS:
             subcommands.append(sensitivity_sync.SyncRando(self))
-        for subcommand in subcommands:
+        self.subcommands = subcommands
+        if self.processes > 1:
+            self.sync_parallel(current_value, step_value)
+        else:
             for lang in self.languages:
-                if self.celery_task:
-                    self.celery_task.update_state(
-                        state='PROGRESS',
-                        meta={
-                            'name': self.celery_task.name,
-                            'current': current_value + step_value,
-                            'total': 100,
-                            'infos': "{} : {} ...".format(_("Language"), lang)
-                        }
-                    )
-                    current_value = current_value + step_value
-
-                zipname = os.path.join('zip', 'treks', lang, 'global.zip')
-                zipfullname = os.path.join(self.tmp_root, zipname)
-                self.mkdirs(zipfullname)
-                self.zipfile = ZipFile(zipfullname, 'w')
-
-                translation.activate(lang)
-                subcommand.sync(lang)
-                translation.deactivate()
-
-                if self.verbosity == 2:
-                    self.stdout.write("{lang} {name} ...".format(lang=lang, name=zipname), ending="")
-
-                self.close_zip(self.zipfile, zipname)
+                current_value = current_value + step_value
+                self.update_progress(current_value, lang)
+                self.sync_language(lang)
 
         self.sync_static_file('**', 'tourism/touristicevent.svg')
         self.sync_pictograms('**', [tourism_models.InformationDeskType, tourism_models.TouristicContentCategory,
                                     tourism_models.TouristicContentType, tourism_models.TouristicEventType])
 
+    def sync_language(self, lang):
+        for subcommand in self.subcommands:
+            zipname = os.path.join('zip', 'treks', lang, 'global.zip')
+            zipfullname = os.path.join(self.tmp_root, zipname)
+            self.mkdirs(zipfullname)
+            self.zipfile = ZipFile(zipfullname, 'w')
+
+            translation.activate(lang)
+            subcommand.sync(lang)
+            translation.deactivate()
+
+            if self.verbosity == 2:
+                self.stdout.write("{lang} {name} ...".format(lang=lang, name=zipname), ending="")
+
+            self.close_zip(self.zipfile, zipname)
+
+    def sync_parallel(self, current_value, step_value):
+        """
+        Sync each language in its own process. Languages write distinct files, so each zip file
+        is still assembled by a single process, in the same order as sequential sync.
+        """
+        global _sync_command
+        _sync_command = self
+        # Worker processes must not share database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(min(self.processes, len(self.languages))) as pool:
+            for lang, successfull, manifest in pool.imap_unordered(_sync_language, self.languages):
+                self.successfull = self.successfull and successfull
+                self.manifest.update(manifest)
+                current_value = current_value + step_value
+                self.update_progress(current_value, lang)
+        _sync_command = None
+
+    def update_progress(self, current_value, lang):
+        if self.celery_task:
+            self.celery_task.update_state(
+                state='PROGRESS',
+                meta={
+                    'name': self.celery_task.name,
+                    'current': current_value,
+                    'total': 100,
+                    'infos': "{} : {} ...".format(_("Language"), lang)
+                }
+            )
+
+    def get_signature(self):
+        """
+        Options and version changing the content of all files. Previous files are not reused if it changes.
+        """
+        keys = ('url', 'rando_url', 'source', 'portal', 'skip_pdf', 'skip_dem', 'skip_profile_png', 'with_events',
+                'content_categories', 'with_signages', 'with_infrastructures', 'with_dives')
+        signature = [settings.VERSION] + [self.options.get(key) for key in keys]
+        return hashlib.sha1(json.dumps(signature).encode()).hexdigest()
+
+    def load_manifest(self):
+        """
+        Return stamp and hash of files generated by previous sync, by file name.
+        """
+        try:
+            with open(os.path.join(self.dst_root, 'manifest.json')) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('signature') != self.get_signature():
+            return {}
+        return manifest['files']
+
+    def write_manifest(self):
+        manifest = {'signature': self.get_signature(), 'files': self.manifest}
+        with open(os.path.join(self.tmp_root, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, sort_keys=True)
+
     def check_dst_root_is_empty(self):
         if not os.path.exists(self.dst_root):
             return
         existing = set([os.path.basename(p) for p in os.listdir(self.dst_root)])
-        remaining = existing - set(('api', 'media', 'meta', 'static', 'zip'))
+        remaining = existing - set(('api', 'media', 'meta', 'static', 'zip', 'manifest.json'))
         if remaining:
             raise CommandError("Destination directory contains extra data")
 
@@ -487,6 +585,9 @@ class Command(BaseCommand):
         self.with_infrastructures = options.get('with_infrastructures', False)
         self.with_dives = options.get('with_dives', False)
         self.celery_task = options.get('task', None)
+        self.processes = options.get('processes', 1)
+        self.manifest = {}
+        self.old_manifest = {} if options.get('full', False) else self.load_manifest()
 
         if self.source is not None:
             self.source = self.source.split(',')
@@ -501,7 +602,11 @@ class Command(BaseCommand):
             'tiles_headers': {"Referer": self.referer},
             'ignore_errors': True,
             'tiles_dir': os.path.join(settings.VAR_DIR, 'tiles'),
+            'workers': options.get('tiles_workers', 1),
         }
+        if not self.skip_tiles:
+            tiles_urls = [settings.MOBILE_TILES_URL] if isinstance(settings.MOBILE_TILES_URL, str) else settings.MOBILE_TILES_URL
+            self.builder_args['store'] = common_sync.TilesStore(os.path.join(settings.VAR_DIR, 'tiles'), tiles_urls)
         self.tmp_root = os.path.join(os.path.dirname(self.dst_root), 'tmp_sync_rando')
         try:
             os.mkdir(self.tmp_root)
@@ -514,6 +619,7 @@ class Command(BaseCommand):
             )
         try:
             self.sync()
+            self.write_manifest()
             if self.celery_task:
                 self.celery_task.update_state(
                     state='PROGRESS',
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0026_objectchange'),
+    ]
+
+    operations = [
+        # Tokens are now transaction ids: changes logged with sequence values are
+        # considered older than any token
+        migrations.RunSQL(
+            "UPDATE common_objectchange SET token = 0, created_token = CASE WHEN created_token IS NOT NULL THEN 0 END",
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            "DROP SEQUENCE IF EXISTS common_objectchange_token_seq;",
+            migrations.RunSQL.noop,
+        ),
+    ]
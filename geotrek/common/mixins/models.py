@@ -232,7 +232,8 @@ class PicturesMixin:
 
     @property
     def sorted_attachments(self):
-        return self.attachments.order_by('-starred', 'date_insert')
+        # Sort in Python to use prefetched attachments if any
+        return sorted(self.attachments.all(), key=lambda attachment: (not attachment.starred, attachment.date_insert))
 
 
 class BasePublishableMixin(models.Model):
@@ -249,11 +250,14 @@ class BasePublishableMixin(models.Model):
         abstract = True
 
     def save(self, *args, **kwargs):
+        self.update_publication_date()
+        super().save(*args, **kwargs)
+
+    def update_publication_date(self):
         if self.publication_date is None and self.any_published:
             self.publication_date = datetime.date.today()
         if self.publication_date is not None and not self.any_published:
             self.publication_date = None
-        super().save(*args, **kwargs)
 
     @property
     def any_published(self):
@@ -3,18 +3,27 @@ from io import BytesIO
 from urllib.parse import urljoin
 
 from django.conf import settings
-from django.http import HttpResponseNotFound, HttpResponse
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.geos import Polygon
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection
+from django.db.models import F
+from django.http import Http404, HttpResponseNotFound, HttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import translation
 from django.utils.translation import gettext as _
 from django.views import static
 from mapentity import views as mapentity_views
+from mapentity.decorators import view_permission_required
 from mapentity.helpers import suffix_for
 from pdfimpose import PageList
 
 from geotrek.common.models import TargetPortal, FileType, Attachment
 from geotrek.common.utils import logger
 from geotrek.common.utils.portals import smart_get_template_by_portal
+from geotrek.common.utils.tiles import TILE_BUFFER, TILE_EXTENT, tile_bounds, tile_cache_key
+from geotrek.common.utils.translation import get_translated_fields
 
 
 class CustomColumnsMixin:
@@ -241,3 +250,147 @@ class CompletenessMixin:
             completeness_fields = settings.COMPLETENESS_FIELDS[modelname]
             context['completeness_fields'] = [obj._meta.get_field(field).verbose_name for field in completeness_fields]
         return context
+
+
+class MapEntityTileMixin:
+    """
+    Serve a MapEntity layer as Mapbox vector tiles, with queryset, filters and
+    properties of the layer view it is combined with (see ``TileEntityOptions``).
+
+    Tiles are cached one by one and invalidated only where objects changed
+    (see ``geotrek.common.signals``).
+    """
+    content_type = 'application/vnd.mapbox-vector-tile'
+    # Labels of models whose changes invalidate tiles (model, and paths for topologies by default)
+    tile_dependencies = None
+
+    @view_permission_required()
+    def dispatch(self, *args, **kwargs):
+        # Skip layer cache, tiles have their own
+        return super(mapentity_views.MapEntityLayer, self).dispatch(*args, **kwargs)
+
+    def get_tile_dependencies(self):
+        if self.tile_dependencies is not None:
+            return self.tile_dependencies
+        model = self.get_model()._meta.concrete_model
+        labels = [model._meta.label_lower]
+        if 'core.topology' in [parent._meta.label_lower for parent in model._meta.get_parent_list()]:
+            labels.append('core.path')
+        return labels
+
+    def get(self, request, z, x, y, **kwargs):
+        # Below minimum zoom level, tiles would contain most objects of the layer
+        if not settings.VECTOR_TILES_MIN_ZOOM <= z <= settings.VECTOR_TILES_MAX_ZOOM \
+                or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            raise Http404
+        cache_key = None
+        # Do not cache filtered tiles
+        if all(key.startswith('_') for key in request.GET):
+            variant = '{}:{}'.format(request.LANGUAGE_CODE, sorted(request.GET.items()))
+            cache_key = tile_cache_key(self.get_tile_dependencies(), z, x, y, variant)
+            content = caches['fat'].get(cache_key)
+            if content is not None:
+                return HttpResponse(content, content_type=self.content_type)
+        content = self.render_tile(z, x, y)
+        if cache_key:
+            caches['fat'].set(cache_key, content)
+        return HttpResponse(content, content_type=self.content_type)
+
+    def get_tile_queryset(self, bounds):
+        """
+        Return objects of the layer whose bounding box overlaps ``bounds`` (in
+        Web Mercator), with their geometry annotated as ``tile_geom``
+        """
+        envelope = Polygon.from_bbox(bounds)
+        envelope.srid = 3857
+        queryset = self.get_queryset().order_by()
+        try:
+            queryset.model._meta.get_field('geom')
+        except FieldDoesNotExist:
+            # Geometry of targets (interventions)
+            envelope.transform(settings.SRID)
+            queryset = queryset.model.filter_target_geom(queryset, 'bboverlaps', envelope)
+            return queryset.model.annotate_target_geom(queryset, 'tile_geom')
+        return queryset.filter(geom__bboverlaps=envelope).annotate(tile_geom=F('geom'))
+
+    @staticmethod
+    def is_column(model, attr):
+        """Whether ``attr`` is read as is from a column of ``model`` table"""
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            return False
+        return field.concrete and not field.is_relation and attr not in get_translated_fields(model)
+
+    @staticmethod
+    def get_tile_value(obj, attr):
+        value = getattr(obj, attr, None)
+        if callable(value):
+            value = value()
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        return str(value)
+
+    def render_tile(self, z, x, y):
+        """
+        Encode objects of the tile z/x/y with ``ST_AsMVT()``, in one query.
+        Geometries and properties stored in columns are read in database,
+        other properties (translated, computed...) are computed for each
+        object, without its geometry.
+        """
+        bounds = tile_bounds(z, x, y)
+        margin = (bounds[2] - bounds[0]) * TILE_BUFFER / TILE_EXTENT
+        queryset = self.get_tile_queryset((bounds[0] - margin, bounds[1] - margin,
+                                           bounds[2] + margin, bounds[3] + margin))
+        model = queryset.model
+        names = [name for name in self.properties if name != 'id']
+        column_names = [name for name in names if self.is_column(model, self.properties[name])]
+        other_names = [name for name in names if name not in column_names]
+        query = queryset.values_list('pk', 'tile_geom', *[self.properties[name] for name in column_names]).query
+        subquery, params = query.sql_with_params()
+        join = ''
+        if other_names:
+            geom_fields = [field.name for field in model._meta.concrete_fields if isinstance(field, GeometryField)]
+            rows = [[obj.pk] + [self.get_tile_value(obj, self.properties[name]) for name in other_names]
+                    for obj in queryset.defer(*geom_fields)]
+            if not rows:
+                return b''
+            # Values of a column must have the same type
+            for i in range(1, len(other_names) + 1):
+                types = {type(row[i]) for row in rows if row[i] is not None}
+                if types and not (types <= {bool} or types <= {int, float}):
+                    for row in rows:
+                        row[i] = None if row[i] is None else str(row[i])
+            join = 'JOIN (VALUES {values}) AS p(id, {columns}) ON p.id = q.id'.format(
+                values=', '.join(['({})'.format(', '.join(['%s'] * (len(other_names) + 1)))] * len(rows)),
+                columns=', '.join(connection.ops.quote_name(name) for name in other_names),
+            )
+            params = tuple(params) + tuple(value for row in rows for value in row)
+        quoted = {name: connection.ops.quote_name(name) for name in names}
+        sql = """
+            SELECT ST_AsMVT(tile, %s, %s, 'geom') FROM (
+                SELECT {properties},
+                       ST_AsMVTGeom(ST_Transform(d.geom, 3857), ST_MakeEnvelope(%s, %s, %s, %s, 3857),
+                                    %s, %s, true) AS geom
+                FROM ({subquery}) AS q(id, geom{columns})
+                {join}
+                -- Features of a tile have a single geometry type
+                CROSS JOIN LATERAL (
+                    SELECT q.geom::geometry WHERE GeometryType(q.geom::geometry) <> 'GEOMETRYCOLLECTION'
+                    UNION ALL
+                    SELECT (ST_Dump(q.geom::geometry)).geom WHERE GeometryType(q.geom::geometry) = 'GEOMETRYCOLLECTION'
+                ) AS d(geom)
+            ) AS tile
+            WHERE tile.geom IS NOT NULL
+        """.format(
+            properties=', '.join(['q.id'] + [('q.' if name in column_names else 'p.') + quoted[name] for name in names]),
+            subquery=subquery,
+            columns=''.join(', ' + quoted[name] for name in column_names),
+            join=join,
+        )
+        params = ([model._meta.model_name, TILE_EXTENT] + list(bounds) + [TILE_EXTENT, TILE_BUFFER]
+                  + list(params))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            content, = cursor.fetchone()
+        return bytes(content) if content else b''
@@ -6,7 +6,7 @@ from PIL import Image
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import connection, models
 from django.db.models import Q
 from django.template.defaultfilters import slugify
 from django.utils.translation import gettext_lazy as _
@@ -270,3 +270,64 @@ class RatingMixin(OptionalPictogramMixin, models.Model):
 
     class Meta:
         abstract = True
+
+
+class ObjectChange(models.Model):
+    """
+    Last change of each object, logged by database triggers at commit
+    (see ``log_object_change()``) to serve changes since a given token.
+    Tokens are ids of the transactions which made the changes. They are not
+    in commit order, so only changes of transactions older than all the ones
+    in progress are served: no change can be committed below them anymore.
+    """
+    model = models.CharField(max_length=32)
+    object_id = models.IntegerField()
+    deleted = models.BooleanField(default=False)
+    token = models.BigIntegerField(db_index=True)
+    created_token = models.BigIntegerField(null=True)
+
+    class Meta:
+        unique_together = (('model', 'object_id'), )
+
+    @classmethod
+    def last_token(cls):
+        """Token below which all changes are committed"""
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot()) - 1")
+            return cursor.fetchone()[0]
+
+    @classmethod
+    def changes_since(cls, token, model_names=None, limit=None):
+        """
+        Return ids of objects created, updated or deleted after ``token`` by
+        model, the last token served and whether changes remain after it
+        (when ``limit`` is reached). Objects created then deleted after
+        ``token`` are not reported. Changes of a transaction are never split
+        between two calls.
+        """
+        max_token = cls.last_token()
+        qs = cls.objects.filter(token__gt=token, token__lte=max_token).order_by('token')
+        if model_names is not None:
+            qs = qs.filter(model__in=model_names)
+        qs = qs.values_list('model', 'object_id', 'deleted', 'token', 'created_token')
+        rows = list(qs if limit is None else qs[:limit + 1])
+        has_more = limit is not None and len(rows) > limit
+        if has_more:
+            # Complete changes of the last transaction of the page
+            last = rows[limit - 1][3]
+            rows = [row for row in rows[:limit] if row[3] != last] + list(qs.filter(token=last))
+            has_more = qs.filter(token__gt=last).exists()
+        changes = {}
+        last_token = token
+        for model, object_id, deleted, change_token, created_token in rows:
+            last_token = change_token
+            created = created_token is not None and created_token > token
+            if deleted and created:
+                continue
+            change = 'deleted' if deleted else 'created' if created else 'updated'
+            model_changes = changes.setdefault(model, {'created': [], 'updated': [], 'deleted': []})
+            model_changes[change].append(object_id)
+        if not has_more:
+            # All changes up to max_token are served
+            last_token = max(last_token, max_token)
+        return changes, last_token, has_more
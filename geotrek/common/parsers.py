@@ -1,41 +1,59 @@
+import hashlib
+import io
+import json
 import os
+import queue
 import re
 import requests
 import logging
+import threading
 from requests.auth import HTTPBasicAuth
 import textwrap
 import xlrd
 import xml.etree.ElementTree as ET
 from functools import reduce
-from collections import Iterable
+from collections import Iterable, deque
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep
 
-from ftplib import FTP
+from ftplib import FTP, all_errors as ftp_errors
 from os.path import dirname
 from urllib.parse import urlparse
 
-from django.db import models, connection
+from django.db import models, connection, transaction
 from django.db.utils import DatabaseError
 from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.gdal import DataSource, GDALException, CoordTransform
 from django.contrib.gis.geos import Point
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.cache import caches
 from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
 from django.template.loader import render_to_string
-from django.utils import translation
+from django.utils import timezone, translation
 from django.utils.translation import gettext as _
 from django.utils.encoding import force_str
+from django.utils.text import slugify
 from django.conf import settings
 from paperclip.models import attachment_upload
 
 from geotrek.authent.models import default_structure
+from geotrek.common.mixins.models import PublishableMixin
 from geotrek.common.models import FileType, Attachment
+from geotrek.common.signals import get_tile_labels
+from geotrek.common.utils.tiles import invalidate_tiles
 from geotrek.common.utils.translation import get_translated_fields
+from geotrek.zoning.mixins import ZoningPropertiesMixin, prefetch_zoning
 
 if 'modeltranslation' in settings.INSTALLED_APPS:
     from modeltranslation.fields import TranslationField
 
 logger = logging.getLogger(__name__)
 
+# Marks natural keys matching several objects in bulk mode
+AMBIGUOUS = object()
+
 
 class ImportError(Exception):
     pass
@@ -78,10 +96,19 @@ class Parser:
     non_fields = {}
     natural_keys = {}
     field_options = {}
+    # Bulk mode: prefetch objects and create/update them by chunks of bulk_size
+    # rows, without calling their save() method
+    bulk = False
+    bulk_size = 1000
+    # Number of rows read in advance by a background thread, 0 to read them while parsing
+    prefetch_size = 0
+    # Save progress every checkpoint_interval lines, to resume a failed import
+    checkpoint_interval = 1000
 
     def __init__(self, progress_cb=None, user=None, encoding='utf8'):
         self.warnings = {}
         self.line = 0
+        self.rows_to_skip = 0
         self.nb_success = 0
         self.nb_created = 0
         self.nb_updated = 0
@@ -183,7 +210,9 @@ class Parser:
             raise RowImportError(_("Blank value not allowed for field '{src}'".format(src=src)))
         if isinstance(field, models.CharField):
             val = str(val)[:256]
-        if isinstance(field, models.ManyToManyField):
+        if isinstance(field, models.ManyToManyField) and self.bulk:
+            self.bulk_m2m[dst][self.obj.pk] = set(val)
+        elif isinstance(field, models.ManyToManyField):
             fk = getattr(self.obj, dst)
             fk.set(val)
         else:
@@ -197,7 +226,7 @@ class Parser:
             val = self.apply_filter(dst, src, val)
         if hasattr(self.obj, dst):
             if dst in self.m2m_fields or dst in self.m2m_constant_fields:
-                old = set(getattr(self.obj, dst).all())
+                old = self.get_m2m_value(dst)
                 val = set(val)
                 if dst in self.m2m_aggregate_fields:
                     val = val | old
@@ -257,10 +286,17 @@ class Parser:
         except RowImportError as warnings:
             self.add_warning(str(warnings))
             return
+        if self.bulk:
+            # Saved later by flush()
+            self.bulk_objects.append((self.line, self.obj, row, operation, update_fields))
+            return
         if operation == "created":
             self.obj.save()
         else:
             self.obj.save(update_fields=update_fields)
+        self.parse_obj_relations(row, operation, update_fields)
+
+    def parse_obj_relations(self, row, operation, update_fields):
         update_fields += self.parse_fields(row, self.m2m_fields)
         update_fields += self.parse_fields(row, self.m2m_constant_fields)
         update_fields += self.parse_fields(row, self.non_fields, non_field=True)
@@ -299,7 +335,7 @@ class Parser:
             except RowImportError as warnings:
                 self.add_warning(str(warnings))
                 return
-            objects = self.model.objects.filter(**eid_kwargs)
+            objects = self.get_objects(eid_kwargs)
         if len(objects) == 0 and self.update_only:
             if self.warn_on_missing_objects:
                 self.add_warning(_("Bad value '{eid_val}' for field '{eid_src}'. No object with this identifier").format(eid_val=self.eid_val, eid_src=self.eid_src))
@@ -310,6 +346,8 @@ class Parser:
                 obj.structure = self.structure
             objects = [obj]
             operation = "created"
+            if self.bulk and self.eid is not None:
+                self.add_bulk_object(eid_kwargs, obj)
         elif len(objects) >= 2 and not self.duplicate_eid_allowed:
             self.add_warning(_("Bad value '{eid_val}' for field '{eid_src}'. Multiple objects with this identifier").format(eid_val=self.eid_val, eid_src=self.eid_src))
             return
@@ -369,12 +407,12 @@ class Parser:
         if fk:
             fields[fk] = getattr(self.obj, fk)
         if create:
-            val, created = model.objects.get_or_create(**fields)
+            val, created = self.get_related(model, fields, create=True)
             if created:
                 self.add_warning(_("{model} '{val}' did not exist in Geotrek-Admin and was automatically created").format(model=model._meta.verbose_name.title(), val=val))
             return val
         try:
-            return model.objects.get(**fields)
+            return self.get_related(model, fields)[0]
         except model.DoesNotExist:
             self.add_warning(_("{model} '{val}' does not exists in Geotrek-Admin. Please add it").format(model=model._meta.verbose_name.title(), val=val))
             return None
@@ -394,18 +432,80 @@ class Parser:
             if fk:
                 fields[fk] = getattr(self.obj, fk)
             if create:
-                subval, created = model.objects.get_or_create(**fields)
+                subval, created = self.get_related(model, fields, create=True)
                 if created:
                     self.add_warning(_("{model} '{val}' did not exist in Geotrek-Admin and was automatically created").format(model=model._meta.verbose_name.title(), val=subval))
                 dst.append(subval)
                 continue
             try:
-                dst.append(model.objects.get(**fields))
+                dst.append(self.get_related(model, fields)[0])
             except model.DoesNotExist:
                 self.add_warning(_("{model} '{val}' does not exists in Geotrek-Admin. Please add it").format(model=model._meta.verbose_name.title(), val=subval))
                 continue
         return dst
 
+    def get_bulk_key(self, model, fields):
+        """Hashable key of a lookup in bulk mode, None if it can not be cached"""
+        names, values = [], []
+        for name, value in sorted(fields.items()):
+            if isinstance(value, models.Model):
+                value = value.pk
+            try:
+                field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+                value = field.to_python(value)
+                hash(value)
+            except (FieldDoesNotExist, ValidationError, TypeError):
+                return None
+            names.append(name)
+            values.append(value)
+        if any(name in get_translated_fields(model) for name in names):
+            # Lookups of translated fields depend on current language
+            return (model, tuple(names), tuple(values), translation.get_language())
+        return (model, tuple(names), tuple(values), None)
+
+    def get_objects(self, eid_kwargs):
+        if self.bulk and self.objects_by_eid is not None:
+            key = self.get_bulk_key(self.model, eid_kwargs)
+            if key is not None:
+                return self.objects_by_eid.get(key, [])
+        return self.model.objects.filter(**eid_kwargs)
+
+    def add_bulk_object(self, eid_kwargs, obj):
+        key = self.get_bulk_key(self.model, eid_kwargs)
+        if self.objects_by_eid is not None and key is not None:
+            self.objects_by_eid[key] = [obj]
+
+    def get_related(self, model, fields, create=False):
+        """Returns (object, created) like get_or_create() if create is True,
+        or like get() otherwise. Objects are looked up in memory in bulk mode."""
+        key = self.get_bulk_key(model, fields) if self.bulk else None
+        obj = self.related_objects.get(key) if key is not None else None
+        if obj is None and key is not None and (key in self.related_objects or key[:2] in self.prefetched_keys):
+            # Known to be missing
+            if not create:
+                raise model.DoesNotExist
+            obj = self.related_objects[key] = model.objects.create(**fields)
+            return obj, True
+        if obj is None or obj is AMBIGUOUS:
+            try:
+                if create:
+                    obj, created = model.objects.get_or_create(**fields)
+                else:
+                    obj, created = model.objects.get(**fields), False
+            except model.DoesNotExist:
+                if key is not None:
+                    self.related_objects[key] = None
+                raise
+            if key is not None and self.related_objects.get(key) is not AMBIGUOUS:
+                self.related_objects[key] = obj
+            return obj, created
+        return obj, False
+
+    def get_m2m_value(self, dst):
+        if self.bulk:
+            return set(self.bulk_m2m[dst][self.obj.pk])
+        return set(getattr(self.obj, dst).all())
+
     def get_to_delete_kwargs(self):
         # FIXME: use mapping if it exists
         kwargs = {}
@@ -438,12 +538,168 @@ class Parser:
             self.to_delete = set()
         else:
             self.to_delete = set(self.model.objects.filter(**kwargs).values_list('pk', flat=True))
+        if self.bulk:
+            self.start_bulk()
+
+    def start_bulk(self):
+        """Prefetch existing objects by eid, and related objects by natural keys"""
+        if self.model._meta.parents:
+            raise GlobalImportError(_("Bulk mode is not available for {model}").format(model=self.model._meta.verbose_name))
+        self.bulk_objects = []
+        self.bulk_m2m = {}
+        self.related_objects = {}
+        self.prefetched_keys = set()
+        self.objects_by_eid = None
+        if self.eid is not None and self.eid not in self.translated_fields:
+            self.objects_by_eid = {}
+            queryset = self.model.objects.all()
+            if any(field.name == 'structure' for field in self.model._meta.fields):
+                queryset = queryset.select_related('structure')
+            attname = self.model._meta.get_field(self.eid).attname
+            for obj in queryset:
+                key = self.get_bulk_key(self.model, {self.eid: getattr(obj, attname)})
+                self.objects_by_eid.setdefault(key, []).append(obj)
+        for dst, natural_key in self.natural_keys.items():
+            try:
+                field = self.model._meta.get_field(dst)
+            except FieldDoesNotExist:
+                continue
+            model = field.related_model
+            if model is None or self.field_options.get(dst, {}).get('fk') or '__' in natural_key:
+                continue
+            if natural_key in get_translated_fields(model) or (model, (natural_key, )) in self.prefetched_keys:
+                continue
+            attname = model._meta.pk.attname if natural_key == 'pk' else model._meta.get_field(natural_key).attname
+            for obj in model.objects.all():
+                key = self.get_bulk_key(model, {natural_key: getattr(obj, attname)})
+                self.related_objects[key] = AMBIGUOUS if key in self.related_objects else obj
+            self.prefetched_keys.add((model, (natural_key, )))
 
     def end(self):
         if self.delete:
             self.model.objects.filter(pk__in=self.to_delete).delete()
 
-    def parse(self, filename=None, limit=None):
+    def flush(self):
+        """Save objects parsed in bulk mode, then parse their m2m and non fields"""
+        pending, self.bulk_objects = self.bulk_objects, []
+        if not pending:
+            return
+        line, obj = self.line, self.obj
+        failed = self.bulk_save(pending)
+        pending = [item for i, item in enumerate(pending) if i not in failed]
+        self.prefetch_m2m({id(item[1]): item[1] for item in pending}.values())
+        for self.line, self.obj, row, operation, update_fields in pending:
+            try:
+                self.parse_obj_relations(row, operation, update_fields)
+            except DatabaseError as e:
+                if settings.DEBUG:
+                    raise
+                self.add_warning(str(e))
+            except (ValueImportError, RowImportError) as e:
+                self.add_warning(str(e))
+        self.save_m2m()
+        self.line, self.obj = line, obj
+        saved = [obj for _, obj, _, operation, update_fields in pending if operation == "created" or update_fields]
+        if saved:
+            if issubclass(self.model, ZoningPropertiesMixin):
+                # Bulk writes do not send post_save signals storing zoning of objects
+                prefetch_zoning(list({id(obj): obj for obj in saved}.values()), store=True)
+            self.invalidate_caches()
+
+    def invalidate_caches(self):
+        """Invalidate caches after a bulk save, as post_save signals do"""
+        invalidate_tiles(get_tile_labels(self.model))
+        if 'geotrek.api' in settings.INSTALLED_APPS:
+            from geotrek.api.v2.utils import invalidate_api_cache
+            invalidate_api_cache()
+
+    def bulk_save(self, pending):
+        """Create and update objects with one query per set of updated fields.
+        Returns indexes of pending rows which failed."""
+        created, updated = {}, {}
+        for line, obj, row, operation, update_fields in pending:
+            if isinstance(obj, PublishableMixin):
+                obj.update_publication_date()
+            if operation == "created":
+                created[id(obj)] = obj
+            elif id(obj) not in created and update_fields:
+                updated.setdefault(id(obj), (obj, set()))[1].update(update_fields)
+        # bulk_update() does not set auto_now fields (date_update), as save() does
+        auto_now_fields = {field.name for field in self.model._meta.concrete_fields if getattr(field, 'auto_now', False)}
+        by_fields = {}
+        for obj, update_fields in updated.values():
+            by_fields.setdefault(tuple(sorted(update_fields | auto_now_fields)), []).append(obj)
+        if not created and not by_fields:
+            return set()
+        try:
+            with transaction.atomic():
+                self.model.objects.bulk_create(created.values())
+                now = timezone.now()
+                for update_fields, objs in by_fields.items():
+                    for obj in objs:
+                        for name in auto_now_fields:
+                            setattr(obj, name, now)
+                    self.model.objects.bulk_update(objs, update_fields)
+        except DatabaseError:
+            if settings.DEBUG:
+                raise
+            for obj in created.values():
+                obj.pk = None
+                obj._state.adding = True
+        else:
+            return set()
+        # Save objects one by one to find out which ones fail
+        failed = set()
+        for i, (self.line, obj, row, operation, update_fields) in enumerate(pending):
+            try:
+                with transaction.atomic():
+                    if obj.pk is None:
+                        obj.save()
+                    elif update_fields:
+                        obj.save(update_fields=set(update_fields) | auto_now_fields)
+            except DatabaseError as e:
+                self.add_warning(str(e))
+                failed.add(i)
+                if obj.pk is None and self.objects_by_eid is not None:
+                    # Next rows with the same eid will create it again
+                    for key, objs in list(self.objects_by_eid.items()):
+                        if objs == [obj]:
+                            del self.objects_by_eid[key]
+        return failed
+
+    def prefetch_m2m(self, objs):
+        pks = [obj.pk for obj in objs]
+        self.bulk_m2m = {}
+        for dst in set(self.m2m_fields) | set(self.m2m_constant_fields):
+            field = self.model._meta.get_field(dst)
+            through = field.remote_field.through
+            source = through._meta.get_field(field.m2m_field_name()).attname
+            target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+            links = list(through.objects.filter(**{source + '__in': pks}).values_list(source, target))
+            related = field.related_model._default_manager.in_bulk({pk for _, pk in links})
+            values = self.bulk_m2m[dst] = {pk: set() for pk in pks}
+            for pk, related_pk in links:
+                if related_pk in related:
+                    values[pk].add(related[related_pk])
+        self.bulk_m2m_old = {dst: {pk: set(value) for pk, value in values.items()}
+                             for dst, values in self.bulk_m2m.items()}
+
+    def save_m2m(self):
+        for dst, values in self.bulk_m2m.items():
+            field = self.model._meta.get_field(dst)
+            through = field.remote_field.through
+            source = through._meta.get_field(field.m2m_field_name()).attname
+            target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+            links = []
+            for pk, value in values.items():
+                old = self.bulk_m2m_old[dst][pk]
+                removed = old - value
+                if removed:
+                    through.objects.filter(**{source: pk, target + '__in': [obj.pk for obj in removed]}).delete()
+                links += [through(**{source: pk, target: obj.pk}) for obj in value - old]
+            through.objects.bulk_create(links)
+
+    def parse(self, filename=None, limit=None, resume=False):
         if filename:
             self.filename = filename
         if not self.url and not self.filename:
@@ -451,11 +707,17 @@ class Parser:
         if self.filename and not os.path.exists(self.filename):
             raise GlobalImportError(_("File does not exists at: {filename}").format(filename=self.filename))
         self.start()
-        for i, row in enumerate(self.next_row()):
+        if resume:
+            self.load_checkpoint()
+        checkpoint_line = self.line
+        rows = self.prefetch_rows(self.skip_rows(self.next_row()))
+        for i, row in enumerate(rows):
             if limit and i >= limit:
                 break
             try:
                 self.parse_row(row)
+                if self.bulk and len(self.bulk_objects) >= self.bulk_size:
+                    self.flush()
             except DatabaseError as e:
                 if settings.DEBUG:
                     raise
@@ -467,19 +729,128 @@ class Parser:
                 if settings.DEBUG:
                     raise
                 self.add_warning(str(e))
+            if self.checkpoint_interval and self.line - checkpoint_line >= self.checkpoint_interval \
+                    and not (self.bulk and self.bulk_objects):
+                self.save_checkpoint()
+                checkpoint_line = self.line
+        if hasattr(rows, 'close'):
+            rows.close()
+        if self.bulk:
+            self.flush()
         self.end()
+        self.delete_checkpoint()
+
+    def skip_rows(self, rows):
+        """Skip rows already imported before resuming. next_row() can skip
+        them itself (fetching only next pages) by decreasing rows_to_skip."""
+        for row in rows:
+            if self.rows_to_skip:
+                self.rows_to_skip -= 1
+                continue
+            yield row
+
+    def prefetch_rows(self, rows):
+        """Hook to prefetch data of next rows while current one is parsed"""
+        if self.prefetch_size:
+            return self.read_rows_in_background(rows)
+        return rows
+
+    def read_rows_in_background(self, rows):
+        """Read rows in a separate thread (and database connection), with
+        at most prefetch_size rows waiting to be parsed"""
+        buffer = queue.Queue(maxsize=self.prefetch_size)
+        stop = threading.Event()
+        end = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    buffer.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for row in rows:
+                    if not put((row, None)):
+                        return
+                put((end, None))
+            except Exception as e:
+                put((None, e))
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                row, error = buffer.get()
+                if error is not None:
+                    raise error
+                if row is end:
+                    return
+                yield row
+        finally:
+            stop.set()
+            thread.join()
+
+    def get_checkpoint_filename(self):
+        parser_class = type(self)
+        key = '{}.{}:{}'.format(parser_class.__module__, parser_class.__qualname__, self.filename or self.url)
+        return os.path.join(settings.TMP_DIR, 'import', hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def save_checkpoint(self):
+        """Save progress, so that import can be resumed from current line"""
+        filename = self.get_checkpoint_filename()
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        checkpoint = {
+            'line': self.line,
+            'nb_success': self.nb_success,
+            'nb_created': self.nb_created,
+            'nb_updated': self.nb_updated,
+            'nb_unmodified': self.nb_unmodified,
+            'warnings': self.warnings,
+            'to_delete': list(self.to_delete),
+        }
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(checkpoint, f, cls=DjangoJSONEncoder)
+        os.replace(filename + '.tmp', filename)
+
+    def load_checkpoint(self):
+        """Restore progress of a failed import, if any"""
+        try:
+            with open(self.get_checkpoint_filename()) as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return
+        self.line = self.rows_to_skip = checkpoint['line']
+        self.nb_success = checkpoint['nb_success']
+        self.nb_created = checkpoint['nb_created']
+        self.nb_updated = checkpoint['nb_updated']
+        self.nb_unmodified = checkpoint['nb_unmodified']
+        self.warnings = checkpoint['warnings']
+        pk_field = self.model._meta.pk
+        self.to_delete &= {pk_field.to_python(pk) for pk in checkpoint['to_delete']}
+
+    def delete_checkpoint(self):
+        try:
+            os.remove(self.get_checkpoint_filename())
+        except FileNotFoundError:
+            pass
 
-    def request_or_retry(self, url, verb='get', **kwargs):
+    def request_or_retry(self, url, verb='get', session=None, **kwargs):
         try_get = settings.PARSER_NUMBER_OF_TRIES
         assert try_get > 0
         while try_get:
-            action = getattr(requests, verb)
+            action = getattr(session or requests, verb)
             response = action(url, allow_redirects=True, **kwargs)
             if response.status_code in settings.PARSER_RETRY_HTTP_STATUS:
                 logger.info("Failed to fetch url {}. Retrying ...".format(url))
                 sleep(settings.PARSER_RETRY_SLEEP_TIME)
                 try_get -= 1
-            elif response.status_code == 200:
+            elif response.status_code == 200 or response.status_code == 304:  # 304 for conditional requests
                 return response
             else:
                 break
@@ -495,7 +866,10 @@ class ShapeParser(Parser):
         target_srs = SpatialRefSys.objects.get(srid=settings.SRID).srs
         coord_transform = CoordTransform(layer.srs, target_srs)
         self.nb = len(layer)
+        skip, self.rows_to_skip = self.rows_to_skip, 0
         for i, feature in enumerate(layer):
+            if i < skip:
+                continue
             row = {self.normalize_field_name(field.name): field.value for field in feature}
             try:
                 ogrgeom = feature.geom
@@ -519,11 +893,12 @@ class ShapeParser(Parser):
 
 class ExcelParser(Parser):
     def next_row(self):
-        workbook = xlrd.open_workbook(self.filename)
+        workbook = xlrd.open_workbook(self.filename, on_demand=True)
         sheet = workbook.sheet_by_index(0)
         header = [self.normalize_field_name(cell.value) for cell in sheet.row(0)]
         self.nb = sheet.nrows - 1
-        for i in range(1, sheet.nrows):
+        skip, self.rows_to_skip = self.rows_to_skip, 0
+        for i in range(1 + skip, sheet.nrows):
             values = [cell.value for cell in sheet.row(i)]
             row = dict(zip(header, values))
             yield row
@@ -545,11 +920,124 @@ class AtomParser(Parser):
         tree = ET.parse(self.filename)
         entries = tree.getroot().findall('Atom:entry', self.ns)
         self.nb = len(entries)
-        for entry in entries:
+        skip, self.rows_to_skip = self.rows_to_skip, 0
+        for entry in entries[skip:]:
             row = {self.normalize_field_name(src): entry.find(src, self.ns).text for src in srcs}
             yield row
 
 
+class AttachmentDownloader:
+    """
+    Fetch attachments with a pool of threads, reusing HTTP connections and FTP sessions.
+    ETag and Last-Modified headers of downloaded files are cached by URL, so that next
+    imports use conditional requests and do not download again unchanged files.
+    """
+    cache_prefix = 'parser_attachment_'
+
+    def __init__(self, parser, workers):
+        self.parser = parser
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.sessions = []
+        self.ftp_sessions = {}
+        self.cache = caches['fat']
+
+    def submit(self, url, download, check):
+        """Fetch content of url if download is True, or only its size if check is True"""
+        if url not in self.futures:
+            self.futures[url] = self.executor.submit(self.fetch, url, download, check)
+
+    def result(self, url):
+        """Returns a dict with 'size', 'content' and 'not_modified' keys,
+        None if url was not submitted"""
+        future = self.futures.get(url)
+        if future is None:
+            return None
+        return future.result()
+
+    def release(self, url):
+        self.futures.pop(url, None)
+
+    def close(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.executor.shutdown()
+        self.futures = {}
+        for session in self.sessions:
+            session.close()
+        for ftps in self.ftp_sessions.values():
+            for ftp in ftps:
+                try:
+                    ftp.quit()
+                except ftp_errors:
+                    ftp.close()
+
+    def fetch(self, url, download, check):
+        parsed_url = urlparse(url)
+        if parsed_url.scheme == 'ftp':
+            return self.fetch_ftp(url, parsed_url, download and not check)
+        return self.fetch_http(url, download, check)
+
+    def get_session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+            with self.lock:
+                self.sessions.append(session)
+        return session
+
+    def fetch_http(self, url, download, check):
+        session = self.get_session()
+        key = self.cache_prefix + hashlib.sha1(url.encode()).hexdigest()
+        validators = self.cache.get(key) if check else None
+        if not download or check and not validators:
+            response = self.parser.request_or_retry(url, verb='head', session=session)
+            size = response.headers.get('content-length')
+            return {'size': int(size) if size is not None else None, 'content': None, 'not_modified': False}
+        headers = {}
+        if validators:
+            if validators['etag']:
+                headers['If-None-Match'] = validators['etag']
+            if validators['last_modified']:
+                headers['If-Modified-Since'] = validators['last_modified']
+        response = self.parser.request_or_retry(url, session=session, headers=headers)
+        if response.status_code == requests.codes.not_modified:
+            return {'size': None, 'content': None, 'not_modified': True}
+        validators = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        if validators['etag'] or validators['last_modified']:
+            self.cache.set(key, validators)
+        return {'size': len(response.content), 'content': response.content, 'not_modified': False}
+
+    def fetch_ftp(self, url, parsed_url, download):
+        key = (parsed_url.hostname, parsed_url.port, parsed_url.username, parsed_url.password)
+        with self.lock:
+            ftps = self.ftp_sessions.setdefault(key, [])
+            ftp = ftps.pop() if ftps else None
+        try:
+            if ftp is None:
+                ftp = FTP()
+                ftp.connect(parsed_url.hostname, parsed_url.port or 21)
+                ftp.login(user=parsed_url.username or '', passwd=parsed_url.password or '')
+            if download:
+                content = io.BytesIO()
+                ftp.retrbinary('RETR {}'.format(parsed_url.path), content.write)
+                result = {'size': content.tell(), 'content': content.getvalue(), 'not_modified': False}
+            else:
+                result = {'size': ftp.size(parsed_url.path), 'content': None, 'not_modified': False}
+        except ftp_errors as e:
+            if ftp is not None:
+                ftp.close()
+            raise DownloadImportError(_("Failed to download {url}. {error}").format(url=url, error=e))
+        with self.lock:
+            ftps.append(ftp)
+        return result
+
+
 class AttachmentParserMixin:
     download_attachments = True
     base_url = ''
@@ -558,9 +1046,18 @@ class AttachmentParserMixin:
     non_fields = {
         'attachments': _("Attachments"),
     }
+    # Number of threads fetching attachments of next rows in advance, 0 to fetch them while saving
+    download_workers = 0
+    downloader = None
 
     def start(self):
         super().start()
+        if self.download_workers:
+            self.downloader = AttachmentDownloader(self, self.download_workers)
+            content_type = ContentType.objects.get_for_model(self.model)
+            names = Attachment.objects.filter(content_type=content_type).values_list('attachment_file', flat=True)
+            # Without the random suffix added by storage to avoid name clashes
+            self.attachment_names = {re.sub(r'_[a-zA-Z0-9]{7}(\.[^.]*)?$', r'\1', os.path.basename(name)) for name in names}
         if settings.PAPERCLIP_ENABLE_LINK is False and self.download_attachments is False:
             raise Exception('You need to enable PAPERCLIP_ENABLE_LINK to use this function')
         try:
@@ -573,12 +1070,62 @@ class AttachmentParserMixin:
                                           "Geotrek-Admin. Please add it").format(name=self.filetype_name))
         self.creator, created = get_user_model().objects.get_or_create(username='import', defaults={'is_active': False})
 
+    def end(self):
+        super().end()
+        if self.downloader is not None:
+            self.downloader.close()
+            self.downloader = None
+
+    def prefetch_rows(self, rows):
+        rows = super().prefetch_rows(rows)
+        if self.downloader is None or 'attachments' not in self.non_fields:
+            return rows
+        return self.prefetch_attachments(rows)
+
+    def prefetch_attachments(self, rows):
+        """Submit attachments of next rows to downloader"""
+        window = deque()
+        src = self.normalize_src(self.non_fields['attachments'])
+        for row in rows:
+            # Warnings will be added when the row is parsed
+            warnings, self.warnings = self.warnings, {}
+            try:
+                attachments = self.filter_attachments(src, self.get_val(row, 'attachments', src))
+            except Exception:
+                attachments = []
+            finally:
+                self.warnings = warnings
+            for url, legend, author in attachments:
+                url = self.base_url + url
+                scheme = urlparse(url).scheme
+                basename, ext = os.path.splitext(os.path.basename(url))
+                exists = slugify(basename[:128]) + ext in self.attachment_names
+                if scheme == 'ftp' or scheme in ('http', 'https') and self.download_attachments:
+                    self.downloader.submit(url, download=True, check=exists)
+                elif scheme in ('http', 'https') and exists:
+                    self.downloader.submit(url, download=False, check=True)
+            window.append(row)
+            if len(window) > self.download_workers * 4:
+                yield window.popleft()
+        yield from window
+
+    def get_prefetched(self, url):
+        try:
+            return self.downloader and self.downloader.result(url)
+        except DownloadImportError as e:
+            raise ValueImportError('Failed to load attachment: {exc}'.format(exc=e))
+
     def filter_attachments(self, src, val):
         if not val:
             return []
         return [(subval.strip(), '', '') for subval in val.split(self.separator) if subval.strip()]
 
     def has_size_changed(self, url, attachment):
+        prefetched = self.get_prefetched(url)
+        if prefetched and prefetched['not_modified']:
+            return False
+        if prefetched and prefetched['size'] is not None:
+            return prefetched['size'] != attachment.attachment_file.size
         parsed_url = urlparse(url)
         if parsed_url.scheme == 'ftp':
             directory = dirname(parsed_url.path)
@@ -600,6 +1147,9 @@ class AttachmentParserMixin:
         return True
 
     def download_attachment(self, url):
+        prefetched = self.get_prefetched(url)
+        if prefetched and prefetched['content'] is not None:
+            return prefetched['content']
         parsed_url = urlparse(url)
         if parsed_url.scheme == 'ftp':
             try:
@@ -622,8 +1172,10 @@ class AttachmentParserMixin:
     def save_attachments(self, src, val):
         updated = False
         attachments_to_delete = list(Attachment.objects.attachments_for_object(self.obj))
+        urls = []
         for url, legend, author in self.filter_attachments(src, val):
             url = self.base_url + url
+            urls.append(url)
             legend = legend or ""
             author = author or ""
             basename, ext = os.path.splitext(os.path.basename(url))
@@ -669,6 +1221,9 @@ class AttachmentParserMixin:
         if self.delete_attachments:
             for att in attachments_to_delete:
                 att.delete()
+        if self.downloader is not None:
+            for url in urls:
+                self.downloader.release(url)
         return updated
 
 
@@ -689,7 +1244,9 @@ class TourInSoftParser(AttachmentParserMixin, Parser):
         return int(self.root['d']['__count'])
 
     def next_row(self):
-        skip = 0
+        # Start from the page of first row to import
+        skip = self.rows_to_skip // 1000 * 1000
+        self.rows_to_skip -= skip
         while True:
             params = {
                 '$format': 'json',
@@ -794,7 +1351,9 @@ class TourismSystemParser(AttachmentParserMixin, Parser):
 
     def next_row(self):
         size = 1000
-        skip = 0
+        # Start from the page of first row to import
+        skip = self.rows_to_skip // size * size
+        self.rows_to_skip -= skip
         while True:
             params = {
                 'size': size,
@@ -0,0 +1,30 @@
+from geotrek.common.utils.tiles import geom_tile_extent, invalidate_tiles
+
+
+def get_tile_labels(model):
+    """Labels of ``model`` and its parents, whose vector tiles depend on ``model`` objects"""
+    model = model._meta.concrete_model
+    return [model._meta.label_lower] + [parent._meta.label_lower for parent in model._meta.get_parent_list()]
+
+
+def remember_tile_geom(sender, instance, **kwargs):
+    # Keep geometry as loaded, to invalidate tiles where the object was
+    instance._tile_geom = instance.__dict__.get('geom')
+
+
+def remember_computed_tile_geom(sender, instance, raw=False, **kwargs):
+    # Geometry is computed (interventions, projects…): keep the stored one
+    # before saving, as it is not loaded with the object
+    if raw or 'geom' in instance.__dict__ or instance.pk is None:
+        return
+    previous = sender._base_manager.filter(pk=instance.pk).first()
+    instance._tile_geom = previous.geom if previous else None
+
+
+def invalidate_object_tiles(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    extents = [geom_tile_extent(getattr(instance, '_tile_geom', None)), geom_tile_extent(instance.geom)]
+    invalidate_tiles(get_tile_labels(sender), extents)
+    if 'geom' in instance.__dict__:
+        instance._tile_geom = instance.geom
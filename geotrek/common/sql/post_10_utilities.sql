@@ -22,3 +22,40 @@ BEGIN
     RETURN NEW;
 END;
 $$ LANGUAGE plpgsql;
+
+-------------------------------------------------------------------------------
+-- Change log (see ObjectChange)
+-------------------------------------------------------------------------------
+
+CREATE FUNCTION {# geotrek.common #}.log_object_change() RETURNS trigger AS $$
+DECLARE
+    object_data jsonb;
+    model_name varchar;
+    change_token bigint;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        object_data := to_jsonb(OLD);
+    ELSE
+        object_data := to_jsonb(NEW);
+    END IF;
+    -- Model name is given as argument, or read from kind column (topologies)
+    IF TG_NARGS > 0 THEN
+        model_name := TG_ARGV[0];
+    ELSE
+        model_name := lower(object_data ->> 'kind');
+    END IF;
+    -- Token is the id of the transaction: unlike a sequence value, it allows
+    -- to know when all changes below a token are committed (see ObjectChange)
+    change_token := txid_current();
+
+    INSERT INTO common_objectchange (model, object_id, deleted, token, created_token)
+    VALUES (model_name, (object_data ->> 'id')::integer,
+            TG_OP = 'DELETE' OR coalesce((object_data ->> 'deleted')::boolean, FALSE),
+            change_token, CASE WHEN TG_OP = 'INSERT' THEN change_token END)
+    ON CONFLICT (model, object_id) DO UPDATE
+    SET deleted = EXCLUDED.deleted,
+        token = EXCLUDED.token,
+        created_token = coalesce(EXCLUDED.created_token, common_objectchange.created_token);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -8,6 +8,7 @@ import urllib
 
 from django.test import TestCase
 from django.conf import settings
+from django.core.cache import caches
 from django.core.management import call_command
 from django.core.management.base import CommandError
 from django.db.utils import DatabaseError
@@ -18,7 +19,7 @@ from geotrek.authent.tests.factories import StructureFactory
 from geotrek.trekking.models import Trek
 from geotrek.common.models import Organism, FileType, Attachment
 from geotrek.common.parsers import (
-    ExcelParser, AttachmentParserMixin, TourInSoftParser, ValueImportError, DownloadImportError,
+    Parser, ExcelParser, AttachmentParserMixin, TourInSoftParser, ValueImportError, DownloadImportError, GlobalImportError,
     TourismSystemParser, OpenSystemParser,
 )
 
@@ -34,10 +35,34 @@ class OrganismEidParser(ExcelParser):
     eid = 'organism'
 
 
+class OrganismEidBulkParser(OrganismEidParser):
+    bulk = True
+
+
+class OrganismListParser(Parser):
+    model = Organism
+    fields = {'organism': 'nOm'}
+    eid = 'organism'
+    url = 'http://test.url'
+    names = ['Organism A', 'Organism B', 'Organism C']
+    fail_after = None
+
+    def next_row(self):
+        self.nb = len(self.names)
+        for i, name in enumerate(self.names):
+            if i == self.fail_after:
+                raise ConnectionError("Connection lost")
+            yield {'NOM': name}
+
+
 class AttachmentParser(AttachmentParserMixin, OrganismEidParser):
     non_fields = {'attachments': 'photo'}
 
 
+class AttachmentPrefetchParser(AttachmentParser):
+    download_workers = 2
+
+
 class AttachmentLegendParser(AttachmentParser):
 
     def filter_attachments(self, src, val):
@@ -102,6 +127,66 @@ class ParserTests(TestCase):
         self.assertEqual(organisms[0].organism, "2.0")
         self.assertEqual(organisms[1].organism, "Comité Hippolyte")
 
+    def test_bulk_same_report(self):
+        reports = {}
+        for parser_class in (OrganismEidParser, OrganismEidBulkParser):
+            Organism.objects.all().delete()
+            for name in ('organism.xls', 'organism2.xls', 'organism2.xls'):
+                parser = parser_class()
+                parser.parse(os.path.join(os.path.dirname(__file__), 'data', name))
+                reports.setdefault(parser_class, []).append(parser.report())
+            self.assertEqual(Organism.objects.count(), 2)
+        self.assertEqual(reports[OrganismEidParser], reports[OrganismEidBulkParser])
+
+    def test_bulk_queries(self):
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism2.xls')
+        OrganismEidBulkParser().parse(filename)
+        parser = OrganismEidBulkParser()
+        # Prefetch of existing objects and to_delete, no query by row
+        with self.assertNumQueries(2):
+            parser.parse(filename)
+        self.assertEqual(parser.nb_unmodified, parser.line)
+
+    def test_bulk_not_available(self):
+        class TrekBulkParser(ExcelParser):
+            model = Trek
+            bulk = True
+        with self.assertRaisesRegex(GlobalImportError, "Bulk mode is not available"):
+            TrekBulkParser().parse(os.path.join(os.path.dirname(__file__), 'data', 'organism.xls'))
+
+    def test_prefetch_rows(self):
+        parser = OrganismListParser()
+        parser.prefetch_size = 1
+        parser.parse()
+        self.assertEqual(parser.nb_created, 3)
+        self.assertQuerysetEqual(Organism.objects.values_list('organism', flat=True),
+                                 ['Organism A', 'Organism B', 'Organism C'], transform=str)
+
+    def test_prefetch_rows_error(self):
+        parser = OrganismListParser()
+        parser.prefetch_size = 1
+        parser.fail_after = 2
+        with self.assertRaisesRegex(ConnectionError, "Connection lost"):
+            parser.parse()
+        self.assertEqual(parser.nb_created, 2)
+
+    @override_settings(TMP_DIR=mkdtemp('geotrek_test'))
+    def test_resume(self):
+        parser = OrganismListParser()
+        parser.checkpoint_interval = 1
+        parser.fail_after = 2
+        with self.assertRaises(ConnectionError):
+            parser.parse()
+        self.assertTrue(os.path.exists(parser.get_checkpoint_filename()))
+        Organism.objects.filter(organism='Organism A').update(organism='Modified')
+        parser = OrganismListParser()
+        parser.parse(resume=True)
+        # First rows are not imported again
+        self.assertEqual(Organism.objects.count(), 3)
+        self.assertFalse(Organism.objects.filter(organism='Organism A').exists())
+        self.assertEqual((parser.line, parser.nb_success, parser.nb_created), (3, 3, 3))
+        self.assertFalse(os.path.exists(parser.get_checkpoint_filename()))
+
     def test_report_format_text(self):
         parser = OrganismParser()
         self.assertRegex(parser.report(), '0/0 lines imported.')
@@ -244,6 +329,37 @@ class AttachmentParserTests(TestCase):
         self.assertEqual(mocked_head.call_count, 1)
         self.assertEqual(Attachment.objects.count(), 1)
 
+    @mock.patch('requests.Session.get')
+    def test_attachment_prefetch(self, mocked_get):
+        caches['fat'].clear()
+        downloaded = mock.Mock(status_code=200, content=b'Fake image', headers={'ETag': '"1234"'})
+        not_modified = mock.Mock(status_code=304, content=b'', headers={})
+        mocked_get.side_effect = [downloaded, not_modified]
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        call_command('import', 'geotrek.common.tests.test_parsers.AttachmentPrefetchParser', filename, verbosity=0)
+        call_command('import', 'geotrek.common.tests.test_parsers.AttachmentPrefetchParser', filename, verbosity=0)
+        self.assertEqual(mocked_get.call_count, 2)
+        self.assertNotIn('If-None-Match', mocked_get.call_args_list[0][1]['headers'])
+        self.assertEqual(mocked_get.call_args_list[1][1]['headers']['If-None-Match'], '"1234"')
+        attachment = Attachment.objects.get()
+        self.assertEqual(attachment.attachment_file.read(), b'Fake image')
+
+    @mock.patch('requests.Session.head')
+    @mock.patch('requests.get')
+    def test_attachment_prefetch_size_changed(self, mocked_get, mocked_head):
+        caches['fat'].clear()
+        mocked_get.return_value.status_code = 200
+        mocked_get.return_value.content = b''
+        mocked_head.return_value.status_code = 200
+        mocked_head.return_value.headers = {'content-length': 10}
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        call_command('import', 'geotrek.common.tests.test_parsers.AttachmentParser', filename, verbosity=0)
+        call_command('import', 'geotrek.common.tests.test_parsers.AttachmentPrefetchParser', filename, verbosity=0)
+        # Size checked in advance, then downloaded again while saving
+        self.assertEqual(mocked_head.call_count, 1)
+        self.assertEqual(mocked_get.call_count, 2)
+        self.assertEqual(Attachment.objects.count(), 1)
+
     @mock.patch('requests.get')
     @mock.patch('geotrek.common.parsers.urlparse')
     def test_attachment_download_fail(self, mocked_urlparse, mocked_get):
@@ -1,6 +1,10 @@
 import errno
 import os
 import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from landez.sources import DownloadError
 from unittest import mock
 import shutil
@@ -8,13 +12,14 @@ from io import StringIO
 import zipfile
 
 from django.conf import settings
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
 from django.contrib.gis.geos import LineString
 from django.core import management
 from django.core.management.base import CommandError
 from django.http import HttpResponse, StreamingHttpResponse
 from django.test.utils import override_settings
 
+from geotrek.common.helpers_sync import TilesStore, ZipTilesBuilder
 from geotrek.common.tests.factories import FileTypeFactory, RecordSourceFactory, TargetPortalFactory, AttachmentFactory, ThemeFactory
 from geotrek.common.utils.testdata import get_dummy_uploaded_image
 from geotrek.core.tests.factories import PathFactory
@@ -40,6 +45,87 @@ class VarTmpTestCase(TestCase):
             shutil.rmtree(os.path.join('var', 'tmp'))
 
 
+class TilesStoreTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = TilesStore(self.tmp_dir.name, ['http://tiles.test/{z}/{x}/{y}.png'])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_put(self):
+        self.assertIsNone(self.store.get((9, 258, 199)))
+        self.store.put((9, 258, 199), b'I am a png')
+        self.store.put((9, 258, 200), b'I am a png')
+        self.store.commit()
+        store = TilesStore(self.tmp_dir.name, ['http://tiles.test/{z}/{x}/{y}.png'])
+        self.assertEqual(store.get((9, 258, 199)), b'I am a png')
+        self.assertEqual(store.connection.execute("SELECT COUNT(*) FROM images").fetchone()[0], 1)
+
+    @mock.patch('landez.TilesManager.tile', return_value=b'I am a png')
+    def test_tiles_fetched_once(self, mock_tile):
+        with tempfile.TemporaryFile() as f, zipfile.ZipFile(f, 'w') as zfile:
+            for i in range(2):
+                tiles = ZipTilesBuilder(zfile, prefix='{}/'.format(i), store=self.store, workers=2,
+                                        tiles_url='http://tiles.test/{z}/{x}/{y}.png', tiles_dir=self.tmp_dir.name)
+                tiles.tiles = {(9, 258, 199), (9, 258, 200)}
+                tiles.run()
+            self.assertEqual(mock_tile.call_count, 2)
+            self.assertEqual(len(zfile.namelist()), 4)
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    latency = 0.02
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.end_headers()
+        self.wfile.write(b'I am a png')
+
+    def log_message(self, *args):
+        pass
+
+
+class ZipTilesBuilderTest(SimpleTestCase):
+    """
+    Download of the tiles of a trek corridor by several workers, from a local
+    tiles server answering with some latency.
+    """
+    def setUp(self):
+        TileHandler.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), TileHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.tiles_url = 'http://127.0.0.1:{}/{{z}}/{{x}}/{{y}}.png'.format(self.server.server_address[1])
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # A 1 km long trek with a vertex every 10 m
+        self.geom = LineString([(5 + i * 0.0001, 45 + i * 0.00005) for i in range(100)], srid=4326)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def test_tiles_fetched_once_by_workers(self):
+        store = TilesStore(self.tmp_dir.name, [self.tiles_url])
+        with tempfile.TemporaryFile() as f, zipfile.ZipFile(f, 'w') as zfile:
+            for i in range(2):
+                tiles = ZipTilesBuilder(zfile, prefix='{}/'.format(i), store=store, workers=8,
+                                        tiles_url=self.tiles_url, tiles_dir=self.tmp_dir.name)
+                tiles.add_corridor_coverage(self.geom, settings.MOBILE_TILES_RADIUS_LARGE,
+                                            settings.MOBILE_TILES_LOW_ZOOMS)
+                tiles.add_corridor_coverage(self.geom, settings.MOBILE_TILES_RADIUS_SMALL,
+                                            settings.MOBILE_TILES_HIGH_ZOOMS)
+                tiles.run()
+                # Second run reads tiles from store
+                self.assertEqual(len(TileHandler.requests), len(tiles.tiles))
+            self.assertEqual(len(set(TileHandler.requests)), len(tiles.tiles))
+            self.assertEqual(len(zfile.namelist()), 2 * len(tiles.tiles))
+
+
 class SyncRandoTilesTest(VarTmpTestCase):
     @mock.patch('geotrek.trekking.models.Trek.prepare_map_image')
     @mock.patch('landez.TilesManager.tile', return_value=b'I am a png')
@@ -266,6 +352,62 @@ class SyncTest(VarTmpTestCase):
                                 skip_pdf=True, verbosity=2, stdout=output)
         self.assertIn("unchanged", output.getvalue())
 
+    def test_sync_incremental(self):
+        kwargs = {'url': 'http://localhost:8000', 'skip_tiles': True, 'skip_pdf': True, 'languages': 'en',
+                  'verbosity': 2, 'stdout': StringIO()}
+        kml = os.path.join('var', 'tmp', 'api', 'en', 'treks', str(self.trek.pk), '{}.kml'.format(self.trek.slug))
+        management.call_command('sync_rando', 'var/tmp', **kwargs)
+        with open(os.path.join('var', 'tmp', 'manifest.json')) as f:
+            manifest = json.load(f)
+        self.assertIn(kml[len('var/tmp/'):], manifest['files'])
+        with open(kml, 'w') as f:
+            f.write('previous')
+
+        # Unchanged trek is not rendered again
+        management.call_command('sync_rando', 'var/tmp', **kwargs)
+        with open(kml) as f:
+            self.assertEqual(f.read(), 'previous')
+
+        # Unless forced to
+        management.call_command('sync_rando', 'var/tmp', full=True, **kwargs)
+        with open(kml) as f:
+            self.assertNotEqual(f.read(), 'previous')
+
+        # Or trek is modified
+        self.trek.save()
+        management.call_command('sync_rando', 'var/tmp', **kwargs)
+        with open(os.path.join('var', 'tmp', 'manifest.json')) as f:
+            new_manifest = json.load(f)
+        name = kml[len('var/tmp/'):]
+        self.assertNotEqual(new_manifest['files'][name]['stamp'], manifest['files'][name]['stamp'])
+
+    def test_sync_incremental_lookups(self):
+        kwargs = {'url': 'http://localhost:8000', 'skip_tiles': True, 'skip_pdf': True, 'languages': 'en',
+                  'verbosity': 2, 'stdout': StringIO()}
+        name = os.path.join('api', 'en', 'treks', str(self.trek.pk), '{}.kml'.format(self.trek.slug))
+        stamps = []
+
+        def sync():
+            management.call_command('sync_rando', 'var/tmp', **kwargs)
+            with open(os.path.join('var', 'tmp', 'manifest.json')) as f:
+                stamps.append(json.load(f)['files'][name]['stamp'])
+
+        sync()
+        # Themes, information desks and lookups have no update date
+        self.trek.themes.add(ThemeFactory.create())
+        sync()
+        desk = InformationDeskFactory.create()
+        self.trek.information_desks.add(desk)
+        sync()
+        desk.name = 'Other name'
+        desk.save()
+        sync()
+        difficulty = self.trek.difficulty
+        difficulty.difficulty = 'Other label'
+        difficulty.save()
+        sync()
+        self.assertEqual(len(set(stamps)), len(stamps))
+
     @override_settings(THUMBNAIL_COPYRIGHT_FORMAT='*' * 300)
     def test_sync_pictures_long_title_legend_author(self):
         with mock.patch('geotrek.trekking.models.Trek.prepare_map_image'):
@@ -333,6 +475,29 @@ class SyncTest(VarTmpTestCase):
         self.assertTrue(os.path.exists(os.path.join('var', 'tmp', 'api', 'fr', 'treks', str(trek_2.pk), 'fr_2.kml')))
 
 
+class SyncParallelTest(TransactionTestCase):
+    def setUp(self):
+        VarTmpTestCase.setUp(self)
+        self.trek = TrekWithPublishedPOIsFactory.create(published_en=True, published_fr=True)
+
+    def tearDown(self):
+        VarTmpTestCase.tearDown(self)
+
+    @mock.patch('geotrek.trekking.models.Trek.prepare_map_image')
+    def test_sync_processes(self, mocke):
+        management.call_command('sync_rando', 'var/tmp', url='http://localhost:8000', skip_tiles=True, skip_pdf=True,
+                                languages='en,fr', processes=2, verbosity=0)
+        for lang in ('en', 'fr'):
+            self.assertTrue(os.path.exists(os.path.join('var', 'tmp', 'api', lang, 'treks.geojson')))
+            self.assertTrue(os.path.exists(os.path.join('var', 'tmp', 'api', lang, 'treks', str(self.trek.pk),
+                                                        'profile.json')))
+            self.assertTrue(os.path.exists(os.path.join('var', 'tmp', 'zip', 'treks', lang, '{}.zip'.format(self.trek.pk))))
+        with open(os.path.join('var', 'tmp', 'manifest.json')) as f:
+            manifest = json.load(f)
+        self.assertIn(os.path.join('api', 'en', 'treks', str(self.trek.pk), 'profile.json'), manifest['files'])
+        self.assertIn(os.path.join('api', 'fr', 'treks', str(self.trek.pk), 'profile.json'), manifest['files'])
+
+
 class SyncComplexTest(VarTmpTestCase):
     @classmethod
     def setUpTestData(cls):
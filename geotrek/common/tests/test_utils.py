@@ -1,11 +1,12 @@
 from unittest import mock
 
-from django.contrib.gis.geos import Point
+from django.contrib.gis.geos import LineString, Point
 from django.db import connection
 from django.test import TestCase, override_settings
 
 from ..utils import sql_extent, uniquify, format_coordinates, spatial_reference
 from ..utils.postgresql import debug_pg_notices
+from ..utils.tiles import corridor_tiles, tile_bounds, tile_range, WORLD_EXTENT
 from ..utils.import_celery import (create_tmp_destination,
                                    subclasses,
                                    )
@@ -13,6 +14,30 @@ from ..utils.import_celery import (create_tmp_destination,
 from geotrek.common.parsers import Parser
 
 
+class TilesTest(TestCase):
+    def test_tile_bounds(self):
+        self.assertEqual(tile_bounds(0, 0, 0), (-WORLD_EXTENT, -WORLD_EXTENT, WORLD_EXTENT, WORLD_EXTENT))
+        self.assertEqual(tile_bounds(1, 1, 0), (0, 0, WORLD_EXTENT, WORLD_EXTENT))
+
+    def test_tile_range(self):
+        xs, ys = tile_range((WORLD_EXTENT / 2, WORLD_EXTENT / 2, WORLD_EXTENT / 2 + 10, WORLD_EXTENT / 2 + 10), 1)
+        self.assertEqual((list(xs), list(ys)), ([1], [0]))
+        # Tiles whose buffer overlaps the extent
+        xs, ys = tile_range((10, 10, 20, 20), 1)
+        self.assertEqual((list(xs), list(ys)), ([0, 1], [0, 1]))
+        # Clamped to the world
+        xs, ys = tile_range((-2 * WORLD_EXTENT, -2 * WORLD_EXTENT, 2 * WORLD_EXTENT, 2 * WORLD_EXTENT), 2)
+        self.assertEqual((list(xs), list(ys)), ([0, 1, 2, 3], [0, 1, 2, 3]))
+
+    def test_corridor_tiles(self):
+        tiles = corridor_tiles(LineString((5, 45), (5.05, 45), (5.1, 45), srid=4326), 0.005, [14])
+        self.assertIn((14, 8419, 5893), tiles)
+        self.assertIn((14, 8424, 5893), tiles)
+        for z, x, y in tiles:
+            self.assertTrue(8419 <= x <= 8424)
+            self.assertTrue(5893 <= y <= 5894)
+
+
 class UtilsTest(TestCase):
 
     def test_sqlextent(self):
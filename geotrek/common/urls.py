@@ -1,6 +1,8 @@
 from django.urls import path, converters, register_converter
 from mapentity.registry import MapEntityOptions
+from mapentity.models import ENTITY_LAYER
 
+from .mixins.views import MapEntityTileMixin
 from .views import (JSSettings, admin_check_extents, DocumentPublic, DocumentBookletPublic, import_view, import_update_json,
                     ThemeViewSet, MarkupPublic, sync_view, sync_update_json, SyncRandoRedirect)
 
@@ -44,3 +46,22 @@ class PublishableEntityOptions(MapEntityOptions):
                  self.markup_public_view.as_view(model=self.model)),
         ]
         return publishable_views + views
+
+
+class TileEntityOptions(MapEntityOptions):
+    # Labels of models whose changes invalidate tiles (see ``MapEntityTileMixin``)
+    tile_dependencies = None
+
+    def scan_views(self, *args, **kwargs):
+        """ Adds the URL of vector tiles, served from the layer view.
+        """
+        views = super().scan_views(*args, **kwargs)
+        layer_name = self.url_shortname(ENTITY_LAYER)
+        layer_view = next(view.callback.view_class for view in views if getattr(view, 'name', None) == layer_name)
+        tile_view = type('{}Tile'.format(self.model.__name__), (MapEntityTileMixin, layer_view),
+                         {'tile_dependencies': self.tile_dependencies})
+        tile_views = [
+            path('api/{name}/tiles/<int:z>/<int:x>/<int:y>.mvt'.format(name=self.modelname),
+                 tile_view.as_view(), name="%s_tile" % self.modelname),
+        ]
+        return views + tile_views
@@ -0,0 +1,120 @@
+import math
+import uuid
+from hashlib import md5
+
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.core.cache import caches
+
+# Half of the width of the world in Web Mercator (EPSG:3857)
+WORLD_EXTENT = 20037508.342789244
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+# Above this number of tiles at a zoom level, invalidate the whole zoom level
+MAX_INVALIDATED_TILES = 64
+
+
+def tile_bounds(z, x, y):
+    """
+    Return (xmin, ymin, xmax, ymax) of tile z/x/y in Web Mercator.
+    """
+    size = 2 * WORLD_EXTENT / 2 ** z
+    return (-WORLD_EXTENT + x * size, WORLD_EXTENT - (y + 1) * size,
+            -WORLD_EXTENT + (x + 1) * size, WORLD_EXTENT - y * size)
+
+
+def tile_range(extent, z):
+    """
+    Return ranges of x and y of the tiles at zoom level ``z`` which draw
+    something of ``extent`` (in Web Mercator), including their buffer.
+    """
+    size = 2 * WORLD_EXTENT / 2 ** z
+    margin = size * TILE_BUFFER / TILE_EXTENT
+    xmin, ymin, xmax, ymax = extent
+
+    def clamp(value):
+        return min(max(int(math.floor(value)), 0), 2 ** z - 1)
+
+    return (range(clamp((xmin - margin + WORLD_EXTENT) / size), clamp((xmax + margin + WORLD_EXTENT) / size) + 1),
+            range(clamp((WORLD_EXTENT - ymax - margin) / size), clamp((WORLD_EXTENT - ymin + margin) / size) + 1))
+
+
+def geom_tile_extent(geom):
+    """
+    Return the extent of ``geom`` in Web Mercator, or None if it is empty.
+    """
+    if not geom:
+        return None
+    if geom.srid != 3857:
+        geom = geom.transform(3857, clone=True)
+    return geom.extent
+
+
+def corridor_tiles(geom, radius, zoomlevels):
+    """
+    Return tiles (z, x, y) at less than ``radius`` degrees from ``geom``.
+    At each zoom level, the geometry is simplified in proportion to the
+    size of tiles before being buffered, so that only the tiles along the
+    corridor are kept.
+    """
+    geom = geom.transform(4326, clone=True)
+    tiles = set()
+    for z in zoomlevels:
+        tolerance = 360 / 2 ** z / 8
+        corridor = geom.simplify(tolerance).buffer(radius + tolerance)
+        corridor.transform(3857)
+        prepared = corridor.prepared
+        xs, ys = tile_range(corridor.extent, z)
+        for x in xs:
+            for y in ys:
+                if prepared.intersects(Polygon.from_bbox(tile_bounds(z, x, y))):
+                    tiles.add((z, x, y))
+    return tiles
+
+
+def tile_version_keys(label, z, x, y):
+    return 'mvt_version_{}_{}'.format(label, z), 'mvt_version_{}_{}_{}_{}'.format(label, z, x, y)
+
+
+def tile_cache_key(labels, z, x, y, variant):
+    """
+    Return cache key of tile z/x/y, built from versions of the tile for each
+    model of ``labels`` (the tile is invalidated when one of them changes).
+    """
+    cache = caches['fat']
+    keys = [key for label in labels for key in tile_version_keys(label, z, x, y)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex)
+            versions[key] = cache.get(key)
+    token = md5(':'.join([str(versions[key]) for key in keys] + [variant]).encode()).hexdigest()
+    return 'mvt_{}_{}_{}_{}'.format(labels[0], z, x, y) + '_' + token
+
+
+def invalidate_tiles(labels, extents=None):
+    """
+    Invalidate cached tiles of models ``labels`` drawing something of one of
+    ``extents`` (in Web Mercator), or all their tiles if ``extents`` is None.
+    """
+    if extents is not None:
+        extents = [extent for extent in extents if extent]
+        if not extents:
+            return
+    keys = []
+    for z in range(settings.VECTOR_TILES_MIN_ZOOM, settings.VECTOR_TILES_MAX_ZOOM + 1):
+        tiles = None
+        if extents is not None:
+            tiles = set()
+            for extent in extents:
+                xs, ys = tile_range(extent, z)
+                if len(tiles) + len(xs) * len(ys) > MAX_INVALIDATED_TILES:
+                    tiles = None
+                    break
+                tiles.update((x, y) for x in xs for y in ys)
+        for label in labels:
+            if tiles is None:
+                keys.append(tile_version_keys(label, z, 0, 0)[0])
+            else:
+                keys += [tile_version_keys(label, z, x, y)[1] for x, y in tiles]
+    caches['fat'].delete_many(keys)
@@ -1,16 +1,192 @@
+import heapq
 import math
+import struct
+import sys
+import uuid
+from array import array
 from collections import defaultdict
 
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.core.cache import caches
+from django.db.models import Count, FloatField, Func, Max
 
-def path_modifier(path):
-    length = 0.0 if math.isnan(path.length) else path.length
-    return {"id": path.pk, "length": length}
 
+def edge_length(length):
+    return 0.0 if length is None or math.isnan(length) else length
 
-def get_key_optimizer():
-    next_id = iter(range(1, 1000000)).__next__
-    mapping = defaultdict(next_id)
-    return lambda x: mapping[x]
+
+def path_rows(queryset):
+    """
+    Return (id, length, start point, end point, update date) of paths,
+    ordered by id, without loading their geometries.
+    """
+    def coordinate(function, point):
+        return Func(Func('geom', function=point), function=function, output_field=FloatField())
+
+    rows = queryset.order_by('pk').annotate(
+        start_x=coordinate('ST_X', 'ST_StartPoint'), start_y=coordinate('ST_Y', 'ST_StartPoint'),
+        end_x=coordinate('ST_X', 'ST_EndPoint'), end_y=coordinate('ST_Y', 'ST_EndPoint'),
+    ).values_list('pk', 'length', 'start_x', 'start_y', 'end_x', 'end_y', 'date_update')
+    for pk, length, start_x, start_y, end_x, end_y, date_update in rows.iterator():
+        yield pk, edge_length(length), (start_x, start_y), (end_x, end_y), date_update
+
+
+def path_graph_state(queryset):
+    """
+    Return (last update date, count) of paths, which changes whenever
+    the graph of these paths has to be updated.
+    """
+    state = queryset.order_by().aggregate(latest=Max('date_update'), count=Count('pk'))
+    return state['latest'], state['count']
+
+
+class PathGraph:
+    """
+    Paths network graph, kept up to date by applying per-path deltas.
+
+    Nodes identifiers are stable across updates, so that clients holding
+    a previous version of the graph can apply the changes returned by
+    ``diff()`` instead of downloading the whole document again.
+    """
+    # Number of versions for which changes are kept
+    history_size = 100
+
+    def __init__(self):
+        # Versions are ``<graph id>-<counter>``, so that versions of a
+        # rebuilt graph never match versions of a previous one
+        self.graph_id = uuid.uuid4().hex
+        self.counter = 0
+        self.latest = None
+        self.edges = {}
+        self.nodes = defaultdict(dict)
+        self.coords = {}  # coordinates -> node id
+        self.node_coords = {}  # node id -> coordinates
+        self.degrees = defaultdict(int)  # node id -> number of edges ends
+        self.next_node_id = 1
+        self.changes = []  # (counter, edges ids, nodes ids)
+
+    @property
+    def version(self):
+        return '{}-{}'.format(self.graph_id, self.counter)
+
+    def node_id(self, coord):
+        node_id = self.coords.get(coord)
+        if node_id is None:
+            node_id = self.next_node_id
+            self.next_node_id += 1
+            self.coords[coord] = node_id
+            self.node_coords[node_id] = coord
+        return node_id
+
+    def add_path(self, edge_id, length, start_point, end_point):
+        k_start_point, k_end_point = self.node_id(start_point), self.node_id(end_point)
+
+        v_path = {'id': edge_id, 'length': length, 'nodes_id': [k_start_point, k_end_point]}
+
+        self.nodes[k_start_point][k_end_point] = edge_id
+        self.nodes[k_end_point][k_start_point] = edge_id
+        self.degrees[k_start_point] += 1
+        self.degrees[k_end_point] += 1
+        self.edges[edge_id] = v_path
+        return v_path['nodes_id']
+
+    def remove_path(self, edge_id):
+        edge = self.edges.pop(edge_id, None)
+        if edge is None:
+            return []
+        k_start_point, k_end_point = edge['nodes_id']
+        for k_from, k_to in ((k_start_point, k_end_point), (k_end_point, k_start_point)):
+            neighbours = self.nodes.get(k_from, {})
+            if neighbours.get(k_to) == edge_id:
+                del neighbours[k_to]
+        for k in (k_start_point, k_end_point):
+            if k in self.nodes and not self.nodes[k]:
+                del self.nodes[k]
+            self.degrees[k] -= 1
+            if not self.degrees[k]:
+                # Node without edges any more, forget its coordinates
+                del self.degrees[k]
+                del self.coords[self.node_coords.pop(k)]
+        return edge['nodes_id']
+
+    def update(self, queryset):
+        """
+        Apply changes of ``queryset`` since last update.
+        Paths updated after ``self.latest`` are (re)inserted, paths that are
+        no longer in ``queryset`` are removed.
+        Returns True if the graph changed.
+        """
+        latest, count = path_graph_state(queryset)
+        if latest == self.latest and count == len(self.edges):
+            # Nothing created, updated nor deleted
+            return False
+        if self.latest is None:
+            updated = queryset
+        else:
+            updated = queryset.filter(date_update__gt=self.latest)
+        updated = list(path_rows(updated))
+
+        changed_edges, changed_nodes = set(), set()
+        created = {row[0] for row in updated} - set(self.edges)
+        if len(self.edges) + len(created) > count:
+            # Some paths were deleted
+            existing_ids = set(queryset.values_list('pk', flat=True))
+            for edge_id in set(self.edges) - existing_ids:
+                changed_nodes.update(self.remove_path(edge_id))
+                changed_edges.add(edge_id)
+        if not self.edges:
+            # Graph is empty, restart nodes numbering
+            self.coords = {}
+            self.node_coords = {}
+            self.degrees = defaultdict(int)
+            self.next_node_id = 1
+        for pk, length, start_point, end_point, date_update in updated:
+            changed_nodes.update(self.remove_path(pk))
+            changed_nodes.update(self.add_path(pk, length, start_point, end_point))
+            changed_edges.add(pk)
+
+        self.latest = latest
+        self.counter += 1
+        self.changes.append((self.counter, changed_edges, changed_nodes))
+        self.changes = self.changes[-self.history_size:]
+        return True
+
+    def diff(self, since):
+        """
+        Return changes since version ``since`` on the form:
+        {
+            version: current version
+            edges: {edge_id: edge or None if deleted}
+            nodes: {node_id: {node_id: edge_id} or None if deleted}
+        }
+        Return None if ``since`` is not a version of this graph or if
+        changes since this version are no longer available.
+        """
+        graph_id, _, counter = str(since).partition('-')
+        if graph_id != self.graph_id or not counter.isdigit():
+            return None
+        counter = int(counter)
+        if counter > self.counter:
+            return None
+        if counter < self.counter and (not self.changes or self.changes[0][0] > counter + 1):
+            return None
+        edges_ids, nodes_ids = set(), set()
+        for change_counter, changed_edges, changed_nodes in self.changes:
+            if change_counter > counter:
+                edges_ids |= changed_edges
+                nodes_ids |= changed_nodes
+        return {
+            'version': self.version,
+            'edges': {edge_id: self.edges.get(edge_id) for edge_id in edges_ids},
+            'nodes': {node_id: self.nodes.get(node_id) for node_id in nodes_ids},
+        }
+
+    def as_dict(self):
+        return {
+            'edges': dict(self.edges),
+            'nodes': dict(self.nodes),
+        }
 
 
 def graph_edges_nodes_of_qs(qs):
@@ -31,27 +207,387 @@ def graph_edges_nodes_of_qs(qs):
 
     coord_point are tuple of float
     """
+    return CompactPathGraph.from_rows(path_rows(qs)).as_dict()
+
+
+class CompactPathGraph:
+    """
+    Paths graph stored in flat typed arrays (compressed sparse rows).
+
+    Nodes are numbered from 0 and neighbours of node ``n`` are
+    ``targets[offsets[n]:offsets[n + 1]]``, reached through edges of index
+    ``edges[offsets[n]:offsets[n + 1]]``. Edge of index ``i`` is path
+    ``edge_ids[i]``, of length ``lengths[i]``, from node ``edge_nodes[2 * i]``
+    to node ``edge_nodes[2 * i + 1]``.
+    """
+    magic = b'GTGRAPH1'
 
-    key_modifier = get_key_optimizer()
-    value_modifier = path_modifier
+    def __init__(self, offsets, targets, edges, edge_ids, edge_nodes, lengths):
+        self.offsets = offsets
+        self.targets = targets
+        self.edges = edges
+        self.edge_ids = edge_ids
+        self.edge_nodes = edge_nodes
+        self.lengths = lengths
 
-    edges = defaultdict(dict)
-    nodes = defaultdict(dict)
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build graph from (id, length, start point, end point, ...) rows.
+        """
+        coords = {}
+        edge_ids, edge_nodes, lengths = array('q'), array('q'), array('d')
+        for row in rows:
+            pk, length, start_point, end_point = row[:4]
+            edge_ids.append(pk)
+            lengths.append(length)
+            edge_nodes.append(coords.setdefault(start_point, len(coords)))
+            edge_nodes.append(coords.setdefault(end_point, len(coords)))
+        del coords
+        return cls.from_edges(edge_ids, edge_nodes, lengths)
 
-    for path in qs:
-        coords = path.geom.coords
-        start_point, end_point = coords[0], coords[-1]
-        k_start_point, k_end_point = key_modifier(start_point), key_modifier(end_point)
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        Build graph from a ``PathGraph``, keeping its nodes ids (node ``n``
+        of the ``PathGraph`` is node ``n - 1``).
+        """
+        edge_ids, edge_nodes, lengths = array('q'), array('q'), array('d')
+        for edge in graph.edges.values():
+            edge_ids.append(edge['id'])
+            lengths.append(edge['length'])
+            edge_nodes.extend(node_id - 1 for node_id in edge['nodes_id'])
+        return cls.from_edges(edge_ids, edge_nodes, lengths)
 
-        v_path = value_modifier(path)
-        v_path['nodes_id'] = [k_start_point, k_end_point]
-        edge_id = v_path['id']
+    @classmethod
+    def from_edges(cls, edge_ids, edge_nodes, lengths):
+        """
+        Build graph from edges arrays, filling neighbours rows.
+        """
+        # Count neighbours of each node, then fill rows in edges order
+        offsets = array('q', [0]) * (max(edge_nodes, default=-1) + 2)
+        for node in edge_nodes:
+            offsets[node + 1] += 1
+        for node in range(1, len(offsets)):
+            offsets[node] += offsets[node - 1]
+        position = array('q', offsets[:-1])
+        targets = array('q', [0]) * len(edge_nodes)
+        edges = array('q', [0]) * len(edge_nodes)
+        for i in range(len(edge_ids)):
+            start, end = edge_nodes[2 * i], edge_nodes[2 * i + 1]
+            for node_from, node_to in ((start, end), (end, start)):
+                targets[position[node_from]] = node_to
+                edges[position[node_from]] = i
+                position[node_from] += 1
+        return cls(offsets, targets, edges, edge_ids, edge_nodes, lengths)
 
-        nodes[k_start_point][k_end_point] = edge_id
-        nodes[k_end_point][k_start_point] = edge_id
-        edges[edge_id] = v_path
+    def neighbours(self, node):
+        """
+        Return (node, path id, length) tuples of neighbours of node.
+        """
+        for k in range(self.offsets[node], self.offsets[node + 1]):
+            i = self.edges[k]
+            yield self.targets[k], self.edge_ids[i], self.lengths[i]
 
-    return {
-        'edges': dict(edges),
-        'nodes': dict(nodes),
-    }
+    def as_dict(self):
+        """
+        Return graph on the form of ``graph_edges_nodes_of_qs()``.
+        """
+        nodes = {}
+        for node in range(len(self.offsets) - 1):
+            if self.offsets[node] == self.offsets[node + 1]:
+                # Id of a removed node of a ``PathGraph``
+                continue
+            nodes[node + 1] = {target + 1: edge_id for target, edge_id, length in self.neighbours(node)}
+        edges = {}
+        for i, edge_id in enumerate(self.edge_ids):
+            edges[edge_id] = {
+                'id': edge_id,
+                'length': self.lengths[i],
+                'nodes_id': [self.edge_nodes[2 * i] + 1, self.edge_nodes[2 * i + 1] + 1],
+            }
+        return {
+            'edges': edges,
+            'nodes': nodes,
+        }
+
+    def to_bytes(self):
+        """
+        Binary export: magic, nodes and edges counts, then little-endian
+        offsets, targets, edges, edge ids, edge nodes and lengths arrays.
+        """
+        data = [self.magic, struct.pack('<qq', len(self.offsets) - 1, len(self.edge_ids))]
+        for values in (self.offsets, self.targets, self.edges, self.edge_ids, self.edge_nodes, self.lengths):
+            if sys.byteorder == 'big':
+                values = array(values.typecode, values)
+                values.byteswap()
+            data.append(values.tobytes())
+        return b''.join(data)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data.startswith(cls.magic):
+            raise ValueError("Invalid graph binary data")
+        start = len(cls.magic)
+        nb_nodes, nb_edges = struct.unpack_from('<qq', data, start)
+        start += struct.calcsize('<qq')
+        values = []
+        for typecode, size in (('q', nb_nodes + 1), ('q', 2 * nb_edges), ('q', 2 * nb_edges),
+                               ('q', nb_edges), ('q', 2 * nb_edges), ('d', nb_edges)):
+            item = array(typecode)
+            end = start + size * item.itemsize
+            item.frombytes(data[start:end])
+            if sys.byteorder == 'big':
+                item.byteswap()
+            values.append(item)
+            start = end
+        return cls(*values)
+
+
+def get_path_graph():
+    """
+    Return the graph of non-draft paths, brought up to date from the one
+    stored in cache.
+    """
+    from .models import Path
+
+    cache = caches['fat']
+    graph = cache.get('path_graph')
+    created = graph is None
+    if created:
+        graph = PathGraph()
+    if graph.update(Path.objects.exclude(draft=True)) or created:
+        cache.set('path_graph', graph)
+        cache.set('path_graph_version', (graph.version, graph.latest, len(graph.edges)))
+    return graph
+
+
+def get_path_graph_version():
+    """
+    Return the current version of the graph of non-draft paths, without
+    loading the graph from cache when it is up to date.
+    """
+    from .models import Path
+
+    cached = caches['fat'].get('path_graph_version')
+    if cached is not None and cached[1:] == path_graph_state(Path.objects.exclude(draft=True)):
+        return cached[0]
+    return get_path_graph().version
+
+
+class PathRouter:
+    """
+    Compute shortest routes along paths between via-points, using A* search
+    over a ``CompactPathGraph`` guided by distances to landmarks (ALT).
+
+    Each step of a route goes through a given edge, so that the shortest of
+    several paths sharing the same ends is used.
+    """
+    # Number of landmarks, each one costs a Dijkstra over the whole graph
+    # when the router is built, and a float per node
+    landmarks_count = 8
+
+    def __init__(self, graph, version=None):
+        self.graph = graph
+        self.version = version
+        self.edge_index = {edge_id: i for i, edge_id in enumerate(graph.edge_ids)}
+        self.landmarks = self.compute_landmarks()
+
+    def snap(self, steps):
+        """
+        Return path id and position of closest path to each point (API_SRID)
+        of ``steps``.
+        """
+        from .models import Path
+
+        points = []
+        for lng, lat in steps:
+            point = Point(lng, lat, srid=settings.API_SRID)
+            point.transform(settings.SRID)
+            points.append(point)
+        snapped = []
+        for pk, position, offset in Path.closest_bulk(points):
+            if pk is None:
+                raise IndexError("No path found")
+            snapped.append((pk, position))
+        return snapped
+
+    def distances(self, sources):
+        """
+        Dijkstra over the whole graph.
+        Return distances of all nodes to closest node of ``sources``
+        (infinite if not reachable).
+        """
+        graph = self.graph
+        distances = array('d', [math.inf]) * (len(graph.offsets) - 1)
+        heap = []
+        for node in sources:
+            distances[node] = 0.0
+            heap.append((0.0, node))
+        while heap:
+            weight, node = heapq.heappop(heap)
+            if weight > distances[node]:
+                continue
+            for k in range(graph.offsets[node], graph.offsets[node + 1]):
+                next_node = graph.targets[k]
+                next_weight = weight + graph.lengths[graph.edges[k]]
+                if next_weight < distances[next_node]:
+                    distances[next_node] = next_weight
+                    heapq.heappush(heap, (next_weight, next_node))
+        return distances
+
+    def compute_landmarks(self):
+        """
+        Return distances of all nodes to each landmark. Landmarks are chosen
+        among nodes the farthest from previous ones, starting with nodes of
+        components without landmark yet.
+        """
+        offsets = self.graph.offsets
+        nb_nodes = len(offsets) - 1
+        closest = array('d', [math.inf]) * nb_nodes
+        landmarks = []
+        while len(landmarks) < self.landmarks_count:
+            landmark, farthest = None, 0.0
+            for node in range(nb_nodes):
+                if offsets[node] < offsets[node + 1] and closest[node] > farthest:
+                    landmark, farthest = node, closest[node]
+            if landmark is None:
+                break
+            distances = self.distances([landmark])
+            for node in range(nb_nodes):
+                if distances[node] < closest[node]:
+                    closest[node] = distances[node]
+            landmarks.append(distances)
+        return landmarks
+
+    def lower_bound(self, node, targets):
+        """
+        Lower bound of the cost from ``node`` to ``targets``, a list of
+        (final cost, distances of target to landmarks).
+        """
+        bound = math.inf
+        for cost, target_distances in targets:
+            estimate = 0.0
+            for distances, target_distance in zip(self.landmarks, target_distances):
+                distance = distances[node]
+                if distance != math.inf and target_distance != math.inf:
+                    estimate = max(estimate, abs(distance - target_distance))
+            bound = min(bound, estimate + cost)
+        return bound
+
+    def shortest_path(self, sources, targets):
+        """
+        Multi-source A* search.
+        ``sources`` and ``targets`` map nodes to initial and final costs.
+        Return (weight, list of nodes, list of edges indexes) or None if not
+        reachable.
+        """
+        graph = self.graph
+        targets_bounds = [(cost, [distances[node] for distances in self.landmarks])
+                          for node, cost in targets.items()]
+        heap = [(weight + self.lower_bound(node, targets_bounds), weight, node) for node, weight in sources.items()]
+        heapq.heapify(heap)
+        weights = dict(sources)
+        previous = {}  # node -> (previous node, edge index)
+        visited = set()
+        best = None
+        while heap:
+            estimate, weight, node = heapq.heappop(heap)
+            if node in visited:
+                continue
+            if best is not None and estimate >= best[0]:
+                break
+            visited.add(node)
+            if node in targets:
+                total = weight + targets[node]
+                if best is None or total < best[0]:
+                    best = (total, node)
+            for k in range(graph.offsets[node], graph.offsets[node + 1]):
+                next_node, i = graph.targets[k], graph.edges[k]
+                next_weight = weight + graph.lengths[i]
+                if next_node not in weights or next_weight < weights[next_node]:
+                    weights[next_node] = next_weight
+                    previous[next_node] = (node, i)
+                    heapq.heappush(heap, (next_weight + self.lower_bound(next_node, targets_bounds),
+                                          next_weight, next_node))
+        if best is None:
+            return None
+        node = best[1]
+        nodes, edges = [node], []
+        while node in previous:
+            node, i = previous[node]
+            nodes.append(node)
+            edges.append(i)
+        return best[0], nodes[::-1], edges[::-1]
+
+    def subtopology(self, start, end):
+        """
+        Return serialized sub-topology from ``start`` to ``end``, both given
+        as (path id, position), or None if not reachable.
+        """
+        graph = self.graph
+        start_index, end_index = self.edge_index[start[0]], self.edge_index[end[0]]
+        start_nodes = graph.edge_nodes[2 * start_index:2 * start_index + 2]
+        end_nodes = graph.edge_nodes[2 * end_index:2 * end_index + 2]
+        start_length, end_length = graph.lengths[start_index], graph.lengths[end_index]
+        sources = {}
+        for node, weight in zip(start_nodes, (start[1] * start_length, (1 - start[1]) * start_length)):
+            sources[node] = min(weight, sources.get(node, weight))
+        targets = {}
+        for node, weight in zip(end_nodes, (end[1] * end_length, (1 - end[1]) * end_length)):
+            targets[node] = min(weight, targets.get(node, weight))
+
+        result = self.shortest_path(sources, targets)
+        if start[0] == end[0] and (result is None or abs(end[1] - start[1]) * start_length <= result[0]):
+            # Stay on the same path
+            return {'offset': 0, 'positions': {'0': [start[1], end[1]]}, 'paths': [start[0]]}
+        if result is None:
+            return None
+        weight, nodes, edges = result
+
+        # Leave first path through its start or its end
+        paths = [start[0]]
+        positions = [[start[1], 0.0 if nodes[0] == start_nodes[0] else 1.0]]
+        for node_from, i in zip(nodes[:-1], edges):
+            paths.append(graph.edge_ids[i])
+            positions.append([0.0, 1.0] if graph.edge_nodes[2 * i] == node_from else [1.0, 0.0])
+        # Enter last path through its start or its end
+        paths.append(end[0])
+        positions.append([0.0 if nodes[-1] == end_nodes[0] else 1.0, end[1]])
+        return {
+            'offset': 0,
+            'positions': {str(i): position for i, position in enumerate(positions)},
+            'paths': paths,
+        }
+
+    def route(self, steps):
+        """
+        Return serialized topology (as accepted by ``Topology.deserialize()``)
+        going through ``steps``, a list of (lng, lat) points in API_SRID.
+        Return None if no route is found.
+        """
+        if len(steps) < 2:
+            raise ValueError("At least two steps are required")
+        snapped = self.snap(steps)
+        topology = []
+        for start, end in zip(snapped[:-1], snapped[1:]):
+            subtopology = self.subtopology(start, end)
+            if subtopology is None:
+                return None
+            topology.append(subtopology)
+        return topology
+
+
+def get_path_router():
+    """
+    Return the router over the graph of non-draft paths, with landmarks
+    computed once per version of the graph and stored in cache.
+    """
+    cache = caches['fat']
+    version = get_path_graph_version()
+    router = cache.get('path_router')
+    if router is None or router.version != version:
+        graph = get_path_graph()
+        router = PathRouter(CompactPathGraph.from_graph(graph), graph.version)
+        cache.set('path_router', router)
+    return router
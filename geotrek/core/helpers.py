@@ -0,0 +1,170 @@
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.contrib.gis.geos.error import GEOSException
+from django.db import transaction
+
+from geotrek.common.mixins.models import BasePublishableMixin
+from geotrek.common.signals import get_tile_labels
+from geotrek.common.utils.tiles import geom_tile_extent, invalidate_tiles
+
+from .models import PathAggregation, Topology
+
+
+class PointTopologyLoader:
+    """
+    Create or update objects of a point topology ``model`` (POIs, signages,
+    infrastructures...) by chunks of ``batch_size`` objects.
+
+    Related objects (types, conditions...) are looked up once, all points of
+    a chunk are snapped to their closest path with one query, then topologies,
+    path aggregations and objects are inserted or updated with bulk queries.
+    As with ``update_or_create()``, an object with the same external id is
+    updated instead of created.
+
+    ``on_flush`` is called with the objects saved by each chunk, to do what
+    their ``save()`` method would have done. Fields computed by triggers
+    (geometry, altimetry) are not reloaded on objects.
+    """
+    def __init__(self, model, batch_size=1000, on_flush=None):
+        self.model = model
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.lookups = {}
+        self.objects_by_eid = None
+        self.update_fields = {'offset', 'geom', 'deleted'}
+        if issubclass(model, BasePublishableMixin):
+            self.update_fields.add('publication_date')
+        self.pending = []
+        self.created = 0
+        self.updated = 0
+
+    def get(self, model, **fields):
+        """``model.objects.get(**fields)``, queried once for the same fields"""
+        key = (model, 'get', tuple(sorted(fields.items())))
+        if key not in self.lookups:
+            self.lookups[key] = model.objects.get(**fields)
+        return self.lookups[key]
+
+    def get_or_create(self, model, **fields):
+        """``model.objects.get_or_create(**fields)``, queried once for the same fields"""
+        key = (model, 'get_or_create', tuple(sorted(fields.items())))
+        if key in self.lookups:
+            return self.lookups[key], False
+        obj, created = model.objects.get_or_create(**fields)
+        self.lookups[key] = obj
+        return obj, created
+
+    def get_objects_by_eid(self):
+        if self.objects_by_eid is None:
+            self.objects_by_eid = {obj.eid: obj for obj in self.model.objects.exclude(eid=None).exclude(eid='')}
+        return self.objects_by_eid
+
+    def add(self, geometry, eid=None, **fields):
+        """
+        Add an object at point ``geometry`` (any SRID) with ``fields`` values.
+        Return (object, created) like ``update_or_create()`` does, the object
+        being saved with the next chunk.
+        """
+        if geometry.geom_type not in ('Point', 'Point25D'):
+            raise GEOSException('Invalid Geometry type.')
+        srid = settings.API_SRID if settings.TREKKING_TOPOLOGY_ENABLED else settings.SRID
+        geometry = geometry.transform(srid, clone=True)
+        obj = self.get_objects_by_eid().get(eid) if eid else None
+        created = obj is None or obj.pk is None
+        if obj is None:
+            obj = self.model(**fields)
+            if eid:
+                obj.eid = eid
+                self.objects_by_eid[eid] = obj
+        else:
+            for name, value in fields.items():
+                setattr(obj, name, value)
+        self.update_fields.update(fields)
+        self.pending.append((obj, (geometry.x, geometry.y)))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return obj, created
+
+    def flush(self):
+        """Save objects added since last chunk"""
+        pending, self.pending = self.pending, []
+        # An object added twice (same external id) gets its last position
+        points = {id(obj): (obj, point) for obj, point in pending}
+        objs = [obj for obj, point in points.values()]
+        if not objs:
+            return []
+        if settings.TREKKING_TOPOLOGY_ENABLED:
+            try:
+                topologies = Topology.deserialize_bulk([{'lng': x, 'lat': y} for obj, (x, y) in points.values()])
+            except IndexError:
+                raise GEOSException('Invalid Geometry type. You need 1 path')
+        # Static value for Topology offset, if any
+        shortmodelname = self.model._meta.object_name.lower().replace('edge', '')
+        for i, (obj, (x, y)) in enumerate(points.values()):
+            obj.kind = self.model.KIND
+            obj.deleted = False
+            if settings.TREKKING_TOPOLOGY_ENABLED:
+                obj.offset = topologies[i].offset
+                obj.geom = topologies[i].geom
+            else:
+                obj.geom = Point(x, y, srid=settings.SRID)
+            obj.offset = settings.TOPOLOGY_STATIC_OFFSETS.get(shortmodelname, obj.offset)
+            if isinstance(obj, BasePublishableMixin):
+                obj.update_publication_date()
+
+        created = [obj for obj in objs if obj.pk is None]
+        updated = [obj for obj in objs if obj.pk is not None]
+        with transaction.atomic():
+            if updated:
+                # Topologies of updated objects are replaced
+                PathAggregation.objects.filter(topo_object__in=[obj.pk for obj in updated]).delete()
+                self.model.objects.bulk_update(updated, sorted(self.update_fields))
+            if created:
+                self.bulk_create(created)
+            if settings.TREKKING_TOPOLOGY_ENABLED:
+                aggregations = []
+                for obj, topology in zip(points.values(), topologies):
+                    # A point on an intersection gets its other aggregations from triggers
+                    aggr = topology.aggregations.all()[0]
+                    aggregations.append(PathAggregation(
+                        path=aggr.path, topo_object_id=obj[0].pk, start_position=aggr.start_position,
+                        end_position=aggr.end_position, order=aggr.order
+                    ))
+                PathAggregation.objects.bulk_create(aggregations)
+
+        self.invalidate(objs)
+        self.created += len(created)
+        self.updated += len(updated)
+        if self.on_flush:
+            self.on_flush(objs)
+        return objs
+
+    def bulk_create(self, objs):
+        """
+        Django can not bulk create objects of multi-table inherited models:
+        insert their topologies, then rows of the model table as
+        ``save_base(raw=True)`` does, but for all objects at once.
+        """
+        fields = [field for field in Topology._meta.concrete_fields if not field.primary_key]
+        topologies = [Topology(**{field.attname: getattr(obj, field.attname) for field in fields}) for obj in objs]
+        Topology.objects.bulk_create(topologies)
+        for obj, topology in zip(objs, topologies):
+            for field in Topology._meta.concrete_fields:
+                setattr(obj, field.attname, getattr(topology, field.attname))
+            setattr(obj, self.model._meta.pk.attname, topology.pk)
+        self.model._base_manager._insert(objs, fields=self.model._meta.local_concrete_fields,
+                                         using=self.model._base_manager.db)
+        for obj in objs:
+            obj._state.adding = False
+            obj._state.db = self.model._base_manager.db
+
+    def invalidate(self, objs):
+        """Invalidate caches, as ``post_save`` signals do"""
+        extents = [geom_tile_extent(getattr(obj, '_tile_geom', None)) for obj in objs]
+        extents += [geom_tile_extent(obj.geom) for obj in objs]
+        invalidate_tiles(get_tile_labels(self.model), extents)
+        for obj in objs:
+            obj._tile_geom = obj.geom
+        if 'geotrek.api' in settings.INSTALLED_APPS:
+            from geotrek.api.v2.utils import invalidate_api_cache
+            invalidate_api_cache()
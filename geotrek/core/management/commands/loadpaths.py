@@ -1,11 +1,16 @@
 from django.contrib.gis.gdal import DataSource, GDALException
-from geotrek.core.models import Path
+from django.contrib.gis.geos import GEOSGeometry
+from geotrek.altimetry.dem import get_dem_sampler
+from geotrek.altimetry.helpers import AltimetryHelper
+from geotrek.common.utils.tiles import invalidate_tiles
+from geotrek.core.models import Path, Topology, schedule_topologies_geom_update
 from geotrek.authent.models import Structure
 from django.contrib.gis.geos.collections import Polygon, LineString
 from django.core.management.base import BaseCommand, CommandError
+from django.apps import apps
 from django.conf import settings
 from django.db.utils import IntegrityError, InternalError
-from django.db import transaction
+from django.db import connection, transaction
 
 
 class Command(BaseCommand):
@@ -29,6 +34,9 @@ class Command(BaseCommand):
         parser.add_argument('--dry', '-d', action='store_true', dest='dry', default=False,
                             help="Do not change the database, dry run. Show the number of fail"
                                  " and objects potentially created")
+        parser.add_argument('--bulk', '-b', action='store_true', dest='bulk', default=False,
+                            help="Snap, split and drape all paths at once instead of one by one (faster for"
+                                 " large files)")
 
     def handle(self, *args, **options):
         verbosity = options.get('verbosity')
@@ -41,6 +49,7 @@ class Command(BaseCommand):
         comments_columns = options.get('comment')
         fail = options.get('fail')
         dry = options.get('dry')
+        bulk = options.get('bulk')
 
         if dry:
             fail = True
@@ -68,6 +77,7 @@ class Command(BaseCommand):
         self.bbox.srid = settings.SRID
 
         sid = transaction.savepoint()
+        features = []
 
         for layer in ds:
             for feat in layer:
@@ -85,6 +95,9 @@ class Command(BaseCommand):
                 self.check_srid(srid, geom)
                 geom.dim = 2
                 if self.should_import(feat, geom):
+                    if bulk:
+                        features.append((name, '</br>'.join(comment_final_tab), geom))
+                        continue
                     try:
                         with transaction.atomic():
                             comment_final = '</br>'.join(comment_final_tab)
@@ -103,6 +116,8 @@ class Command(BaseCommand):
                             self.stdout.write('Integrity Error on path : {}, {}'.format(name, geom))
                         else:
                             raise
+        if bulk:
+            counter, counter_fail = self.load_bulk(features, structure, fail, dry, verbosity)
         if not dry:
             transaction.savepoint_commit(sid)
             if verbosity >= 2:
@@ -127,3 +142,263 @@ class Command(BaseCommand):
             self.do_intersect and self.bbox.intersects(geom)
             or not self.do_intersect and geom.within(self.bbox)
         )
+
+    def load_bulk(self, features, structure, fail, dry, verbosity):
+        """
+        Load all features at once: stage them in a temporary table, snap
+        their extremities, split them where they cross each other or existing
+        paths, then insert them with their elevation, without row triggers.
+        Existing paths are finally split where new paths end on them.
+        Return the numbers of created and failed features.
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            self.stage_features(cursor, features)
+            if verbosity > 0:
+                self.stdout.write("{} paths staged".format(len(features)))
+            self.snap_features(cursor)
+            failed = self.check_features(cursor, features, fail)
+            segments = self.split_features(cursor)
+            if verbosity > 0:
+                self.stdout.write("{} paths snapped and split into {} paths".format(
+                    len(features) - len(failed), segments))
+            path_ids = self.insert_segments(cursor, structure)
+            for idx, path_id in path_ids:
+                if verbosity > 0:
+                    self.stdout.write('Create path with pk : {}'.format(path_id))
+                if verbosity > 1:
+                    name, comment, geom = features[idx]
+                    self.stdout.write("The comment %s was added on %s" % (comment, name))
+            split = self.split_existing_paths(cursor)
+            if verbosity > 0:
+                self.stdout.write("{} paths created, {} existing paths split".format(len(path_ids), split))
+            cursor.execute("DROP TABLE loadpaths_segment")
+            cursor.execute("DROP TABLE loadpaths_feature")
+            if dry:
+                transaction.set_rollback(True)
+            else:
+                # Topologies of split paths
+                schedule_topologies_geom_update()
+                transaction.on_commit(self.invalidate_caches)
+        return len(features) - len(failed), len(failed)
+
+    def invalidate_caches(self):
+        """
+        Invalidate caches of paths and topologies, as signals do when paths
+        are saved one by one.
+        """
+        invalidate_tiles([model._meta.label_lower for model in apps.get_models()
+                          if issubclass(model, (Path, Topology))])
+        if 'geotrek.api' in settings.INSTALLED_APPS:
+            from geotrek.api.v2.utils import invalidate_api_cache
+            invalidate_api_cache()
+
+    def stage_features(self, cursor, features, chunk_size=1000):
+        cursor.execute("DROP TABLE IF EXISTS loadpaths_segment")
+        cursor.execute("DROP TABLE IF EXISTS loadpaths_feature")
+        cursor.execute("""
+            CREATE TEMPORARY TABLE loadpaths_feature (
+                idx integer PRIMARY KEY,
+                name varchar(250),
+                comments text,
+                geom geometry,
+                cuts float8[] NOT NULL DEFAULT '{0, 1}'
+            )
+        """)
+        for start in range(0, len(features), chunk_size):
+            chunk = features[start:start + chunk_size]
+            params = []
+            for idx, (name, comment, geom) in enumerate(chunk, start):
+                params += [idx, name, comment, bytes(geom.ewkb)]
+            cursor.execute("INSERT INTO loadpaths_feature (idx, name, comments, geom) VALUES {}".format(
+                ', '.join(['(%s, %s, %s, ST_GeomFromEWKB(%s))'] * len(chunk))), params)
+        cursor.execute("CREATE INDEX ON loadpaths_feature USING gist(geom)")
+        cursor.execute("ANALYZE loadpaths_feature")
+
+    def snap_features(self, cursor):
+        """
+        Snap extremities on the closest path (or previous feature) nearer than
+        ``PATH_SNAPPING_DISTANCE``, on its closest vertex if near enough, like
+        the ``paths_snap_extremities()`` trigger does.
+        """
+        cursor.execute("""
+            CREATE TEMPORARY TABLE loadpaths_snap AS
+            WITH extremities AS (
+                SELECT f.idx, e.n, e.point
+                FROM loadpaths_feature f,
+                     LATERAL (VALUES (0, ST_StartPoint(f.geom)),
+                                     (ST_NPoints(f.geom) - 1, ST_EndPoint(f.geom))) AS e(n, point)
+            )
+            SELECT e.idx, e.n, COALESCE((
+                SELECT d.geom FROM ST_DumpPoints(c.other) d
+                WHERE ST_Distance(c.closest, d.geom) < %(distance)s
+                ORDER BY ST_Distance(c.closest, d.geom), d.path
+                LIMIT 1
+            ), c.closest) AS point
+            FROM extremities e
+            CROSS JOIN LATERAL (
+                SELECT ST_ClosestPoint(o.geom, e.point) AS closest, o.geom AS other
+                FROM (SELECT geom FROM core_path
+                      UNION ALL
+                      SELECT geom FROM loadpaths_feature f WHERE f.idx < e.idx) AS o
+                WHERE ST_DWithin(o.geom, e.point, %(distance)s) AND ST_Distance(o.geom, e.point) < %(distance)s
+                ORDER BY ST_Distance(o.geom, e.point)
+                LIMIT 1
+            ) AS c
+        """, {'distance': settings.PATH_SNAPPING_DISTANCE})
+        cursor.execute("""
+            UPDATE loadpaths_feature f SET geom = ST_SetPoint(f.geom, s.n, s.point)
+            FROM loadpaths_snap s
+            WHERE s.idx = f.idx AND s.n = 0
+        """)
+        cursor.execute("""
+            UPDATE loadpaths_feature f SET geom = ST_SetPoint(f.geom, s.n, s.point)
+            FROM loadpaths_snap s
+            WHERE s.idx = f.idx AND s.n > 0
+        """)
+        cursor.execute("DROP TABLE loadpaths_snap")
+
+    def check_features(self, cursor, features, fail):
+        """
+        Remove features which would break geometry constraints of paths
+        """
+        cursor.execute("""
+            DELETE FROM loadpaths_feature
+            WHERE NOT ST_IsValid(geom) OR NOT ST_IsSimple(geom)
+            RETURNING idx
+        """)
+        failed = sorted(idx for idx, in cursor.fetchall())
+        for idx in failed:
+            name, comment, geom = features[idx]
+            if not fail:
+                raise IntegrityError('Invalid geometry on path : {}, {}'.format(name, geom))
+            self.stdout.write('Integrity Error on path : {}, {}'.format(name, geom))
+        return failed
+
+    def split_features(self, cursor):
+        """
+        Split features where they cross each other or existing paths, merging
+        parts shorter than 1 meter like the ``paths_topology_intersect_split()``
+        trigger does. Return the number of resulting paths.
+        """
+        cursor.execute("""
+            SELECT f.idx, ST_Length(f.geom), array_agg(DISTINCT ST_LineLocatePoint(f.geom, d.geom))
+            FROM loadpaths_feature f
+            CROSS JOIN LATERAL (
+                SELECT p.geom FROM core_path p WHERE NOT p.draft AND ST_Intersects(p.geom, f.geom)
+                UNION ALL
+                SELECT o.geom FROM loadpaths_feature o WHERE o.idx != f.idx AND ST_Intersects(o.geom, f.geom)
+            ) AS o
+            CROSS JOIN LATERAL ST_Dump(ST_Intersection(f.geom, o.geom)) AS d
+            WHERE GeometryType(d.geom) = 'POINT'
+            GROUP BY f.idx
+        """)
+        cuts = []
+        for idx, length, fractions in cursor.fetchall():
+            kept = [0.0]
+            for fraction in sorted(fraction for fraction in fractions if 0 < fraction < 1):
+                if (fraction - kept[-1]) * length >= 1:
+                    kept.append(fraction)
+            if len(kept) > 1 and (1 - kept[-1]) * length < 1:
+                kept.pop()
+            if len(kept) > 1:
+                cuts += [idx, kept + [1.0]]
+        for start in range(0, len(cuts), 2000):
+            chunk = cuts[start:start + 2000]
+            cursor.execute("""
+                UPDATE loadpaths_feature f SET cuts = c.cuts
+                FROM (VALUES {}) AS c(idx, cuts)
+                WHERE f.idx = c.idx
+            """.format(', '.join(['(%s, %s::float8[])'] * (len(chunk) // 2))), chunk)
+        cursor.execute("""
+            CREATE TEMPORARY TABLE loadpaths_segment AS
+            SELECT f.idx, s.part, nextval(pg_get_serial_sequence('core_path', 'id')) AS path_id,
+                   CASE WHEN cardinality(f.cuts) = 2 THEN f.geom
+                        ELSE ST_LineSubstring(f.geom, f.cuts[s.part], f.cuts[s.part + 1]) END AS geom
+            FROM loadpaths_feature f, generate_series(1, cardinality(f.cuts) - 1) AS s(part)
+            ORDER BY f.idx, s.part
+        """)
+        return cursor.rowcount
+
+    def drape_segments(self, cursor, chunk_size=1000):
+        """
+        Compute elevation of staged paths from the DEM file (see
+        ``ALTIMETRIC_DEM_FILE``) into a temporary table.
+        Return False if there is no DEM file.
+        """
+        if get_dem_sampler() is None:
+            return False
+        cursor.execute("SELECT path_id, ST_AsEWKB(geom) FROM loadpaths_segment ORDER BY path_id")
+        rows = []
+        for path_id, geom in cursor.fetchall():
+            infos = AltimetryHelper.elevation_infos(GEOSGeometry(geom))
+            rows.append([path_id, bytes(infos['draped'].ewkb), infos['slope'], infos['min_elevation'],
+                         infos['max_elevation'], infos['positive_gain'], infos['negative_gain']])
+        cursor.execute("""
+            CREATE TEMPORARY TABLE loadpaths_elevation (
+                path_id bigint PRIMARY KEY,
+                draped geometry,
+                slope float8,
+                min_elevation integer,
+                max_elevation integer,
+                positive_gain integer,
+                negative_gain integer
+            )
+        """)
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            cursor.execute("INSERT INTO loadpaths_elevation VALUES {}".format(
+                ', '.join(['(%s, ST_GeomFromEWKB(%s), %s, %s, %s, %s, %s)'] * len(chunk))),
+                [value for row in chunk for value in row])
+        return True
+
+    def insert_segments(self, cursor, structure):
+        """
+        Insert staged paths with their elevation, without snapping, splitting
+        and elevation triggers. Elevation is computed from the DEM file if
+        any, by the database otherwise. Return (feature index, path id) tuples.
+        """
+        if self.drape_segments(cursor):
+            elevation, params = "JOIN loadpaths_elevation e ON e.path_id = s.path_id", []
+        else:
+            elevation, params = "CROSS JOIN LATERAL ft_elevation_infos(s.geom, %s) AS e", [settings.ALTIMETRIC_PROFILE_STEP]
+        triggers = ['core_path_00_snap_geom_iu_tgr', 'core_path_10_split_geom_iu_tgr', 'core_path_10_elevation_iu_tgr']
+        for trigger in triggers:
+            cursor.execute("ALTER TABLE core_path DISABLE TRIGGER {}".format(trigger))
+        cursor.execute("""
+            INSERT INTO core_path (id, structure_id, valid, visible, name, comments, departure, arrival, draft,
+                                   geom, geom_3d, length, slope, min_elevation, max_elevation, ascent, descent)
+            SELECT s.path_id, %s, TRUE, TRUE, f.name, f.comments, '', '', FALSE,
+                   s.geom, e.draped, ST_3DLength(e.draped), e.slope, e.min_elevation, e.max_elevation,
+                   e.positive_gain, e.negative_gain
+            FROM loadpaths_segment s
+            JOIN loadpaths_feature f ON f.idx = s.idx
+            {}
+            ORDER BY s.path_id
+        """.format(elevation), [structure.pk] + params)
+        for trigger in triggers:
+            cursor.execute("ALTER TABLE core_path ENABLE TRIGGER {}".format(trigger))
+        cursor.execute("DROP TABLE IF EXISTS loadpaths_elevation")
+        cursor.execute("SELECT idx, path_id FROM loadpaths_segment ORDER BY path_id")
+        return cursor.fetchall()
+
+    def split_existing_paths(self, cursor):
+        """
+        Split existing paths where new paths end on them, through the split
+        trigger which keeps their topologies. Return the number of paths split.
+        """
+        cursor.execute("""
+            SELECT DISTINCT s.path_id, p.id
+            FROM loadpaths_segment s
+            JOIN core_path p ON ST_DWithin(p.geom, s.geom, 0)
+            CROSS JOIN LATERAL ST_Dump(ST_Intersection(p.geom, s.geom)) AS d
+            WHERE NOT p.draft
+              AND p.id NOT IN (SELECT path_id FROM loadpaths_segment)
+              AND GeometryType(d.geom) = 'POINT'
+              AND NOT ST_Equals(d.geom, ST_StartPoint(p.geom))
+              AND NOT ST_Equals(d.geom, ST_EndPoint(p.geom))
+            ORDER BY s.path_id
+        """)
+        rows = cursor.fetchall()
+        for path_id in sorted({path_id for path_id, existing_id in rows}):
+            cursor.execute("UPDATE core_path SET geom = geom WHERE id = %s", [path_id])
+        return len({existing_id for path_id, existing_id in rows})
@@ -1,45 +1,104 @@
 from django.core.management.base import BaseCommand
 from django.db import connection, transaction
+from django.db.models import Case, IntegerField, When
 
-from geotrek.core.models import Path
+from geotrek.core.models import Path, PathAggregation
 
 
 class Command(BaseCommand):
     help = """Remove all duplicate path (same geom)."""
     """Do not remove path with topology."""
 
+    def add_arguments(self, parser):
+        parser.add_argument('--tolerance', '-t', action='store', dest='tolerance', default=0, type=float,
+                            help="Also remove paths following the same way within this distance (in meters)")
+        parser.add_argument('--batch-size', action='store', dest='batch_size', default=1000, type=int,
+                            help="Number of paths removed by query")
+
+    def get_exact_duplicates(self, cursor):
+        """
+        Group paths by hash of their geometry, which is the same for paths
+        with the same points in the same order (``ST_OrderingEquals``).
+        """
+        cursor.execute("""
+            SELECT array_agg(id ORDER BY id)
+            FROM core_path
+            GROUP BY md5(ST_AsEWKB(geom))
+            HAVING COUNT(*) > 1
+        """)
+        return [ids for ids, in cursor.fetchall()]
+
+    def get_near_duplicates(self, cursor, tolerance):
+        """
+        Group paths following the same way in the same direction, at less than
+        ``tolerance`` from each other (Fréchet distance). Candidates are found
+        with the spatial index.
+        """
+        cursor.execute("""
+            SELECT t1.id, t2.id
+            FROM core_path t1
+            JOIN core_path t2 ON t1.id < t2.id AND t2.geom && ST_Expand(t1.geom, %(tolerance)s)
+            WHERE ST_DWithin(ST_StartPoint(t1.geom), ST_StartPoint(t2.geom), %(tolerance)s)
+              AND ST_DWithin(ST_EndPoint(t1.geom), ST_EndPoint(t2.geom), %(tolerance)s)
+              AND ST_FrechetDistance(t1.geom, t2.geom) <= %(tolerance)s
+        """, {'tolerance': tolerance})
+        # Merge pairs into groups (union-find)
+        parents = {}
+
+        def find(pk):
+            while parents.setdefault(pk, pk) != pk:
+                parents[pk] = parents[parents[pk]]
+                pk = parents[pk]
+            return pk
+
+        for pk1, pk2 in cursor.fetchall():
+            root1, root2 = find(pk1), find(pk2)
+            if root1 != root2:
+                parents[max(root1, root2)] = min(root1, root2)
+        groups = {}
+        for pk in parents:
+            groups.setdefault(find(pk), []).append(pk)
+        return [sorted(ids) for ids in groups.values()]
+
     def handle(self, *args, **options):
         verbosity = options['verbosity']
+        tolerance = options['tolerance']
+        batch_size = options['batch_size']
         cursor = connection.cursor()
-        query = """with relations as (SELECT t1.id as t1_id,
-                                             t2.id as t2_id
-                                      FROM core_path t1
-                                      JOIN core_path t2 ON t1.id < t2.id AND ST_OrderingEquals(t1.geom, t2.geom)
-                                      ORDER BY t1.id, t2.id)
-                      SELECT * FROM relations WHERE t1_id NOT IN (SELECT t2_id FROM relations) """
-        cursor.execute(query)
-        list_topologies = cursor.fetchall()
+        if tolerance > 0:
+            groups = self.get_near_duplicates(cursor, tolerance)
+        else:
+            groups = self.get_exact_duplicates(cursor)
+
+        visible = set(Path.objects.filter(pk__in=[pk for ids in groups for pk in ids]).values_list('pk', flat=True))
+        # Keep the first visible path of each group, or the first one if none is visible
+        replacements = {}
+        for ids in groups:
+            kept = next((pk for pk in ids if pk in visible), ids[0])
+            for pk in ids:
+                if pk != kept:
+                    replacements[pk] = kept
 
         path_deleted = []
 
-        with transaction.atomic():
-            try:
-                for path1_pk, path2_pk in list_topologies:
-                    path1 = Path.include_invisible.get(pk=path1_pk)
-                    path2 = Path.include_invisible.get(pk=path2_pk)
-                    if not path1.visible and path2.visible:
-                        path1.aggregations.update(path_id=path2_pk)
-                        path1.delete()
-                        path_deleted.append(path1)
-                    else:
-                        path2.aggregations.update(path_id=path1_pk)
-                        path2.delete()
-                        path_deleted.append(path2)
+        try:
+            with transaction.atomic():
+                removed = sorted(replacements)
+                for start in range(0, len(removed), batch_size):
+                    batch = removed[start:start + batch_size]
+                    PathAggregation.objects.filter(path_id__in=batch).update(path_id=Case(
+                        *[When(path_id=pk, then=replacements[pk]) for pk in batch], output_field=IntegerField()
+                    ))
+                    paths = list(Path.include_invisible.filter(pk__in=batch).only('pk', 'name'))
+                    Path.include_invisible.filter(pk__in=batch).delete()
                     if verbosity > 1:
-                        self.stdout.write("Deleting path %s" % path_deleted[-1])
+                        for path in paths:
+                            self.stdout.write("Deleting path %s" % path)
+                    path_deleted += paths
 
-            except Exception as exc:
-                self.stdout.write(self.style.ERROR("{}".format(exc)))
+        except Exception as exc:
+            path_deleted = []
+            self.stdout.write(self.style.ERROR("{}".format(exc)))
 
         if verbosity > 0:
             self.stdout.write(self.style.SUCCESS("{} duplicate paths have been deleted".format(len(path_deleted))))
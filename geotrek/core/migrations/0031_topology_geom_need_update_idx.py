@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_auto_20220127_0939'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='topology',
+            index=models.Index(condition=models.Q(geom_need_update=True), fields=['id'], name='topology_geom_need_update_idx'),
+        ),
+    ]
@@ -8,8 +8,8 @@ from django.contrib.gis.db import models
 from django.contrib.gis.db.models.functions import Distance
 from django.contrib.gis.geos import Point, fromstr, LineString, GEOSGeometry
 from django.contrib.postgres.indexes import GistIndex
-from django.db import connection, connections, DEFAULT_DB_ALIAS
-from django.db.models import ProtectedError
+from django.db import connection, connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import ProtectedError, Q
 from django.db.models.query import QuerySet
 from django.utils.translation import gettext_lazy as _
 from modelcluster.fields import ParentalKey
@@ -36,7 +36,28 @@ def simplify_coords(coords):
     raise Exception("Param is {}. Should be <list>, <tuple> or <float>".format(type(coords)))
 
 
-class PathManager(models.Manager):
+def schedule_topologies_geom_update():
+    """
+    With ``TOPOLOGY_GEOM_DEFERRED_UPDATE``, run ``update_topologies_geom``
+    task once the transaction is committed if path changes marked some
+    topologies as outdated.
+    """
+    if not (settings.TREKKING_TOPOLOGY_ENABLED and settings.TOPOLOGY_GEOM_DEFERRED_UPDATE):
+        return
+    if Topology.objects.filter(geom_need_update=True).exists():
+        from geotrek.core.tasks import update_topologies_geom
+        transaction.on_commit(update_topologies_geom.delay)
+
+
+class PathQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Also used by bulk_update()
+        rows = super().update(**kwargs)
+        schedule_topologies_geom_update()
+        return rows
+
+
+class PathManager(models.Manager.from_queryset(PathQuerySet)):
     # Use this manager when walking through FK/M2M relationships
     use_for_related_fields = True
 
@@ -46,7 +67,7 @@ class PathManager(models.Manager):
         return super().get_queryset().filter(visible=True).annotate(length_2d=Length('geom'))
 
 
-class PathInvisibleManager(models.Manager):
+class PathInvisibleManager(models.Manager.from_queryset(PathQuerySet)):
     use_for_related_fields = True
 
     def get_queryset(self):
@@ -158,6 +179,47 @@ class Path(ZoningPropertiesMixin, AddPropertyMixin, MapEntityMixin, AltimetryMix
             qs = qs.exclude(pk=exclude.pk)
         return qs.exclude(visible=False).annotate(distance=Distance('geom', point)).order_by('distance')[0]
 
+    @classmethod
+    def closest_bulk(cls, points, snaps=None, chunk_size=500):
+        """
+        Returns (path id, position, offset) of each point of ``points``
+        along its closest path, or along the path of ``snaps`` with the same
+        index if not None, as ``closest()`` and ``interpolate()`` do.
+        Closest paths are found with the KNN operator of the spatial index,
+        with one query for each chunk of points.
+        (None, None, None) is returned for points without path.
+        """
+        if snaps is None:
+            snaps = [None] * len(points)
+        results = [(None, None, None)] * len(points)
+        for start in range(0, len(points), chunk_size):
+            chunk = points[start:start + chunk_size]
+            values = ', '.join(['(%s, ST_GeomFromEWKB(%s), %s::integer)'] * len(chunk))
+            params = []
+            for idx, point in enumerate(chunk, start):
+                if point.srid != settings.SRID:
+                    point = point.transform(settings.SRID, clone=True)
+                params += [idx, bytes(point.ewkb), snaps[idx]]
+            sql = """
+                WITH points(idx, geom, snap) AS (VALUES {values})
+                SELECT p.idx, t.id, i.position, i.distance
+                FROM points p
+                CROSS JOIN LATERAL (
+                    (SELECT id, geom FROM core_path
+                     WHERE p.snap IS NULL AND visible AND NOT draft
+                     ORDER BY geom <-> p.geom
+                     LIMIT 1)
+                    UNION ALL
+                    (SELECT id, geom FROM core_path WHERE id = p.snap AND visible)
+                ) t,
+                LATERAL ST_InterpolateAlong(t.geom, p.geom) AS i(position float, distance float)
+            """.format(values=values)
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                for idx, pk, position, offset in cursor.fetchall():
+                    results[idx] = (pk, position, offset)
+        return results
+
     @classmethod
     def check_path_not_overlap(cls, geom, pk):
         """
@@ -240,6 +302,7 @@ class Path(ZoningPropertiesMixin, AddPropertyMixin, MapEntityMixin, AltimetryMix
             self._is_reversed = False
         super().save(*args, **kwargs)
         self.reload()
+        schedule_topologies_geom_update()
 
     def delete(self, *args, **kwargs):
         if not settings.TREKKING_TOPOLOGY_ENABLED:
@@ -364,6 +427,7 @@ class Path(ZoningPropertiesMixin, AddPropertyMixin, MapEntityMixin, AltimetryMix
             if result:
                 # reload object after unification
                 self.reload()
+                schedule_topologies_geom_update()
 
             return result
 
@@ -399,6 +463,7 @@ class Topology(ZoningPropertiesMixin, AddPropertyMixin, AltimetryMixin,
         indexes = [
             GistIndex(name='topology_geom_gist_idx', fields=['geom']),
             GistIndex(name='topology_geom_3d_gist_idx', fields=['geom_3d']),
+            models.Index(name='topology_geom_need_update_idx', fields=['id'], condition=Q(geom_need_update=True)),
         ]
 
     def __init__(self, *args, **kwargs):
@@ -457,62 +522,92 @@ class Topology(ZoningPropertiesMixin, AddPropertyMixin, AltimetryMixin,
             self.reload()
         return aggr
 
+    @classmethod
+    def _overlapping_pairs(cls, topology_pks, all_objects):
+        """ Return (topology pk, overlapping pk) tuples for specified topologies,
+        ordered along each topology, in a single query.
+        """
+        is_generic = all_objects.model.KIND == Topology.KIND
+        sql = """
+        WITH aggregations AS (SELECT a.topo_object_id AS topology, a.start_position AS start,
+                                     a.end_position AS end, a.path_id, a.order AS order
+                              FROM %(aggregations_table)s a
+                              WHERE a.topo_object_id = ANY(%%s))
+        SELECT pa.topology, t.id
+        FROM %(topology_table)s t, %(aggregations_table)s a, aggregations pa
+        WHERE a.path_id = pa.path_id AND a.topo_object_id = t.id
+          AND least(a.start_position, a.end_position) <= greatest(pa.start, pa.end)
+          AND greatest(a.start_position, a.end_position) >= least(pa.start, pa.end)
+          AND %(extra_condition)s
+        ORDER BY pa.topology, (pa.order + CASE WHEN pa.start > pa.end THEN (1 - a.start_position) ELSE a.start_position END);
+        """ % {
+            'topology_table': Topology._meta.db_table,
+            'aggregations_table': PathAggregation._meta.db_table,
+            'extra_condition': 'true' if is_generic else "kind = '%s'" % all_objects.model.KIND
+        }
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [list(topology_pks)])
+            return cursor.fetchall()
+
     @classmethod
     def overlapping(cls, queryset, all_objects=None):
         """ Return a Topology queryset overlapping specified topologies.
         """
         if all_objects is None:
             all_objects = cls.objects.existing()
-        is_generic = all_objects.model.KIND == Topology.KIND
         single_input = isinstance(queryset, QuerySet)
 
         if single_input:
-            topology_pks = [str(pk) for pk in queryset.values_list('pk', flat=True)]
+            topology_pks = list(queryset.values_list('pk', flat=True))
         else:
-            topology_pks = [str(queryset.pk)]
+            topology_pks = [queryset.pk]
 
         if len(topology_pks) == 0:
             return all_objects.filter(pk__in=[])
 
-        sql = """
-        WITH topologies AS (SELECT id FROM %(topology_table)s WHERE id IN (%(topology_list)s)),
-        -- Concerned aggregations
-             aggregations AS (SELECT * FROM %(aggregations_table)s a, topologies t
-                              WHERE a.topo_object_id = t.id),
-        -- Concerned paths along with (start, end)
-             paths_aggr AS (SELECT a.start_position AS start, a.end_position AS end, p.id, a.order AS order
-                            FROM %(paths_table)s p, aggregations a
-                            WHERE a.path_id = p.id
-                            ORDER BY a.order)
-        -- Retrieve primary keys
-        SELECT t.id
-        FROM %(topology_table)s t, %(aggregations_table)s a, paths_aggr pa
-        WHERE a.path_id = pa.id AND a.topo_object_id = t.id
-          AND least(a.start_position, a.end_position) <= greatest(pa.start, pa.end)
-          AND greatest(a.start_position, a.end_position) >= least(pa.start, pa.end)
-          AND %(extra_condition)s
-        ORDER BY (pa.order + CASE WHEN pa.start > pa.end THEN (1 - a.start_position) ELSE a.start_position END);
-        """ % {
-            'topology_table': Topology._meta.db_table,
-            'aggregations_table': PathAggregation._meta.db_table,
-            'paths_table': Path._meta.db_table,
-            'topology_list': ','.join(topology_pks),
-            'extra_condition': 'true' if is_generic else "kind = '%s'" % all_objects.model.KIND
-        }
-
-        cursor = connection.cursor()
-        cursor.execute(sql)
-        result = cursor.fetchall()
-        pk_list = uniquify([row[0] for row in result])
+        pk_list = uniquify([pk for topology_pk, pk in cls._overlapping_pairs(topology_pks, all_objects)])
+        if len(pk_list) == 0:
+            return all_objects.filter(pk__in=[])
 
         # Return a QuerySet and preserve pk list order
-        # http://stackoverflow.com/a/1310188/141895
-        ordering = 'CASE %s END' % ' '.join(['WHEN %s.id=%s THEN %s' % (Topology._meta.db_table, id_, i)
-                                             for i, id_ in enumerate(pk_list)])
+        ordering = 'array_position(%%s::integer[], %s.id)' % Topology._meta.db_table
         queryset = all_objects.filter(pk__in=pk_list).extra(
-            select={'ordering': ordering}, order_by=('ordering',))
+            select={'ordering': ordering}, select_params=[pk_list], order_by=('ordering',))
         return queryset
 
+    @classmethod
+    def overlapping_bulk(cls, topologies, all_objects=None):
+        """ Return a dict mapping each of specified topologies (or primary keys)
+        to the list of topologies overlapping it, ordered as ``overlapping()`` does.
+        Overlaps of all topologies are found with one query, and overlapping
+        objects are fetched with another one.
+        """
+        if all_objects is None:
+            all_objects = cls.objects.existing()
+        topology_pks = uniquify([getattr(topology, 'pk', topology) for topology in topologies])
+        if not topology_pks:
+            return {}
+
+        pk_lists = {pk: [] for pk in topology_pks}
+        for topology_pk, pk in cls._overlapping_pairs(topology_pks, all_objects):
+            pk_lists[topology_pk].append(pk)
+        objects = all_objects.in_bulk({pk for pk_list in pk_lists.values() for pk in pk_list})
+        return {
+            topology_pk: [objects[pk] for pk in uniquify(pk_list) if pk in objects]
+            for topology_pk, pk_list in pk_lists.items()
+        }
+
+    @classmethod
+    def prefetch_overlapping(cls, topologies, to_attr, all_objects=None):
+        """ Store in ``to_attr`` attribute of each topology the list of
+        topologies overlapping it, like ``Prefetch(to_attr=...)`` does for
+        relations, so that serializers avoid a query per topology.
+        """
+        overlapping = cls.overlapping_bulk(topologies, all_objects)
+        for topology in topologies:
+            setattr(topology, to_attr, overlapping[topology.pk])
+        return topologies
+
     def mutate(self, other):
         """
         Take alls attributes of the other topology specified and
@@ -641,104 +736,52 @@ class Topology(ZoningPropertiesMixin, AddPropertyMixin, AltimetryMixin,
         Receives a point (lng, lat) with API_SRID, and returns
         a topology objects with a computed path aggregation.
         """
-        # Find closest path
-        point = Point(lng, lat, srid=settings.API_SRID)
-        point.transform(settings.SRID)
-        if snap is None:
-            closest = Path.closest(point)
-            position, offset = closest.interpolate(point)
-        else:
-            closest = Path.objects.get(pk=snap)
-            position, offset = closest.interpolate(point)
-            offset = 0
-        # We can now instantiante a Topology object
-        topology = Topology(kind=kind, offset=offset)
-        aggr = PathAggregation(
-            topo_object=topology,
-            path=closest,
-            start_position=position,
-            end_position=position
-        )
-        topology.aggregations = [aggr]
-        closest.aggregations.add(aggr)
-        point = Point(point.x, point.y, srid=settings.SRID)
-        topology.geom = point
-        return topology
+        return cls._topologypoints([(lng, lat, kind, snap)])[0]
 
     @classmethod
-    def deserialize(cls, serialized):
+    def _topologypoints(cls, points):
         """
-        Topologies can be points or lines. Serialized topologies come from Javascript
-        module ``topology_helper.js``.
-
-        Example of linear point topology (snapped with path 1245):
-
-            {"lat":5.0, "lng":10.2, "snap":1245}
-
-        Example of linear serialized topology :
-
-        [
-            {"offset":0,"positions":{"0":[0,0.3],"1":[0.2,1]},"paths":[1264,1208]},
-            {"offset":0,"positions":{"0":[0.2,1],"5":[0,0.2]},"paths":[1208,1263,678,1265,1266,686]}
-        ]
-
-        * Each sub-topology represents a way between markers.
-        * Start point is first position of sub-topology.
-        * End point is last position of sub-topology.
-        * All last positions represents intermediary markers.
-
-        Global strategy is :
-        * If has lat/lng return point topology
-        * Otherwise, create path aggregations from serialized data.
-        ____________________________________________________________________________________________
-        Without Dynamic Segmentation :
-
-        Deserialize normally and create a topology from the geojson
+        Receives points (lng, lat, kind, snap) with API_SRID, and returns
+        topology objects with computed path aggregations, snapping all points
+        and fetching their paths at once.
         """
-        try:
-            return Topology.objects.get(pk=int(serialized))
-        except Topology.DoesNotExist:
-            raise
-        except (TypeError, ValueError):
-            pass  # value is not integer, thus should be deserialized
-        if not settings.TREKKING_TOPOLOGY_ENABLED:
-            return Topology(kind='TMP', geom=GEOSGeometry(serialized, srid=settings.API_SRID))
-        objdict = serialized
-        if isinstance(serialized, str):
-            try:
-                objdict = json.loads(serialized)
-            except ValueError as e:
-                raise ValueError("Invalid serialization: %s" % e)
-
-        if objdict and not isinstance(objdict, list):
-            lat = objdict.get('lat')
-            lng = objdict.get('lng')
-            pk = objdict.get('pk')
-            kind = objdict.get('kind')
-            # Point topology ?
-            if lat is not None and lng is not None:
-                if pk:
-                    try:
-                        return Topology.objects.get(pk=int(pk))
-                    except (Topology.DoesNotExist, ValueError):
-                        pass
-
-                return Topology._topologypoint(lng, lat, kind, snap=objdict.get('snap'))
-            else:
-                objdict = [objdict]
-
-        if not objdict:
-            raise ValueError("Invalid serialized topology : empty list found")
-
-        # If pk is still here, the user did not edit it.
-        # Return existing topology instead
-        pk = objdict[0].get('pk')
-        if pk:
-            try:
-                return Topology.objects.get(pk=int(pk))
-            except (Topology.DoesNotExist, ValueError):
-                pass
+        geoms = []
+        for lng, lat, kind, snap in points:
+            point = Point(lng, lat, srid=settings.API_SRID)
+            point.transform(settings.SRID)
+            geoms.append(point)
+        closests = Path.closest_bulk(geoms, [snap for lng, lat, kind, snap in points])
+        paths = Path.objects.in_bulk({pk for pk, position, offset in closests if pk is not None})
+        topologies = []
+        for (lng, lat, kind, snap), point, (pk, position, offset) in zip(points, geoms, closests):
+            if pk is None:
+                if snap is not None:
+                    raise Path.DoesNotExist("Path matching query does not exist.")
+                # Fail like Path.closest() if no path in database
+                raise IndexError("No path found")
+            closest = paths[pk]
+            if snap is not None:
+                offset = 0
+            # We can now instantiante a Topology object
+            topology = Topology(kind=kind, offset=offset)
+            aggr = PathAggregation(
+                topo_object=topology,
+                path=closest,
+                start_position=position,
+                end_position=position
+            )
+            topology.aggregations = [aggr]
+            closest.aggregations.add(aggr)
+            topology.geom = Point(point.x, point.y, srid=settings.SRID)
+            topologies.append(topology)
+        return topologies
 
+    @classmethod
+    def _topologyline(cls, objdict, paths):
+        """
+        Receives sub-topologies of a line topology (see ``deserialize()``) and
+        their paths by id, and returns a topology object with its path aggregations.
+        """
         offset = objdict[0].get('offset', 0.0)
         topology = Topology(kind='TMP', offset=offset)
         try:
@@ -746,15 +789,17 @@ class Topology(ZoningPropertiesMixin, AddPropertyMixin, AltimetryMixin,
             for j, subtopology in enumerate(objdict):
                 last_topo = j == len(objdict) - 1
                 positions = subtopology.get('positions', {})
-                paths = subtopology['paths']
+                paths_ids = subtopology['paths']
                 # Create path aggregations
                 aggrs = []
-                for i, path in enumerate(paths):
-                    last_path = i == len(paths) - 1
+                for i, path in enumerate(paths_ids):
+                    last_path = i == len(paths_ids) - 1
                     # Javascript hash keys are parsed as a string
                     idx = str(i)
                     start_position, end_position = positions.get(idx, (0.0, 1.0))
-                    path = Path.objects.get(pk=path)
+                    path = paths.get(int(path))
+                    if path is None:
+                        raise Path.DoesNotExist("Path matching query does not exist.")
                     aggr = PathAggregation(
                         path=path,
                         topo_object=topology,
@@ -782,7 +827,7 @@ class Topology(ZoningPropertiesMixin, AddPropertyMixin, AltimetryMixin,
                             pos = start_position
                         elif end_position == 1.0:
                             pos = start_position
-                        elif len(paths) == 1:
+                        elif len(paths_ids) == 1:
                             pos = end_position
                         assert pos >= 0, "Invalid position (%s, %s)." % (start_position, end_position)
                         aggr = PathAggregation(
@@ -800,6 +845,112 @@ class Topology(ZoningPropertiesMixin, AddPropertyMixin, AltimetryMixin,
             raise ValueError("Invalid serialized topology : %s" % e)
         return topology
 
+    @classmethod
+    def deserialize(cls, serialized):
+        """
+        Topologies can be points or lines. Serialized topologies come from Javascript
+        module ``topology_helper.js``.
+
+        Example of linear point topology (snapped with path 1245):
+
+            {"lat":5.0, "lng":10.2, "snap":1245}
+
+        Example of linear serialized topology :
+
+        [
+            {"offset":0,"positions":{"0":[0,0.3],"1":[0.2,1]},"paths":[1264,1208]},
+            {"offset":0,"positions":{"0":[0.2,1],"5":[0,0.2]},"paths":[1208,1263,678,1265,1266,686]}
+        ]
+
+        * Each sub-topology represents a way between markers.
+        * Start point is first position of sub-topology.
+        * End point is last position of sub-topology.
+        * All last positions represents intermediary markers.
+
+        Global strategy is :
+        * If has lat/lng return point topology
+        * Otherwise, create path aggregations from serialized data.
+        ____________________________________________________________________________________________
+        Without Dynamic Segmentation :
+
+        Deserialize normally and create a topology from the geojson
+        """
+        return cls.deserialize_bulk([serialized])[0]
+
+    @classmethod
+    def deserialize_bulk(cls, serialized_list):
+        """
+        Deserialize each topology of ``serialized_list`` as ``deserialize()``
+        does, fetching existing topologies and paths with one query each, and
+        snapping all point topologies to their closest path at once.
+        """
+        topologies = [None] * len(serialized_list)
+        existing = {}
+        points = {}
+        lines = {}
+        for i, serialized in enumerate(serialized_list):
+            try:
+                existing[i] = (int(serialized), True)
+                continue
+            except (TypeError, ValueError):
+                pass  # value is not integer, thus should be deserialized
+            if not settings.TREKKING_TOPOLOGY_ENABLED:
+                topologies[i] = Topology(kind='TMP', geom=GEOSGeometry(serialized, srid=settings.API_SRID))
+                continue
+            objdict = serialized
+            if isinstance(serialized, str):
+                try:
+                    objdict = json.loads(serialized)
+                except ValueError as e:
+                    raise ValueError("Invalid serialization: %s" % e)
+
+            if objdict and not isinstance(objdict, list):
+                lat = objdict.get('lat')
+                lng = objdict.get('lng')
+                # Point topology ?
+                if lat is not None and lng is not None:
+                    points[i] = (lng, lat, objdict.get('kind'), objdict.get('snap'))
+                    pk = objdict.get('pk')
+                else:
+                    objdict = [objdict]
+
+            if i not in points:
+                if not objdict:
+                    raise ValueError("Invalid serialized topology : empty list found")
+                lines[i] = objdict
+                pk = objdict[0].get('pk')
+
+            # If pk is still here, the user did not edit it.
+            # Return existing topology instead
+            if pk:
+                try:
+                    existing[i] = (int(pk), False)
+                except ValueError:
+                    pass
+
+        found = Topology.objects.in_bulk({pk for pk, required in existing.values()})
+        for i, (pk, required) in existing.items():
+            if pk in found:
+                topologies[i] = found[pk]
+            elif required:
+                raise Topology.DoesNotExist("Topology matching query does not exist.")
+
+        pending = [i for i in points if topologies[i] is None]
+        if pending:
+            for i, topology in zip(pending, cls._topologypoints([points[i] for i in pending])):
+                topologies[i] = topology
+
+        pending = [i for i in lines if topologies[i] is None]
+        if pending:
+            try:
+                paths = Path.objects.in_bulk({int(path) for i in pending
+                                              for subtopology in lines[i] for path in subtopology['paths']})
+            except (TypeError, ValueError, KeyError) as e:
+                raise ValueError("Invalid serialized topology : %s" % e)
+            for i in pending:
+                topologies[i] = cls._topologyline(lines[i], paths)
+        return topologies
+
     def distance(self, to_cls):
         """Distance to associate this topology to another topology class"""
         return None
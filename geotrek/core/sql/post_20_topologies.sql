@@ -14,6 +14,12 @@ CREATE TRIGGER core_topology_date_update_tgr
     BEFORE INSERT OR UPDATE ON core_topology
     FOR EACH ROW EXECUTE PROCEDURE ft_date_update();
 
+-- Log changes at commit, model name is read from kind column
+CREATE CONSTRAINT TRIGGER core_topology_changes_tgr
+    AFTER INSERT OR UPDATE OR DELETE ON core_topology
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE PROCEDURE log_object_change();
+
 ---------------------------------------------------------------------
 -- Make sure cache key (base on lastest updated) is refresh on DELETE
 ---------------------------------------------------------------------
@@ -145,6 +151,92 @@ END;
 $$ LANGUAGE plpgsql;
 
 
+-------------------------------------------------------------------------------
+-- Update geometry of several topologies at once
+-------------------------------------------------------------------------------
+
+CREATE FUNCTION {# geotrek.core #}.update_geometry_of_topologies(topology_ids integer[]) RETURNS void AS $$
+BEGIN
+    -- Same as update_geometry_of_topology(), with one query for all topologies
+    -- instead of a few queries for each of them.
+
+    -- If Geotrek-light, don't do anything
+    IF NOT {{ TREKKING_TOPOLOGY_ENABLED }} THEN
+        RETURN;
+    END IF;
+
+    -- No more paths, close these topologies
+    UPDATE core_topology e SET deleted = true, geom = NULL, "length" = 0
+        WHERE e.id = ANY(topology_ids)
+          AND NOT EXISTS (SELECT 1 FROM core_pathaggregation et WHERE et.topo_object_id = e.id);
+
+    WITH kinds AS (
+        SELECT et.topo_object_id AS id,
+               ((NOT bool_and(et.start_position != et.end_position) AND count(*) = 1)
+                OR bool_and(et.start_position = et.end_position)) AS is_point
+        FROM core_pathaggregation et
+        WHERE et.topo_object_id = ANY(topology_ids)
+        GROUP BY et.topo_object_id
+    ),
+    points AS (
+        -- Special case: the topology describe a point on the path
+        SELECT DISTINCT ON (e.id) e.id,
+               CASE WHEN NOT (e."offset" = 0 OR e.geom IS NULL OR ST_IsEmpty(e.geom) OR (ST_X(e.geom) = 0 AND ST_Y(e.geom) = 0))
+                        THEN e.geom
+                    WHEN et.start_position < 0.000000000000001 THEN ST_StartPoint(t.geom)
+                    WHEN et.start_position > 0.999999999999999 THEN ST_EndPoint(t.geom)
+                    ELSE ST_GeometryN(ST_LocateAlong(ST_AddMeasure(ST_Force2D(t.geom), 0, 1), et.start_position, e.offset), 1)
+               END AS geom
+        FROM kinds k
+        JOIN core_topology e ON e.id = k.id
+        JOIN core_pathaggregation et ON et.topo_object_id = e.id
+        JOIN core_path t ON t.id = et.path_id
+        WHERE k.is_point
+        ORDER BY e.id, et.id
+    ),
+    lines AS (
+        -- Regular case: the topology describe a line
+        SELECT e.id, e."offset",
+               ft_Smart_MakeLine(array_agg(ST_SmartLineSubstring(t.geom, et.start_position, et.end_position)
+                                           ORDER BY et."order", et.id)
+                                 FILTER (WHERE GeometryType(ST_SmartLineSubstring(t.geom, et.start_position, et.end_position)) != 'POINT')) AS geom,
+               ft_Smart_MakeLine(array_agg(ST_SmartLineSubstring(t.geom_3d, et.start_position, et.end_position)
+                                           ORDER BY et."order", et.id)
+                                 FILTER (WHERE GeometryType(ST_SmartLineSubstring(t.geom, et.start_position, et.end_position)) != 'POINT')) AS geom_3d
+        FROM kinds k
+        JOIN core_topology e ON e.id = k.id
+        JOIN core_pathaggregation et ON et.topo_object_id = e.id
+        JOIN core_path t ON t.id = et.path_id
+        WHERE NOT k.is_point
+        GROUP BY e.id, e."offset"
+    ),
+    geoms AS (
+        SELECT id, geom, geom AS geom_3d FROM points
+        UNION ALL
+        -- Add some offset if necessary.
+        SELECT id,
+               CASE WHEN "offset" != 0 THEN ST_GeometryN(ST_LocateBetween(ST_AddMeasure(geom, 0, 1), 0, 1, "offset"), 1)
+                    ELSE geom END,
+               CASE WHEN "offset" != 0 THEN ST_GeometryN(ST_LocateBetween(ST_AddMeasure(geom_3d, 0, 1), 0, 1, "offset"), 1)
+                    ELSE geom_3d END
+        FROM lines
+    )
+    UPDATE core_topology e SET geom = ST_Force2D(g.geom),
+                               geom_3d = ST_Force3DZ(elevation.draped),
+                               "length" = ST_3DLength(elevation.draped),
+                               slope = elevation.slope,
+                               min_elevation = elevation.min_elevation,
+                               max_elevation = elevation.max_elevation,
+                               ascent = elevation.positive_gain,
+                               descent = elevation.negative_gain
+        FROM geoms g, LATERAL ft_elevation_infos(g.geom_3d, {{ ALTIMETRIC_PROFILE_STEP }}) AS elevation
+        WHERE e.id = g.id;
+
+    UPDATE core_topology SET geom_need_update = FALSE WHERE id = ANY(topology_ids) AND geom_need_update;
+END;
+$$ LANGUAGE plpgsql;
+
+
 -------------------------------------------------------------------------------
 -- Update geometry when offset change
 -------------------------------------------------------------------------------
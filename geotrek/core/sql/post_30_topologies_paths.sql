@@ -71,18 +71,49 @@ DROP FUNCTION IF EXISTS ft_topologies_paths_geometry_statement() CASCADE;
 
 CREATE FUNCTION {# geotrek.core #}.ft_topologies_paths_geometry_statement() RETURNS trigger SECURITY DEFINER AS $$
 DECLARE
-    rec record;
+    topology_ids integer[];
 BEGIN
-    FOR rec IN SELECT * FROM core_topology WHERE geom_need_update = TRUE LOOP
-        PERFORM update_geometry_of_topology(rec.id);
-    END LOOP;
+    IF {{ TOPOLOGY_GEOM_DEFERRED_UPDATE }} THEN
+        -- Only update topologies whose aggregations changed: the ones marked
+        -- after a path change are left to update_topologies_geom task
+        IF TG_OP = 'INSERT' THEN
+            SELECT array_agg(DISTINCT topo_object_id) INTO topology_ids FROM new_aggregations;
+        ELSIF TG_OP = 'DELETE' THEN
+            SELECT array_agg(DISTINCT topo_object_id) INTO topology_ids FROM old_aggregations;
+        ELSE
+            SELECT array_agg(topo_object_id) INTO topology_ids FROM (
+                SELECT topo_object_id FROM new_aggregations
+                UNION
+                SELECT topo_object_id FROM old_aggregations
+            ) AS a;
+        END IF;
+        SELECT array_agg(id) INTO topology_ids
+        FROM core_topology WHERE id = ANY(topology_ids) AND geom_need_update;
+    ELSE
+        SELECT array_agg(id) INTO topology_ids FROM core_topology WHERE geom_need_update;
+    END IF;
+
+    IF topology_ids IS NOT NULL THEN
+        PERFORM update_geometry_of_topologies(topology_ids);
+    END IF;
 
     RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
-CREATE TRIGGER core_pathaggregation_geometry_statement_tgr
-AFTER INSERT OR UPDATE OR DELETE ON core_pathaggregation
+CREATE TRIGGER core_pathaggregation_geometry_statement_i_tgr
+AFTER INSERT ON core_pathaggregation
+REFERENCING NEW TABLE AS new_aggregations
+FOR EACH STATEMENT EXECUTE PROCEDURE ft_topologies_paths_geometry_statement();
+
+CREATE TRIGGER core_pathaggregation_geometry_statement_u_tgr
+AFTER UPDATE ON core_pathaggregation
+REFERENCING OLD TABLE AS old_aggregations NEW TABLE AS new_aggregations
+FOR EACH STATEMENT EXECUTE PROCEDURE ft_topologies_paths_geometry_statement();
+
+CREATE TRIGGER core_pathaggregation_geometry_statement_d_tgr
+AFTER DELETE ON core_pathaggregation
+REFERENCING OLD TABLE AS old_aggregations
 FOR EACH STATEMENT EXECUTE PROCEDURE ft_topologies_paths_geometry_statement();
 
 
@@ -38,41 +38,76 @@ $$ LANGUAGE plpgsql;
 
 CREATE FUNCTION {# geotrek.core #}.update_topology_geom_when_path_changes() RETURNS trigger SECURITY DEFINER AS $$
 DECLARE
-    eid integer;
-    egeom geometry;
-    linear_offset float;
-    side_offset float;
+    topology_ids integer[];
 BEGIN
+    -- Statement-level trigger: topologies of all paths whose geometry changed
+    -- are updated at once.
+
     -- Geometry of linear topologies are always updated
     -- Geometry of point topologies are updated if offset = 0
-    FOR eid IN SELECT e.id
-               FROM core_pathaggregation et, core_topology e
-               WHERE et.path_id = NEW.id AND et.topo_object_id = e.id
-               GROUP BY e.id, e."offset"
-               HAVING BOOL_OR(et.start_position != et.end_position) OR e."offset" = 0.0
-    LOOP
-        PERFORM update_geometry_of_topology(eid);
-    END LOOP;
+    SELECT array_agg(DISTINCT e.id) INTO topology_ids
+    FROM (
+        SELECT e.id
+        FROM new_paths n
+        JOIN old_paths o ON o.id = n.id
+        JOIN core_pathaggregation et ON et.path_id = n.id
+        JOIN core_topology e ON et.topo_object_id = e.id
+        WHERE NOT ST_OrderingEquals(n.geom, o.geom)
+        GROUP BY e.id, e."offset", n.id
+        HAVING BOOL_OR(et.start_position != et.end_position) OR e."offset" = 0.0
+    ) AS e;
+
+    IF topology_ids IS NOT NULL THEN
+        IF {{ TOPOLOGY_GEOM_DEFERRED_UPDATE }} THEN
+            -- Geometries will be updated later (see update_topologies_geom task)
+            UPDATE core_topology SET geom_need_update = TRUE WHERE id = ANY(topology_ids) AND kind != 'TMP';
+        ELSE
+            PERFORM update_geometry_of_topologies(topology_ids);
+        END IF;
+    END IF;
 
     -- Special case of point geometries with offset != 0
-    FOR eid, egeom IN SELECT e.id, e.geom
-               FROM core_pathaggregation et, core_topology e
-               WHERE et.path_id = NEW.id AND et.topo_object_id = e.id
-               GROUP BY e.id, e.geom, e."offset"
-               HAVING COUNT(et.id) = 1 AND BOOL_OR(et.start_position = et.end_position) AND e."offset" != 0.0
-    LOOP
-        SELECT * INTO linear_offset, side_offset FROM ST_InterpolateAlong(NEW.geom, egeom) AS (position float, distance float);
-        UPDATE core_topology SET "offset" = side_offset WHERE id = eid;
-        UPDATE core_pathaggregation SET start_position = linear_offset, end_position = linear_offset WHERE topo_object_id = eid AND path_id = NEW.id;
-    END LOOP;
+    -- (only when there are some, since updating no aggregation still fires
+    -- statement triggers of core_pathaggregation)
+    IF EXISTS (
+        SELECT 1
+        FROM new_paths n
+        JOIN old_paths o ON o.id = n.id
+        JOIN core_pathaggregation et ON et.path_id = n.id
+        JOIN core_topology e ON et.topo_object_id = e.id
+        WHERE NOT ST_OrderingEquals(n.geom, o.geom) AND et.start_position = et.end_position AND e."offset" != 0.0
+    ) THEN
+        WITH points AS (
+            SELECT e.id, n.id AS path_id
+            FROM new_paths n
+            JOIN old_paths o ON o.id = n.id
+            JOIN core_pathaggregation et ON et.path_id = n.id
+            JOIN core_topology e ON et.topo_object_id = e.id
+            WHERE NOT ST_OrderingEquals(n.geom, o.geom)
+            GROUP BY e.id, e."offset", n.id
+            HAVING COUNT(et.id) = 1 AND BOOL_OR(et.start_position = et.end_position) AND e."offset" != 0.0
+        ), moved AS (
+            SELECT p.id, p.path_id, i.position, i.distance
+            FROM points p
+            JOIN core_topology e ON e.id = p.id
+            JOIN core_path t ON t.id = p.path_id,
+            LATERAL ST_InterpolateAlong(t.geom, e.geom) AS i(position float, distance float)
+        ), offsets AS (
+            UPDATE core_topology e SET "offset" = m.distance FROM moved m WHERE e.id = m.id
+        )
+        UPDATE core_pathaggregation et SET start_position = m.position, end_position = m.position
+        FROM moved m
+        WHERE et.topo_object_id = m.id AND et.path_id = m.path_id;
+    END IF;
 
     RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
 CREATE TRIGGER core_path_90_topologies_geom_u_tgr
-AFTER UPDATE OF geom ON core_path
-FOR EACH ROW EXECUTE PROCEDURE update_topology_geom_when_path_changes();
+AFTER UPDATE ON core_path
+REFERENCING OLD TABLE AS old_paths NEW TABLE AS new_paths
+FOR EACH STATEMENT EXECUTE PROCEDURE update_topology_geom_when_path_changes();
 
 
 -------------------------------------------------------------------------------
@@ -0,0 +1,43 @@
+from celery import shared_task
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+
+from geotrek.common.utils.tiles import invalidate_tiles
+from geotrek.core.models import Topology
+
+
+def topologies_extent(cursor, ids):
+    """
+    Return the extent of geometries of topologies ``ids`` in Web Mercator,
+    or None if they have no geometry.
+    """
+    cursor.execute("""
+        SELECT ST_XMin(extent), ST_YMin(extent), ST_XMax(extent), ST_YMax(extent)
+        FROM (SELECT ST_Extent(ST_Transform(geom, 3857)) AS extent FROM core_topology WHERE id = ANY(%s)) AS e
+    """, [ids])
+    extent = cursor.fetchone()
+    return None if extent[0] is None else extent
+
+
+@shared_task(name='geotrek.core.update-topologies-geom')
+def update_topologies_geom():
+    """
+    Update geometries of topologies marked as outdated (``geom_need_update``),
+    when ``TOPOLOGY_GEOM_DEFERRED_UPDATE`` is enabled, then invalidate caches
+    of their previous and new extents.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT id FROM core_topology WHERE geom_need_update FOR UPDATE SKIP LOCKED")
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return
+        extents = [topologies_extent(cursor, ids)]
+        cursor.execute("SELECT update_geometry_of_topologies(%s)", [ids])
+        extents.append(topologies_extent(cursor, ids))
+    # Tiles of topologies of all kinds (and of interventions, which depend on them)
+    labels = [model._meta.label_lower for model in apps.get_models() if issubclass(model, Topology)]
+    invalidate_tiles(labels, extents)
+    if 'geotrek.api' in settings.INSTALLED_APPS:
+        from geotrek.api.v2.utils import invalidate_api_cache
+        invalidate_api_cache()
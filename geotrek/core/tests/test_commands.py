@@ -1,3 +1,4 @@
+import tempfile
 from io import StringIO
 from unittest import mock, skipIf
 
@@ -6,8 +7,10 @@ from django.contrib.gis.geos import LineString
 from django.core.management import call_command
 from django.core.management.base import CommandError
 from django.test import TestCase, override_settings
-from django.db import IntegrityError
+from django.db import IntegrityError, connection
 
+from geotrek.altimetry.dem import DemSampler
+from geotrek.altimetry.tests.test_elevation import fill_raster_order
 from geotrek.authent.models import Structure
 from geotrek.core.models import Path
 from geotrek.trekking.tests.factories import POIFactory
@@ -104,7 +107,7 @@ class RemoveDuplicatePathTest(TestCase):
 
     def test_remove_duplicate_path_fail(self):
         output = StringIO()
-        with mock.patch('geotrek.core.models.Path.delete') as mock_delete:
+        with mock.patch('django.db.models.query.QuerySet.delete') as mock_delete:
             mock_delete.side_effect = Exception('An ERROR')
             call_command('remove_duplicate_paths', verbosity=2, stdout=output)
         self.assertIn("An ERROR", output.getvalue())
@@ -113,6 +116,16 @@ class RemoveDuplicatePathTest(TestCase):
         self.assertIn("0 duplicate paths have been deleted",
                       output.getvalue())
 
+    def test_remove_near_duplicate_path(self):
+        p10 = Path.objects.create(name='Tenth Path', geom=LineString((10, 0), (11, 0.3), (12, 0)))
+        p11 = Path.objects.create(name='Eleventh Path', geom=LineString((10, 0), (11, 0), (12, 0)))
+        poi = POIFactory.create(name='POI4', paths=[(p11, 0.5, 0.5)])
+        call_command('remove_duplicate_paths', tolerance=0.5, verbosity=0)
+        # Reversed path p5 is not a duplicate
+        self.assertCountEqual((self.p1, self.p3, self.p5, self.p6, self.p8, p10),
+                              list(Path.objects.all()))
+        self.assertEqual(poi.aggregations.get().path, p10)
+
 
 @skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
 class LoadPathsCommandTest(TestCase):
@@ -229,3 +242,89 @@ class LoadPathsCommandTest(TestCase):
         value = Path.objects.first()
         self.assertEqual(value.name, 'lulu')
         self.assertEqual(value.structure, self.structure)
+
+    @override_settings(SRID=4326, SPATIAL_EXTENT=(-1, 0, 4, 2))
+    def test_load_paths_bulk(self):
+        output = StringIO()
+        call_command('loadpaths', self.filename, '-i', '--bulk', srid=4326, verbosity=2,
+                     comment=['comment', 'foo'], stdout=output)
+        output = output.getvalue()
+        self.assertEqual(Path.objects.count(), 2)
+        for path in Path.objects.all():
+            self.assertEqual(path.structure, self.structure)
+            self.assertIn('Create path with pk : %s' % path.pk, output)
+        self.assertEqual(Path.objects.get(name='lulu').comments, 'Comment 2</br>foo2')
+        self.assertIn('2 objects created, 0 objects failed', output)
+
+    @override_settings(SRID=4326, SPATIAL_EXTENT=(-1, 0, 4, 2))
+    @mock.patch('geotrek.api.v2.utils.invalidate_api_cache')
+    @mock.patch('geotrek.core.management.commands.loadpaths.invalidate_tiles')
+    @mock.patch('geotrek.core.management.commands.loadpaths.transaction.on_commit', side_effect=lambda func: func())
+    def test_load_paths_bulk_invalidates_caches(self, on_commit, invalidate_tiles, invalidate_api_cache):
+        call_command('loadpaths', self.filename, '-i', '--bulk', srid=4326, verbosity=0)
+        self.assertEqual(Path.objects.count(), 2)
+        labels = invalidate_tiles.call_args[0][0]
+        self.assertIn('core.path', labels)
+        self.assertIn('trekking.trek', labels)
+        invalidate_api_cache.assert_called_once_with()
+
+    @override_settings(SRID=4326, SPATIAL_EXTENT=(-1, 0, 4, 2))
+    def test_load_paths_bulk_dry(self):
+        output = StringIO()
+        call_command('loadpaths', self.filename, '-i', '--bulk', dry=True, verbosity=2, stdout=output)
+        self.assertIn('2 objects will be create, 0 objects failed;', output.getvalue())
+        self.assertEqual(Path.objects.count(), 0)
+
+    @override_settings(SRID=4326, SPATIAL_EXTENT=(-1, 0, 4, 2))
+    def test_load_paths_bulk_fail(self):
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'bad_path.geojson')
+        output = StringIO()
+        call_command('loadpaths', filename, '-i', '--bulk', dry=True, verbosity=2, stdout=output)
+        self.assertIn('0 objects will be create, 1 objects failed;', output.getvalue())
+        with self.assertRaises(IntegrityError):
+            call_command('loadpaths', filename, '-i', '--bulk', verbosity=0)
+        self.assertEqual(Path.objects.count(), 0)
+
+
+@skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
+class LoadPathsBulkCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.structure = Structure.objects.create(name='huh')
+        cls.filename = os.path.join(os.path.dirname(__file__), 'data', 'paths_crossing.geojson')
+
+    @override_settings(SPATIAL_EXTENT=(-1000, -1000, 1000, 1000))
+    def test_snap_and_split_like_triggers(self):
+        existing = Path.objects.create(name='existing', geom=LineString((0, 50), (200, 50)), structure=self.structure)
+        poi = POIFactory.create(paths=[(existing, 0.75, 0.75)], offset=0)
+        call_command('loadpaths', self.filename, '--bulk', structure='huh', verbosity=0)
+        # New path is split where it crosses the existing one
+        self.assertEqual([path.length for path in Path.objects.filter(name='first')], [50, 50])
+        # Existing path is split where the new path crosses it, keeping its topologies
+        self.assertEqual([path.length for path in Path.objects.filter(name='existing')], [100, 100])
+        poi.reload()
+        self.assertAlmostEqual(poi.geom.x, 150)
+        self.assertAlmostEqual(poi.geom.y, 50)
+        # Extremity of second path was snapped on the extremity of the first one
+        second = Path.objects.get(name='second')
+        self.assertEqual(second.geom.coords[0], (100, 100))
+        self.assertIsNotNone(second.geom_3d)
+
+    @override_settings(SPATIAL_EXTENT=(-1000, -1000, 1000, 1000))
+    def test_elevation_from_dem_file(self):
+        fill_raster_order()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dem_file = os.path.join(tmp_dir, 'dem.bin')
+            DemSampler.build(dem_file)
+            with override_settings(ALTIMETRIC_DEM_FILE=dem_file):
+                call_command('loadpaths', self.filename, '--bulk', structure='huh', verbosity=0)
+        self.assertEqual(Path.objects.count(), 2)
+        # Same elevation as computed by the database
+        for path in Path.objects.all():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT slope, min_elevation, max_elevation, positive_gain, negative_gain '
+                               'FROM ft_elevation_infos(%s::geometry, %s)', [path.geom.ewkt, settings.ALTIMETRIC_PROFILE_STEP])
+                slope, *elevations = cursor.fetchone()
+            self.assertAlmostEqual(path.slope, slope)
+            self.assertEqual([path.min_elevation, path.max_elevation, path.ascent, path.descent], elevations)
+        self.assertGreater(Path.objects.get(name='first').max_elevation, 0)
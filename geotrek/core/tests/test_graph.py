@@ -1,14 +1,16 @@
-from unittest import skipIf
+import json
+import tracemalloc
+from unittest import mock, skipIf
 
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.contrib.gis.geos import LineString
+from django.contrib.gis.geos import LineString, Point
 from django.urls import reverse
 
 from geotrek.core.tests.factories import PathFactory
-from geotrek.core.graph import graph_edges_nodes_of_qs
-from geotrek.core.models import Path
+from geotrek.core.graph import graph_edges_nodes_of_qs, CompactPathGraph, PathGraph, PathRouter
+from geotrek.core.models import Path, Topology
 
 
 @skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
@@ -97,3 +99,284 @@ class SimpleGraph(TestCase):
         PathFactory(geom=LineString((0, 0), (1, 1)))
         response = self.client.get(self.url)
         self.assertNotEqual(response['Cache-Control'], None)
+
+    def test_json_graph_version_header(self):
+        PathFactory(geom=LineString((0, 0), (1, 1)))
+        response = self.client.get(self.url)
+        self.assertIn('Graph-Version', response)
+
+    def test_json_graph_since(self):
+        path_1 = PathFactory(geom=LineString((0, 0), (1, 1)))
+        response = self.client.get(self.url)
+        graph_id, counter = response['Graph-Version'].split('-')
+        path_2 = PathFactory(geom=LineString((1, 1), (2, 2)))
+        response = self.client.get(self.url, {'since': response['Graph-Version']})
+        self.assertEqual(response.status_code, 200)
+        diff = response.json()
+        self.assertEqual(diff['version'], '{}-{}'.format(graph_id, int(counter) + 1))
+        self.assertEqual(response['Graph-Version'], diff['version'])
+        self.assertEqual(list(diff['edges'].keys()), [str(path_2.pk)])
+        self.assertDictEqual(diff['nodes'], {'2': {'1': path_1.pk, '3': path_2.pk}, '3': {'2': path_2.pk}})
+
+    def test_binary_graph(self):
+        path = PathFactory(geom=LineString((0, 0), (1, 1)))
+        response = self.client.get(self.url)
+        json_graph = response.json()
+        response = self.client.get(self.url, {'format': 'binary'})
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(response['Graph-Version'], self.client.get(self.url)['Graph-Version'])
+        graph = CompactPathGraph.from_bytes(response.content).as_dict()
+        self.assertEqual(graph['edges'][path.pk]['nodes_id'], json_graph['edges'][str(path.pk)]['nodes_id'])
+        with mock.patch('geotrek.core.graph.get_path_graph') as get_path_graph:
+            self.assertEqual(self.client.get(self.url, {'format': 'binary'}).content, response.content)
+        get_path_graph.assert_not_called()
+
+    def test_json_graph_since_current_version(self):
+        PathFactory(geom=LineString((0, 0), (1, 1)))
+        version = self.client.get(self.url)['Graph-Version']
+        with mock.patch('geotrek.core.graph.get_path_graph') as get_path_graph:
+            response = self.client.get(self.url, {'since': version})
+        get_path_graph.assert_not_called()
+        self.assertDictEqual(response.json(), {'version': version, 'edges': {}, 'nodes': {}})
+
+    def test_json_graph_since_unknown_version(self):
+        PathFactory(geom=LineString((0, 0), (1, 1)))
+        graph_id = self.client.get(self.url)['Graph-Version'].split('-')[0]
+        for since in ('1', 'foo-1', '{}-foo'.format(graph_id), '{}-1000'.format(graph_id)):
+            response = self.client.get(self.url, {'since': since})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('nodes', response.json())
+            self.assertNotIn('version', response.json())
+
+
+@skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
+class PathGraphTest(TestCase):
+    def test_update_path(self):
+        path_1 = PathFactory(geom=LineString((0, 0), (1, 1)))
+        path_2 = PathFactory(geom=LineString((1, 1), (2, 2)))
+        graph = PathGraph()
+        graph.update(Path.objects.order_by('id'))
+        version = graph.version
+        path_2.geom = LineString((1, 1), (3, 3))
+        path_2.save()
+        self.assertTrue(graph.update(Path.objects.order_by('id')))
+        self.assertDictEqual(graph.as_dict()['nodes'], {1: {2: path_1.pk}, 2: {1: path_1.pk, 4: path_2.pk}, 4: {2: path_2.pk}})
+        self.assertDictEqual(graph.diff(version)['nodes'], {2: {1: path_1.pk, 4: path_2.pk}, 3: None, 4: {2: path_2.pk}})
+
+    def test_delete_path(self):
+        path_1 = PathFactory(geom=LineString((0, 0), (1, 1)))
+        path_2 = PathFactory(geom=LineString((1, 1), (2, 2)))
+        graph = PathGraph()
+        graph.update(Path.objects.order_by('id'))
+        version = graph.version
+        path_2.delete()
+        self.assertTrue(graph.update(Path.objects.order_by('id')))
+        self.assertDictEqual(graph.as_dict()['edges'], {path_1.pk: {'nodes_id': [1, 2], 'length': path_1.length, 'id': path_1.pk}})
+        self.assertDictEqual(graph.diff(version), {'version': graph.version,
+                                                   'edges': {path_2.pk: None},
+                                                   'nodes': {2: {1: path_1.pk}, 3: None}})
+
+    def test_coords_of_removed_nodes(self):
+        path_1 = PathFactory(geom=LineString((0, 0), (1, 1)))
+        path_2 = PathFactory(geom=LineString((1, 1), (2, 2)))
+        graph = PathGraph()
+        graph.update(Path.objects.order_by('id'))
+        path_2.geom = LineString((1, 1), (3, 3))
+        path_2.save()
+        graph.update(Path.objects.order_by('id'))
+        self.assertCountEqual(graph.coords.values(), [1, 2, 4])
+        path_1.delete()
+        graph.update(Path.objects.order_by('id'))
+        self.assertCountEqual(graph.coords.values(), [2, 4])
+        self.assertCountEqual(graph.node_coords, [2, 4])
+
+    def test_no_change(self):
+        PathFactory(geom=LineString((0, 0), (1, 1)))
+        graph = PathGraph()
+        graph.update(Path.objects.all())
+        self.assertFalse(graph.update(Path.objects.all()))
+        self.assertEqual(graph.counter, 1)
+        self.assertIsNone(graph.diff('{}-{}'.format(graph.graph_id, graph.counter + 1)))
+
+    def test_version_of_another_graph(self):
+        PathFactory(geom=LineString((0, 0), (1, 1)))
+        graph = PathGraph()
+        graph.update(Path.objects.all())
+        other_graph = PathGraph()
+        other_graph.update(Path.objects.all())
+        self.assertNotEqual(graph.version, other_graph.version)
+        self.assertIsNone(other_graph.diff(graph.version))
+        self.assertEqual(other_graph.diff(other_graph.version)['edges'], {})
+
+    def test_nodes_numbered_by_path_id(self):
+        path_1 = PathFactory(geom=LineString((0, 0), (1, 1)))
+        path_2 = PathFactory(geom=LineString((2, 2), (3, 3)))
+        graph = PathGraph()
+        graph.update(Path.objects.order_by('-id'))
+        self.assertEqual(graph.edges[path_1.pk]['nodes_id'], [1, 2])
+        self.assertEqual(graph.edges[path_2.pk]['nodes_id'], [3, 4])
+
+
+@skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
+class PathRouterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('homer', 'h@s.com', 'dooh')
+        cls.url = reverse('core:path_json_route')
+        cls.path_1 = PathFactory(geom=LineString((0, 0), (10, 0)))
+        cls.path_2 = PathFactory(geom=LineString((10, 0), (20, 0)))
+        cls.path_3 = PathFactory(geom=LineString((20, 0), (20, 10)))
+
+    def setUp(self):
+        self.client.force_login(user=self.user)
+
+    def step(self, x, y):
+        point = Point(x, y, srid=settings.SRID).transform(settings.API_SRID, clone=True)
+        return {'lng': point.x, 'lat': point.y}
+
+    def test_route_two_steps(self):
+        steps = [self.step(2, 0), self.step(20, 5)]
+        response = self.client.get(self.url, {'steps': json.dumps(steps)})
+        self.assertEqual(response.status_code, 200)
+        topology = response.json()
+        self.assertEqual(len(topology), 1)
+        self.assertEqual(topology[0]['paths'], [self.path_1.pk, self.path_2.pk, self.path_3.pk])
+        self.assertAlmostEqual(topology[0]['positions']['0'][0], 0.2)
+        self.assertEqual(topology[0]['positions']['0'][1], 1.0)
+        self.assertEqual(topology[0]['positions']['1'], [0.0, 1.0])
+        self.assertEqual(topology[0]['positions']['2'][0], 0.0)
+        self.assertAlmostEqual(topology[0]['positions']['2'][1], 0.5)
+
+    def test_route_same_path(self):
+        steps = [self.step(8, 0), self.step(3, 0), self.step(15, 0)]
+        response = self.client.get(self.url, {'steps': json.dumps(steps)})
+        topology = response.json()
+        self.assertEqual(len(topology), 2)
+        self.assertEqual(topology[0]['paths'], [self.path_1.pk])
+        self.assertAlmostEqual(topology[0]['positions']['0'][0], 0.8)
+        self.assertAlmostEqual(topology[0]['positions']['0'][1], 0.3)
+        self.assertEqual(topology[1]['paths'], [self.path_1.pk, self.path_2.pk])
+        topology = Topology.deserialize(topology)
+        self.assertEqual(len(topology.aggregations.all()), 4)
+
+    def test_route_not_found(self):
+        PathFactory(geom=LineString((100, 100), (110, 100)))
+        steps = [self.step(2, 0), self.step(105, 100)]
+        response = self.client.get(self.url, {'steps': json.dumps(steps)})
+        self.assertEqual(response.status_code, 404)
+
+    def test_route_invalid_steps(self):
+        response = self.client.get(self.url, {'steps': json.dumps([self.step(2, 0)])})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {'steps': 'foo'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PathRouterGraphTest(SimpleTestCase):
+    def test_parallel_paths(self):
+        rows = [
+            (1, 10.0, (0., 0.), (1., 1.)),
+            (2, 3.0, (0., 0.), (1., 1.)),
+            (3, 1.0, (1., 1.), (2., 2.)),
+            (4, 1.0, (-1., -1.), (0., 0.)),
+        ]
+        router = PathRouter(CompactPathGraph.from_rows(rows))
+        self.assertEqual(router.subtopology((4, 0.5), (3, 0.5))['paths'], [4, 2, 3])
+        self.assertEqual(router.subtopology((3, 0.5), (4, 0.5))['positions'],
+                         {'0': [0.5, 0.0], '1': [1.0, 0.0], '2': [1.0, 0.5]})
+
+    def test_landmarks_same_as_dijkstra(self):
+        rows = []
+        for x in range(10):
+            for y in range(10):
+                rows.append((len(rows) + 1, 1.0 + (x * 7 + y * 3) % 5, (x, y), (x + 1, y)))
+                rows.append((len(rows) + 1, 1.0 + (x * 3 + y * 7) % 5, (x, y), (x, y + 1)))
+        rows.append((len(rows) + 1, 1.0, (100, 100), (101, 100)))
+        graph = CompactPathGraph.from_rows(rows)
+        router = PathRouter(graph)
+        self.assertEqual(len(router.landmarks), PathRouter.landmarks_count)
+        dijkstra = PathRouter(graph)
+        dijkstra.landmarks = []
+        nb_nodes = len(graph.offsets) - 1
+        for source in range(0, nb_nodes, 7):
+            for target in range(0, nb_nodes, 11):
+                result = router.shortest_path({source: 0.0}, {target: 0.5})
+                expected = dijkstra.shortest_path({source: 0.0}, {target: 0.5})
+                if expected is None:
+                    self.assertIsNone(result)
+                else:
+                    self.assertAlmostEqual(result[0], expected[0])
+
+
+class CompactPathGraphTest(SimpleTestCase):
+    rows = [
+        (10, 1.0, (1., 1.), (2., 2.)),
+        (11, 2.0, (2., 2.), (3., 3.)),
+        (12, 3.0, (4., 4.), (5., 5.)),
+        (13, 1.5, (3., 3.), (3., 3.)),
+    ]
+
+    def test_as_dict(self):
+        graph = CompactPathGraph.from_rows(self.rows)
+        self.assertDictEqual(graph.as_dict(), {
+            'nodes': {
+                1: {2: 10},
+                2: {1: 10, 3: 11},
+                3: {2: 11, 3: 13},
+                4: {5: 12},
+                5: {4: 12}
+            },
+            'edges': {
+                10: {'nodes_id': [1, 2], 'length': 1.0, 'id': 10},
+                11: {'nodes_id': [2, 3], 'length': 2.0, 'id': 11},
+                12: {'nodes_id': [4, 5], 'length': 3.0, 'id': 12},
+                13: {'nodes_id': [3, 3], 'length': 1.5, 'id': 13},
+            }
+        })
+
+    def test_same_as_path_graph(self):
+        graph = PathGraph()
+        for row in self.rows:
+            graph.add_path(*row)
+        self.assertDictEqual(CompactPathGraph.from_rows(self.rows).as_dict(), graph.as_dict())
+        self.assertDictEqual(CompactPathGraph.from_graph(graph).as_dict(), graph.as_dict())
+
+    def test_same_node_ids_as_path_graph(self):
+        graph = PathGraph()
+        for row in self.rows:
+            graph.add_path(*row)
+        graph.remove_path(10)
+        graph.add_path(14, 1.0, (6., 6.), (2., 2.))
+        self.assertDictEqual(CompactPathGraph.from_graph(graph).as_dict(), graph.as_dict())
+
+    def test_empty(self):
+        graph = CompactPathGraph.from_rows([])
+        self.assertDictEqual(graph.as_dict(), {'edges': {}, 'nodes': {}})
+
+    def test_bytes(self):
+        graph = CompactPathGraph.from_rows(self.rows)
+        self.assertDictEqual(CompactPathGraph.from_bytes(graph.to_bytes()).as_dict(), graph.as_dict())
+        with self.assertRaises(ValueError):
+            CompactPathGraph.from_bytes(b'foo')
+
+
+class CompactPathGraphMemoryTest(SimpleTestCase):
+    def memory(self, build, rows):
+        tracemalloc.start()
+        graph = build(rows)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del graph
+        return memory
+
+    def test_memory(self):
+        rows = [(i, 10.0, (float(i % 300), float(i // 300)), (float(i % 300 + 1), float(i // 300)))
+                for i in range(10000)]
+
+        def build_path_graph(rows):
+            graph = PathGraph()
+            for row in rows:
+                graph.add_path(*row)
+            return graph
+
+        self.assertLess(self.memory(CompactPathGraph.from_rows, rows) * 4, self.memory(build_path_graph, rows))
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.contrib.gis.geos import LineString, Point
+from django.contrib.gis.geos.error import GEOSException
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from geotrek.core.helpers import PointTopologyLoader
+from geotrek.core.tests.factories import PathFactory
+from geotrek.infrastructure.models import Infrastructure, InfrastructureType
+from geotrek.infrastructure.tests.factories import InfrastructureTypeFactory, PointInfrastructureFactory
+
+
+class PointTopologyLoaderTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.path = PathFactory.create(geom=LineString((0, 0), (1000, 0)))
+        cls.type = InfrastructureTypeFactory.create()
+
+    def test_objects_are_created(self):
+        loader = PointTopologyLoader(Infrastructure)
+        loader.add(Point(100, 10, srid=settings.SRID), name='first', type=self.type)
+        loader.add(Point(200, -10, srid=settings.SRID), name='second', type=self.type)
+        self.assertEqual(Infrastructure.objects.count(), 0)
+        loader.flush()
+        self.assertEqual(loader.created, 2)
+        first = Infrastructure.objects.get(name='first')
+        self.assertAlmostEqual(first.geom.x, 100)
+        self.assertAlmostEqual(first.geom.y, 10)
+        if settings.TREKKING_TOPOLOGY_ENABLED:
+            self.assertEqual(list(first.paths.all()), [self.path])
+            self.assertAlmostEqual(first.aggregations.get().start_position, 0.1)
+            self.assertAlmostEqual(abs(first.offset), 10)
+
+    def test_objects_are_flushed_by_batch(self):
+        loader = PointTopologyLoader(Infrastructure, batch_size=2)
+        for i in range(3):
+            loader.add(Point(100 * i, 10, srid=settings.SRID), name=str(i), type=self.type)
+        self.assertEqual(Infrastructure.objects.count(), 2)
+        loader.flush()
+        self.assertEqual(Infrastructure.objects.count(), 3)
+
+    def test_object_with_same_eid_is_updated(self):
+        infra = PointInfrastructureFactory.create(eid='eid1', name='old')
+        loader = PointTopologyLoader(Infrastructure)
+        obj, created = loader.add(Point(300, 10, srid=settings.SRID), eid='eid1', name='new', type=self.type)
+        self.assertFalse(created)
+        self.assertEqual(obj.pk, infra.pk)
+        loader.flush()
+        self.assertEqual(loader.updated, 1)
+        infra = Infrastructure.objects.get(eid='eid1')
+        self.assertEqual(infra.name, 'new')
+        self.assertAlmostEqual(infra.geom.x, 300)
+        if settings.TREKKING_TOPOLOGY_ENABLED:
+            self.assertEqual(list(infra.paths.all()), [self.path])
+
+    def test_lookups_are_cached(self):
+        loader = PointTopologyLoader(Infrastructure)
+        infra_type, created = loader.get_or_create(InfrastructureType, label='bench', type='B')
+        self.assertTrue(created)
+        with self.assertNumQueries(0):
+            self.assertEqual(loader.get_or_create(InfrastructureType, label='bench', type='B'), (infra_type, False))
+
+    def test_line_is_refused(self):
+        loader = PointTopologyLoader(Infrastructure)
+        with self.assertRaises(GEOSException):
+            loader.add(LineString((0, 0), (10, 0), srid=settings.SRID), name='line', type=self.type)
+
+    def count_queries(self, prefix, count, offset):
+        loader = PointTopologyLoader(Infrastructure)
+        with CaptureQueriesContext(connection) as context:
+            for i in range(count):
+                loader.add(Point(i * 10, offset, srid=settings.SRID), eid=prefix + str(i), name=str(i), type=self.type)
+            loader.flush()
+        return len(context.captured_queries)
+
+    def test_number_of_queries_is_constant(self):
+        # Created objects
+        self.assertEqual(self.count_queries('a', 5, 10), self.count_queries('b', 50, 10))
+        # Updated objects
+        self.assertEqual(self.count_queries('a', 5, 20), self.count_queries('b', 50, 20))
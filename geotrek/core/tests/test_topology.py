@@ -1,16 +1,19 @@
 import json
 import math
-from unittest import skipIf
+from unittest import mock, skipIf
 
-from django.test import TestCase
+from django.apps import apps
+from django.test import TestCase, override_settings
 from django.conf import settings
-from django.db import connections, DEFAULT_DB_ALIAS
+from django.db import connection, connections, DEFAULT_DB_ALIAS
 from django.contrib.gis.geos import Point, LineString
 
 from geotrek.common.utils import dbnow
+from geotrek.common.utils.postgresql import load_sql_files
 from geotrek.core.tests.factories import (PathFactory, PathAggregationFactory,
                                           TopologyFactory)
 from geotrek.core.models import Path, Topology, PathAggregation
+from geotrek.core.tasks import update_topologies_geom
 
 
 def dictfetchall(cursor):
@@ -155,6 +158,17 @@ class TopologyTest(TestCase):
         self.assertEqual(point.wkt, 'POINT (0 0)')
         self.assertEqual(closest, path_normal)
 
+    def test_closest_bulk(self):
+        path_draft = PathFactory.create(geom='LINESTRING(0 0, 1 0, 2 0)', draft=True)
+        path_1 = PathFactory.create(geom='LINESTRING(0 3, 1 3, 2 3)')
+        path_2 = PathFactory.create(geom='LINESTRING(0 10, 2 10)')
+        points = [Point(1, 0, srid=settings.SRID), Point(1, 9, srid=settings.SRID), Point(1, 0, srid=settings.SRID)]
+        closests = Path.closest_bulk(points, snaps=[None, None, path_draft.pk])
+        self.assertEqual([pk for pk, position, offset in closests], [path_1.pk, path_2.pk, path_draft.pk])
+        for (pk, position, offset), point in zip(closests, points):
+            path = Path.objects.get(pk=pk)
+            self.assertEqual((position, offset), path.interpolate(point))
+
     def test_topology_deserialize(self):
         p1 = PathFactory.create(geom=LineString((0, 0), (2, 2)))
         p2 = PathFactory.create(geom=LineString((2, 2), (2, 0)))
@@ -197,6 +211,28 @@ class TopologyTest(TestCase):
         with self.assertRaises(ValueError):
             Topology.deserialize('[{"paths": [4012999999], "positions": {}, "offset": 1}]')
 
+    def test_topology_deserialize_bulk(self):
+        p1 = PathFactory.create(geom=LineString((699999, 6600001), (700001, 6600001)))
+        p2 = PathFactory.create(geom=LineString((700001, 6600001), (700001, 6600101)))
+        existing = TopologyFactory.create()
+        topologies = Topology.deserialize_bulk([
+            '{"lat": 46.5, "lng": 3}',
+            {'lat': 46.5, 'lng': 3, 'snap': p2.pk},
+            '[{"paths": [%s, %s], "positions": {"0": [0.5, 1.0], "1": [0.0, 0.5]}, "offset": 1}]' % (p1.pk, p2.pk),
+            str(existing.pk),
+        ])
+        self.assertEqual(len(topologies), 4)
+        self.assertEqual(topologies[0].aggregations.get().path, p1)
+        self.assertEqual(topologies[0].aggregations.get().start_position, .5)
+        self.assertEqual(topologies[1].aggregations.get().path, p2)
+        self.assertEqual(topologies[1].offset, 0)
+        self.assertEqual([aggr.path for aggr in topologies[2].aggregations.all()], [p1, p2])
+        self.assertEqual(topologies[3], existing)
+
+    def test_topology_deserialize_bulk_without_path(self):
+        with self.assertRaises(IndexError):
+            Topology.deserialize_bulk([{'lat': 46.5, 'lng': 3}])
+
 
 @skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
 class TopologyDeletionTest(TestCase):
@@ -542,6 +578,117 @@ class TopologyLineTest(TestCase):
         self.assertEqual(t2_agg.end_position, 0.25)
 
 
+@skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
+class TopologiesGeomUpdateTest(TestCase):
+    def setUp(self):
+        self.p1 = PathFactory.create(geom=LineString((0, 0), (2, 0)))
+        self.p2 = PathFactory.create(geom=LineString((2, 0), (2, 1), (4, 1), (4, 0)))
+        self.p3 = PathFactory.create(geom=LineString((2, 0), (4, 0)))
+        self.topologies = [
+            TopologyFactory.create(paths=[(self.p1, 0.5, 0.5)]),
+            TopologyFactory.create(paths=[(self.p1, 0, 0)]),
+            TopologyFactory.create(offset=1, paths=[(self.p3, 0.5, 0.5)]),
+            TopologyFactory.create(paths=[(self.p1, 0.5, 1), self.p3]),
+            TopologyFactory.create(offset=1, paths=[self.p1, self.p2]),
+            TopologyFactory.create(paths=[self.p1, self.p2, (self.p2, 0.5, 0.5), (self.p3, 1, 0)]),
+        ]
+        self.ids = [topology.pk for topology in self.topologies]
+        self.topologies = list(Topology.objects.filter(pk__in=self.ids).order_by('pk'))
+
+    def break_geoms(self):
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE core_topology SET geom = ST_SetSRID(ST_MakePoint(0, 0), %s), length = 0, "
+                           "geom_need_update = TRUE WHERE id = ANY(%s)", [settings.SRID, self.ids])
+
+    def assertGeomsRestored(self):
+        for topology in self.topologies:
+            updated = Topology.objects.get(pk=topology.pk)
+            self.assertEqual(updated.geom, topology.geom)
+            self.assertAlmostEqual(updated.length, topology.length)
+            self.assertFalse(updated.geom_need_update)
+
+    def test_same_geometries_as_one_by_one(self):
+        self.break_geoms()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT update_geometry_of_topologies(%s)", [self.ids])
+        self.assertGeomsRestored()
+
+    def test_task(self):
+        self.break_geoms()
+        update_topologies_geom()
+        self.assertGeomsRestored()
+
+    def test_several_paths_in_one_statement(self):
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE core_path SET geom = ST_Translate(geom, 0, 10) WHERE id IN (%s, %s, %s)",
+                           [self.p1.pk, self.p2.pk, self.p3.pk])
+        topology = Topology.objects.get(pk=self.topologies[3].pk)
+        self.assertEqual(topology.geom, LineString((1, 10), (2, 10), (4, 10), srid=settings.SRID))
+        # Point with offset keeps its geometry
+        topology = Topology.objects.get(pk=self.topologies[2].pk)
+        self.assertEqual(topology.geom, self.topologies[2].geom)
+        self.assertAlmostEqual(topology.offset, -9)
+
+
+@skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
+@override_settings(TOPOLOGY_GEOM_DEFERRED_UPDATE=True)
+class TopologiesGeomDeferredUpdateTest(TestCase):
+    def setUp(self):
+        self.path = PathFactory.create(geom=LineString((0, 0), (10, 0)))
+        self.topology = TopologyFactory.create(paths=[(self.path, 0, 1)])
+        # Triggers are rendered with the setting (rolled back with the test transaction)
+        core = apps.get_app_config('core')
+        load_sql_files(core, 'pre')
+        load_sql_files(core, 'post')
+
+    @mock.patch('geotrek.core.models.transaction.on_commit')
+    def test_path_save_marks_topologies(self, on_commit):
+        self.path.geom = LineString((0, 0), (10, 10))
+        self.path.save()
+        topology = Topology.objects.get(pk=self.topology.pk)
+        self.assertTrue(topology.geom_need_update)
+        self.assertEqual(topology.geom, LineString((0, 0), (10, 0), srid=settings.SRID))
+        on_commit.assert_called_once_with(update_topologies_geom.delay)
+        update_topologies_geom()
+        topology = Topology.objects.get(pk=self.topology.pk)
+        self.assertFalse(topology.geom_need_update)
+        self.assertEqual(topology.geom, LineString((0, 0), (10, 10), srid=settings.SRID))
+
+    @mock.patch('geotrek.core.models.transaction.on_commit')
+    def test_path_save_without_geometry_change(self, on_commit):
+        self.path.name = 'Renamed'
+        self.path.save()
+        self.assertFalse(Topology.objects.get(pk=self.topology.pk).geom_need_update)
+        on_commit.assert_not_called()
+
+    @mock.patch('geotrek.core.models.transaction.on_commit')
+    def test_queryset_update_marks_topologies(self, on_commit):
+        Path.objects.filter(pk=self.path.pk).update(geom=LineString((0, 0), (10, 10), srid=settings.SRID))
+        self.assertTrue(Topology.objects.get(pk=self.topology.pk).geom_need_update)
+        on_commit.assert_called_once_with(update_topologies_geom.delay)
+
+    @mock.patch('geotrek.core.tasks.invalidate_tiles')
+    @mock.patch('geotrek.api.v2.utils.invalidate_api_cache')
+    @mock.patch('geotrek.core.models.transaction.on_commit')
+    def test_task_invalidates_caches(self, on_commit, invalidate_api_cache, invalidate_tiles):
+        self.path.geom = LineString((0, 0), (10, 10))
+        self.path.save()
+        update_topologies_geom()
+        invalidate_api_cache.assert_called_once_with()
+        labels, extents = invalidate_tiles.call_args[0]
+        self.assertIn('core.topology', labels)
+        self.assertIn('trekking.trek', labels)
+        # Previous and new extents of the topology
+        self.assertEqual(len(extents), 2)
+        self.assertNotEqual(extents[0], extents[1])
+
+    def test_topology_change_is_not_deferred(self):
+        PathAggregation.objects.filter(topo_object=self.topology).update(end_position=0.5)
+        topology = Topology.objects.get(pk=self.topology.pk)
+        self.assertFalse(topology.geom_need_update)
+        self.assertEqual(topology.geom, LineString((0, 0), (5, 0), srid=settings.SRID))
+
+
 @skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
 class TopologyCornerCases(TestCase):
     def test_opposite_paths(self):
@@ -911,3 +1058,21 @@ class TopologyOverlappingTest(TestCase):
         from geotrek.trekking.models import Trek
         overlaps = Topology.overlapping(Trek.objects.all())
         self.assertEqual(list(overlaps), [])
+
+    def test_overlapping_bulk(self):
+        with self.assertNumQueries(2):
+            overlaps = Topology.overlapping_bulk([self.topo1, self.topo2, self.point1])
+        self.assertEqual(overlaps[self.topo1.pk], list(Topology.overlapping(self.topo1)))
+        self.assertEqual(overlaps[self.topo2.pk], list(Topology.overlapping(self.topo2)))
+        self.assertEqual(overlaps[self.point1.pk], list(Topology.overlapping(self.point1)))
+
+    def test_overlapping_bulk_filtered(self):
+        overlaps = Topology.overlapping_bulk([self.topo1.pk], Topology.objects.exclude(pk=self.point3.pk))
+        self.assertEqual(overlaps, {self.topo1.pk: [self.topo1, self.point2, self.point1, self.topo2]})
+        self.assertEqual(Topology.overlapping_bulk([]), {})
+
+    def test_prefetch_overlapping(self):
+        topologies = [self.topo2, self.point2]
+        Topology.prefetch_overlapping(topologies, 'overlaps')
+        self.assertEqual(self.topo2.overlaps, [self.topo2, self.point1, self.point3, self.point2, self.topo1])
+        self.assertEqual(self.point2.overlaps, [self.topo2, self.point2, self.topo1])
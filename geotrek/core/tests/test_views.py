@@ -14,6 +14,7 @@ from django.test import TestCase
 from mapentity.tests.factories import UserFactory
 
 from geotrek.common.tests import CommonTest
+from geotrek.common.utils.tiles import tile_range
 
 from geotrek.authent.tests.factories import PathManagerFactory, StructureFactory
 from geotrek.authent.tests.base import AuthentFixturesTest
@@ -860,3 +861,52 @@ class RemovePathKeepTopology(TestCase):
         self.assertEqual(poi.deleted, False)
 
         self.assertAlmostEqual(1.5, poi.offset)
+
+
+@skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
+class PathTileTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = PathManagerFactory.create()
+
+    def setUp(self):
+        caches['fat'].clear()
+        self.client.force_login(user=self.user)
+        self.path = PathFactory.create(name='first', geom=self.make_geom(3.0))
+
+    def make_geom(self, lng):
+        return LineString((lng, 45.0), (lng + 0.001, 45.001), srid=4326).transform(settings.SRID, clone=True)
+
+    def get_tile(self, z=14, shift=0):
+        xs, ys = tile_range(self.path.geom.transform(3857, clone=True).extent, z)
+        return self.client.get(reverse('core:path_tile', kwargs={'z': z, 'x': xs[0] + shift, 'y': ys[0]}))
+
+    def test_tile(self):
+        response = self.get_tile()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        self.assertIn(b'first', response.content)
+        response = self.get_tile(shift=10)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+
+    def test_invalid_tile(self):
+        response = self.get_tile(z=settings.VECTOR_TILES_MAX_ZOOM + 1)
+        self.assertEqual(response.status_code, 404)
+        response = self.get_tile(z=settings.VECTOR_TILES_MIN_ZOOM - 1)
+        self.assertEqual(response.status_code, 404)
+
+    def test_tile_cache(self):
+        content = self.get_tile().content
+        # Not saved through the ORM, cached tile is still served
+        Path.objects.filter(pk=self.path.pk).update(name='second')
+        self.assertEqual(self.get_tile().content, content)
+        # Another tile changed
+        PathFactory.create(geom=self.make_geom(5.0))
+        self.assertEqual(self.get_tile().content, content)
+        # This tile changed
+        self.path.name = 'third'
+        self.path.save()
+        content = self.get_tile().content
+        self.assertNotIn(b'first', content)
+        self.assertIn(b'third', content)
@@ -5,11 +5,11 @@ from mapentity.registry import registry
 
 from geotrek.altimetry.urls import AltimetryEntityOptions
 from geotrek.common.functions import Length
-from geotrek.common.urls import LangConverter
+from geotrek.common.urls import LangConverter, TileEntityOptions
 from geotrek.common.views import ParametersView
 from geotrek.core.models import Path, Trail
 from geotrek.core.views import (
-    get_graph_json, merge_path, PathGPXDetail, PathKMLDetail, TrailGPXDetail, TrailKMLDetail,
+    get_graph_json, get_route_json, merge_path, PathGPXDetail, PathKMLDetail, TrailGPXDetail, TrailKMLDetail,
     MultiplePathDelete
 )
 
@@ -18,6 +18,7 @@ register_converter(LangConverter, 'lang')
 app_name = 'core'
 urlpatterns = [
     path('api/graph.json', get_graph_json, name="path_json_graph"),
+    path('api/route.json', get_route_json, name="path_json_route"),
     path('api/<lang:lang>/parameters.json', ParametersView.as_view(), name='parameters_json'),
     path('mergepath/', merge_path, name="merge_path"),
     re_path(r'^path/delete/(?P<pk>\d+(,\d+)+)/', MultiplePathDelete.as_view(), name="multiple_path_delete"),
@@ -32,7 +33,7 @@ urlpatterns = [
 ]
 
 
-class PathEntityOptions(AltimetryEntityOptions):
+class PathEntityOptions(AltimetryEntityOptions, TileEntityOptions):
     def get_queryset(self):
         return super().get_queryset().annotate(length_2d=Round(Length('geom'),
                                                                precision=1)).prefetch_related('networks', 'usages')
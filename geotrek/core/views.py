@@ -282,25 +282,74 @@ class PathViewSet(GeotrekMapentityViewSet):
 @cache_control(max_age=0, must_revalidate=True)
 @cache_last_modified(lambda x: Path.latest_updated())
 def get_graph_json(request):
+    """
+    Return the paths graph. If ``since`` parameter is given with a version
+    (see ``Graph-Version`` header), return only changes since this version,
+    or the whole graph if this version is too old or of a rebuilt graph.
+    With ``format=binary`` parameter, return the whole graph as compact
+    arrays with the same nodes ids (see ``CompactPathGraph.to_bytes()``).
+    """
     cache = caches['fat']
-    key = 'path_graph_json'
+    # The graph is only loaded from cache when a document must be computed
+    version = graph_lib.get_path_graph_version()
 
-    result = cache.get(key)
-    latest = Path.latest_updated()
+    if request.GET.get('format') == 'binary':
+        result = cache.get('path_graph_binary')
+        if result and result[0] == version:
+            binary_graph = result[1]
+        else:
+            graph = graph_lib.get_path_graph()
+            version = graph.version
+            binary_graph = graph_lib.CompactPathGraph.from_graph(graph).to_bytes()
+            cache.set('path_graph_binary', (version, binary_graph))
+        response = HttpResponse(binary_graph, content_type='application/octet-stream')
+        response['Graph-Version'] = version
+        return response
 
-    if result and latest:
-        cache_latest, json_graph = result
-        # Not empty and still valid
-        if cache_latest and cache_latest >= latest:
-            return HttpJSONResponse(json_graph)
+    since = request.GET.get('since')
+    diff = None
+    if since == version:
+        diff = {'version': version, 'edges': {}, 'nodes': {}}
+    elif since and since.partition('-')[0] == version.partition('-')[0]:
+        graph = graph_lib.get_path_graph()
+        version = graph.version
+        diff = graph.diff(since)
+    if diff is not None:
+        response = HttpJSONResponse(json.dumps(diff))
+    else:
+        result = cache.get('path_graph_json')
+        if result and result[0] == version:
+            json_graph = result[1]
+        else:
+            graph = graph_lib.get_path_graph()
+            version = graph.version
+            json_graph = json.dumps(graph.as_dict())
+            cache.set('path_graph_json', (version, json_graph))
+        response = HttpJSONResponse(json_graph)
+    response['Graph-Version'] = version
+    return response
 
-    # cache does not exist or is not up to date
-    # rebuild the graph and cache the json
-    graph = graph_lib.graph_edges_nodes_of_qs(Path.objects.exclude(draft=True))
-    json_graph = json.dumps(graph)
 
-    cache.set(key, (latest, json_graph))
-    return HttpJSONResponse(json_graph)
+@login_required
+def get_route_json(request):
+    """
+    Return the serialized topology of the shortest route going through
+    ``steps``, a JSON list of ``{"lat": ..., "lng": ...}`` points.
+    """
+    try:
+        steps = json.loads(request.GET.get('steps', ''))
+        steps = [(float(step['lng']), float(step['lat'])) for step in steps]
+        if len(steps) < 2:
+            raise ValueError
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'error': _("Invalid steps")}, status=400)
+    if not Path.objects.exclude(draft=True).exists():
+        return JsonResponse({'error': _("No path found")}, status=404)
+    router = graph_lib.get_path_router()
+    topology = router.route(steps)
+    if topology is None:
+        return JsonResponse({'error': _("No route found")}, status=404)
+    return JsonResponse(topology, safe=False)
 
 
 class TrailLayer(MapEntityLayer):
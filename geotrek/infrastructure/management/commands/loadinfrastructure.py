@@ -1,17 +1,15 @@
 import os.path
 
 from django.contrib.gis.gdal import DataSource
-from django.contrib.gis.geos import Point
-from django.contrib.gis.geos.error import GEOSException
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 
 from geotrek.authent.models import default_structure
 from geotrek.authent.models import Structure
-from geotrek.core.models import Topology
+from geotrek.core.helpers import PointTopologyLoader
 from geotrek.infrastructure.models import (InfrastructureType,
                                            InfrastructureCondition, Infrastructure)
-from django.conf import settings
+from geotrek.trekking.models import Trek
 
 
 class Command(BaseCommand):
@@ -47,6 +45,8 @@ class Command(BaseCommand):
         parser.add_argument('--eid-field', action='store', dest='eid_field', help='External ID field')
         parser.add_argument('--year-default', action='store', dest='year_default',
                             help='Default year for all infrastructures')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of infrastructures saved at once, 1000 by default')
 
     def handle(self, *args, **options):
         verbosity = options.get('verbosity')
@@ -67,6 +67,7 @@ class Command(BaseCommand):
         field_implantation_year = options.get('year_field')
         field_eid = options.get('eid_field')
 
+        loader = self.get_loader(options['batch_size'])
         sid = transaction.savepoint()
         structure_default = options.get('structure_default')
 
@@ -158,7 +159,7 @@ class Command(BaseCommand):
                         condition = feature.get(field_condition_type)
                     else:
                         condition = options.get('condition_default')
-                    structure = Structure.objects.get(name=feature.get(field_structure_type)) \
+                    structure = loader.get(Structure, name=feature.get(field_structure_type)) \
                         if field_structure_type in available_fields else structure
                     description = feature.get(
                         field_description) if field_description in available_fields else options.get(
@@ -168,9 +169,10 @@ class Command(BaseCommand):
                         field_implantation_year).isdigit() else options.get('year_default')
                     eid = feature.get(field_eid) if field_eid in available_fields else None
 
-                    self.create_infrastructure(feature_geom, name, type, category, use_structure,
-                                               condition, structure, description, year, verbosity, eid)
+                    self.create_infrastructure(feature_geom, name, type, category, use_structure, condition,
+                                               structure, description, year, verbosity, eid, loader=loader)
 
+            loader.flush()
             transaction.savepoint_commit(sid)
             if verbosity >= 2:
                 self.stdout.write(self.style.NOTICE("{} objects created.".format(self.counter)))
@@ -180,56 +182,46 @@ class Command(BaseCommand):
             transaction.savepoint_rollback(sid)
             raise
 
-    def create_infrastructure(self, geometry, name, type, category, use_structure,
-                              condition, structure, description, year, verbosity, eid):
+    def get_loader(self, batch_size=1000):
+        return PointTopologyLoader(Infrastructure, batch_size=batch_size, on_flush=self.save_treks)
+
+    def save_treks(self, infrastructures):
+        for trek in Trek.topologies_treks(infrastructures):
+            trek.save()
 
-        infra_type, created = InfrastructureType.objects.get_or_create(label=type, type=category,
-                                                                       structure=structure if use_structure else None)
+    def create_infrastructure(self, geometry, name, type, category, use_structure,
+                              condition, structure, description, year, verbosity, eid, loader=None):
+        if loader is None:
+            loader = self.get_loader()
+            infra = self.create_infrastructure(geometry, name, type, category, use_structure, condition, structure,
+                                               description, year, verbosity, eid, loader=loader)
+            loader.flush()
+            return infra
+
+        infra_type, created = loader.get_or_create(InfrastructureType, label=type, type=category,
+                                                   structure=structure if use_structure else None)
         if created and verbosity:
             self.stdout.write("- InfrastructureType '{}' created".format(infra_type))
 
         if condition:
-            condition_type, created = InfrastructureCondition.objects.get_or_create(
-                label=condition,
-                structure=structure if use_structure else None)
+            condition_type, created = loader.get_or_create(InfrastructureCondition, label=condition,
+                                                           structure=structure if use_structure else None)
             if created and verbosity:
                 self.stdout.write("- Condition Type '{}' created".format(condition_type))
         else:
             condition_type = None
 
-        with transaction.atomic():
-            fields_without_eid = {
-                'type': infra_type,
-                'name': name,
-                'condition': condition_type,
-                'structure': structure,
-                'description': description,
-                'implantation_year': year
-            }
-            if eid:
-                infra, created = Infrastructure.objects.update_or_create(
-                    eid=eid,
-                    defaults=fields_without_eid
-                )
-                if verbosity > 0 and not created:
-                    self.stdout.write("Update : %s with eid %s" % (name, eid))
-            else:
-                infra = Infrastructure.objects.create(**fields_without_eid)
-        if settings.TREKKING_TOPOLOGY_ENABLED:
-            try:
-                geometry.coord_dim = 2
-                geometry = geometry.transform(settings.API_SRID, clone=True)
-                serialized = '{"lng": %s, "lat": %s}' % (geometry.x, geometry.y)
-                topology = Topology.deserialize(serialized)
-                infra.mutate(topology)
-            except IndexError:
-                raise GEOSException('Invalid Geometry type. You need 1 path')
-        else:
-            if geometry.geom_type != 'Point':
-                raise GEOSException('Invalid Geometry type.')
-            geometry = geometry.transform(settings.SRID, clone=True)
-            infra.geom = Point(geometry.x, geometry.y)
-            infra.save()
+        fields_without_eid = {
+            'type': infra_type,
+            'name': name,
+            'condition': condition_type,
+            'structure': structure,
+            'description': description,
+            'implantation_year': year
+        }
+        infra, created = loader.add(geometry, eid=eid, **fields_without_eid)
+        if eid and verbosity > 0 and not created:
+            self.stdout.write("Update : %s with eid %s" % (name, eid))
         self.counter += 1
 
         return infra
@@ -6,7 +6,7 @@ from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.db import models
 from django.contrib.gis.geos import GeometryCollection
 from django.contrib.postgres.indexes import GistIndex
-from django.db.models import Q, Min, Max
+from django.db.models import Case, OuterRef, Q, Min, Max, Subquery, When
 from django.db.models.functions import ExtractYear
 from django.utils.translation import gettext_lazy as _
 
@@ -276,6 +276,89 @@ class Intervention(ZoningPropertiesMixin, AddPropertyMixin, MapEntityMixin, Alti
     def topology_interventions(cls, topology):
         return cls.get_interventions(topology)
 
+    @classmethod
+    def prefetch_topology_interventions(cls, topologies, to_attr):
+        """
+        Store interventions of each topology (``topology_interventions()``)
+        in its ``to_attr`` attribute, with a constant number of queries.
+        """
+        if not settings.TREKKING_TOPOLOGY_ENABLED:
+            for topology in topologies:
+                setattr(topology, to_attr, list(cls.topology_interventions(topology)))
+            return topologies
+        blade_content_type = ContentType.objects.get_for_model(Blade)
+        non_topology_content_types = [blade_content_type]
+        if 'geotrek.outdoor' in settings.INSTALLED_APPS:
+            non_topology_content_types += [
+                ContentType.objects.get_by_natural_key('outdoor', 'site'),
+                ContentType.objects.get_by_natural_key('outdoor', 'course'),
+            ]
+        overlapping = Topology.overlapping_bulk(topologies, Topology.objects.existing().only('pk'))
+        targets = {topology_pk: {topology.pk for topology in overlapped}
+                   for topology_pk, overlapped in overlapping.items()}
+        target_ids = set().union(*targets.values())
+        qs = Q(target_id__in=target_ids) & ~Q(target_type__in=non_topology_content_types)
+        blades = {}
+        if 'geotrek.signage' in settings.INSTALLED_APPS:
+            blades = dict(Blade.objects.filter(signage__in=target_ids).values_list('id', 'signage_id'))
+            qs |= Q(target_id__in=blades.keys(), target_type=blade_content_type)
+        interventions = list(cls.objects.existing().filter(qs).order_by('pk'))
+        for topology in topologies:
+            topology_targets = targets[topology.pk]
+            setattr(topology, to_attr, [
+                intervention for intervention in interventions
+                if (intervention.target_type_id == blade_content_type.pk
+                    and blades.get(intervention.target_id) in topology_targets)
+                or (intervention.target_type_id not in [content_type.pk for content_type in non_topology_content_types]
+                    and intervention.target_id in topology_targets)
+            ])
+        return topologies
+
+    @classmethod
+    def non_topology_targets(cls):
+        """
+        Return (content type, queryset, geometry lookup) of kinds of targets
+        which are not topologies.
+        """
+        targets = []
+        if 'geotrek.signage' in settings.INSTALLED_APPS:
+            targets.append((ContentType.objects.get_for_model(Blade), Blade.objects.all(), 'topology__geom'))
+        if 'geotrek.outdoor' in settings.INSTALLED_APPS:
+            for model_name in ('site', 'course'):
+                content_type = ContentType.objects.get_by_natural_key('outdoor', model_name)
+                targets.append((content_type, content_type.model_class().objects.all(), 'geom'))
+        return targets
+
+    @classmethod
+    def filter_target_geom(cls, queryset, lookup, geom):
+        """
+        Filter interventions of ``queryset`` whose target geometry matches
+        ``geom`` with ``lookup`` (``bboverlaps``, ``intersects``...), with
+        subqueries on tables of targets.
+        """
+        targets = cls.non_topology_targets()
+        topologies = Topology.objects.filter(**{'geom__{}'.format(lookup): geom}).values('pk')
+        qs = Q(target_id__in=topologies) & ~Q(target_type__in=[content_type for content_type, _, _ in targets])
+        for content_type, objects, geom_lookup in targets:
+            objects = objects.filter(**{'{}__{}'.format(geom_lookup, lookup): geom}).values('pk')
+            qs |= Q(target_id__in=objects, target_type=content_type)
+        return queryset.filter(qs)
+
+    @classmethod
+    def annotate_target_geom(cls, queryset, name):
+        """
+        Annotate interventions of ``queryset`` with the geometry of their
+        target as ``name``, with subqueries on tables of targets.
+        """
+        cases = [
+            When(target_type=content_type,
+                 then=Subquery(objects.filter(pk=OuterRef('target_id')).values(geom_lookup)[:1]))
+            for content_type, objects, geom_lookup in cls.non_topology_targets()
+        ]
+        topology_geom = Subquery(Topology.objects.filter(pk=OuterRef('target_id')).values('geom')[:1])
+        return queryset.annotate(**{name: Case(*cases, default=topology_geom,
+                                               output_field=models.GeometryField(srid=settings.SRID))})
+
     @classmethod
     def blade_interventions(cls, blade):
         return cls.get_interventions(blade.signage)
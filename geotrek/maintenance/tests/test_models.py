@@ -6,7 +6,7 @@ from unittest import skipIf
 
 from geotrek.infrastructure.models import Infrastructure
 from geotrek.infrastructure.tests.factories import InfrastructureFactory
-from geotrek.signage.tests.factories import SignageFactory
+from geotrek.signage.tests.factories import BladeFactory, SignageFactory
 from geotrek.maintenance.models import Intervention
 from geotrek.maintenance.tests.factories import (InterventionFactory,
                                                  InfrastructureInterventionFactory,
@@ -14,6 +14,7 @@ from geotrek.maintenance.tests.factories import (InterventionFactory,
                                                  SignageInterventionFactory,
                                                  ProjectFactory, ManDayFactory, InterventionJobFactory,
                                                  InterventionDisorderFactory)
+from geotrek.core.models import Topology
 from geotrek.core.tests.factories import PathFactory, TopologyFactory, StakeFactory, TrailFactory
 
 
@@ -128,6 +129,31 @@ class InterventionTest(TestCase):
         interv.project = proj
         self.assertTrue(interv.in_project)
 
+    def test_prefetch_topology_interventions(self):
+        p1 = PathFactory.create(geom=LineString((0, 0), (4, 4)))
+        p2 = PathFactory.create(geom=LineString((10, 10), (14, 14)))
+        topo1 = TopologyFactory.create(paths=[(p1, 0, 0.5)])
+        topo2 = TopologyFactory.create(paths=[(p1, 0.5, 1)])
+        topo3 = TopologyFactory.create(paths=[p2])
+        signage = SignageFactory.create(paths=[(p1, 0.2, 0.2)])
+        blade = BladeFactory.create(signage=signage)
+        infra = InfrastructureFactory.create(paths=[(p1, 0.8, 0.8)])
+        interv1 = InterventionFactory.create(target=TopologyFactory.create(paths=[(p1, 0.1, 0.3)]))
+        interv2 = InterventionFactory.create(target=signage)
+        interv3 = InterventionFactory.create(target=blade)
+        interv4 = InterventionFactory.create(target=infra)
+        interv5 = InterventionFactory.create(target=TopologyFactory.create(paths=[p2]))
+        InterventionFactory.create(target=infra, deleted=True)
+
+        topologies = [Topology.objects.get(pk=topo.pk) for topo in (topo1, topo2, topo3)]
+        Intervention.prefetch_topology_interventions(topologies, 'prefetched_interventions')
+        self.assertEqual(topologies[0].prefetched_interventions, [interv1, interv2, interv3])
+        self.assertEqual(topologies[1].prefetched_interventions, [interv4])
+        self.assertEqual(topologies[2].prefetched_interventions, [interv5])
+        for topology in topologies:
+            self.assertEqual(topology.prefetched_interventions,
+                             list(Intervention.topology_interventions(topology)))
+
     def test_delete_topology(self):
         infra = InfrastructureFactory.create()
         interv = InterventionFactory.create(target=infra)
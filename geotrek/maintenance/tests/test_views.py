@@ -11,8 +11,10 @@ from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.geos import Point, LineString, GeometryCollection
 from django.contrib.gis import gdal
+from django.core.cache import caches
 from django.test import TestCase
 from django.test.utils import override_settings
+from django.urls import reverse
 from django.utils.translation import activate, deactivate_all
 
 from geotrek.common.tests import CommonTest
@@ -24,9 +26,10 @@ from geotrek.core.tests.factories import StakeFactory
 from geotrek.core.models import PathAggregation
 from geotrek.common.tests.factories import OrganismFactory
 from geotrek.common.tests import TranslationResetMixin
+from geotrek.common.utils.tiles import tile_range
 from geotrek.maintenance.models import Intervention, InterventionStatus, Project
 from geotrek.maintenance.views import InterventionFormatList, ProjectFormatList
-from geotrek.core.tests.factories import PathFactory, TopologyFactory
+from geotrek.core.tests.factories import PathFactory, PointTopologyFactory, TopologyFactory
 from geotrek.infrastructure.models import Infrastructure
 from geotrek.infrastructure.tests.factories import InfrastructureFactory
 from geotrek.outdoor.tests.factories import CourseFactory
@@ -438,6 +441,46 @@ class InterventionViewsTest(CommonTest):
         self.assertEqual(Intervention.objects.first().target.kind, 'INTERVENTION')
 
 
+@skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
+class InterventionTileTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = PathManagerFactory.create()
+
+    def setUp(self):
+        caches['fat'].clear()
+        self.client.force_login(user=self.user)
+        self.path = PathFactory.create(geom=self.make_geom(3.0))
+        self.other_path = PathFactory.create(geom=self.make_geom(5.0))
+
+    def make_geom(self, lng):
+        return LineString((lng, 45.0), (lng + 0.001, 45.001), srid=4326).transform(settings.SRID, clone=True)
+
+    def get_tile(self, z=14):
+        xs, ys = tile_range(self.path.geom.transform(3857, clone=True).extent, z)
+        return self.client.get(reverse('maintenance:intervention_tile', kwargs={'z': z, 'x': xs[0], 'y': ys[0]}))
+
+    def test_tile(self):
+        InterventionFactory.create(name='on topology', target=TopologyFactory.create(paths=[self.path]))
+        blade = BladeFactory.create(topology=PointTopologyFactory.create(paths=[(self.path, 0.5, 0.5)]))
+        InterventionFactory.create(name='on blade', target=blade)
+        InterventionFactory.create(name='elsewhere', target=TopologyFactory.create(paths=[self.other_path]))
+        response = self.get_tile()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'on topology', response.content)
+        self.assertIn(b'on blade', response.content)
+        self.assertNotIn(b'elsewhere', response.content)
+
+    def test_tile_cache(self):
+        intervention = InterventionFactory.create(name='first', target=TopologyFactory.create(paths=[self.path]))
+        self.assertIn(b'first', self.get_tile().content)
+        # Target moved elsewhere, previous tile is invalidated
+        intervention = Intervention.objects.get(pk=intervention.pk)
+        intervention.target = TopologyFactory.create(paths=[self.other_path])
+        intervention.save()
+        self.assertNotIn(b'first', self.get_tile().content)
+
+
 class ProjectViewsTest(CommonTest):
     model = Project
     modelfactory = ProjectWithInterventionFactory
@@ -2,9 +2,16 @@ from django.conf import settings
 
 from mapentity.registry import registry
 
+from geotrek.common.urls import TileEntityOptions
+
 from . import models
 
 
+class InterventionEntityOptions(TileEntityOptions):
+    # Geometry of interventions comes from their target
+    tile_dependencies = ['maintenance.intervention', 'core.topology', 'core.path']
+
+
 app_name = 'maintenance'
-urlpatterns = registry.register(models.Intervention, menu=settings.INTERVENTION_MODEL_ENABLED)
+urlpatterns = registry.register(models.Intervention, InterventionEntityOptions, menu=settings.INTERVENTION_MODEL_ENABLED)
 urlpatterns += registry.register(models.Project, menu=settings.PROJECT_MODEL_ENABLED)
@@ -1,4 +1,7 @@
 import uuid
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.db import models
@@ -211,18 +214,90 @@ class Site(ZoningPropertiesMixin, AddPropertyMixin, PicturesMixin, PublishableMi
             q |= Q(**{'published_{}'.format(lang): True})
         return self.children.filter(q)
 
+    def save(self, *args, **kwargs):
+        self.__dict__.pop('_super_fields', None)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def prefetch_super_fields(cls, sites):
+        """
+        Compute values of ``super_*`` properties (values of each site and its
+        descendants) of all ``sites`` at once, with a constant number of
+        queries whatever the number of sites.
+        """
+        sites = list(sites)
+        tree_ids = {site.tree_id for site in sites}
+        if not tree_ids:
+            return sites
+        # Sites of the same trees, in tree order: descendants of a site are the
+        # rows between its left and right values
+        rows = {}
+        for row in cls.objects.filter(tree_id__in=tree_ids).order_by('tree_id', 'lft').values_list(
+                'pk', 'tree_id', 'lft', 'practice_id', 'practice__sector_id', 'orientation', 'wind'):
+            rows.setdefault(row[1], []).append(row)
+        lfts = {tree_id: [row[2] for row in tree_rows] for tree_id, tree_rows in rows.items()}
+        ratings = {}
+        for site_id, rating_id in cls.ratings.through.objects.filter(site__tree_id__in=tree_ids) \
+                .values_list('site_id', 'rating_id'):
+            ratings.setdefault(site_id, []).append(rating_id)
+        managers = {}
+        for site_id, organism_id in cls.managers.through.objects.filter(site__tree_id__in=tree_ids) \
+                .values_list('site_id', 'organism_id'):
+            managers.setdefault(site_id, []).append(organism_id)
+
+        values = []
+        for site in sites:
+            tree_rows = rows.get(site.tree_id, [])
+            start = bisect_left(lfts.get(site.tree_id, []), site.lft)
+            end = bisect_right(lfts.get(site.tree_id, []), site.rght)
+            descendants = tree_rows[start:end]
+            values.append({
+                'practices_id': {row[3] for row in descendants if row[3] is not None},
+                'ratings_id': {pk for row in descendants for pk in ratings.get(row[0], [])},
+                'sectors_id': {row[4] for row in descendants if row[4] is not None},
+                'orientation': {o for row in descendants for o in row[5]},
+                'wind': {o for row in descendants for o in row[6]},
+                # Organisms managing several sites are repeated, as with a join
+                'managers_id': [pk for row in descendants for pk in managers.get(row[0], [])],
+            })
+
+        def fetch(queryset, key):
+            """Objects of all sites sorted by model ordering"""
+            ids = {pk for value in values for pk in value[key]}
+            return list(queryset.filter(id__in=ids)) if ids else []
+
+        practices = fetch(Practice.objects.all(), 'practices_id')
+        all_ratings = fetch(Rating.objects.select_related('scale'), 'ratings_id')
+        sectors = fetch(Sector.objects.all(), 'sectors_id')
+        organisms = fetch(Organism.objects.all(), 'managers_id')
+        for site, value in zip(sites, values):
+            managers_count = Counter(value['managers_id'])
+            site._super_fields = {
+                'practices_id': value['practices_id'],
+                'practices': [practice for practice in practices if practice.pk in value['practices_id']],
+                'ratings_id': value['ratings_id'],
+                'ratings': [rating for rating in all_ratings if rating.pk in value['ratings_id']],
+                'sectors': [sector for sector in sectors if sector.pk in value['sectors_id']],
+                'orientation': [o for o, _o in cls.ORIENTATION_CHOICES if o in value['orientation']],
+                'wind': [o for o, _o in cls.WIND_CHOICES if o in value['wind']],
+                'managers': [organism for organism in organisms for i in range(managers_count[organism.pk])],
+            }
+        return sites
+
+    def get_super_fields(self):
+        if not hasattr(self, '_super_fields'):
+            Site.prefetch_super_fields([self])
+        return self._super_fields
+
     @property
     def super_practices_id(self):
         """ Return practices of itself and its descendants as ids """
-        practices_id = self.get_descendants(include_self=True) \
-            .exclude(practice=None) \
-            .values_list('practice_id', flat=True)
-        return set(practices_id)
+        return self.get_super_fields()['practices_id']
 
     @property
     def super_practices(self):
         """ Return practices of itself and its descendants as objects """
-        return Practice.objects.filter(id__in=self.super_practices_id)  # Sorted and unique
+        return self.get_super_fields()['practices']  # Sorted and unique
 
     @property
     def super_practices_display(self):
@@ -230,7 +305,7 @@ class Site(ZoningPropertiesMixin, AddPropertyMixin, PicturesMixin, PublishableMi
         if not practices:
             return ""
         verbose = [
-            str(practice) if practice == self.practice else "<i>{}</i>".format(escape(practice))
+            str(practice) if practice.pk == self.practice_id else "<i>{}</i>".format(escape(practice))
             for practice in practices
         ]
         return ", ".join(verbose)
@@ -239,41 +314,32 @@ class Site(ZoningPropertiesMixin, AddPropertyMixin, PicturesMixin, PublishableMi
     @property
     def super_ratings_id(self):
         """ Return ratings of itself and its descendants as ids """
-        ratings_id = self.get_descendants(include_self=True) \
-            .exclude(ratings=None) \
-            .values_list('ratings', flat=True)
-        return set(ratings_id)
+        return self.get_super_fields()['ratings_id']
 
     @property
     def super_ratings(self):
         """ Return ratings of itself and its descendants as objects """
-        return Rating.objects.filter(id__in=self.super_ratings_id)  # Sorted and unique
+        return self.get_super_fields()['ratings']  # Sorted and unique
 
     @property
     def super_sectors(self):
         """ Return sectors of itself and its descendants """
-        sectors_id = self.get_descendants(include_self=True) \
-            .exclude(practice=None) \
-            .values_list('practice__sector_id', flat=True)
-        return Sector.objects.filter(id__in=sectors_id)  # Sorted and unique
+        return self.get_super_fields()['sectors']  # Sorted and unique
 
     @property
     def super_orientation(self):
         """ Return orientation of itself and its descendants """
-        orientation = set(sum(self.get_descendants(include_self=True).values_list('orientation', flat=True), []))
-        return [o for o, _o in self.ORIENTATION_CHOICES if o in orientation]  # Sorting
+        return self.get_super_fields()['orientation']
 
     @property
     def super_wind(self):
         """ Return wind of itself and its descendants """
-        wind = set(sum(self.get_descendants(include_self=True).values_list('wind', flat=True), []))
-        return [o for o, _o in self.WIND_CHOICES if o in wind]  # Sorting
+        return self.get_super_fields()['wind']
 
     @property
     def super_managers(self):
         """ Return managers of itself and its descendants """
-        sites = self.get_descendants(include_self=True)
-        return Organism.objects.filter(site__in=sites)  # Sorted and unique
+        return self.get_super_fields()['managers']  # Sorted
 
     @property
     def all_pois(self):
@@ -3,6 +3,7 @@ from geotrek.trekking.tests.factories import POIFactory
 from django.contrib.gis.geos.point import Point
 from django.contrib.gis.geos import Polygon
 from geotrek.common.tests.factories import OrganismFactory
+from geotrek.outdoor.models import Site
 from geotrek.outdoor.tests.factories import SiteFactory, RatingScaleFactory, SectorFactory
 from django.test import TestCase, override_settings
 
@@ -98,6 +99,21 @@ class SiteSuperTest(TestCase):
         self.assertEqual(self.grandchild1.super_practices_display, "Bbb")
         self.assertEqual(self.grandchild2.super_practices_display, "")
 
+    def test_prefetch_super_fields(self):
+        sites = list(Site.objects.all())
+        with self.assertNumQueries(6):
+            Site.prefetch_super_fields(sites)
+        with self.assertNumQueries(0):
+            parent = [site for site in sites if site.pk == self.parent.pk][0]
+            self.assertEqual([practice.name for practice in parent.super_practices], ['Aaa', 'Bbb'])
+            self.assertEqual([sector.name for sector in parent.super_sectors], ['Axx', 'Bxx'])
+            self.assertEqual(parent.super_orientation, ['N', 'E', 'S'])
+            self.assertEqual([str(organism) for organism in parent.super_managers], ['a', 'b', 'b', 'c'])
+            self.assertEqual(parent.super_practices_display, "<i>Aaa</i>, Bbb")
+            grandchild2 = [site for site in sites if site.pk == self.grandchild2.pk][0]
+            self.assertEqual(grandchild2.super_practices, [])
+            self.assertEqual(grandchild2.super_managers, [])
+
 
 class SectorTest(TestCase):
     def test_sector_str(self):
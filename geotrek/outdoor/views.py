@@ -124,6 +124,13 @@ class SiteViewSet(GeotrekMapentityViewSet):
     def get_queryset(self):
         return self.model.objects.all()
 
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            # Practices of descendants of all sites of the page at once
+            Site.prefetch_super_fields(page)
+        return page
+
 
 class SiteAPIViewSet(APIViewSet):
     model = Site
@@ -110,6 +110,12 @@ class SensitiveArea(MapEntityMixin, StructureRelated, TimeStampedModelMixin, NoD
     def category_verbose_name(cls):
         return _("Category")
 
+    @classmethod
+    def topology_sensitive_areas(cls, topology):
+        if 'geotrek.trekking' in settings.INSTALLED_APPS and isinstance(topology, trekking_models.Trek) and topology.pk:
+            return trekking_models.TrekRelatedObject.filter_queryset(cls.objects.existing(), topology)
+        return intersecting(cls, topology, settings.SENSITIVE_AREA_INTERSECTION_MARGIN, False)
+
     def save(self, *args, **kwargs):
         if self.publication_date is None and self.published:
             self.publication_date = datetime.date.today()
@@ -194,8 +200,8 @@ class SensitiveArea(MapEntityMixin, StructureRelated, TimeStampedModelMixin, NoD
 
 if 'geotrek.core' in settings.INSTALLED_APPS:
     from geotrek.core.models import Topology
-    Topology.add_property('sensitive_areas', lambda self: intersecting(SensitiveArea, self, settings.SENSITIVE_AREA_INTERSECTION_MARGIN, False), _("Sensitive areas"))
-    Topology.add_property('published_sensitive_areas', lambda self: intersecting(SensitiveArea, self, settings.SENSITIVE_AREA_INTERSECTION_MARGIN, False).filter(published=True), _("Published sensitive areas"))
+    Topology.add_property('sensitive_areas', lambda self: SensitiveArea.topology_sensitive_areas(self), _("Sensitive areas"))
+    Topology.add_property('published_sensitive_areas', lambda self: SensitiveArea.topology_sensitive_areas(self).filter(published=True), _("Published sensitive areas"))
 
 if 'geotrek.trekking' in settings.INSTALLED_APPS:
     from geotrek.trekking import models as trekking_models
@@ -78,3 +78,12 @@ class SensitiveAreaModelTest(TestCase):
                  "700100 6600000, 700000 6600000))")
         trek = TrekFactory.create()
         self.assertEqual(trek.published_sensitive_areas.count(), 2)
+
+    def test_trek_sensitive_areas_updated(self):
+        trek = TrekFactory.create()
+        self.assertEqual(list(trek.sensitive_areas), [])
+        sensitive_area = SensitiveAreaFactory.create()
+        self.assertEqual(list(trek.sensitive_areas), [sensitive_area])
+        sensitive_area.geom = 'POLYGON((800000 6700000, 800000 6700100, 800100 6700100, 800100 6700000, 800000 6700000))'
+        sensitive_area.save()
+        self.assertEqual(list(trek.sensitive_areas), [])
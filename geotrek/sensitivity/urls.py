@@ -4,14 +4,14 @@ from django.urls import path, register_converter
 from mapentity.registry import registry
 from rest_framework.routers import DefaultRouter
 
-from geotrek.common.urls import PublishableEntityOptions, LangConverter
+from geotrek.common.urls import PublishableEntityOptions, LangConverter, TileEntityOptions
 
 from . import models
 from . import serializers
 from . import views
 
 
-class SensitiveAreaEntityOptions(PublishableEntityOptions):
+class SensitiveAreaEntityOptions(PublishableEntityOptions, TileEntityOptions):
     def get_serializer(self):
         return serializers.SensitiveAreaSerializer
 
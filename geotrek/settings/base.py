@@ -363,6 +363,10 @@ SRID = int(os.getenv('SRID', '2154'))  # Lambert-93 for Metropolitan France
 # API projection (client-side), can differ from SRID (database). Leaflet requires 4326.
 API_SRID = 4326
 
+# Minimum and maximum zoom levels of vector tiles of map layers
+VECTOR_TILES_MIN_ZOOM = 8
+VECTOR_TILES_MAX_ZOOM = 20
+
 # SRID displayed for the user (screens / pdf ...)
 DISPLAY_SRID = 3857
 DISPLAY_COORDS_AS_DECIMALS = False
@@ -435,6 +439,8 @@ ALTIMETRIC_PROFILE_FONT = 'ubuntu'
 ALTIMETRIC_PROFILE_MIN_YSCALE = 1200  # Minimum y scale (in meters)
 ALTIMETRIC_AREA_MAX_RESOLUTION = 150  # Maximum number of points (by width/height)
 ALTIMETRIC_AREA_MARGIN = 0.15
+ALTIMETRIC_DEM_FILE = None  # Memory-mapped copy of the DEM used to compute elevations without database
+ALTIMETRIC_DEM_BILINEAR = False  # Interpolate elevations between DEM pixels
 
 # Let this be defined at instance-level
 LEAFLET_CONFIG = {
@@ -545,6 +551,8 @@ PATH_MODEL_ENABLED = True
 
 
 TREKKING_TOPOLOGY_ENABLED = True
+# Update geometries of topologies in a Celery task after path changes, instead of during path save
+TOPOLOGY_GEOM_DEFERRED_UPDATE = False
 FLATPAGES_ENABLED = True
 TOURISM_ENABLED = True
 
@@ -6,13 +6,13 @@ from rest_framework.routers import DefaultRouter
 
 from . import models
 from geotrek.trekking.views import TrekSignageViewSet
-from geotrek.common.urls import LangConverter
+from geotrek.common.urls import LangConverter, TileEntityOptions
 from .views import SignageAPIViewSet, BladeAPIViewSet
 
 register_converter(LangConverter, 'lang')
 
 app_name = 'signage'
-urlpatterns = registry.register(models.Signage, menu=settings.SIGNAGE_MODEL_ENABLED)
+urlpatterns = registry.register(models.Signage, TileEntityOptions, menu=settings.SIGNAGE_MODEL_ENABLED)
 
 router = DefaultRouter(trailing_slash=False)
 
@@ -98,6 +98,10 @@ class ApidaeParser(AttachmentParserMixin, Parser):
         return self.root['objetsTouristiques']
 
     def next_row(self):
+        # Start from the page of first row to import
+        skipped = self.rows_to_skip // self.size * self.size
+        self.skip += skipped
+        self.rows_to_skip -= skipped
         while True:
             params = {
                 'apiKey': self.api_key,
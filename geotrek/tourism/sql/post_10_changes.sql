@@ -0,0 +1,13 @@
+-------------------------------------------------------------------------------
+-- Log changes at commit (see ObjectChange)
+-------------------------------------------------------------------------------
+
+CREATE CONSTRAINT TRIGGER tourism_touristiccontent_changes_tgr
+    AFTER INSERT OR UPDATE OR DELETE ON tourism_touristiccontent
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE PROCEDURE log_object_change('touristiccontent');
+
+CREATE CONSTRAINT TRIGGER tourism_touristicevent_changes_tgr
+    AFTER INSERT OR UPDATE OR DELETE ON tourism_touristicevent
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE PROCEDURE log_object_change('touristicevent');
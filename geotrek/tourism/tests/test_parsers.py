@@ -1,4 +1,4 @@
-from datetime import date
+from datetime import date, datetime
 import io
 import json
 import requests
@@ -6,6 +6,7 @@ from unittest import mock
 import os
 
 from django.test import TestCase, override_settings
+from django.utils import timezone
 from django.core.management import call_command
 from django.core.management.base import CommandError
 
@@ -46,6 +47,10 @@ class EauViveParser(TouristicContentApidaeParser):
     type2 = []
 
 
+class EauViveBulkParser(EauViveParser):
+    bulk = True
+
+
 class EspritParc(EspritParcParser):
     category = "Miels et produits de la ruche"
     type1 = ["Miel", "Pollen", "Gelée royale, propolis et pollen"]
@@ -273,6 +278,69 @@ class ParserTests(TranslationResetMixin, TestCase):
         self.assertEqual(Attachment.objects.count(), 4)
         self.assertEqual(Attachment.objects.first().content_object, content)
 
+    @mock.patch('geotrek.common.parsers.requests.get')
+    def test_create_content_apidae_bulk(self, mocked):
+        def mocked_json():
+            filename = os.path.join(os.path.dirname(__file__), 'data', 'apidaeContent.json')
+            with open(filename, 'r') as f:
+                return json.load(f)
+        mocked.return_value.status_code = 200
+        mocked.return_value.json = mocked_json
+        mocked.return_value.content = b'Fake image'
+        FileType.objects.create(type="Photographie")
+        category = TouristicContentCategoryFactory(label="Eau vive")
+        TouristicContentType1Factory(label="Type A")
+        TouristicContentType1Factory(label="Type B")
+        reports = {}
+        for parser_class in (EauViveParser, EauViveBulkParser):
+            TouristicContent.objects.all().delete()
+            for i in range(2):
+                parser = parser_class()
+                parser.parse()
+                reports.setdefault(parser_class, []).append(parser.report())
+            content = TouristicContent.objects.get()
+            self.assertEqual(content.eid, "479743")
+            self.assertEqual(content.name, "Quey' Raft")
+            self.assertEqual(content.category, category)
+            self.assertTrue(content.published)
+            self.assertIsNotNone(content.publication_date)
+            self.assertQuerysetEqual(
+                content.type1.all(),
+                ['<TouristicContentType1: Type A>', '<TouristicContentType1: Type B>']
+            )
+            self.assertEqual(Attachment.objects.filter(object_id=content.pk).count(), 4)
+        self.assertEqual(reports[EauViveParser], reports[EauViveBulkParser])
+
+    @mock.patch('geotrek.api.v2.utils.invalidate_api_cache')
+    @mock.patch('geotrek.common.parsers.invalidate_tiles')
+    @mock.patch('geotrek.common.parsers.requests.get')
+    def test_update_content_apidae_bulk(self, mocked, invalidate_tiles, invalidate_api_cache):
+        def mocked_json():
+            filename = os.path.join(os.path.dirname(__file__), 'data', 'apidaeContent.json')
+            with open(filename, 'r') as f:
+                return json.load(f)
+        mocked.return_value.status_code = 200
+        mocked.return_value.json = mocked_json
+        mocked.return_value.content = b'Fake image'
+        FileType.objects.create(type="Photographie")
+        TouristicContentCategoryFactory(label="Eau vive")
+        TouristicContentType1Factory(label="Type A")
+        TouristicContentType1Factory(label="Type B")
+        EauViveBulkParser().parse()
+        old_date = timezone.make_aware(datetime(2000, 1, 1))
+        TouristicContent.objects.update(name="Old name", date_update=old_date)
+        invalidate_tiles.reset_mock()
+        invalidate_api_cache.reset_mock()
+        parser = EauViveBulkParser()
+        parser.parse()
+        self.assertEqual(parser.nb_updated, 1)
+        content = TouristicContent.objects.get()
+        self.assertEqual(content.name, "Quey' Raft")
+        # Updated rows get a new date_update, as with save()
+        self.assertGreater(content.date_update, old_date)
+        invalidate_tiles.assert_called_once_with(['tourism.touristiccontent'])
+        invalidate_api_cache.assert_called_once_with()
+
     @mock.patch('geotrek.common.parsers.requests.get')
     def test_filetype_structure_none(self, mocked):
         def mocked_json():
@@ -1,5 +1,7 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.conf import settings
 from django.core.checks import register, Tags
+from django.db.models.signals import post_delete, post_save
 from django.utils.translation import gettext_lazy as _
 
 
@@ -9,6 +11,7 @@ class TrekkingConfig(AppConfig):
 
     def ready(self):
         from .forms import TrekForm, POIForm, ServiceForm
+        from .signals import invalidate_trek_related_objects
 
         def check_hidden_fields_settings(app_configs, **kwargs):
             # Check all Forms hidden fields settings
@@ -18,3 +21,8 @@ class TrekkingConfig(AppConfig):
             return errors
 
         register(check_hidden_fields_settings, Tags.security)
+
+        if 'geotrek.sensitivity' in settings.INSTALLED_APPS:
+            sensitive_area_model = apps.get_model('sensitivity', 'SensitiveArea')
+            post_save.connect(invalidate_trek_related_objects, sender=sensitive_area_model)
+            post_delete.connect(invalidate_trek_related_objects, sender=sensitive_area_model)
@@ -1,10 +1,15 @@
 from django.conf import settings
-from django.db.models import Q
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, Max, Q
 
+import hashlib
 import os
 from zipfile import ZipFile
 
+from geotrek.altimetry.helpers import AltimetryHelper
 from geotrek.common import views as common_views
+from geotrek.common.models import Attachment, Theme
+from geotrek.tourism.models import InformationDeskType
 from geotrek.trekking import views
 from geotrek.trekking import models
 
@@ -14,7 +19,26 @@ if 'geotrek.sensitivity' in settings.INSTALLED_APPS:
     from geotrek.sensitivity import views as sensitivity_views
 
 
+def rows_hash(queryset):
+    """
+    Hash of the values of all concrete fields (translations included) of ``queryset`` rows,
+    for tables without update date.
+    """
+    fields = [field.attname for field in queryset.model._meta.concrete_fields]
+    digest = hashlib.md5()
+    for row in queryset.order_by('pk').values_list(*fields):
+        digest.update(repr(row).encode())
+    return digest.hexdigest()
+
+
 class SyncRando:
+    # Signature of the trek being synced, see ``get_stamp()``
+    stamp = None
+    # Signature of lookup tables, see ``get_lookups_stamp()``
+    lookups_stamp = None
+    lookup_models = [Theme, models.TrekNetwork, models.Practice, models.Accessibility, models.DifficultyLevel,
+                     models.Route, InformationDeskType]
+
     def __init__(self, sync):
         self.global_sync = sync
 
@@ -41,10 +65,56 @@ class SyncRando:
         if self.global_sync.portal:
             treks = treks.filter(Q(portal__name=self.global_sync.portal) | Q(portal=None))
 
+        self.profiles = AltimetryHelper.elevation_profiles(treks)
+        # Compute POIs, services and sensitive areas of outdated treks at once
+        models.TrekRelatedObject.refresh(treks.values_list('pk', flat=True))
         for trek in treks:
             self.sync_detail(lang, trek)
 
+    def get_lookups_stamp(self):
+        """
+        Signature of labels and pictograms of lookups rendered in files of treks,
+        computed once per sync.
+        """
+        if self.lookups_stamp is None:
+            self.lookups_stamp = ','.join(rows_hash(model.objects.all()) for model in self.lookup_models)
+        return self.lookups_stamp
+
+    def get_stamp(self, trek):
+        """
+        Signature of the trek and of the related objects rendered in its files, used to keep
+        files of treks unchanged since previous sync without rendering them again.
+        """
+        querysets = [
+            models.Trek.objects.filter(pk=trek.pk), trek.parents, trek.children, trek.pois, trek.services,
+            Attachment.objects.filter(content_type=ContentType.objects.get_for_model(models.Trek),
+                                      object_id=trek.pk),
+            Attachment.objects.filter(content_type=ContentType.objects.get_for_model(models.POI),
+                                      object_id__in=trek.pois.values('pk')),
+        ]
+        if self.global_sync.with_infrastructures:
+            querysets.append(trek.infrastructures)
+        if self.global_sync.with_signages:
+            querysets.append(trek.signages)
+        if self.global_sync.with_events:
+            querysets.append(trek.touristic_events)
+        if self.global_sync.categories:
+            querysets.append(trek.touristic_contents)
+        if 'geotrek.sensitivity' in settings.INSTALLED_APPS:
+            querysets.append(trek.published_sensitive_areas)
+        stamp = []
+        for qs in querysets:
+            aggregate = qs.order_by().aggregate(count=Count('pk'), date_update=Max('date_update'))
+            stamp.append('{count}:{date_update}'.format(**aggregate))
+        # Information desks and lookups have no update date
+        stamp.append(rows_hash(trek.information_desks.all()))
+        for related in (trek.themes, trek.networks, trek.accessibilities):
+            stamp.append(':'.join(str(pk) for pk in related.order_by('pk').values_list('pk', flat=True)))
+        stamp.append(self.get_lookups_stamp())
+        return ','.join(stamp)
+
     def sync_detail(self, lang, trek):
+        self.stamp = self.get_stamp(trek)
         zipname = os.path.join('zip', 'treks', lang, '{pk}.zip'.format(pk=trek.pk))
         zipfullname = os.path.join(self.global_sync.tmp_root, zipname)
         self.global_sync.mkdirs(zipfullname)
@@ -61,16 +131,17 @@ class SyncRando:
         self.sync_trek_services(lang, trek, zipfile=self.global_sync.zipfile)
         self.sync_trek_gpx(lang, trek)
         self.sync_trek_kml(lang, trek)
-        self.global_sync.sync_metas(lang, views.TrekMeta, trek)
+        self.global_sync.sync_metas(lang, views.TrekMeta, trek, stamp=self.stamp)
         self.global_sync.sync_metas(lang, common_views.Meta)
         if settings.USE_BOOKLET_PDF:
-            self.global_sync.sync_pdf(lang, trek, views.TrekDocumentBookletPublic.as_view(model=type(trek)))
+            self.global_sync.sync_pdf(lang, trek, views.TrekDocumentBookletPublic.as_view(model=type(trek)),
+                                      stamp=self.stamp)
         else:
-            self.global_sync.sync_pdf(lang, trek, views.TrekDocumentPublic.as_view(model=type(trek)))
-        self.global_sync.sync_profile_json(lang, trek)
+            self.global_sync.sync_pdf(lang, trek, views.TrekDocumentPublic.as_view(model=type(trek)), stamp=self.stamp)
+        self.global_sync.sync_profile_json(lang, trek, profiles=self.profiles, stamp=self.stamp)
         if not self.global_sync.skip_profile_png:
-            self.global_sync.sync_profile_png(lang, trek, zipfile=self.global_sync.zipfile)
-        self.global_sync.sync_dem(lang, trek)
+            self.global_sync.sync_profile_png(lang, trek, zipfile=self.global_sync.zipfile, stamp=self.stamp)
+        self.global_sync.sync_dem(lang, trek, stamp=self.stamp)
         for desk in trek.information_desks.all():
             self.global_sync.sync_media_file(lang, desk.thumbnail, zipfile=self.trek_zipfile)
         for poi in trek.published_pois:
@@ -93,13 +164,14 @@ class SyncRando:
                                           ending="")
 
         self.global_sync.close_zip(self.trek_zipfile, zipname)
+        self.stamp = None
 
     def sync_trek_sensitiveareas(self, lang, trek):
         params = {'format': 'geojson', 'practices': 'Terrestre'}
 
         view = sensitivity_views.TrekSensitiveAreaViewSet.as_view({'get': 'list'})
         name = os.path.join('api', lang, 'treks', str(trek.pk), 'sensitiveareas.geojson')
-        self.global_sync.sync_view(lang, view, name, params=params, pk=trek.pk)
+        self.global_sync.sync_view(lang, view, name, params=params, stamp=self.stamp, pk=trek.pk)
 
     def sync_trek_touristiccontents(self, lang, trek, zipfile=None):
         params = {'format': 'geojson',
@@ -107,7 +179,7 @@ class SyncRando:
         self.global_sync.get_params_portal(params)
         view = tourism_views.TrekTouristicContentViewSet.as_view({'get': 'list'})
         name = os.path.join('api', lang, 'treks', str(trek.pk), 'touristiccontents.geojson')
-        self.global_sync.sync_view(lang, view, name, params=params, zipfile=zipfile, pk=trek.pk)
+        self.global_sync.sync_view(lang, view, name, params=params, zipfile=zipfile, stamp=self.stamp, pk=trek.pk)
 
         for content in trek.touristic_contents.all():
             self.sync_touristiccontent_media(lang, content, zipfile=self.trek_zipfile)
@@ -117,7 +189,7 @@ class SyncRando:
         self.global_sync.get_params_portal(params)
         view = tourism_views.TrekTouristicEventViewSet.as_view({'get': 'list'})
         name = os.path.join('api', lang, 'treks', str(trek.pk), 'touristicevents.geojson')
-        self.global_sync.sync_view(lang, view, name, params=params, zipfile=zipfile, pk=trek.pk)
+        self.global_sync.sync_view(lang, view, name, params=params, zipfile=zipfile, stamp=self.stamp, pk=trek.pk)
 
         for event in trek.touristic_events.all():
             self.sync_touristicevent_media(lang, event, zipfile=self.trek_zipfile)
@@ -146,27 +218,28 @@ class SyncRando:
         params = {'format': 'geojson'}
         view = views.TrekInfrastructureViewSet.as_view({'get': 'list'})
         name = os.path.join('api', lang, 'treks', str(trek.pk), 'infrastructures.geojson')
-        self.global_sync.sync_view(lang, view, name, params=params, zipfile=zipfile, pk=trek.pk)
+        self.global_sync.sync_view(lang, view, name, params=params, zipfile=zipfile, stamp=self.stamp, pk=trek.pk)
 
     def sync_trek_signages(self, lang, trek, zipfile=None):
         params = {'format': 'geojson'}
         view = views.TrekSignageViewSet.as_view({'get': 'list'})
         name = os.path.join('api', lang, 'treks', str(trek.pk), 'signages.geojson')
-        self.global_sync.sync_view(lang, view, name, params=params, zipfile=zipfile, pk=trek.pk)
+        self.global_sync.sync_view(lang, view, name, params=params, zipfile=zipfile, stamp=self.stamp, pk=trek.pk)
 
     def sync_trek_pois(self, lang, trek, zipfile=None):
         params = {'format': 'geojson'}
         view = views.TrekPOIViewSet.as_view({'get': 'list'})
         name = os.path.join('api', lang, 'treks', str(trek.pk), 'pois.geojson')
-        self.global_sync.sync_view(lang, view, name, params=params, zipfile=zipfile, pk=trek.pk)
+        self.global_sync.sync_view(lang, view, name, params=params, zipfile=zipfile, stamp=self.stamp, pk=trek.pk)
 
     def sync_trek_services(self, lang, trek, zipfile=None):
         view = views.TrekServiceViewSet.as_view({'get': 'list'})
         name = os.path.join('api', lang, 'treks', str(trek.pk), 'services.geojson')
-        self.global_sync.sync_view(lang, view, name, params={'format': 'geojson'}, zipfile=zipfile, pk=trek.pk)
+        self.global_sync.sync_view(lang, view, name, params={'format': 'geojson'}, zipfile=zipfile,
+                                   stamp=self.stamp, pk=trek.pk)
 
     def sync_trek_gpx(self, lang, obj):
-        self.global_sync.sync_object_view(lang, obj, views.TrekGPXDetail.as_view(), '{obj.slug}.gpx')
+        self.global_sync.sync_object_view(lang, obj, views.TrekGPXDetail.as_view(), '{obj.slug}.gpx', stamp=self.stamp)
 
     def sync_trek_kml(self, lang, obj):
-        self.global_sync.sync_object_view(lang, obj, views.TrekKMLDetail.as_view(), '{obj.slug}.kml')
+        self.global_sync.sync_object_view(lang, obj, views.TrekKMLDetail.as_view(), '{obj.slug}.kml', stamp=self.stamp)
@@ -1,13 +1,11 @@
 import os
 
-from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.gis.gdal import DataSource
-from django.contrib.gis.geos import Point
 from django.db import transaction
 
-from geotrek.core.models import Topology
-from geotrek.trekking.models import POI, POIType
+from geotrek.core.helpers import PointTopologyLoader
+from geotrek.trekking.models import POI, POIType, Trek
 
 
 class Command(BaseCommand):
@@ -23,6 +21,7 @@ class Command(BaseCommand):
         parser.add_argument('--description-field', '-d', action='store', dest='description_field', help='Name of the field that contains the description of the POI (optional)')
         parser.add_argument('--name-default', action='store', dest='name_default', help='Default value for POI name. Use only if --name-field is not set')
         parser.add_argument('--type-default', action='store', dest='type_default', help='Default value for POI Type. Use only if --type-field is not set')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of POIs saved at once, 1000 by default')
 
     def handle(self, *args, **options):
         filename = options['point_layer']
@@ -37,6 +36,7 @@ class Command(BaseCommand):
         field_poitype = options.get('type_field')
         field_description = options.get('description_field')
 
+        loader = self.get_loader(options.get('batch_size') or 1000)
         sid = transaction.savepoint()
 
         try:
@@ -65,10 +65,11 @@ class Command(BaseCommand):
                     name = feature.get(field_name) if field_name in available_fields else options.get('name_default')
                     poitype = feature.get(field_poitype) if field_poitype in available_fields else options.get('type_default')
                     description = feature.get(field_description) if field_description in available_fields else ""
-                    self.create_poi(feature_geom, name, poitype, description)
+                    self.create_poi(feature_geom, name, poitype, description, loader=loader)
                     if verbosity >= 2:
                         self.stdout.write(self.style.NOTICE("{} POI created.".format(name)))
 
+            loader.flush()
             transaction.savepoint_commit(sid)
             if verbosity >= 2:
                 self.stdout.write(self.style.NOTICE("{} objects created.".format(self.counter)))
@@ -78,23 +79,26 @@ class Command(BaseCommand):
             transaction.savepoint_rollback(sid)
             raise
 
-    def create_poi(self, geometry, name, poitype, description):
-        poitype, created = POIType.objects.get_or_create(label=poitype)
-        poi = POI.objects.create(name=name, type=poitype, description=description)
-        if settings.TREKKING_TOPOLOGY_ENABLED:
-            # Use existing topology helpers to transform a Point(x, y)
-            # to a path aggregation (topology)
-            geometry = geometry.transform(settings.API_SRID, clone=True)
-            geometry.coord_dim = 2
-            serialized = '{"lng": %s, "lat": %s}' % (geometry.x, geometry.y)
-            topology = Topology.deserialize(serialized)
-            # Move deserialization aggregations to the POI
-            poi.mutate(topology)
-        else:
-            if geometry.geom_type != 'Point':
-                raise TypeError
-            poi.geom = Point(geometry.x, geometry.y, srid=settings.SRID)
-            poi.save()
+    def get_loader(self, batch_size=1000):
+        return PointTopologyLoader(POI, batch_size=batch_size, on_flush=self.remove_treks_map_images)
+
+    def remove_treks_map_images(self, pois):
+        # Invalidate treks map, as POI.save() does
+        for trek in Trek.topologies_treks(pois):
+            try:
+                os.remove(trek.get_map_image_path())
+            except OSError:
+                pass
+
+    def create_poi(self, geometry, name, poitype, description, loader=None):
+        if loader is None:
+            loader = self.get_loader()
+            poi = self.create_poi(geometry, name, poitype, description, loader=loader)
+            loader.flush()
+            return poi
+
+        poitype, created = loader.get_or_create(POIType, label=poitype)
+        poi, created = loader.add(geometry, name=name, type=poitype, description=description)
         self.counter += 1
 
         return poi
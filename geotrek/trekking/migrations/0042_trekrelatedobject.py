@@ -0,0 +1,37 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:05
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trekking', '0041_auto_20220304_1442'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrekRelatedObjectsState',
+            fields=[
+                ('trek', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='related_objects_state', serialize=False, to='trekking.trek')),
+                ('date_update', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrekRelatedObject',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=32)),
+                ('related_id', models.PositiveIntegerField()),
+                ('position', models.FloatField()),
+                ('trek', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_objects', to='trekking.trek')),
+            ],
+            options={
+                'unique_together': {('trek', 'kind', 'related_id')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='trekrelatedobject',
+            index=models.Index(fields=['kind', 'related_id'], name='trekrelatedobject_related_idx'),
+        ),
+    ]
@@ -1,13 +1,16 @@
 import os
 import logging
 
+from django.apps import apps
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.gis.db import models
+from django.contrib.gis.geos import GeometryCollection
 from django.contrib.gis.db.models.functions import Transform, LineLocatePoint
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db.models import F
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery
 from django.template.defaultfilters import slugify
 from django.utils.translation import get_language, gettext, gettext_lazy as _
 from django.urls import reverse
@@ -18,7 +21,7 @@ from mapentity.serializers import plain_text
 
 from geotrek.authent.models import StructureRelated
 from geotrek.core.models import Path, Topology, simplify_coords
-from geotrek.common.utils import intersecting, classproperty
+from geotrek.common.utils import intersecting, classproperty, uniquify
 from geotrek.common.mixins.models import PicturesMixin, PublishableMixin, PictogramMixin, OptionalPictogramMixin
 from geotrek.common.mixins.managers import NoDeleteManager
 from geotrek.common.models import Theme, ReservationSystem, RatingMixin, RatingScaleMixin
@@ -364,6 +367,20 @@ class Trek(Topology, StructureRelated, PicturesMixin, PublishableMixin, MapEntit
             qs = cls.objects.existing().filter(geom__intersects=area)
         return qs
 
+    @classmethod
+    def topologies_treks(cls, topologies):
+        """ Treks of any of saved ``topologies``, found with one query """
+        if not topologies:
+            return []
+        if settings.TREKKING_TOPOLOGY_ENABLED:
+            treks = {}
+            for overlapping in cls.overlapping_bulk(topologies).values():
+                treks.update((trek.pk, trek) for trek in overlapping)
+            return list(treks.values())
+        geoms = [topology.geom.transform(settings.SRID, clone=True) for topology in topologies]
+        area = GeometryCollection(geoms, srid=settings.SRID)
+        return list(cls.objects.existing().filter(geom__dwithin=(area, settings.TREK_POI_INTERSECTION_MARGIN)))
+
     @classmethod
     def published_topology_treks(cls, topology):
         return cls.topology_treks(topology).filter(published=True)
@@ -383,8 +400,7 @@ class Trek(Topology, StructureRelated, PicturesMixin, PublishableMixin, MapEntit
 
     @property
     def parents_id(self):
-        parents = self.trek_parents.values_list('parent__id', flat=True)
-        return list(parents)
+        return [relation.parent_id for relation in self.trek_parents.all()]
 
     @property
     def children(self):
@@ -393,12 +409,9 @@ class Trek(Topology, StructureRelated, PicturesMixin, PublishableMixin, MapEntit
     @property
     def children_id(self):
         """
-        Get children IDs
+        Get children IDs (from prefetched ``trek_children`` if any)
         """
-        children = self.trek_children.order_by('order')\
-                                     .values_list('child__id',
-                                                  flat=True)
-        return children
+        return [relation.child_id for relation in self.trek_children.all()]
 
     def previous_id_for(self, parent):
         children_id = list(parent.children_id)
@@ -414,19 +427,25 @@ class Trek(Topology, StructureRelated, PicturesMixin, PublishableMixin, MapEntit
             return None
         return children_id[index + 1]
 
+    @property
+    def published_parents(self):
+        # From prefetched ``trek_parents`` if any
+        return [relation.parent for relation in self.trek_parents.all()
+                if relation.parent.published and not relation.parent.deleted]
+
     @property
     def previous_id(self):
         """
         Dict of parent -> previous child
         """
-        return {parent.id: self.previous_id_for(parent) for parent in self.parents.filter(published=True, deleted=False)}
+        return {parent.id: self.previous_id_for(parent) for parent in self.published_parents}
 
     @property
     def next_id(self):
         """
         Dict of parent -> next child
         """
-        return {parent.id: self.next_id_for(parent) for parent in self.parents.filter(published=True, deleted=False)}
+        return {parent.id: self.next_id_for(parent) for parent in self.published_parents}
 
     def clean(self):
         """
@@ -767,7 +786,9 @@ class POI(StructureRelated, PicturesMixin, PublishableMixin, MapEntityMixin, Top
 
     @classmethod
     def topology_all_pois(cls, topology):
-        if settings.TREKKING_TOPOLOGY_ENABLED:
+        if isinstance(topology, Trek) and topology.pk:
+            qs = TrekRelatedObject.filter_queryset(cls.objects.existing(), topology)
+        elif settings.TREKKING_TOPOLOGY_ENABLED:
             qs = cls.overlapping(topology)
         else:
             object_geom = topology.geom.transform(settings.SRID, clone=True).buffer(settings.TREK_POI_INTERSECTION_MARGIN)
@@ -791,6 +812,36 @@ class POI(StructureRelated, PicturesMixin, PublishableMixin, MapEntityMixin, Top
     def published_topology_pois(cls, topology):
         return cls.topology_pois(topology).filter(published=True)
 
+    @classmethod
+    def prefetch_topology_pois(cls, topologies, to_attr, published=False):
+        """
+        Store POIs of each topology (``topology_pois()``) in its ``to_attr``
+        attribute, with a constant number of queries.
+        """
+        all_objects = cls.objects.existing()
+        if published:
+            all_objects = all_objects.filter(published=True)
+        treks = [topology for topology in topologies if isinstance(topology, Trek) and topology.pk]
+        TrekRelatedObject.prefetch(treks, to_attr, all_objects)
+        others = [topology for topology in topologies if not (isinstance(topology, Trek) and topology.pk)]
+        if settings.TREKKING_TOPOLOGY_ENABLED:
+            cls.prefetch_overlapping(others, to_attr, all_objects)
+        else:
+            for topology in others:
+                qs = cls.topology_all_pois(topology)
+                if published:
+                    qs = qs.filter(published=True)
+                setattr(topology, to_attr, list(qs))
+        excluded = {}
+        for trek_id, poi_id in Trek.pois_excluded.through.objects.filter(
+                trek__in=[topology.pk for topology in topologies]).values_list('trek_id', 'poi_id'):
+            excluded.setdefault(trek_id, set()).add(poi_id)
+        for topology in topologies:
+            if topology.pk in excluded:
+                setattr(topology, to_attr, [poi for poi in getattr(topology, to_attr)
+                                            if poi.pk not in excluded[topology.pk]])
+        return topologies
+
     def distance(self, to_cls):
         return settings.TOURISM_INTERSECTION_MARGIN
 
@@ -902,7 +953,9 @@ class Service(StructureRelated, MapEntityMixin, Topology):
 
     @classmethod
     def topology_services(cls, topology):
-        if settings.TREKKING_TOPOLOGY_ENABLED:
+        if isinstance(topology, Trek) and topology.pk:
+            qs = TrekRelatedObject.filter_queryset(cls.objects.existing(), topology)
+        elif settings.TREKKING_TOPOLOGY_ENABLED:
             qs = cls.overlapping(topology)
         else:
             area = topology.geom.buffer(settings.TREK_POI_INTERSECTION_MARGIN)
@@ -915,6 +968,31 @@ class Service(StructureRelated, MapEntityMixin, Topology):
     def published_topology_services(cls, topology):
         return cls.topology_services(topology).filter(type__published=True)
 
+    @classmethod
+    def prefetch_topology_services(cls, topologies, to_attr, published=False):
+        """
+        Store services of each topology (``topology_services()``) in its
+        ``to_attr`` attribute, with a constant number of queries.
+        """
+        all_objects = cls.objects.existing().prefetch_related('type__practices')
+        if published:
+            all_objects = all_objects.filter(type__published=True)
+        treks = [topology for topology in topologies if isinstance(topology, Trek) and topology.pk]
+        TrekRelatedObject.prefetch(treks, to_attr, all_objects)
+        for trek in treks:
+            setattr(trek, to_attr, [
+                service for service in getattr(trek, to_attr)
+                if trek.practice_id in [practice.pk for practice in service.type.practices.all()]
+            ])
+        others = [topology for topology in topologies if not (isinstance(topology, Trek) and topology.pk)]
+        if settings.TREKKING_TOPOLOGY_ENABLED:
+            cls.prefetch_overlapping(others, to_attr, all_objects)
+        else:
+            for topology in others:
+                qs = cls.published_topology_services(topology) if published else cls.topology_services(topology)
+                setattr(topology, to_attr, list(qs))
+        return topologies
+
     def distance(self, to_cls):
         return settings.TOURISM_INTERSECTION_MARGIN
 
@@ -931,3 +1009,127 @@ tourism_models.TouristicEvent.add_property('published_services', lambda self: in
 if 'geotrek.signage' in settings.INSTALLED_APPS:
     Blade.add_property('services', lambda self: self.signage.services, _("Services"))
     Blade.add_property('published_services', lambda self: self.signage.published_pois, _("Published Services"))
+
+
+class TrekRelatedObject(models.Model):
+    """
+    POIs, services and sensitive areas related to a trek, with their rank
+    along it, so that they are not searched again on each request.
+
+    Relations of a trek are computed on demand, and again once its
+    ``TrekRelatedObjectsState`` row has been removed: by triggers when the
+    trek or a POI or service near it is moved, (un)deleted or removed, by
+    signals when a sensitive area changes.
+    """
+    trek = models.ForeignKey(Trek, related_name='related_objects', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=32)
+    related_id = models.PositiveIntegerField()
+    position = models.FloatField()
+
+    class Meta:
+        unique_together = ('trek', 'kind', 'related_id')
+        indexes = [
+            models.Index(fields=['kind', 'related_id'], name='trekrelatedobject_related_idx'),
+        ]
+
+    @classmethod
+    def related_models(cls):
+        related_models = [POI, Service]
+        if 'geotrek.sensitivity' in settings.INSTALLED_APPS:
+            related_models.append(apps.get_model('sensitivity', 'SensitiveArea'))
+        return related_models
+
+    @classmethod
+    def _nearby_pairs(cls, trek_pks, model, distance):
+        """ Return (trek pk, object pk) tuples of objects of ``model`` at less
+        than ``distance`` from specified treks, ordered along each trek.
+        """
+        if issubclass(model, Topology):
+            table, condition, params = Topology._meta.db_table, "o.kind = %s", [model.KIND]
+        else:
+            table, condition, params = model._meta.db_table, "true", []
+        sql = """
+            SELECT t.id, o.id
+            FROM {topology_table} t JOIN {table} o ON ST_DWithin(t.geom, o.geom, %s)
+            WHERE t.id = ANY(%s) AND {condition}
+            ORDER BY t.id,
+                     CASE WHEN GeometryType(t.geom) = 'LINESTRING'
+                          THEN ST_LineLocatePoint(t.geom, ST_ClosestPoint(t.geom, o.geom)) END,
+                     o.id
+        """.format(topology_table=Topology._meta.db_table, table=table, condition=condition)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [distance, list(trek_pks)] + params)
+            return cursor.fetchall()
+
+    @classmethod
+    def update_treks(cls, treks):
+        """ Compute and store related objects of specified treks (or primary
+        keys), with one query per related model.
+        """
+        trek_pks = uniquify([getattr(trek, 'pk', trek) for trek in treks])
+        if not trek_pks:
+            return
+        rows = []
+        for model in cls.related_models():
+            if not issubclass(model, Topology):
+                pairs = cls._nearby_pairs(trek_pks, model, settings.SENSITIVE_AREA_INTERSECTION_MARGIN)
+            elif settings.TREKKING_TOPOLOGY_ENABLED:
+                pairs = Topology._overlapping_pairs(trek_pks, model.objects.all())
+            else:
+                pairs = cls._nearby_pairs(trek_pks, model, settings.TREK_POI_INTERSECTION_MARGIN)
+            positions = {}
+            for trek_pk, pk in pairs:
+                related = positions.setdefault(trek_pk, {})
+                if pk not in related:
+                    related[pk] = len(related)
+                    rows.append(cls(trek_id=trek_pk, kind=model._meta.model_name, related_id=pk,
+                                    position=related[pk]))
+        with transaction.atomic():
+            cls.objects.filter(trek__in=trek_pks).delete()
+            cls.objects.bulk_create(rows, ignore_conflicts=True)
+            TrekRelatedObjectsState.objects.bulk_create([TrekRelatedObjectsState(trek_id=pk) for pk in trek_pks],
+                                                        ignore_conflicts=True)
+
+    @classmethod
+    def refresh(cls, treks):
+        """ Compute related objects of specified treks (or primary keys)
+        which are not up to date.
+        """
+        trek_pks = {getattr(trek, 'pk', trek) for trek in treks}
+        fresh = TrekRelatedObjectsState.objects.filter(trek__in=trek_pks).values_list('trek', flat=True)
+        cls.update_treks(sorted(trek_pks - set(fresh)))
+
+    @classmethod
+    def filter_queryset(cls, qs, trek):
+        """ Restrict ``qs`` to objects related to ``trek``, ordered along it.
+        """
+        cls.refresh([trek])
+        relations = cls.objects.filter(trek=trek, kind=qs.model._meta.model_name)
+        qs = qs.filter(pk__in=relations.values('related_id'))
+        qs = qs.annotate(ordering=Subquery(relations.filter(related_id=OuterRef('pk')).values('position')))
+        return qs.order_by('ordering')
+
+    @classmethod
+    def prefetch(cls, treks, to_attr, qs):
+        """ Store in ``to_attr`` attribute of each trek the list of objects of
+        ``qs`` related to it, ordered along it, like ``filter_queryset()`` but
+        with a constant number of queries.
+        """
+        cls.refresh(treks)
+        related_pks = {trek.pk: [] for trek in treks}
+        relations = cls.objects.filter(trek__in=list(related_pks), kind=qs.model._meta.model_name)
+        for trek_pk, pk in relations.order_by('trek', 'position').values_list('trek', 'related_id'):
+            related_pks[trek_pk].append(pk)
+        objects = qs.in_bulk({pk for pks in related_pks.values() for pk in pks})
+        for trek in treks:
+            setattr(trek, to_attr, [objects[pk] for pk in related_pks[trek.pk] if pk in objects])
+        return treks
+
+
+class TrekRelatedObjectsState(models.Model):
+    """
+    Treks whose related objects (``TrekRelatedObject``) are up to date.
+    """
+    trek = models.OneToOneField(Trek, primary_key=True, related_name='related_objects_state',
+                                on_delete=models.CASCADE)
+    date_update = models.DateTimeField(auto_now=True)
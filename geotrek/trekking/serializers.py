@@ -9,7 +9,7 @@ from drf_dynamic_fields import DynamicFieldsMixin
 from mapentity.serializers import GPXSerializer
 from rest_framework import serializers
 from rest_framework_gis import fields as rest_gis_fields
-from rest_framework_gis.serializers import GeoFeatureModelSerializer
+from rest_framework_gis.serializers import GeoFeatureModelSerializer, GeoFeatureModelListSerializer
 
 from geotrek.altimetry.serializers import AltimetrySerializerMixin
 from geotrek.authent.serializers import StructureSerializer
@@ -159,6 +159,23 @@ class TrekSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
         fields = "__all__"
 
 
+class TrekAPIListSerializerMixin:
+    def to_representation(self, data):
+        treks = list(data.all() if hasattr(data, 'all') else data)
+        if settings.TREK_WITH_POIS_PICTURES:
+            # Fetch POIs of all treks at once (see get_pictures())
+            trekking_models.POI.prefetch_topology_pois(treks, 'prefetched_published_pois', published=True)
+        return super().to_representation(treks)
+
+
+class TrekAPIListSerializer(TrekAPIListSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+class TrekAPIGeojsonListSerializer(TrekAPIListSerializerMixin, GeoFeatureModelListSerializer):
+    pass
+
+
 class TrekAPISerializer(PublishableSerializerMixin, PicturesSerializerMixin, AltimetrySerializerMixin,
                         ZoningSerializerMixin, TranslatedModelSerializer):
     difficulty = DifficultyLevelSerializer()
@@ -234,6 +251,7 @@ class TrekAPISerializer(PublishableSerializerMixin, PicturesSerializerMixin, Alt
     class Meta:
         model = trekking_models.Trek
         id_field = 'id'  # By default on this model it's topo_object = OneToOneField(parent_link=True)
+        list_serializer_class = TrekAPIListSerializer
         fields = (
             'id', 'departure', 'arrival', 'duration', 'duration_pretty',
             'description', 'description_teaser', 'networks', 'advice', 'gear',
@@ -254,7 +272,8 @@ class TrekAPISerializer(PublishableSerializerMixin, PicturesSerializerMixin, Alt
         pictures_list = []
         pictures_list.extend(obj.serializable_pictures)
         if settings.TREK_WITH_POIS_PICTURES:
-            for poi in obj.published_pois:
+            pois = getattr(obj, 'prefetched_published_pois', None)
+            for poi in obj.published_pois if pois is None else pois:
                 pictures_list.extend(poi.serializable_pictures)
         return pictures_list
 
@@ -317,6 +336,7 @@ class TrekAPIGeojsonSerializer(GeoFeatureModelSerializer, TrekAPISerializer):
 
     class Meta(TrekAPISerializer.Meta):
         geo_field = 'api_geom'
+        list_serializer_class = TrekAPIGeojsonListSerializer
         fields = TrekAPISerializer.Meta.fields + ('api_geom', )
 
 
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.contrib.gis.measure import D
+from django.db.models import Q
+
+from .models import TrekRelatedObject, TrekRelatedObjectsState
+
+
+def invalidate_trek_related_objects(sender, instance, **kwargs):
+    """
+    Forget related objects of treks which may be affected by a change of a
+    sensitive area: the ones near the area and the ones which referenced it
+    (its geometry may have moved away or it may have been deleted).
+    Changes of POIs and services are handled by triggers.
+    """
+    related = TrekRelatedObject.objects.filter(kind=sender._meta.model_name, related_id=instance.pk)
+    query = Q(trek__in=related.values('trek'))
+    if instance.geom:
+        query |= Q(trek__geom__dwithin=(instance.geom, D(m=settings.SENSITIVE_AREA_INTERSECTION_MARGIN)))
+    TrekRelatedObjectsState.objects.filter(query).delete()
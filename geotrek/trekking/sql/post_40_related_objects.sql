@@ -0,0 +1,31 @@
+CREATE FUNCTION {# geotrek.trekking #}.trek_related_objects_iud() RETURNS trigger SECURITY DEFINER AS $$
+DECLARE
+    topology record;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        topology := OLD;
+    ELSE
+        topology := NEW;
+    END IF;
+    -- Related objects of the treks concerned will be computed again when read (see TrekRelatedObject)
+    IF topology.kind = 'TREK' THEN
+        DELETE FROM trekking_trekrelatedobjectsstate WHERE trek_id = topology.id;
+    ELSIF topology.kind IN ('POI', 'SERVICE') THEN
+        DELETE FROM trekking_trekrelatedobjectsstate s
+        USING core_topology t
+        WHERE s.trek_id = t.id
+          AND ST_DWithin(t.geom, topology.geom, {{ TREK_POI_INTERSECTION_MARGIN }});
+
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM trekking_trekrelatedobjectsstate s
+            USING trekking_trekrelatedobject r
+            WHERE s.trek_id = r.trek_id AND r.kind = lower(topology.kind) AND r.related_id = topology.id;
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trekking_related_objects_iud_tgr
+AFTER INSERT OR UPDATE OF geom, deleted OR DELETE ON core_topology
+FOR EACH ROW EXECUTE PROCEDURE trek_related_objects_iud();
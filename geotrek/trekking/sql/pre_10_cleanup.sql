@@ -14,3 +14,8 @@ DROP VIEW IF EXISTS o_v_itineraire CASCADE;
 DROP VIEW IF EXISTS v_treks CASCADE;
 DROP VIEW IF EXISTS o_v_poi CASCADE;
 DROP VIEW IF EXISTS v_pois CASCADE;
+
+-- 40
+
+DROP FUNCTION IF EXISTS trek_related_objects_iu() CASCADE;
+DROP FUNCTION IF EXISTS trek_related_objects_iud() CASCADE;
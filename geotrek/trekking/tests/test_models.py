@@ -5,16 +5,17 @@ from django.core.exceptions import ValidationError
 from django.conf import settings
 from django.test.utils import override_settings
 
-from unittest import skipIf
+from unittest import mock, skipIf
 from bs4 import BeautifulSoup
 
 from geotrek.common.tests import TranslationResetMixin
+from geotrek.core.models import Topology
 from geotrek.core.tests.factories import PathFactory
 from geotrek.zoning.tests.factories import DistrictFactory, CityFactory
 from geotrek.trekking.tests.factories import (POIFactory, TrekFactory,
                                               TrekWithPOIsFactory, ServiceFactory,
                                               RatingFactory, RatingScaleFactory)
-from geotrek.trekking.models import Trek, OrderedTrekChild
+from geotrek.trekking.models import Trek, OrderedTrekChild, POI, Service, TrekRelatedObject, TrekRelatedObjectsState
 
 
 class TrekTest(TranslationResetMixin, TestCase):
@@ -216,6 +217,36 @@ class RelatedObjectsTest(TranslationResetMixin, TestCase):
             Polygon(((3, 3), (9, 3), (9, 9), (3, 9), (3, 3)))))
         self.assertCountEqual(trek.districts, [d1, d2])
 
+    @skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
+    def test_prefetch_helpers(self):
+        p1 = PathFactory.create(geom=LineString((0, 0), (4, 4)))
+        trek1 = TrekFactory.create(paths=[(p1, 0, 0.5)])
+        trek2 = TrekFactory.create(paths=[(p1, 0.5, 1)])
+        poi1 = POIFactory.create(paths=[(p1, 0.2, 0.2)], published=True)
+        poi2 = POIFactory.create(paths=[(p1, 0.8, 0.8)], published=False)
+        poi3 = POIFactory.create(paths=[(p1, 0.9, 0.9)], published=True)
+        service = ServiceFactory.create(paths=[(p1, 0.7, 0.7)])
+        service.type.practices.add(trek2.practice)
+        trek2.pois_excluded.add(poi3.pk)
+
+        treks = [Trek.objects.get(pk=trek1.pk), Trek.objects.get(pk=trek2.pk)]
+        TrekRelatedObject.refresh(treks)
+        # Stored relations are read
+        with mock.patch.object(Topology, '_overlapping_pairs') as overlapping_pairs:
+            with self.assertNumQueries(4):
+                POI.prefetch_topology_pois(treks, 'prefetched_pois')
+            with self.assertNumQueries(4):
+                POI.prefetch_topology_pois(treks, 'prefetched_published_pois', published=True)
+            Service.prefetch_topology_services(treks, 'prefetched_services')
+        overlapping_pairs.assert_not_called()
+        self.assertEqual(treks[0].prefetched_pois, [poi1])
+        self.assertEqual(treks[1].prefetched_pois, [poi2])
+        self.assertEqual(treks[0].prefetched_published_pois, [poi1])
+        self.assertEqual(treks[1].prefetched_published_pois, [])
+        self.assertEqual(treks[0].prefetched_services, [])
+        self.assertEqual(treks[1].prefetched_services, [service])
+        self.assertEqual(treks[1].prefetched_pois, list(trek2.pois))
+
     @skipIf(settings.TREKKING_TOPOLOGY_ENABLED, 'Test without dynamic segmentation only')
     def test_helpers_nds(self):
         trek = TrekFactory.create(geom=LineString((2, 2), (8, 8)))
@@ -237,6 +268,27 @@ class RelatedObjectsTest(TranslationResetMixin, TestCase):
         self.assertCountEqual(service.treks, [trek])
         self.assertCountEqual(trek.districts, [d1])
 
+    @skipIf(settings.TREKKING_TOPOLOGY_ENABLED, 'Test without dynamic segmentation only')
+    def test_prefetch_helpers_nds(self):
+        trek = TrekFactory.create(geom=LineString((2, 2), (8, 8)))
+        poi1 = POIFactory.create(geom=Point(6, 6), published=True)
+        poi2 = POIFactory.create(geom=Point(3, 3), published=False)
+        poi3 = POIFactory.create(geom=Point(4, 4), published=True)
+        service = ServiceFactory.create(geom=Point(2.8, 2.8))
+        service.type.practices.add(trek.practice)
+        trek.pois_excluded.add(poi3.pk)
+
+        treks = [Trek.objects.get(pk=trek.pk)]
+        TrekRelatedObject.refresh(treks)
+        with self.assertNumQueries(4):
+            POI.prefetch_topology_pois(treks, 'prefetched_pois')
+        POI.prefetch_topology_pois(treks, 'prefetched_published_pois', published=True)
+        Service.prefetch_topology_services(treks, 'prefetched_services')
+        self.assertEqual(treks[0].prefetched_pois, [poi2, poi1])
+        self.assertEqual(treks[0].prefetched_published_pois, [poi1])
+        self.assertEqual(treks[0].prefetched_services, [service])
+        self.assertEqual(treks[0].prefetched_pois, list(trek.pois))
+
     @skipIf(settings.TREKKING_TOPOLOGY_ENABLED, 'Test without dynamic segmentation only')
     def test_deleted_pois_nds(self):
         trek = TrekFactory.create(geom=LineString((0, 0), (4, 4)))
@@ -332,6 +384,59 @@ class RelatedObjectsTest(TranslationResetMixin, TestCase):
         self.assertEqual(trek.city_departure, str(city1))
 
 
+class TrekRelatedObjectTest(TestCase):
+    @skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
+    def test_related_objects(self):
+        p1 = PathFactory.create(geom=LineString((0, 0), (4, 4)))
+        trek = TrekFactory.create(paths=[(p1, 0, 1)])
+        poi1 = POIFactory.create(paths=[(p1, 0.6, 0.6)])
+        service = ServiceFactory.create(paths=[(p1, 0.7, 0.7)])
+        self.assertEqual(list(trek.pois), [poi1])
+        self.assertTrue(TrekRelatedObjectsState.objects.filter(trek=trek).exists())
+        self.assertCountEqual(trek.related_objects.values_list('kind', 'related_id', 'position'),
+                              [('poi', poi1.pk, 0), ('service', service.pk, 0)])
+        # Stored relations are read
+        with self.assertNumQueries(2):
+            self.assertEqual(list(POI.topology_all_pois(trek)), [poi1])
+
+        poi2 = POIFactory.create(paths=[(p1, 0.2, 0.2)])
+        self.assertFalse(TrekRelatedObjectsState.objects.filter(trek=trek).exists())
+        self.assertEqual(list(trek.pois), [poi2, poi1])
+
+    @skipIf(settings.TREKKING_TOPOLOGY_ENABLED, 'Test without dynamic segmentation only')
+    def test_related_objects_nds(self):
+        trek = TrekFactory.create(geom=LineString((0, 0), (4, 4)))
+        poi1 = POIFactory.create(geom=Point(3, 3))
+        poi2 = POIFactory.create(geom=Point(1, 1))
+        self.assertEqual(list(trek.pois), [poi2, poi1])
+
+        poi2.geom = Point(10000, 10000)
+        poi2.save()
+        self.assertFalse(TrekRelatedObjectsState.objects.filter(trek=trek).exists())
+        self.assertEqual(list(trek.pois), [poi1])
+
+        trek.geom = LineString((10000, 10000), (10004, 10004))
+        trek.save()
+        self.assertEqual(list(trek.pois), [poi2])
+
+    def test_related_objects_deleted(self):
+        trek = TrekWithPOIsFactory.create()
+        poi = list(trek.pois)[0]
+        self.assertTrue(TrekRelatedObjectsState.objects.filter(trek=trek).exists())
+        POI.objects.filter(pk=poi.pk).update(deleted=True)
+        self.assertFalse(TrekRelatedObjectsState.objects.filter(trek=trek).exists())
+        self.assertNotIn(poi, list(trek.pois))
+
+    def test_refresh(self):
+        trek1 = TrekFactory.create()
+        trek2 = TrekFactory.create()
+        TrekRelatedObject.refresh([trek1])
+        with self.assertNumQueries(1):
+            TrekRelatedObject.refresh([trek1.pk])
+        TrekRelatedObject.refresh([trek1.pk, trek2.pk])
+        self.assertEqual(TrekRelatedObjectsState.objects.filter(trek__in=[trek1, trek2]).count(), 2)
+
+
 class TrekUpdateGeomTest(TestCase):
     @classmethod
     def setUpTestData(cls):
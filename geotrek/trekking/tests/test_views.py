@@ -13,6 +13,7 @@ from django.conf import settings
 from django.test import TestCase
 from django.contrib.auth.models import User, Group, Permission
 from django.contrib.gis.geos import LineString, MultiPoint, Point
+from django.core.cache import caches
 from django.core.management import call_command
 from django.urls import reverse
 from django.db import connections, DEFAULT_DB_ALIAS
@@ -28,6 +29,7 @@ from geotrek.common.tests.factories import (AttachmentFactory, ThemeFactory, Lab
                                             RecordSourceFactory, TargetPortalFactory)
 from geotrek.common.tests import CommonTest, CommonLiveTest, TranslationResetMixin, GeotrekAPITestCase
 from geotrek.common.utils.testdata import get_dummy_uploaded_image
+from geotrek.common.utils.tiles import tile_range
 from geotrek.authent.tests.factories import TrekkingManagerFactory, StructureFactory, UserProfileFactory
 from geotrek.authent.tests.base import AuthentFixturesTest
 from geotrek.core.tests.factories import PathFactory
@@ -1589,3 +1591,34 @@ class TestDepublishInfrastructuresRemovedFromPDF(TestCase):
         trek.infrastructures[0].delete()
         trek = Trek.objects.get(pk=self.trek.pk)
         self.assertFalse(is_file_uptodate(trek.get_map_image_path(), trek.get_date_update()))
+
+
+class TrekTileTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = TrekkingManagerFactory.create()
+
+    def setUp(self):
+        caches['fat'].clear()
+        self.client.force_login(user=self.user)
+
+    def make_geom(self, lng):
+        return LineString((lng, 45.0), (lng + 0.001, 45.001), srid=4326).transform(settings.SRID, clone=True)
+
+    def create_trek(self, lng, **kwargs):
+        if settings.TREKKING_TOPOLOGY_ENABLED:
+            trek = TrekFactory.create(paths=[PathFactory.create(geom=self.make_geom(lng))], **kwargs)
+        else:
+            trek = TrekFactory.create(geom=self.make_geom(lng), **kwargs)
+        # Geometry computed by the database
+        return Trek.objects.get(pk=trek.pk)
+
+    def test_tile(self):
+        trek = self.create_trek(3.0, name='first', published=True)
+        self.create_trek(5.0, name='elsewhere')
+        xs, ys = tile_range(trek.geom.transform(3857, clone=True).extent, 14)
+        response = self.client.get(reverse('trekking:trek_tile', kwargs={'z': 14, 'x': xs[0], 'y': ys[0]}))
+        self.assertEqual(response.status_code, 200)
+        # Translated name is computed for each trek, geometry is read in database
+        self.assertIn(b'first', response.content)
+        self.assertNotIn(b'elsewhere', response.content)
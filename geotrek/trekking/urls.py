@@ -5,7 +5,7 @@ from mapentity.registry import registry
 from rest_framework.routers import DefaultRouter
 
 from geotrek.altimetry.urls import AltimetryEntityOptions
-from geotrek.common.urls import PublishableEntityOptions, LangConverter
+from geotrek.common.urls import PublishableEntityOptions, LangConverter, TileEntityOptions
 from mapentity.registry import MapEntityOptions
 
 from . import models
@@ -29,11 +29,12 @@ urlpatterns = [
 ]
 
 
-class TrekEntityOptions(AltimetryEntityOptions, PublishableEntityOptions):
+class TrekEntityOptions(AltimetryEntityOptions, PublishableEntityOptions, TileEntityOptions):
     """
     Add more urls using mixins:
     - altimetry views (profile, dem etc.)
     - public documents views
+    - vector tiles
     We override trek public view to add more context variables and
     preprocess attributes.
     """
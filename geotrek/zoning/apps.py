@@ -1,7 +1,20 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.db.models.signals import post_delete, post_save
 from django.utils.translation import gettext_lazy as _
 
 
 class ZoningConfig(AppConfig):
     name = 'geotrek.zoning'
     verbose_name = _("Zoning")
+
+    def ready(self):
+        from .mixins import ZONING_MODELS, ZoningPropertiesMixin
+        from .signals import delete_object_zoning, store_object_zoning, update_zoning
+
+        for name, model in ZONING_MODELS:
+            post_save.connect(update_zoning, sender=model)
+            post_delete.connect(update_zoning, sender=model)
+        for model in apps.get_models():
+            if issubclass(model, ZoningPropertiesMixin):
+                post_save.connect(store_object_zoning, sender=model)
+                post_delete.connect(delete_object_zoning, sender=model)
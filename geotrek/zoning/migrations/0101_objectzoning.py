@@ -0,0 +1,32 @@
+# Generated by Django 3.1.14 on 2026-10-18 09:12
+from django.conf import settings
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('zoning', '0100_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ObjectZoning',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('geom', django.contrib.gis.db.models.fields.GeometryField(srid=settings.SRID)),
+                ('geom_hash', models.CharField(max_length=32)),
+                ('cities', models.JSONField(default=list)),
+                ('districts', models.JSONField(default=list)),
+                ('areas', models.JSONField(default=list)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'unique_together': {('content_type', 'object_id')},
+            },
+        ),
+    ]
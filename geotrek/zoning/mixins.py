@@ -1,6 +1,165 @@
+import hashlib
+import uuid
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
-from .models import RestrictedArea, District, City
-from geotrek.common.utils import intersecting, uniquify
+
+from .models import RestrictedArea, District, City, ObjectZoning
+
+ZONING_MODELS = (
+    ('cities', City),
+    ('districts', District),
+    ('areas', RestrictedArea),
+)
+
+
+def get_zoning_version():
+    """
+    Version of zoning layers, shared by all processes through the cache, so that
+    zoning resolved before a zoning layer changed is not used any more.
+    """
+    return caches['fat'].get('zoning_version', '')
+
+
+def update_zoning_version():
+    caches['fat'].set('zoning_version', uuid.uuid4().hex, None)
+
+
+def compute_zoning(model, geoms, chunk_size=500):
+    """
+    Return the primary keys of ``model`` instances intersecting each geometry
+    of ``geoms``, ordered like ``intersecting()`` does: along the line for
+    linestrings, by model ordering otherwise.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk_column = connection.ops.quote_name(model._meta.pk.column)
+    ordering = []
+    for name in model._meta.ordering:
+        column = connection.ops.quote_name(model._meta.get_field(name.lstrip('-')).column)
+        ordering.append('z.{}{}'.format(column, ' DESC' if name.startswith('-') else ''))
+    results = [[] for geom in geoms]
+    for start in range(0, len(geoms), chunk_size):
+        chunk = geoms[start:start + chunk_size]
+        values = ', '.join(['(%s, ST_GeomFromEWKB(%s))'] * len(chunk))
+        params = []
+        for idx, geom in enumerate(chunk, start):
+            params += [idx, bytes(geom.ewkb)]
+        sql = """
+            WITH objects(idx, geom) AS (VALUES {values})
+            SELECT o.idx, z.{pk}
+            FROM objects o JOIN {table} z ON ST_Intersects(z.geom, o.geom)
+            ORDER BY o.idx,
+                     CASE WHEN GeometryType(o.geom) = 'LINESTRING' THEN (
+                         SELECT MIN(ST_LineLocatePoint(o.geom, ST_StartPoint(d.geom)))
+                         FROM ST_Dump(ST_Intersection(o.geom, z.geom)) d
+                     ) END,
+                     {ordering}
+        """.format(values=values, pk=pk_column, table=table, ordering=', '.join(ordering + ['z.' + pk_column]))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for idx, pk in cursor.fetchall():
+                results[idx].append(pk)
+    return results
+
+
+def prefetch_zoning(objs, store=False):
+    """
+    Resolve cities, districts and restricted areas of all ``objs`` at once.
+
+    Stored intersections (``ObjectZoning``) are read in a single query, the
+    missing or outdated ones are computed for all objects together, then
+    zones are fetched with one query per zoning model.
+
+    Computed intersections are only stored with ``store``, when objects are
+    saved (see ``store_object_zoning()``), so that reading objects never writes.
+    """
+    version = get_zoning_version()
+    pending = []
+    for obj in objs:
+        geom = obj.get_zoning_geom()
+        key = obj.get_zoning_key(geom, version)
+        zoning = getattr(obj, '_zoning', None)
+        if store or zoning is None or zoning[0] != key:
+            pending.append((obj, geom, key))
+    if not pending:
+        return
+
+    content_types = {}
+    for obj, geom, key in pending:
+        if geom and obj.pk is not None:
+            content_type = ContentType.objects.get_for_model(obj)
+            content_types.setdefault(content_type, set()).add(obj.pk)
+    stored = {}
+    if content_types:
+        query = reduce(or_, [Q(content_type=content_type, object_id__in=pks)
+                             for content_type, pks in content_types.items()])
+        for row in ObjectZoning.objects.filter(query).defer('geom'):
+            stored[(row.content_type_id, row.object_id)] = row
+
+    pks = []
+    outdated = []
+    for obj, geom, key in pending:
+        if not geom:
+            pks.append({name: [] for name, model in ZONING_MODELS})
+            continue
+        content_type_id = ContentType.objects.get_for_model(obj).pk
+        row = stored.get((content_type_id, obj.pk))
+        if row is None or row.geom_hash != key[0]:
+            row = ObjectZoning(content_type_id=content_type_id, object_id=obj.pk, geom=geom, geom_hash=key[0])
+            outdated.append(row)
+        pks.append({name: getattr(row, name) for name, model in ZONING_MODELS})
+
+    if outdated:
+        geoms = [row.geom for row in outdated]
+        for name, model in ZONING_MODELS:
+            for row, value in zip(outdated, compute_zoning(model, geoms)):
+                setattr(row, name, value)
+        rows = [row for row in outdated if row.object_id is not None]
+        if store and rows:
+            ObjectZoning.objects.filter(
+                reduce(or_, [Q(content_type_id=row.content_type_id, object_id=row.object_id) for row in rows])
+            ).delete()
+            ObjectZoning.objects.bulk_create(rows, ignore_conflicts=True)
+
+    zones = {}
+    for name, model in ZONING_MODELS:
+        ids = {pk for value in pks for pk in value[name]}
+        zones[name] = model.objects.in_bulk(ids) if ids else {}
+    for (obj, geom, key), value in zip(pending, pks):
+        obj._zoning = (key, {
+            name: [zones[name][pk] for pk in value[name] if pk in zones[name]]
+            for name, model in ZONING_MODELS
+        })
+
+
+def update_stored_zoning(queryset, chunk_size=500):
+    """
+    Compute again stored intersections (``ObjectZoning``) of ``queryset``,
+    from their stored geometries, after a change of zoning layers.
+    """
+    names = [name for name, model in ZONING_MODELS]
+
+    def update(rows):
+        geoms = [row.geom for row in rows]
+        for name, model in ZONING_MODELS:
+            for row, value in zip(rows, compute_zoning(model, geoms, chunk_size)):
+                setattr(row, name, value)
+        ObjectZoning.objects.bulk_update(rows, names)
+
+    rows = []
+    for row in queryset.order_by('pk').iterator(chunk_size=chunk_size):
+        rows.append(row)
+        if len(rows) == chunk_size:
+            update(rows)
+            rows = []
+    if rows:
+        update(rows)
 
 
 class ZoningPropertiesMixin:
@@ -10,17 +169,37 @@ class ZoningPropertiesMixin:
     def zoning_property(self):
         return self
 
+    def get_zoning_geom(self):
+        geom = self.zoning_property.geom
+        if geom and geom.srid != settings.SRID:
+            if geom.srid:
+                geom = geom.transform(settings.SRID, clone=True)
+            else:
+                geom = geom.clone()
+                geom.srid = settings.SRID
+        return geom
+
+    def get_zoning_key(self, geom, version):
+        geom_hash = hashlib.md5(bytes(geom.ewkb)).hexdigest() if geom else ''
+        return geom_hash, version
+
+    def get_zoning(self):
+        zoning = getattr(self, '_zoning', None)
+        if zoning is None or zoning[0] != self.get_zoning_key(self.get_zoning_geom(), get_zoning_version()):
+            prefetch_zoning([self])
+        return self._zoning[1]
+
     @property
     def areas(self):
-        return uniquify(intersecting(RestrictedArea, self.zoning_property, distance=0))
+        return self.get_zoning()['areas']
 
     @property
     def districts(self):
-        return uniquify(intersecting(District, self.zoning_property, distance=0))
+        return self.get_zoning()['districts']
 
     @property
     def cities(self):
-        return uniquify(intersecting(City, self.zoning_property, distance=0))
+        return self.get_zoning()['cities']
 
     @property
     def published_areas(self):
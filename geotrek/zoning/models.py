@@ -5,6 +5,7 @@
 
 """
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.db import models
 from django.utils.translation import gettext_lazy as _
 
@@ -69,3 +70,24 @@ class District(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class ObjectZoning(models.Model):
+    """
+    Cities, districts and restricted areas intersecting an object, stored as
+    lists of primary keys in display order (see ``ZoningPropertiesMixin``).
+
+    Rows are stored when the object is saved (or imported in bulk), and
+    computed again when a zoning layer changes. Objects whose geometry changed
+    since (``geom_hash``) get their zoning computed when read, without storing it.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    geom = models.GeometryField(srid=settings.SRID, spatial_index=True)
+    geom_hash = models.CharField(max_length=32)
+    cities = models.JSONField(default=list)
+    districts = models.JSONField(default=list)
+    areas = models.JSONField(default=list)
+
+    class Meta:
+        unique_together = ('content_type', 'object_id')
@@ -2,7 +2,8 @@ from django.contrib.gis.geos import MultiPolygon
 from django.utils.translation import gettext as _
 
 from geotrek.common.parsers import ShapeParser, GlobalImportError
-from geotrek.zoning.models import City
+from geotrek.zoning.mixins import update_stored_zoning, update_zoning_version
+from geotrek.zoning.models import City, ObjectZoning
 
 
 # Data: https://www.data.gouv.fr/fr/datasets/decoupage-administratif-communal-francais-issu-d-openstreetmap/
@@ -16,6 +17,13 @@ class CityParser(ShapeParser):
         'geom': 'geom',
     }
 
+    def end(self):
+        super().end()
+        if self.bulk:
+            # Bulk writes do not send signals, compute all stored intersections again
+            update_stored_zoning(ObjectZoning.objects.all())
+            update_zoning_version()
+
     def filter_code(self, src, val):
         return str(val)
 
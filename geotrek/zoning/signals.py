@@ -0,0 +1,28 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q
+
+from .mixins import ZONING_MODELS, prefetch_zoning, update_stored_zoning, update_zoning_version
+from .models import ObjectZoning
+
+
+def update_zoning(sender, instance, **kwargs):
+    """
+    Compute again stored intersections which may be affected by a change of a
+    zoning layer: the ones overlapping the zone and the ones which referenced
+    it (its geometry may have moved away or it may have been deleted).
+    """
+    name = {model: name for name, model in ZONING_MODELS}[sender]
+    query = Q(**{'{}__contains'.format(name): [instance.pk]})
+    if instance.geom:
+        query |= Q(geom__bboverlaps=instance.geom)
+    update_stored_zoning(ObjectZoning.objects.filter(query))
+    update_zoning_version()
+
+
+def store_object_zoning(sender, instance, **kwargs):
+    prefetch_zoning([instance], store=True)
+
+
+def delete_object_zoning(sender, instance, **kwargs):
+    ObjectZoning.objects.filter(content_type=ContentType.objects.get_for_model(sender),
+                                object_id=instance.pk).delete()
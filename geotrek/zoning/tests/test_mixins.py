@@ -1,8 +1,12 @@
 from django.conf import settings
+from django.contrib.gis.geos import LineString
 from django.test import TestCase
 
 from geotrek.core.tests.factories import PathFactory
 from geotrek.trekking.tests.factories import TrekFactory
+from geotrek.core.models import Path
+from geotrek.zoning.mixins import get_zoning_version, prefetch_zoning
+from geotrek.zoning.models import ObjectZoning
 from geotrek.zoning.tests.factories import CityFactory, DistrictFactory, RestrictedAreaFactory
 
 
@@ -90,3 +94,67 @@ class ZoningPropertiesMixinTest(TestCase):
         self.assertEqual(len(self.path.areas), 2)
         self.assertQuerysetEqual(self.path.published_areas, [repr(area), repr(self.area)])
         self.assertEqual(len(self.path.published_areas), 2)
+
+
+class ObjectZoningTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = CityFactory.create(geom='SRID=2154;MULTIPOLYGON(((200000 300000, 900000 300000, 900000 1200000, '
+                                           '200000 1200000, 200000 300000)))')
+        cls.paths = [PathFactory.create(geom='SRID=2154;LINESTRING({x} 400000, {x} 500000)'.format(x=x))
+                     for x in range(300000, 1300000, 100000)]
+
+    def test_stored(self):
+        self.assertEqual(self.paths[0].cities, [self.city])
+        zoning = ObjectZoning.objects.get(object_id=self.paths[0].pk)
+        self.assertEqual(zoning.cities, [self.city.pk])
+        self.assertEqual(zoning.districts, [])
+        # Read from table
+        path = Path.objects.get(pk=self.paths[0].pk)
+        with self.assertNumQueries(2):
+            self.assertEqual(path.cities, [self.city])
+
+    def test_geometry_changed(self):
+        path = self.paths[0]
+        self.assertEqual(path.cities, [self.city])
+        path.geom = LineString((1050000, 400000), (1050000, 500000), srid=settings.SRID)
+        path.save()
+        self.assertEqual(Path.objects.get(pk=path.pk).cities, [])
+        self.assertEqual(ObjectZoning.objects.get(object_id=path.pk).cities, [])
+
+    def test_zone_changed(self):
+        path = self.paths[-1]
+        self.assertEqual(path.cities, [])
+        city = CityFactory.create(geom='SRID=2154;MULTIPOLYGON(((900000 300000, 1300000 300000, 1300000 1200000, '
+                                       '900000 1200000, 900000 300000)))')
+        self.assertEqual(path.cities, [city])
+        self.assertEqual(Path.objects.get(pk=path.pk).cities, [city])
+        city.delete()
+        self.assertEqual(Path.objects.get(pk=path.pk).cities, [])
+
+    def test_prefetch(self):
+        prefetch_zoning(Path.objects.all())
+        paths = list(Path.objects.all())
+        with self.assertNumQueries(2):
+            prefetch_zoning(paths)
+        with self.assertNumQueries(0):
+            for path in paths:
+                self.assertEqual(path.cities, [self.city] if path.geom.coords[0][0] <= 900000 else [])
+
+    def test_read_does_not_store(self):
+        ObjectZoning.objects.all().delete()
+        path = Path.objects.get(pk=self.paths[0].pk)
+        self.assertEqual(path.cities, [self.city])
+        self.assertFalse(ObjectZoning.objects.exists())
+        path.save()
+        self.assertEqual(ObjectZoning.objects.get(object_id=path.pk).cities, [self.city.pk])
+
+    def test_version_shared(self):
+        version = get_zoning_version()
+        path = Path.objects.get(pk=self.paths[0].pk)
+        self.assertEqual(path.cities, [self.city])
+        # Zone changed, possibly in another process
+        self.city.delete()
+        self.assertNotEqual(get_zoning_version(), version)
+        self.assertEqual(ObjectZoning.objects.get(object_id=path.pk).cities, [])
+        self.assertEqual(path.cities, [])